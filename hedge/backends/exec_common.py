@@ -29,6 +29,112 @@ import numpy as np
 import hedge.optemplate
 
 
+class BufferPool(object):
+    """Hands out scratch and result arrays, recycling those that are
+    no longer in use.
+
+    Arrays are kept in free lists keyed by *(shape, dtype, kind)*, of which
+    only *kind* ``"numpy"`` is currently supported.
+
+    .. attribute:: allocation_count
+
+        The number of arrays that could not be taken from a free list.
+
+    .. attribute:: reuse_count
+
+        The number of arrays that were taken from a free list.
+
+    The pool may be used from several threads at once.
+    """
+
+    def __init__(self):
+        from threading import Lock
+        self.lock = Lock()
+
+        # arrays handed out and not yet released, by id
+        from weakref import WeakValueDictionary
+        self.issued = WeakValueDictionary()
+
+        self.free_lists = {}
+        self.allocation_count = 0
+        self.reuse_count = 0
+
+    def empty(self, shape, dtype, kind="numpy"):
+        if kind != "numpy":
+            raise ValueError("invalid vector kind requested")
+
+        dtype = np.dtype(dtype)
+        self.lock.acquire()
+        try:
+            try:
+                result = self.free_lists[shape, dtype, kind].pop()
+            except (KeyError, IndexError):
+                self.allocation_count += 1
+                result = None
+            else:
+                self.reuse_count += 1
+        finally:
+            self.lock.release()
+
+        if result is None:
+            result = np.empty(shape, dtype)
+
+        self.lock.acquire()
+        try:
+            self.issued[id(result)] = result
+        finally:
+            self.lock.release()
+
+        return result
+
+    def zeros(self, shape, dtype, kind="numpy"):
+        result = self.empty(shape, dtype, kind)
+        result.fill(0)
+        return result
+
+    def release(self, ary):
+        """Return *ary* to the pool. The caller guarantees that *ary* is no
+        longer used anywhere.
+        """
+        self.lock.acquire()
+        try:
+            self.issued.pop(id(ary), None)
+            self.free_lists.setdefault(
+                    (ary.shape, ary.dtype, "numpy"), []).append(ary)
+        finally:
+            self.lock.release()
+
+    def release_variable(self, context, name, is_private):
+        """Remove *name* from *context*, which the caller guarantees to no
+        longer need. If its value was handed out by this pool and
+        *is_private* (see :meth:`hedge.compiler.Code.is_value_private`)
+        is true, return the value to the pool.
+
+        Values not handed out by the pool, such as cached data, are never
+        recycled.
+        """
+        value = context.pop(name)
+
+        if is_private and isinstance(value, np.ndarray):
+            self.lock.acquire()
+            try:
+                is_issued = self.issued.get(id(value)) is value
+            finally:
+                self.lock.release()
+
+            if is_issued:
+                self.release(value)
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.free_lists.clear()
+        finally:
+            self.lock.release()
+
+
+
+
 class ExecutionMapperBase(hedge.optemplate.Evaluator,
         hedge.optemplate.BoundOpMapperMixin,
         hedge.optemplate.LocalOpReducerMixin):
@@ -37,6 +143,12 @@ class ExecutionMapperBase(hedge.optemplate.Evaluator,
         self.discr = executor.discr
         self.executor = executor
 
+    def discard_variable(self, name):
+        """Called by :class:`hedge.compiler.Code` once the variable *name*
+        is no longer needed.
+        """
+        del self.context[name]
+
     def map_ones(self, expr):
         # FIXME
         if expr.quadrature_tag is not None:
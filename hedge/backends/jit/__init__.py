@@ -37,6 +37,10 @@ logger = logging.getLogger(__name__)
 # {{{ exec mapper
 
 class ExecutionMapper(ExecutionMapperBase):
+    def discard_variable(self, name):
+        self.executor.buffer_pool.release_variable(self.context, name,
+                self.executor.code.is_value_private(name, self.context))
+
     # {{{ code execution functions --------------------------------------------
     def exec_assign(self, insn):
         return [(name, self.rec(expr))
@@ -56,7 +60,8 @@ class ExecutionMapper(ExecutionMapperBase):
         else:
             compiled = insn.compiled(self.executor)
             return zip(compiled.result_names(),
-                    compiled(self, stats_callback)), []
+                    compiled(self, self.executor.buffer_pool.empty,
+                        stats_callback)), []
 
     def exec_flux_batch_assign(self, insn):
         from pymbolic.primitives import is_zero
@@ -89,13 +94,20 @@ class ExecutionMapper(ExecutionMapperBase):
                 [a.dtype for a in args if not isinstance(a, ZeroSpec)],
                 self.discr.default_scalar_type)
 
+        pool = self.executor.buffer_pool
+        zero_args = []
+
         def cast_arg(arg):
-            if isinstance(arg, BoundaryZeros):
-                return self.discr.boundary_zeros(
-                        insn.repr_op.boundary_tag, dtype=max_dtype)
-            elif isinstance(arg, VolumeZeros):
-                return self.discr.volume_zeros(
-                        dtype=max_dtype)
+            if isinstance(arg, ZeroSpec):
+                if isinstance(arg, BoundaryZeros):
+                    shape = (len(self.discr.get_boundary(
+                        insn.repr_op.boundary_tag).nodes),)
+                else:
+                    shape = (len(self.discr),)
+
+                result = pool.zeros(shape, max_dtype)
+                zero_args.append(result)
+                return result
             elif isinstance(arg, np.ndarray):
                 return np.asarray(arg, dtype=max_dtype)
             else:
@@ -103,28 +115,61 @@ class ExecutionMapper(ExecutionMapperBase):
 
         args = [cast_arg(arg) for arg in args]
 
-        if insn.quadrature_tag is None:
-            if insn.is_boundary:
-                face_groups = self.discr.get_boundary(insn.repr_op.boundary_tag)\
-                        .face_groups
-            else:
-                face_groups = self.discr.face_groups
-        else:
-            if insn.is_boundary:
-                face_groups = self.discr.get_boundary(insn.repr_op.boundary_tag)\
-                        .get_quadrature_info(insn.quadrature_tag).face_groups
-            else:
-                face_groups = self.discr.get_quadrature_info(insn.quadrature_tag) \
-                        .face_groups
+        fused = insn.fused
+        if fused is None:
+            fused = self.executor.fused_flux_choices.get(insn)
 
-        result = []
+        if fused is None:
+            fused = self.pick_flux_variant(insn, args, max_dtype)
+            self.executor.fused_flux_choices[insn] = fused
 
-        for fg in face_groups:
-            # grab module
-            module = insn.get_module(self.discr, max_dtype)
-            func = module.gather_flux
+        result = self.gather_and_lift(insn, args, max_dtype, fused)
+
+        del args
+        for zero_arg in zero_args:
+            pool.release(zero_arg)
+
+        return result, []
 
-            # set up argument structure
+    def pick_flux_variant(self, insn, args, dtype, attempts=3):
+        """Return whether the fused flux-lift variant of *insn* is faster
+        than separate gather and lift for *args*.
+        """
+        pool = self.executor.buffer_pool
+
+        from time import time
+
+        def run_trial(fused):
+            start = time()
+            trial_result = self.gather_and_lift(insn, args, dtype, fused)
+            seconds = time()-start
+
+            for name, ary in trial_result:
+                pool.release(ary)
+
+            return seconds
+
+        # The first run of each variant compiles it and fills caches, so
+        # it is not timed.
+        timings = {}
+        for fused in [False, True]:
+            run_trial(fused)
+            timings[fused] = []
+
+        # Alternate the variants so that neither profits from running last.
+        for i in range(attempts):
+            for fused in [False, True]:
+                timings[fused].append(run_trial(fused))
+
+        return min(timings[True]) < min(timings[False])
+
+    def gather_and_lift(self, insn, args, dtype, fused):
+        face_groups = insn.get_face_groups(self.discr)
+
+        pool = self.executor.buffer_pool
+        vol_shape = (len(self.discr),)
+
+        def make_arg_struct(module):
             arg_struct = module.ArgStruct()
             for arg_name, arg in zip(insn.flux_var_info.arg_names, args):
                 setattr(arg_struct, arg_name, arg)
@@ -133,54 +178,92 @@ class ExecutionMapper(ExecutionMapperBase):
                 setattr(arg_struct,
                         "_scalar_arg_%d" % arg_num,
                         self.rec(scalar_arg_expr))
+            return arg_struct
 
-            fof_shape = (fg.face_count*fg.face_length()*fg.element_count(),)
-            all_fluxes_on_faces = [
-                    np.zeros(fof_shape, dtype=max_dtype)
-                    for f in insn.expressions]
-            for i, fof in enumerate(all_fluxes_on_faces):
-                setattr(arg_struct, "flux%d_on_faces" % i, fof)
-
-            # make sure everything ended up in Boost.Python attributes
-            # (i.e. empty __dict__)
-            assert not arg_struct.__dict__, arg_struct.__dict__.keys()
-
-            # perform gather
-            func(fg, arg_struct)
-
-            # do lift, produce output
-            for name, flux_bdg, fluxes_on_faces in zip(insn.names, insn.expressions,
-                    all_fluxes_on_faces):
-
-                if insn.quadrature_tag is None:
-                    if flux_bdg.op.is_lift:
-                        mat = fg.ldis_loc.lifting_matrix()
-                        scaling = fg.local_el_inverse_jacobians
-                    else:
-                        mat = fg.ldis_loc.multi_face_mass_matrix()
-                        scaling = None
-                else:
-                    assert not flux_bdg.op.is_lift
-                    mat = fg.ldis_loc_quad_info.multi_face_mass_matrix()
-                    scaling = None
+        def count_lift_flops(fg):
+            if self.discr.instrumented:
+                from hedge.tools import lift_flops
+
+                # correct for quadrature, too.
+                self.discr.lift_flop_counter.add(lift_flops(fg))
+
+        result = []
+
+        for fg in face_groups:
+            if fused:
+                module = insn.get_fused_module(self.discr, dtype)
+                arg_struct = make_arg_struct(module)
+                arg_struct.el_face_pairs = \
+                        self.executor.get_element_face_pair_table(fg)
 
-                out = self.discr.volume_zeros(dtype=fluxes_on_faces.dtype)
-                self.executor.lift_flux(fg, mat, scaling, fluxes_on_faces, out)
+                from pytools import to_uncomplex_dtype
+                outs = []
+                for i, flux_bdg in enumerate(insn.expressions):
+                    mat, scaling = insn.get_lift_data(fg, flux_bdg)
+                    setattr(arg_struct, "lift_matrix%d" % i,
+                            np.asarray(mat, dtype=to_uncomplex_dtype(dtype),
+                                order="C").ravel())
+                    if scaling is not None:
+                        setattr(arg_struct, "scaling%d" % i, scaling)
 
-                if self.discr.instrumented:
-                    from hedge.tools import lift_flops
+                    out = pool.zeros(vol_shape, dtype)
+                    setattr(arg_struct, "result%d" % i, out)
+                    outs.append(out)
 
-                    # correct for quadrature, too.
-                    self.discr.lift_flop_counter.add(lift_flops(fg))
+                assert not arg_struct.__dict__, arg_struct.__dict__.keys()
 
-                result.append((name, out))
+                module.gather_lift(fg, arg_struct)
+
+                for name, out in zip(insn.names, outs):
+                    count_lift_flops(fg)
+                    result.append((name, out))
+
+                del arg_struct
+
+            else:
+                # grab module
+                module = insn.get_module(self.discr, dtype)
+                func = module.gather_flux
+
+                # set up argument structure
+                arg_struct = make_arg_struct(module)
+
+                fof_shape = (fg.face_count*fg.face_length()*fg.element_count(),)
+                all_fluxes_on_faces = [
+                        pool.zeros(fof_shape, dtype)
+                        for f in insn.expressions]
+                for i, fof in enumerate(all_fluxes_on_faces):
+                    setattr(arg_struct, "flux%d_on_faces" % i, fof)
+
+                # make sure everything ended up in Boost.Python attributes
+                # (i.e. empty __dict__)
+                assert not arg_struct.__dict__, arg_struct.__dict__.keys()
+
+                # perform gather
+                func(fg, arg_struct)
+
+                # do lift, produce output
+                for name, flux_bdg, fluxes_on_faces in zip(
+                        insn.names, insn.expressions, all_fluxes_on_faces):
+
+                    mat, scaling = insn.get_lift_data(fg, flux_bdg)
+
+                    out = pool.zeros(vol_shape, fluxes_on_faces.dtype)
+                    self.executor.lift_flux(fg, mat, scaling, fluxes_on_faces, out)
+
+                    count_lift_flops(fg)
+                    result.append((name, out))
+
+                del arg_struct
+                for fof in all_fluxes_on_faces:
+                    pool.release(fof)
 
         if not face_groups:
             # No face groups? Still assign context variables.
             for name, flux_bdg in zip(insn.names, insn.expressions):
-                result.append((name, self.discr.volume_zeros()))
+                result.append((name, pool.zeros(vol_shape, dtype)))
 
-        return result, []
+        return result
 
     def exec_diff_batch_assign(self, insn):
         rst_diff = self.executor.diff(insn.operators, self.rec(insn.field))
@@ -189,6 +272,14 @@ class ExecutionMapper(ExecutionMapperBase):
 
     exec_quad_diff_batch_assign = exec_diff_batch_assign
 
+    def exec_multi_field_diff_batch_assign(self, insn):
+        rst_diffs = self.executor.diff_many(insn.operators,
+                [self.rec(field) for field in insn.fields])
+
+        return [(name, diff)
+                for field_names, field_diffs in zip(insn.names, rst_diffs)
+                for name, diff in zip(field_names, field_diffs)], []
+
     # }}}
 
     # {{{ expression mappings -------------------------------------------------
@@ -211,7 +302,8 @@ class ExecutionMapper(ExecutionMapperBase):
         true_indices = np.nonzero(bool_crit)
         false_indices = np.nonzero(~bool_crit)
 
-        result = np.empty_like(crit)
+        crit = np.asarray(crit)
+        result = self.executor.buffer_pool.empty(crit.shape, crit.dtype)
 
         if isinstance(then, np.ndarray):
             then = then[true_indices]
@@ -230,7 +322,8 @@ class ExecutionMapper(ExecutionMapperBase):
         true_indices = np.nonzero(bool_crit)
         false_indices = np.nonzero(~bool_crit)
 
-        result = self.discr.volume_empty(
+        result = self.executor.buffer_pool.empty(
+                (len(self.discr),), self.discr.default_scalar_type,
                 kind=self.discr.compute_kind)
 
         if isinstance(then, np.ndarray):
@@ -242,6 +335,21 @@ class ExecutionMapper(ExecutionMapperBase):
         result[false_indices] = else_
         return result
 
+    def map_boundarize(self, op, field_expr):
+        field = self.rec(field_expr)
+
+        if (not isinstance(field, np.ndarray)
+                or field.dtype == object or field.ndim != 1):
+            return self.discr.boundarize_volume_field(
+                    field, tag=op.tag, kind=self.discr.compute_kind)
+
+        vol_indices = self.discr.get_boundary(op.tag).vol_indices
+        out = self.executor.buffer_pool.empty(
+                (len(vol_indices),), field.dtype)
+        if len(vol_indices):
+            np.take(field, vol_indices, out=out)
+        return out
+
     def map_ref_diff_base(self, op, field_expr):
         raise NotImplementedError(
                 "differentiation should be happening in batched form")
@@ -253,7 +361,8 @@ class ExecutionMapper(ExecutionMapperBase):
         if is_zero(field):
             return 0
 
-        out = self.discr.volume_zeros()
+        out = self.executor.buffer_pool.zeros(
+                (len(self.discr),), self.discr.default_scalar_type)
         self.executor.do_elementwise_linear(op, field, out)
         return out
 
@@ -268,7 +377,8 @@ class ExecutionMapper(ExecutionMapperBase):
 
         from hedge._internal import perform_elwise_operator
 
-        out = self.discr.volume_zeros()
+        out = self.executor.buffer_pool.zeros(
+                (len(self.discr),), self.discr.default_scalar_type)
         for eg in self.discr.element_groups:
             eg_quad_info = eg.quadrature_info[qtag]
 
@@ -290,7 +400,8 @@ class ExecutionMapper(ExecutionMapperBase):
         from hedge._internal import perform_elwise_operator
         quad_info = self.discr.get_quadrature_info(qtag)
 
-        out = np.zeros(quad_info.node_count, field.dtype)
+        out = self.executor.buffer_pool.zeros(
+                (quad_info.node_count,), field.dtype)
         for eg in self.discr.element_groups:
             eg_quad_info = eg.quadrature_info[qtag]
 
@@ -312,7 +423,8 @@ class ExecutionMapper(ExecutionMapperBase):
         from hedge._internal import perform_elwise_operator
         quad_info = self.discr.get_quadrature_info(qtag)
 
-        out = np.zeros(quad_info.int_faces_node_count, field.dtype)
+        out = self.executor.buffer_pool.zeros(
+                (quad_info.int_faces_node_count,), field.dtype)
         for eg in self.discr.element_groups:
             eg_quad_info = eg.quadrature_info[qtag]
 
@@ -333,7 +445,8 @@ class ExecutionMapper(ExecutionMapperBase):
         bdry = self.discr.get_boundary(op.boundary_tag)
         bdry_q_info = bdry.get_quadrature_info(op.quadrature_tag)
 
-        out = np.zeros(bdry_q_info.node_count, field.dtype)
+        out = self.executor.buffer_pool.zeros(
+                (bdry_q_info.node_count,), field.dtype)
 
         from hedge._internal import perform_elwise_operator
         for fg, from_ranges, to_ranges, ldis_quad_info in zip(
@@ -351,7 +464,8 @@ class ExecutionMapper(ExecutionMapperBase):
         from hedge._internal import perform_elwise_max
         field = self.rec(field_expr)
 
-        out = self.discr.volume_zeros(dtype=field.dtype)
+        out = self.executor.buffer_pool.zeros(
+                (len(self.discr),), field.dtype)
         for eg in self.discr.element_groups:
             perform_elwise_max(eg.ranges, field, out)
 
@@ -371,6 +485,15 @@ class Executor(object):
                 post_bind_mapper, type_hints)
         self.elwise_linear_cache = {}
 
+        from hedge.backends.exec_common import BufferPool
+        self.buffer_pool = BufferPool()
+
+        self.fused_flux_choices = {}
+        self.element_face_pair_tables = {}
+
+        self.has_run = False
+        self.profiler = None
+
         if "dump_op_code" in discr.debug:
             from hedge.tools import open_unique_debug_file
             open_unique_debug_file("op-code", ".txt").write(
@@ -408,12 +531,42 @@ class Executor(object):
                     (f, min(benchmark(f) for i in range(attempts)))
                     for f in choices)
 
-        from hedge.backends.jit.diff import JitDifferentiator
-        self.diff = pick_faster_func(bench_diff,
-                [self.diff_builtin, JitDifferentiator(discr)])
-        from hedge.backends.jit.lift import JitLifter
-        self.lift_flux = pick_faster_func(bench_lift,
-                [self.lift_flux, JitLifter(discr)])
+        runner = discr.chunk_runner
+
+        from hedge.backends.jit.diff import (
+                JitDifferentiator, NumpyDifferentiator)
+        differentiators = {
+                "builtin": self.diff_builtin,
+                "jit": JitDifferentiator(discr, runner, self.buffer_pool),
+                "numpy": NumpyDifferentiator(discr, self.buffer_pool),
+                }
+        if runner is not None:
+            self.diff = differentiators["jit"]
+        elif discr.diff_engine is None:
+            self.diff = pick_faster_func(bench_diff,
+                    differentiators.values())
+        else:
+            self.diff = differentiators[discr.diff_engine]
+
+        from hedge.backends.jit.lift import JitLifter, GemmLifter
+        lifters = {
+                "builtin": self.lift_flux,
+                "jit": JitLifter(discr, runner),
+                "gemm": GemmLifter(discr),
+                }
+        if runner is not None:
+            self.lift_flux = lifters["jit"]
+        elif discr.lift_engine is None:
+            self.lift_flux = pick_faster_func(bench_lift,
+                    lifters.values())
+        else:
+            self.lift_flux = lifters[discr.lift_engine]
+
+        if runner is not None:
+            from hedge.backends.jit.elwise import JitElementwiseOperator
+            self.elwise_operator = JitElementwiseOperator(discr, runner)
+        else:
+            self.elwise_operator = None
 
     def compile_optemplate(self, discr, optemplate, post_bind_mapper,
             type_hints):
@@ -480,8 +633,17 @@ class Executor(object):
                 matrix.astype(to_uncomplex_dtype(field.dtype)),
                 scaling, field, out)
 
+    def get_element_face_pair_table(self, fg):
+        try:
+            return self.element_face_pair_tables[fg]
+        except KeyError:
+            from hedge.backends.jit.flux import get_element_face_pair_table
+            result = self.element_face_pair_tables[fg] = \
+                    get_element_face_pair_table(fg)
+            return result
+
     def diff_rst(self, op, field):
-        result = self.discr.volume_zeros(dtype=field.dtype)
+        result = self.buffer_pool.zeros((len(self.discr),), field.dtype)
 
         from hedge._internal import perform_elwise_operator
         for eg in self.discr.element_groups:
@@ -491,6 +653,18 @@ class Executor(object):
 
         return result
 
+    def diff_many(self, operators, fields):
+        """For each entry of *fields*, return the local derivatives
+        corresponding to the reference differentiation operators in the
+        matching entry of *operators*.
+        """
+        diff_many = getattr(self.diff, "diff_many", None)
+        if diff_many is not None:
+            return diff_many(operators, fields)
+        else:
+            return [self.diff(field_ops, field)
+                    for field_ops, field in zip(operators, fields)]
+
     def diff_builtin(self, operators, field):
         """For the batch of reference differentiation operators in
         *operators*, return the local corresponding derivatives of
@@ -512,16 +686,217 @@ class Executor(object):
                     perform_elwise_scaled_operator,
                     perform_elwise_operator)
 
-            if coeffs is None:
+            if self.elwise_operator is not None:
+                self.elwise_operator(eg.ranges, eg.ranges,
+                        matrix, coeffs, field, out)
+            elif coeffs is None:
                 perform_elwise_operator(eg.ranges, eg.ranges,
                         matrix, field, out)
             else:
                 perform_elwise_scaled_operator(eg.ranges, eg.ranges,
                         coeffs, matrix, field, out)
 
+    def _make_dtype_getter(self, var_dtypes, dtype):
+        """Return a function mapping a dependency expression to its dtype,
+        looking up variables in *var_dtypes* and defaulting to *dtype* for
+        fields and to the real type of the same precision for scalar
+        parameters.
+        """
+        from pytools import to_uncomplex_dtype
+        scalar_dtype = np.dtype(to_uncomplex_dtype(dtype))
+
+        from pymbolic.primitives import Variable, Subscript
+        from hedge.optemplate.primitives import ScalarParameter
+        exec_mapper = self.discr.exec_mapper_class({}, self)
+
+        def get_dtype(expr):
+            if isinstance(expr, ScalarParameter):
+                return var_dtypes.get(expr.name, scalar_dtype)
+
+            if isinstance(expr, Subscript):
+                expr = expr.aggregate
+            if isinstance(expr, Variable):
+                return var_dtypes.get(expr.name, dtype)
+            else:
+                # geometric factors and the like
+                return exec_mapper(expr).dtype
+
+        return get_dtype
+
+    def infer_dtypes(self, dtype=None, arg_dtypes=None):
+        """Find the dtype of each variable assigned by :attr:`code`, by
+        propagating the dtypes of the operator's arguments through the
+        instructions the same way execution would.
+
+        :param dtype: the dtype of field arguments not listed in
+          *arg_dtypes*. Defaults to the discretization's
+          *default_scalar_type*.
+        :param arg_dtypes: a mapping from names of the operator's
+          arguments (fields and :class:`hedge.optemplate.ScalarParameter`
+          instances) to the dtypes they will be passed with. Scalar
+          parameters not listed here are assumed to be real numbers of the
+          same precision as *dtype*.
+        :returns: a dictionary mapping variable names to dtypes.
+        """
+        discr = self.discr
+        code = self.code
+
+        if dtype is None:
+            dtype = discr.default_scalar_type
+        dtype = np.dtype(dtype)
+
+        if arg_dtypes is None:
+            arg_dtypes = {}
+
+        var_dtypes = dict(
+                (name, np.dtype(arg_dtype))
+                for name, arg_dtype in arg_dtypes.iteritems())
+        get_dtype = self._make_dtype_getter(var_dtypes, dtype)
+
+        unresolved = set()
+        for insn in code.instructions:
+            unresolved |= insn.get_assignees()
+
+        from pytools import common_dtype
+        from hedge.backends.jit.compiler import VectorExprAssign
+        pending = list(enumerate(code.instructions))
+        while pending:
+            still_pending = []
+            for insn_nr, insn in pending:
+                if code.insn_dep_names[insn_nr] & unresolved:
+                    still_pending.append((insn_nr, insn))
+                    continue
+
+                if isinstance(insn, VectorExprAssign) and insn.flop_count():
+                    compiled = insn.compiled(self)
+                    result_dtype = compiled.result_dtype_getter(
+                            dict((v, get_dtype(v))
+                                for v in compiled.vector_deps),
+                            dict((s, get_dtype(s))
+                                for s in compiled.scalar_deps),
+                            compiled.constant_dtypes)
+                else:
+                    # Flux, differentiation and copy instructions produce
+                    # results of the common dtype of their inputs.
+                    result_dtype = common_dtype(
+                            [get_dtype(dep) for dep in insn.get_dependencies()]
+                            or [dtype])
+
+                for name in insn.get_assignees():
+                    var_dtypes[name] = np.dtype(result_dtype)
+                unresolved -= insn.get_assignees()
+
+            if len(still_pending) == len(pending):
+                raise RuntimeError("unable to order instructions "
+                        "by their dependencies")
+
+            pending = still_pending
+
+        return var_dtypes
+
+    def warm_up(self, dtype=None, arg_dtypes=None):
+        """Build (or fetch from the kernel cache) every compiled module that
+        executing :attr:`code` will need, without evaluating the operator.
+        The dtypes of intermediate results are found by :meth:`infer_dtypes`,
+        to which *dtype* and *arg_dtypes* are passed.
+
+        :returns: a list of tuples *(insn, seconds)* giving the time spent
+          preparing each instruction of :attr:`code`.
+        """
+        discr = self.discr
+
+        if dtype is None:
+            dtype = discr.default_scalar_type
+        dtype = np.dtype(dtype)
+
+        get_dtype = self._make_dtype_getter(
+                self.infer_dtypes(dtype, arg_dtypes), dtype)
+
+        from pytools import common_dtype
+        from time import time
+        from hedge.compiler import DiffBatchAssign, QuadratureDiffBatchAssign
+        from hedge.backends.jit.compiler import (
+                VectorExprAssign, CompiledFluxBatchAssign,
+                MultiFieldDiffBatchAssign)
+
+        report = []
+        for insn in self.code.instructions:
+            start = time()
+
+            if isinstance(insn, VectorExprAssign):
+                if insn.flop_count():
+                    compiled = insn.compiled(self)
+                    compiled.get_kernel(
+                            tuple(get_dtype(v) for v in compiled.vector_deps),
+                            tuple(get_dtype(s) for s in compiled.scalar_deps))
+
+            elif isinstance(insn, CompiledFluxBatchAssign):
+                flux_dtype = common_dtype(
+                        [get_dtype(dep) for dep in insn.get_dependencies()]
+                        or [dtype])
+
+                insn.get_module(discr, flux_dtype)
+                if insn.fused is not False:
+                    insn.get_fused_module(discr, flux_dtype)
+
+                for fg in insn.get_face_groups(discr):
+                    fof = np.zeros(
+                            fg.face_count*fg.face_length()*fg.element_count(),
+                            dtype=flux_dtype)
+                    for flux_bdg in insn.expressions:
+                        mat, scaling = insn.get_lift_data(fg, flux_bdg)
+                        self.lift_flux(fg, mat, scaling, fof,
+                                discr.volume_zeros(dtype=flux_dtype))
+
+            elif (isinstance(insn, DiffBatchAssign)
+                    and not isinstance(insn, QuadratureDiffBatchAssign)):
+                self.diff(insn.operators,
+                        discr.volume_zeros(dtype=get_dtype(insn.field)))
+
+            elif isinstance(insn, MultiFieldDiffBatchAssign):
+                self.diff_many(insn.operators,
+                        [discr.volume_zeros(dtype=get_dtype(f))
+                            for f in insn.fields])
+
+            report.append((insn, time()-start))
+
+        return report
+
+    def start_profiling(self, **kwargs):
+        """Record the cost of each instruction in all subsequent
+        evaluations.
+
+        :returns: a :class:`hedge.backends.profile.InstructionProfiler`.
+          Keyword arguments are passed to its constructor.
+        """
+        from hedge.backends.profile import InstructionProfiler
+        self.profiler = InstructionProfiler(self.discr, self.code, **kwargs)
+        return self.profiler
+
+    def stop_profiling(self):
+        """Stop recording instruction costs and return the profiler
+        that recorded them.
+        """
+        result = self.profiler
+        self.profiler = None
+        return result
+
     def __call__(self, **context):
-        return self.code.execute(
-                self.discr.exec_mapper_class(context, self))
+        # The first run is always sequential, so that kernels get compiled
+        # and engines get picked without interference.
+        if self.has_run:
+            worker_pool = self.discr.insn_worker_pool
+        else:
+            worker_pool = None
+
+        exec_mapper = self.discr.exec_mapper_class(context, self)
+        if self.profiler is not None:
+            from hedge.backends.profile import ProfilingExecutionMapper
+            exec_mapper = ProfilingExecutionMapper(exec_mapper, self.profiler)
+
+        result = self.code.execute(exec_mapper, worker_pool=worker_pool)
+        self.has_run = True
+        return result
 
 # }}}
 
@@ -544,10 +919,71 @@ class Discretization(hedge.discretization.Discretization):
                 hedge.discretization.Discretization.noninteractive_debug_flags()
                 | set(["jit_dont_optimize_large_exprs"]))
 
+    diff_engines = ["builtin", "jit", "numpy"]
+    lift_engines = ["builtin", "jit", "gemm"]
+    flux_engines = ["split", "fused"]
+
     def __init__(self, *args, **kwargs):
+        """
+        :param kernel_cache_dir: a directory in which compiled kernels are
+          kept across runs. Defaults to the value of the environment
+          variable :envvar:`HEDGE_KERNEL_CACHE_DIR`, if set.
+        :param diff_engine: one of :attr:`diff_engines`, or *None* to
+          pick the fastest one by benchmark. The ``"numpy"`` engine
+          needs no generated code.
+        :param lift_engine: one of :attr:`lift_engines`, or *None* to
+          pick the fastest one by benchmark.
+        :param flux_engine: one of :attr:`flux_engines`, or *None* to
+          pick the faster one by benchmark for each interior flux batch.
+          ``"fused"`` computes and lifts interior fluxes element by
+          element without storing the fluxes on all faces first.
+          Individual batches may be changed through
+          :attr:`hedge.backends.jit.compiler.CompiledFluxBatchAssign.fused`.
+        :param insn_thread_count: if not *None*, execute instructions
+          of compiled operators whose inputs are available concurrently
+          on this many threads, beginning with the second evaluation of
+          each operator. Since compiled kernels release the global
+          interpreter lock, independent flux batches, derivatives and
+          elementwise operators then overlap.
+        :param thread_count: if not *None*, split flux gather, lift,
+          differentiation and elementwise linear operators into chunks of
+          face pairs or elements and process them on this many threads,
+          with the global interpreter lock released. This uses the
+          ``"jit"`` diff and lift engines. Chunking does not depend on
+          the thread count, so results are identical for any number of
+          threads. In a
+          :class:`hedge.backends.mpi.ParallelDiscretization`, outstanding
+          halo messages are polled between chunks.
+        """
         logger.info("init jit discretization: start")
 
         toolchain = kwargs.pop("toolchain", None)
+        kernel_cache_dir = kwargs.pop("kernel_cache_dir", None)
+
+        self.diff_engine = kwargs.pop("diff_engine", None)
+        if (self.diff_engine is not None
+                and self.diff_engine not in self.diff_engines):
+            raise ValueError("unknown diff engine '%s'" % self.diff_engine)
+
+        self.lift_engine = kwargs.pop("lift_engine", None)
+        if (self.lift_engine is not None
+                and self.lift_engine not in self.lift_engines):
+            raise ValueError("unknown lift engine '%s'" % self.lift_engine)
+
+        self.flux_engine = kwargs.pop("flux_engine", None)
+        if (self.flux_engine is not None
+                and self.flux_engine not in self.flux_engines):
+            raise ValueError("unknown flux engine '%s'" % self.flux_engine)
+
+        thread_count = kwargs.pop("thread_count", None)
+        insn_thread_count = kwargs.pop("insn_thread_count", None)
+        if thread_count is not None:
+            for what, engine in [
+                    ("diff", self.diff_engine),
+                    ("lift", self.lift_engine)]:
+                if engine not in [None, "jit"]:
+                    raise ValueError("%s engine '%s' does not support "
+                            "threaded execution" % (what, engine))
 
         # tolerate (and ignore) the CUDA backend's tune_for argument
         kwargs.pop("tune_for", None)
@@ -564,8 +1000,62 @@ class Discretization(hedge.discretization.Discretization):
 
         self.toolchain = toolchain
 
+        if kernel_cache_dir is None:
+            import os
+            from hedge.backends.jit.cache import CACHE_DIR_ENV_VAR
+            kernel_cache_dir = os.environ.get(CACHE_DIR_ENV_VAR)
+
+        if kernel_cache_dir is not None:
+            from hedge.backends.jit.cache import KernelCache
+            self.kernel_cache = KernelCache(kernel_cache_dir)
+        else:
+            self.kernel_cache = None
+
+        if thread_count is not None:
+            from hedge.backends.jit.parallel import ChunkRunner
+            self.chunk_runner = ChunkRunner(thread_count)
+        else:
+            self.chunk_runner = None
+
+        if insn_thread_count is not None:
+            from multiprocessing.pool import ThreadPool
+            self.insn_worker_pool = ThreadPool(insn_thread_count)
+        else:
+            self.insn_worker_pool = None
+
         logger.info("init jit discretization: done")
 
+    def close(self):
+        if self.chunk_runner is not None:
+            self.chunk_runner.close()
+
+        if self.insn_worker_pool is not None:
+            self.insn_worker_pool.close()
+            self.insn_worker_pool.join()
+            self.insn_worker_pool = None
+
+        hedge.discretization.Discretization.close(self)
+
+    def add_instrumentation(self, mgr):
+        hedge.discretization.Discretization.add_instrumentation(self, mgr)
+
+        if self.kernel_cache is not None:
+            self.kernel_cache.add_instrumentation(mgr)
+
+    def compile_kernel_module(self, mod, toolchain=None, extra_key=()):
+        """Compile the :class:`codepy.bpl.BoostPythonModule` *mod*, going
+        through the on-disk kernel cache if one was configured via the
+        *kernel_cache_dir* constructor argument or the
+        :envvar:`HEDGE_KERNEL_CACHE_DIR` environment variable.
+        """
+        if toolchain is None:
+            toolchain = self.toolchain
+
+        if self.kernel_cache is None:
+            return mod.compile(toolchain)
+        else:
+            return self.kernel_cache.compile(mod, toolchain, extra_key)
+
     # {{{ scalar reduction
 
     def nodewise_dot_product(self, a, b):
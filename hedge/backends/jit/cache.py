@@ -0,0 +1,245 @@
+"""Persistent, content-addressed cache for JIT-compiled kernel modules."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import os
+import errno
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+CACHE_DIR_ENV_VAR = "HEDGE_KERNEL_CACHE_DIR"
+
+
+# {{{ helpers
+
+def toolchain_fingerprint(toolchain):
+    """Return a string that changes whenever *toolchain* would produce
+    different binaries for the same source.
+    """
+    parts = []
+
+    abi_id = getattr(toolchain, "abi_id", None)
+    if abi_id is not None:
+        parts.append(repr(abi_id()))
+
+    for attr in ["cc", "ld", "cflags", "ldflags", "defines", "undefines",
+            "include_dirs", "library_dirs", "libraries"]:
+        parts.append("%s=%r" % (attr, getattr(toolchain, attr, None)))
+
+    return "\n".join(parts)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+# }}}
+
+
+# {{{ kernel cache
+
+class KernelCache(object):
+    """A directory of compiled kernel modules shared between processes.
+
+    Modules are keyed on their generated source, a fingerprint of the
+    toolchain used to build them, the hedge version and a caller-supplied
+    *extra_key* (such as the dtype). The actual binaries are kept by
+    :mod:`codepy` in a subdirectory; this class adds a completion marker per
+    key and a lock file so that, when many MPI ranks start up at once, only
+    one of them runs the compiler while the others wait for it to finish.
+
+    :param lock_timeout: Number of seconds after which a lock file is
+      considered stale (e.g. left behind by a killed process) and broken.
+    """
+
+    def __init__(self, cache_dir, lock_timeout=600, poll_interval=0.5):
+        from hedge.version import VERSION_TEXT
+        self.cache_dir = os.path.join(
+                os.path.expanduser(cache_dir), "hedge-%s" % VERSION_TEXT)
+        self.codepy_cache_dir = os.path.join(self.cache_dir, "codepy")
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+        _makedirs(self.codepy_cache_dir)
+
+        self.hit_count = 0
+        self.miss_count = 0
+
+        self.hit_counter = None
+        self.miss_counter = None
+        self.compile_timer = None
+
+    # {{{ instrumentation
+
+    def add_instrumentation(self, mgr):
+        from pytools.log import IntervalTimer, EventCounter
+
+        self.hit_counter = EventCounter("n_kernel_cache_hit",
+                "Number of kernel modules found in the on-disk cache")
+        self.miss_counter = EventCounter("n_kernel_cache_miss",
+                "Number of kernel modules compiled from scratch")
+        self.compile_timer = IntervalTimer("t_kernel_compile",
+                "Time spent compiling kernel modules")
+
+        for quantity in [self.hit_counter, self.miss_counter,
+                self.compile_timer]:
+            mgr.add_quantity(quantity)
+
+    def _record(self, hit, seconds):
+        if hit:
+            self.hit_count += 1
+            if self.hit_counter is not None:
+                self.hit_counter.add()
+        else:
+            self.miss_count += 1
+            if self.miss_counter is not None:
+                self.miss_counter.add()
+
+        if self.compile_timer is not None:
+            self.compile_timer.add_time(seconds)
+
+    # }}}
+
+    def get_key(self, mod, toolchain, extra_key=()):
+        from hashlib import sha1
+        checksum = sha1()
+        checksum.update(str(mod.generate()))
+        checksum.update(toolchain_fingerprint(toolchain))
+        checksum.update(repr(tuple(extra_key)))
+        return checksum.hexdigest()
+
+    def _marker_name(self, key):
+        return os.path.join(self.cache_dir, key + ".done")
+
+    def _lock_name(self, key):
+        return os.path.join(self.cache_dir, key + ".lock")
+
+    def _try_lock(self, key):
+        try:
+            fd = os.open(self._lock_name(key),
+                    os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return False
+            raise
+
+        os.write(fd, str(os.getpid()))
+        os.close(fd)
+        return True
+
+    def _unlock(self, key):
+        try:
+            os.unlink(self._lock_name(key))
+        except OSError:
+            pass
+
+    def _write_marker(self, key):
+        marker_name = self._marker_name(key)
+        tmp_name = "%s.%d.tmp" % (marker_name, os.getpid())
+        outf = open(tmp_name, "w")
+        try:
+            outf.write(key)
+        finally:
+            outf.close()
+
+        # rename is atomic on POSIX file systems
+        os.rename(tmp_name, marker_name)
+
+    def _wait_for_other(self, key):
+        """Wait until another process holding the lock for *key* finishes.
+        Return *True* if that process produced the module.
+        """
+        from time import time, sleep
+
+        lock_name = self._lock_name(key)
+        marker_name = self._marker_name(key)
+
+        while True:
+            if os.path.exists(marker_name):
+                return True
+
+            try:
+                lock_age = time() - os.stat(lock_name).st_mtime
+            except OSError:
+                # lock went away without a marker: the other process failed
+                return os.path.exists(marker_name)
+
+            if lock_age > self.lock_timeout:
+                logger.warning("breaking stale kernel cache lock '%s'"
+                        % lock_name)
+                self._unlock(key)
+                return False
+
+            sleep(self.poll_interval)
+
+    def compile(self, mod, toolchain, extra_key=()):
+        """Return the compiled extension module for the
+        :class:`codepy.bpl.BoostPythonModule` *mod*, building it only if
+        no process has done so before.
+        """
+        from time import time
+
+        key = self.get_key(mod, toolchain, extra_key)
+
+        def do_compile():
+            return mod.compile(toolchain, cache_dir=self.codepy_cache_dir)
+
+        start = time()
+
+        if os.path.exists(self._marker_name(key)):
+            result = do_compile()
+            self._record(True, time()-start)
+            logger.debug("kernel cache hit: %s" % key)
+            return result
+
+        while True:
+            if self._try_lock(key):
+                try:
+                    result = do_compile()
+                    self._write_marker(key)
+                finally:
+                    self._unlock(key)
+
+                self._record(False, time()-start)
+                logger.info("kernel cache miss: %s (compiled in %g s)"
+                        % (key, time()-start))
+                return result
+
+            if self._wait_for_other(key):
+                result = do_compile()
+                self._record(True, time()-start)
+                logger.debug("kernel cache hit after wait: %s" % key)
+                return result
+
+# }}}
+
+
+# vim: foldmethod=marker
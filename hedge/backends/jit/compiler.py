@@ -27,7 +27,7 @@ THE SOFTWARE.
 
 from pytools import memoize_method
 from hedge.compiler import OperatorCompilerBase, FluxBatchAssign, \
-        Assign
+        Assign, Instruction
 
 
 # {{{ jit instructions
@@ -38,6 +38,13 @@ class VectorExprAssign(Assign):
     def get_executor_method(self, executor):
         return executor.exec_vector_expr_assign
 
+    def get_value_aliases(self):
+        if self.flop_count():
+            # the compiled kernel writes every result into a new array
+            return []
+        else:
+            return Assign.get_value_aliases(self)
+
     comment = "compiled"
 
     @memoize_method
@@ -64,11 +71,67 @@ class VectorExprAssign(Assign):
                     for name, expr, dnr in zip(
                         self.names, self.exprs, self.do_not_return)],
                 result_dtype_getter=simple_result_dtype_getter,
-                toolchain=toolchain)
+                toolchain=toolchain,
+                kernel_cache=discr.kernel_cache)
+
+
+class MultiFieldDiffBatchAssign(Instruction):
+    """Reference derivatives of several fields, computed together.
+
+    :ivar names: a list containing, for each entry of *fields*, a list of
+        names to be assigned.
+    :ivar operators: a list containing, for each entry of *fields*, a list
+        of operators. All operators are guaranteed to satisfy
+        :meth:`hedge.optemplate.operators.DiffOperatorBase.
+        equal_except_for_axis`.
+    :ivar fields:
+    """
+
+    def get_assignees(self):
+        from pytools import flatten
+        return set(flatten(self.names))
+
+    @memoize_method
+    def get_dependencies(self):
+        dep_mapper = self.dep_mapper_factory()
+
+        result = set()
+        for field in self.fields:
+            result |= dep_mapper(field)
+        return result
+
+    def __str__(self):
+        lines = ["{"]
+        for field_names, field_ops, field in zip(
+                self.names, self.operators, self.fields):
+            for n, d in zip(field_names, field_ops):
+                lines.append("  %s <- %s(%s)" % (n, d, field))
+        lines.append("}")
+
+        return "\n".join(lines)
+
+    def get_executor_method(self, executor):
+        return executor.exec_multi_field_diff_batch_assign
+
+    def estimate_flops(self, discr):
+        from hedge.tools.flops import diff_rst_flops
+        return (sum(len(field_ops) for field_ops in self.operators)
+                * diff_rst_flops(discr))
 
 
 class CompiledFluxBatchAssign(FluxBatchAssign):
-    # members: compiled_func, arg_specs, is_boundary, quadrature_tag
+    """
+    :ivar fused: whether to compute and lift interior fluxes in a single
+      pass over the elements (see
+      :func:`hedge.backends.jit.flux.get_fused_flux_lift_mod`), rather
+      than gathering all face fluxes before lifting them. *None* means
+      to pick the faster of the two by benchmark on first execution.
+      Always *False* if :meth:`can_fuse` is not true.
+    """
+    # members: compiled_func, arg_specs, is_boundary, quadrature_tag, fused
+
+    def can_fuse(self):
+        return not self.is_boundary and self.quadrature_tag is None
 
     @memoize_method
     def get_dependencies(self):
@@ -98,8 +161,23 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
             mod = get_interior_flux_mod(
                     self.expressions, self.flux_var_info,
                     discr, dtype)
+        else:
+            mod = get_boundary_flux_mod(
+                    self.expressions, self.flux_var_info, discr, dtype)
+
+        runner = discr.chunk_runner
+        if runner is not None:
+            gather_flux_range = mod.gather_flux_range
+
+            def gather_flux(fg, args):
+                runner(lambda start, stop:
+                        gather_flux_range(fg, args, start, stop),
+                        len(fg.face_pairs))
+
+            mod.gather_flux = gather_flux
 
-            if discr.instrumented:
+        if discr.instrumented:
+            if not self.is_boundary:
                 from hedge.tools import time_count_flop, gather_flops
                 mod.gather_flux = \
                         time_count_flop(
@@ -110,18 +188,76 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
                                 len(self.expressions)
                                 * gather_flops(discr, self.quadrature_tag)
                                 * len(self.flux_var_info.arg_names))
-
-        else:
-            mod = get_boundary_flux_mod(
-                    self.expressions, self.flux_var_info, discr, dtype)
-
-            if discr.instrumented:
+            else:
                 from pytools.log import time_and_count_function
                 mod.gather_flux = time_and_count_function(
                         mod.gather_flux, discr.gather_timer)
 
         return mod
 
+    @memoize_method
+    def get_fused_module(self, discr, dtype):
+        assert self.can_fuse()
+
+        from hedge.backends.jit.flux import get_fused_flux_lift_mod
+        mod = get_fused_flux_lift_mod(
+                self.expressions, self.flux_var_info, discr, dtype,
+                [flux_bdg.op.is_lift for flux_bdg in self.expressions])
+
+        runner = discr.chunk_runner
+        if runner is not None:
+            gather_lift_range = mod.gather_lift_range
+
+            def gather_lift(fg, args):
+                runner(lambda start, stop:
+                        gather_lift_range(fg, args, start, stop),
+                        fg.element_count())
+
+            mod.gather_lift = gather_lift
+
+        if discr.instrumented:
+            from hedge.tools import time_count_flop, gather_flops
+            mod.gather_lift = \
+                    time_count_flop(
+                            mod.gather_lift,
+                            discr.gather_timer,
+                            discr.gather_counter,
+                            discr.gather_flop_counter,
+                            len(self.expressions)
+                            * gather_flops(discr, self.quadrature_tag)
+                            * len(self.flux_var_info.arg_names))
+
+        return mod
+
+    def get_face_groups(self, discr):
+        if self.quadrature_tag is None:
+            if self.is_boundary:
+                return discr.get_boundary(self.repr_op.boundary_tag)\
+                        .face_groups
+            else:
+                return discr.face_groups
+        else:
+            if self.is_boundary:
+                return discr.get_boundary(self.repr_op.boundary_tag)\
+                        .get_quadrature_info(self.quadrature_tag).face_groups
+            else:
+                return discr.get_quadrature_info(self.quadrature_tag) \
+                        .face_groups
+
+    def get_lift_data(self, fg, flux_bdg):
+        """Return a tuple *(matrix, scaling)* with which the fluxes of
+        *flux_bdg* on the faces of *fg* are to be lifted.
+        """
+        if self.quadrature_tag is None:
+            if flux_bdg.op.is_lift:
+                return (fg.ldis_loc.lifting_matrix(),
+                        fg.local_el_inverse_jacobians)
+            else:
+                return fg.ldis_loc.multi_face_mass_matrix(), None
+        else:
+            assert not flux_bdg.op.is_lift
+            return fg.ldis_loc_quad_info.multi_face_mass_matrix(), None
+
 # }}}
 
 
@@ -169,6 +305,72 @@ class OperatorCompiler(OperatorCompilerBase):
             return OperatorCompilerBase.map_operator_binding(
                     self, expr, name_hint=name_hint)
 
+    # {{{ diff batching
+
+    @staticmethod
+    def is_input_field(expr):
+        """Return whether *expr* is an input variable or a component of one,
+        i.e. whether it is available before any instruction is executed.
+        """
+        from pymbolic.primitives import (
+                Variable, Subscript, CommonSubexpression)
+        from hedge.optemplate.primitives import ScalarParameter
+
+        while isinstance(expr, CommonSubexpression):
+            expr = expr.child
+
+        if isinstance(expr, Subscript):
+            expr = expr.aggregate
+
+        return (isinstance(expr, Variable)
+                and not isinstance(expr, ScalarParameter))
+
+    def map_ref_diff_op_binding(self, expr):
+        """Differentiate all input fields needing the same kind of
+        derivative with a single :class:`MultiFieldDiffBatchAssign`.
+        Since these fields do not depend on any computed quantity, joining
+        their derivatives cannot introduce a dependency cycle.
+        """
+        try:
+            return self.expr_to_var[expr]
+        except KeyError:
+            pass
+
+        if not self.is_input_field(expr.field):
+            return OperatorCompilerBase.map_ref_diff_op_binding(self, expr)
+
+        fields = []
+        field_to_diffs = {}
+        for diff in self.diff_ops:
+            if (diff.op.equal_except_for_axis(expr.op)
+                    and self.is_input_field(diff.field)):
+                if diff.field not in field_to_diffs:
+                    fields.append(diff.field)
+                field_to_diffs.setdefault(diff.field, []).append(diff)
+
+        if len(fields) == 1:
+            return OperatorCompilerBase.map_ref_diff_op_binding(self, expr)
+
+        names = [[self.get_var_name() for d in field_to_diffs[field]]
+                for field in fields]
+
+        self.code.append(
+                MultiFieldDiffBatchAssign(
+                    names=names,
+                    operators=[[d.op for d in field_to_diffs[field]]
+                        for field in fields],
+                    fields=[self.rec(field) for field in fields],
+                    dep_mapper_factory=self.dep_mapper_factory))
+
+        from pymbolic import var
+        for field, field_names in zip(fields, names):
+            for n, d in zip(field_names, field_to_diffs[field]):
+                self.expr_to_var[d] = var(n)
+
+        return self.expr_to_var[expr]
+
+    # }}}
+
     # {{{ flux compilation
     def make_flux_batch_assign(self, names, expressions, repr_op):
         from hedge.optemplate.operators import (
@@ -180,10 +382,22 @@ class OperatorCompiler(OperatorCompilerBase):
         else:
             quad_tag = None
 
+        is_boundary = isinstance(repr_op, BoundaryFluxOperatorBase)
+
+        if is_boundary or quad_tag is not None:
+            fused = False
+        else:
+            fused = {
+                    None: None,
+                    "split": False,
+                    "fused": True,
+                    }[self.discr.flux_engine]
+
         from hedge.backends.jit.flux import get_flux_var_info
         return CompiledFluxBatchAssign(
-                is_boundary=isinstance(repr_op, BoundaryFluxOperatorBase),
+                is_boundary=is_boundary,
                 quadrature_tag=quad_tag,
+                fused=fused,
                 names=names, expressions=expressions, repr_op=repr_op,
                 flux_var_info=get_flux_var_info(expressions),
                 dep_mapper_factory=self.dep_mapper_factory)
@@ -33,9 +33,37 @@ from pytools import memoize_method
 
 
 
+def volume_zeros(discr, buffer_pool, dtype):
+    """Return a zero volume vector of *dtype*, taken from *buffer_pool*
+    (a :class:`hedge.backends.exec_common.BufferPool`) unless that is
+    *None*.
+    """
+    if buffer_pool is None:
+        return discr.volume_zeros(dtype=dtype)
+    else:
+        return buffer_pool.zeros((len(discr),), dtype)
+
+
+
+
 class JitDifferentiator:
-    def __init__(self, discr):
+    """
+    :param runner: a :class:`hedge.backends.jit.parallel.ChunkRunner` used
+      to split each element group into chunks that are differentiated
+      concurrently, or *None* to process each element group in one call.
+    :param buffer_pool: a :class:`hedge.backends.exec_common.BufferPool`
+      from which to take the result vectors, or *None*.
+    """
+
+    def __init__(self, discr, runner=None, buffer_pool=None):
         self.discr = discr
+        self.buffer_pool = buffer_pool
+
+        if runner is None:
+            from hedge.backends.jit.parallel import SerialRunner
+            runner = SerialRunner()
+
+        self.runner = runner
 
     # {{{ code generation
     @memoize_method
@@ -93,8 +121,10 @@ class JitDifferentiator:
                     ]+[
                     Value("numpy_array<value_type>", "result%d" % i)
                     for i in range(discr.dimensions)
-                    ]
-                    )
+                    ]+[
+                    POD(numpy.uint32, "el_start"),
+                    POD(numpy.uint32, "el_stop"),
+                    ])
         # }}}
 
         # {{{ set-up
@@ -124,7 +154,10 @@ class JitDifferentiator:
             If("from_ers.size() != to_ers.size()",
                 S('throw(std::runtime_error("image and preimage element groups '
                     'do nothave the same element count"))')),
+            If("el_stop > to_ers.size()",
+                S('throw(std::runtime_error("element range out of bounds"))')),
             Line(),
+            Line("Py_BEGIN_ALLOW_THREADS"),
             make_it("field"),
             ]+[
             make_it("result%d" % i, is_const=False)
@@ -134,8 +167,8 @@ class JitDifferentiator:
         # }}}
 
         # {{{ computation
-            For("element_number_t eg_el_nr = 0",
-                "eg_el_nr < to_ers.size()",
+            For("element_number_t eg_el_nr = el_start",
+                "eg_el_nr < el_stop",
                 "++eg_el_nr",
                 Block([
                     Initializer(
@@ -172,7 +205,8 @@ class JitDifferentiator:
                             ])
                         )
                     ])
-                )
+                ),
+            Line("Py_END_ALLOW_THREADS"),
             ])
         # }}}
 
@@ -183,7 +217,15 @@ class JitDifferentiator:
         #print mod.generate()
         #raw_input()
 
-        compiled_func = mod.compile(self.discr.toolchain).diff
+        diff_range = discr.compile_kernel_module(mod,
+                extra_key=(str(dtype), shape)).diff
+
+        el_count = len(elgroup.ranges)
+        runner = self.runner
+
+        def compiled_func(*args):
+            runner(lambda start, stop: diff_range(*(args + (start, stop))),
+                    el_count)
 
         if self.discr.instrumented:
             from hedge.tools import time_count_flop
@@ -209,7 +251,7 @@ class JitDifferentiator:
         # pick a "representative operator"
         rep_op = operators[0]
 
-        result = [self.discr.volume_zeros(dtype=field.dtype) 
+        result = [volume_zeros(self.discr, self.buffer_pool, field.dtype)
                 for i in range(self.discr.dimensions)]
         from hedge.tools import is_zero
         if not is_zero(field):
@@ -228,4 +270,109 @@ class JitDifferentiator:
         return [result[op.rst_axis] for op in operators]
     # }}}
 
+
+class NumpyDifferentiator(object):
+    """Computes reference derivatives using matrix-matrix products in
+    :mod:`numpy`, without any generated code.
+
+    The differentiation matrices for all requested axes are stacked, so that
+    each element group needs only a single product, even when several fields
+    are differentiated at once through :meth:`diff_many`.
+
+    :param buffer_pool: a :class:`hedge.backends.exec_common.BufferPool`
+      from which to take the result vectors, or *None*.
+    """
+
+    def __init__(self, discr, buffer_pool=None):
+        self.discr = discr
+        self.buffer_pool = buffer_pool
+        self.stacked_matrix_cache = {}
+
+    def get_stacked_matrix(self, matrices, dtype):
+        """Return the matrices in the list *matrices* stacked on top of each
+        other and converted to *dtype*.
+        """
+        key = id(matrices[0]), dtype
+        try:
+            orig_matrix, stacked = self.stacked_matrix_cache[key]
+        except KeyError:
+            pass
+        else:
+            if orig_matrix is matrices[0]:
+                return stacked
+
+        stacked = numpy.asarray(numpy.vstack(matrices), dtype=dtype, order="C")
+        self.stacked_matrix_cache[key] = matrices[0], stacked
+        return stacked
+
+    def diff_many(self, operators, fields):
+        """
+        :param operators: a list containing, for each entry in *fields*, a
+          list of reference differentiation operators to apply to it. All
+          operators must be equal except for their axis.
+        :returns: a list containing, for each entry in *fields*, a list of
+          derivatives in the order of the corresponding entry in *operators*.
+        """
+        discr = self.discr
+
+        from hedge.tools import is_zero
+        from pytools import common_dtype
+        nonzero_fields = [(i, field) for i, field in enumerate(fields)
+                if not is_zero(field)]
+        if nonzero_fields:
+            dtype = common_dtype(field.dtype for i, field in nonzero_fields)
+        else:
+            dtype = discr.default_scalar_type
+
+        results = [[volume_zeros(discr, self.buffer_pool, dtype)
+                for op in field_ops]
+                for field_ops in operators]
+
+        if not nonzero_fields:
+            return results
+
+        if discr.instrumented:
+            from hedge.tools import diff_rst_flops
+            op_count = sum(len(operators[i]) for i, field in nonzero_fields)
+            discr.diff_counter.add(op_count)
+            discr.diff_flop_counter.add(op_count*diff_rst_flops(discr))
+            sub_timer = discr.diff_timer.start_sub_timer()
+
+        # pick a "representative operator"
+        rep_op = operators[nonzero_fields[0][0]][0]
+
+        for eg in discr.element_groups:
+            in_ranges = rep_op.preimage_ranges(eg)
+            out_ranges = eg.ranges
+            el_count = len(out_ranges)
+
+            matrices = rep_op.matrices(eg)
+            stacked = self.get_stacked_matrix(matrices, dtype)
+            out_size, in_size = matrices[0].shape
+
+            in_slice = slice(in_ranges.start, in_ranges.start+el_count*in_size)
+            out_slice = slice(out_ranges.start,
+                    out_ranges.start+el_count*out_size)
+
+            # (field_count*el_count) x in_size
+            block = numpy.vstack([
+                field[in_slice].reshape(el_count, in_size)
+                for i, field in nonzero_fields])
+
+            derivatives = numpy.dot(block, stacked.T).reshape(
+                    len(nonzero_fields), el_count, len(matrices), out_size)
+
+            for field_nr, (i, field) in enumerate(nonzero_fields):
+                for op, result in zip(operators[i], results[i]):
+                    result[out_slice].reshape(el_count, out_size)[:] = \
+                            derivatives[field_nr, :, op.rst_axis]
+
+        if discr.instrumented:
+            sub_timer.stop().submit()
+
+        return results
+
+    def __call__(self, operators, field):
+        return self.diff_many([operators], [field])[0]
+
 # vim: foldmethod=marker
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Generated-code elementwise linear operators that can be split into
+chunks of elements for threaded execution."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+import numpy
+from pytools import memoize_method
+
+
+
+
+class JitElementwiseOperator(object):
+    """Applies a (possibly elementwise scaled) matrix to each element of an
+    element group, like :func:`hedge._internal.perform_elwise_operator` and
+    :func:`hedge._internal.perform_elwise_scaled_operator`, but in generated
+    code that releases the global interpreter lock and can work on a
+    subrange of the elements.
+
+    :param runner: a :class:`hedge.backends.jit.parallel.ChunkRunner` used
+      to split the elements into chunks that are processed concurrently, or
+      *None* to process all elements in one call.
+    """
+
+    def __init__(self, discr, runner=None):
+        self.discr = discr
+
+        if runner is None:
+            from hedge.backends.jit.parallel import SerialRunner
+            runner = SerialRunner()
+
+        self.runner = runner
+
+    @memoize_method
+    def make_operator(self, dtype, shape, with_scale):
+        from cgen import (
+                FunctionDeclaration, FunctionBody, Typedef,
+                Const, Reference, Value, POD,
+                Statement, Include, Line, Block, Initializer,
+                For, If, Define)
+
+        from codepy.bpl import BoostPythonModule
+        mod = BoostPythonModule()
+
+        S = Statement
+        mod.add_to_preamble([
+            Include("hedge/volume_operators.hpp"),
+            ])
+
+        mod.add_to_module([
+            S("namespace ublas = boost::numeric::ublas"),
+            S("using namespace hedge"),
+            S("using namespace pyublas"),
+            Line(),
+            Define("ROW_COUNT", shape[0]),
+            Define("COL_COUNT", shape[1]),
+            Line(),
+            Typedef(POD(dtype, "value_type")),
+            ])
+
+        fdecl = FunctionDeclaration(
+                Value("void", "apply"),
+                [
+                Const(Reference(Value("uniform_element_ranges", "from_ers"))),
+                Const(Reference(Value("uniform_element_ranges", "to_ers"))),
+                Value("ublas::matrix<value_type>", "matrix"),
+                Value("numpy_array<value_type>", "field"),
+                Value("numpy_array<value_type>", "result"),
+                ]+[
+                Const(Reference(Value("numpy_array<double>", "scale_factors")))
+                for i in range(int(with_scale))
+                ]+[
+                POD(numpy.uint32, "el_start"),
+                POD(numpy.uint32, "el_stop"),
+                ])
+
+        if with_scale:
+            update = S("result_it[to_el_base+i] += "
+                    "value_type(scale_factors_it[el_nr]) * tmp")
+        else:
+            update = S("result_it[to_el_base+i] += tmp")
+
+        fbody = Block([
+            If("ROW_COUNT != matrix.size1() || COL_COUNT != matrix.size2()",
+                S('throw(std::runtime_error("unexpected matrix size"))')),
+            If("ROW_COUNT != to_ers.el_size()",
+                S('throw(std::runtime_error("unsupported image element size"))')),
+            If("COL_COUNT != from_ers.el_size()",
+                S('throw(std::runtime_error("unsupported preimage element size"))')),
+            If("from_ers.size() != to_ers.size()",
+                S('throw(std::runtime_error('
+                    '"element ranges have different sizes"))')),
+            If("el_stop > to_ers.size()",
+                S('throw(std::runtime_error("element range out of bounds"))')),
+            Line(),
+            Line("Py_BEGIN_ALLOW_THREADS"),
+            Initializer(
+                Value("numpy_array<value_type>::const_iterator", "field_it"),
+                "field.begin()"),
+            Initializer(
+                Value("numpy_array<value_type>::iterator", "result_it"),
+                "result.begin()"),
+            ]+[
+            Initializer(
+                Value("numpy_array<double>::const_iterator", "scale_factors_it"),
+                "scale_factors.begin()")
+            for i in range(int(with_scale))
+            ]+[
+            Line(),
+            For("element_number_t el_nr = el_start",
+                "el_nr < el_stop",
+                "++el_nr",
+                Block([
+                    Initializer(
+                        Value("node_number_t", "from_el_base"),
+                        "from_ers.start() + el_nr*COL_COUNT"),
+                    Initializer(
+                        Value("node_number_t", "to_el_base"),
+                        "to_ers.start() + el_nr*ROW_COUNT"),
+                    Line(),
+                    For("unsigned i = 0",
+                        "i < ROW_COUNT",
+                        "++i",
+                        Block([
+                            Initializer(Value("value_type", "tmp"), 0),
+                            For("unsigned j = 0",
+                                "j < COL_COUNT",
+                                "++j",
+                                S("tmp += matrix(i, j)*field_it[from_el_base+j]")),
+                            update,
+                            ]))
+                    ])),
+            Line("Py_END_ALLOW_THREADS"),
+            ])
+
+        mod.add_function(FunctionBody(fdecl, fbody))
+
+        return self.discr.compile_kernel_module(mod,
+                extra_key=(str(dtype), shape, with_scale)).apply
+
+    def __call__(self, src_ranges, dest_ranges, matrix, coefficients,
+            field, out):
+        """Add the result of applying *matrix* to each element of *field*,
+        scaled by the corresponding entry of *coefficients* unless that is
+        *None*, to *out*.
+        """
+        apply = self.make_operator(field.dtype, matrix.shape,
+                coefficients is not None)
+
+        args = [src_ranges, dest_ranges, matrix, field, out]
+        if coefficients is not None:
+            args.append(coefficients)
+
+        def apply_range(start, stop):
+            apply(*(args + [start, stop]))
+
+        self.runner(apply_range, len(dest_ranges))
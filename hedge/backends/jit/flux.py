@@ -236,12 +236,94 @@ def get_flux_toolchain(discr, fluxes):
 
 
 
+def add_ranged_functions(mod, name, prelude, item_count, item_body):
+    """Add the entry points *name(fg, args)* and
+    *name_range(fg, args, start, stop)* to *mod*. Both run *item_body* for
+    a range of work items numbered by *item_nr*: the former for all
+    *item_count* of them, the latter only for those numbered *start* up to
+    *stop*. The latter releases the global interpreter lock while doing
+    so, so that disjoint ranges may be processed concurrently.
+
+    :param prelude: statements run once per call, with *fg* and *args*
+      in scope.
+    :param item_count: a C expression for the number of work items.
+    """
+    from cgen import (
+            FunctionDeclaration, FunctionBody,
+            Const, Reference, Value, POD,
+            Statement, Line, Block, For)
+    import numpy
+
+    S = Statement
+
+    fg_arg = Const(Reference(
+        Value("face_group<face_pair<straight_face> >", "fg")))
+    args_arg = Reference(Value("arg_struct", "args"))
+    range_args = [
+            POD(numpy.uint32, "start"),
+            POD(numpy.uint32, "stop")]
+
+    mod.add_to_module([
+        FunctionBody(
+            FunctionDeclaration(
+                Value("void", name+"_impl"),
+                [fg_arg, args_arg]+range_args),
+            Block(prelude + [
+                Line(),
+                For("unsigned item_nr = start",
+                    "item_nr < stop",
+                    "++item_nr",
+                    Block(item_body))
+                ])),
+        Line(),
+        ])
+
+    mod.add_function(FunctionBody(
+        FunctionDeclaration(Value("void", name), [fg_arg, args_arg]),
+        Block([
+            S("%s_impl(fg, args, 0, %s)" % (name, item_count)),
+            ])))
+
+    mod.add_function(FunctionBody(
+        FunctionDeclaration(Value("void", name+"_range"),
+            [fg_arg, args_arg]+range_args),
+        Block([
+            Line("Py_BEGIN_ALLOW_THREADS"),
+            S("%s_impl(fg, args, start, stop)" % name),
+            Line("Py_END_ALLOW_THREADS"),
+            ])))
+
+
+
+
+def add_gather_functions(mod, prelude, fp_body):
+    """Add the entry points *gather_flux(fg, args)* and
+    *gather_flux_range(fg, args, fp_start, fp_stop)* to *mod*, the latter
+    processing only the face pairs numbered *fp_start* up to *fp_stop*.
+    Since every face of every element belongs to exactly one face pair,
+    disjoint ranges never write to the same face flux entry.
+
+    :param fp_body: statements run for each face pair *fp*.
+    """
+    from cgen import Const, Reference, Value, Line, Initializer
+
+    add_ranged_functions(mod, "gather_flux", prelude,
+            "fg.face_pairs.size()", [
+                Initializer(
+                    Const(Reference(Value("face_pair<straight_face>", "fp"))),
+                    "fg.face_pairs[item_nr]"),
+                Line(),
+                ] + fp_body)
+
+
+
+
 def get_interior_flux_mod(fluxes, fvi, discr, dtype):
     from cgen import \
             FunctionDeclaration, FunctionBody, \
             Const, Reference, Value, MaybeUnused, Typedef, POD, \
             Statement, Include, Line, Block, Initializer, Assign, \
-            CustomLoop, For, Struct
+            For, Struct
 
     from codepy.bpl import BoostPythonModule
     mod = BoostPythonModule()
@@ -282,13 +364,6 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
     mod.add_struct(arg_struct, "ArgStruct")
     mod.add_to_module([Line()])
 
-    fdecl = FunctionDeclaration(
-            Value("void", "gather_flux"),
-            [
-                Const(Reference(Value("face_group<face_pair<straight_face> >", "fg"))),
-                Reference(Value("arg_struct", "args"))
-                ])
-
     from pymbolic.mapper.stringifier import PREC_PRODUCT
 
     def gen_flux_code():
@@ -308,7 +383,7 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
             Initializer(Value("value_type", cse_name), cse_str)
             for cse_name, cse_str in f2cm.cse_name_list] + result
 
-    fbody = Block([
+    prelude = [
         Initializer(
             Const(Value("numpy_array<value_type>::iterator", "fof%d_it" % i)),
             "args.flux%d_on_faces.begin()" % i)
@@ -318,10 +393,9 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
             Const(Value("numpy_array<value_type>::const_iterator", "%s_it" % arg_name)),
             "args.%s.begin()" % arg_name)
         for arg_name in fvi.arg_names
-        ]+[
-        Line(),
-        CustomLoop("BOOST_FOREACH(const face_pair<straight_face> &fp, fg.face_pairs)", Block(
-            list(flatten([
+        ]
+
+    fp_body = list(flatten([
             Initializer(Value("node_number_t", "%s_ebi" % where),
                 "fp.%s.el_base_index" % where),
             Initializer(Value("index_lists_t::const_iterator", "%s_idx_list" % where),
@@ -342,22 +416,250 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
                 "++i",
                 Block(
                     [
-                    Initializer(MaybeUnused(Value("node_number_t", "%s_idx" % where)),
+                    Initializer(MaybeUnused(
+                        Value("node_number_t", "%s_idx" % where)),
                         "%(where)s_ebi + %(where)s_idx_list[i]"
                         % {"where": where})
                     for where in ["int_side", "ext_side"]
                     ]+gen_flux_code()
                     )
                 )
-            ]))
-        ])
-    mod.add_function(FunctionBody(fdecl, fbody))
+            ]
+
+    add_gather_functions(mod, prelude, fp_body)
 
     #print "----------------------------------------------------------------"
     #print mod.generate()
     #raw_input("[Enter]")
 
-    return mod.compile(get_flux_toolchain(discr, fluxes))
+    return discr.compile_kernel_module(mod,
+            get_flux_toolchain(discr, fluxes), extra_key=(str(dtype),))
+
+
+
+
+NO_FACE_PAIR = 0xffffffff
+
+
+def get_element_face_pair_table(fg):
+    """Return an array that, for face *face_id* of local element *el* of
+    the interior face group *fg*, contains at index
+    *el*fg.face_count+face_id* the number *2*fp_nr+side* of the face pair
+    containing it, where *side* is 0 for the interior side and 1 for the
+    exterior side. Faces not part of any face pair are marked with
+    :data:`NO_FACE_PAIR`.
+    """
+    import numpy
+    result = numpy.empty(fg.element_count()*fg.face_count, dtype=numpy.uint32)
+    result.fill(NO_FACE_PAIR)
+
+    for fp_nr, fp in enumerate(fg.face_pairs):
+        for side_nr, side in enumerate([fp.int_side, fp.ext_side]):
+            result[side.local_el_number*fg.face_count + side.face_id] = \
+                    2*fp_nr + side_nr
+
+    return result
+
+
+
+
+def get_fused_flux_lift_mod(fluxes, fvi, discr, dtype, with_scale):
+    """Generate a module that computes interior fluxes and lifts them in one
+    pass over the elements of a face group, without storing the fluxes on
+    all faces in between.
+
+    Its entry points *gather_lift(fg, args)* and
+    *gather_lift_range(fg, args, el_start, el_stop)* expect, in addition to
+    the arguments of the module from :func:`get_interior_flux_mod`,
+    *el_face_pairs* from :func:`get_element_face_pair_table` and, for each
+    flux, the flattened lift matrix *lift_matrix%d*, the output vector
+    *result%d* and, if the corresponding entry of *with_scale* is true,
+    elementwise post-scaling factors *scaling%d*.
+    """
+    from cgen import (
+            Const, Reference, Value, MaybeUnused, Typedef, POD,
+            Statement, Include, Line, Block, Initializer, Assign,
+            For, If, Struct)
+
+    from codepy.bpl import BoostPythonModule
+    mod = BoostPythonModule()
+
+    from pytools import to_uncomplex_dtype, flatten
+
+    S = Statement
+    mod.add_to_preamble([
+        Include("vector"),
+        Include("algorithm"),
+        Line(),
+        Include("hedge/face_operators.hpp"),
+        ])
+
+    mod.add_to_module([
+        S("using namespace hedge"),
+        S("using namespace pyublas"),
+        Line(),
+        Typedef(POD(dtype, "value_type")),
+        Typedef(POD(to_uncomplex_dtype(dtype), "uncomplex_type")),
+        Line(),
+        ])
+
+    flux_indices = range(len(fluxes))
+
+    arg_struct = Struct("arg_struct", [
+        Value("numpy_array<value_type>", arg_name)
+        for arg_name in fvi.arg_names
+        ]+[
+        Value("value_type" if scalar_par.is_complex else "uncomplex_type",
+            "_scalar_arg_%d" % i)
+        for i, scalar_par in enumerate(fvi.scalar_parameters)
+        ]+[
+        Value("numpy_array<npy_uint32>", "el_face_pairs"),
+        ]+[
+        Value("numpy_array<uncomplex_type>", "lift_matrix%d" % i)
+        for i in flux_indices
+        ]+[
+        Value("numpy_array<value_type>", "result%d" % i)
+        for i in flux_indices
+        ]+[
+        Value("numpy_array<double>", "scaling%d" % i)
+        for i in flux_indices if with_scale[i]
+        ])
+
+    mod.add_struct(arg_struct, "ArgStruct")
+    mod.add_to_module([Line()])
+
+    from pymbolic.mapper.stringifier import PREC_PRODUCT
+
+    def gen_flux_code(is_flipped, tgt_idx):
+        f2cm = FluxToCodeMapper()
+
+        result = [
+                Assign("fof%d[face_base+%s]" % (flux_idx, tgt_idx),
+                    "uncomplex_type(fp.int_side.face_jacobian) * " +
+                    flux_to_code(f2cm, is_flipped, flux_idx, fvi,
+                        flux.op.flux, PREC_PRODUCT))
+                for flux_idx, flux in enumerate(fluxes)]
+
+        return [
+            Initializer(Value("value_type", cse_name), cse_str)
+            for cse_name, cse_str in f2cm.cse_name_list] + result
+
+    def gen_face_loop(is_flipped, tgt_idx):
+        return For(
+                "unsigned i = 0",
+                "i < face_length",
+                "++i",
+                Block([
+                    Initializer(MaybeUnused(Value("node_number_t", "%s_idx" % where)),
+                        "%(where)s_ebi + %(where)s_idx_list[i]"
+                        % {"where": where})
+                    for where in ["int_side", "ext_side"]
+                    ]+gen_flux_code(is_flipped, tgt_idx)))
+
+    def make_it(name, tpname="value_type", is_const=True):
+        if is_const:
+            const = "const_"
+        else:
+            const = ""
+
+        return Initializer(
+            Const(Value("numpy_array<%s>::%siterator" % (tpname, const),
+                name+"_it")),
+            "args.%s.begin()" % name)
+
+    prelude = [
+        make_it(arg_name) for arg_name in fvi.arg_names
+        ]+[
+        make_it("el_face_pairs", "npy_uint32"),
+        ]+[
+        make_it("lift_matrix%d" % i, "uncomplex_type")
+        for i in flux_indices
+        ]+[
+        make_it("result%d" % i, is_const=False)
+        for i in flux_indices
+        ]+[
+        make_it("scaling%d" % i, "double")
+        for i in flux_indices if with_scale[i]
+        ]+[
+        Line(),
+        Initializer(Const(Value("unsigned", "face_length")),
+            "fg.face_length()"),
+        Initializer(Const(Value("unsigned", "el_fof_size")),
+            "fg.face_count*face_length"),
+        Initializer(Const(Value("unsigned", "dofs_per_el")),
+            "args.lift_matrix0.size()/el_fof_size"),
+        Line(),
+        ]+[
+        Initializer(Value("std::vector<value_type>", "fof%d" % i),
+            "el_fof_size")
+        for i in flux_indices
+        ]
+
+    el_body = [
+            S("std::fill(fof%d.begin(), fof%d.end(), value_type(0))" % (i, i))
+            for i in flux_indices
+            ]+[
+            Line(),
+            For("unsigned face_nr = 0",
+                "face_nr < fg.face_count",
+                "++face_nr",
+                Block([
+                    Initializer(Const(Value("npy_uint32", "fp_side")),
+                        "el_face_pairs_it[item_nr*fg.face_count + face_nr]"),
+                    If("fp_side == %du" % NO_FACE_PAIR, S("continue")),
+                    Line(),
+                    Initializer(
+                        Const(Reference(Value("face_pair<straight_face>", "fp"))),
+                        "fg.face_pairs[fp_side >> 1]"),
+                    Initializer(Const(Value("node_number_t", "face_base")),
+                        "face_length*face_nr"),
+                    ]+list(flatten([
+                        Initializer(Value("node_number_t", "%s_ebi" % where),
+                            "fp.%s.el_base_index" % where),
+                        Initializer(
+                            Value("index_lists_t::const_iterator",
+                                "%s_idx_list" % where),
+                            "fg.index_list(fp.%s.face_index_list_number)" % where),
+                        ]
+                        for where in ["int_side", "ext_side"]))+[
+                    Line(),
+                    If("(fp_side & 1) == 0",
+                        Block([gen_face_loop(False, "i")]),
+                        Block([
+                            Initializer(
+                                Value("index_lists_t::const_iterator",
+                                    "ext_native_write_map"),
+                                "fg.index_list(fp.ext_native_write_map)"),
+                            gen_face_loop(True, "ext_native_write_map[i]"),
+                            ])),
+                    ])),
+            Line(),
+            Initializer(Const(Value("node_number_t", "dest_el_base")),
+                "fg.local_el_write_base[item_nr]"),
+            ]+[
+            For("unsigned i = 0",
+                "i < dofs_per_el",
+                "++i",
+                Block([
+                    Initializer(Value("value_type", "tmp"), 0),
+                    For("unsigned j = 0",
+                        "j < el_fof_size",
+                        "++j",
+                        S("tmp += lift_matrix%d_it[i*el_fof_size+j]"
+                            "*fof%d[j]" % (flux_idx, flux_idx))),
+                    Assign("result%d_it[dest_el_base+i]" % flux_idx,
+                        "tmp * value_type(scaling%d_it[item_nr])" % flux_idx
+                        if with_scale[flux_idx] else "tmp"),
+                    ]))
+            for flux_idx in flux_indices
+            ]
+
+    add_ranged_functions(mod, "gather_lift", prelude,
+            "fg.element_count()", el_body)
+
+    return discr.compile_kernel_module(mod,
+            get_flux_toolchain(discr, fluxes),
+            extra_key=(str(dtype), tuple(with_scale)))
 
 
 
@@ -367,7 +669,7 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
             FunctionDeclaration, FunctionBody, Typedef, Struct, \
             Const, Reference, Value, POD, MaybeUnused, \
             Statement, Include, Line, Block, Initializer, Assign, \
-            CustomLoop, For
+            For
 
     from pytools import to_uncomplex_dtype, flatten
 
@@ -403,13 +705,6 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
     mod.add_struct(arg_struct, "ArgStruct")
     mod.add_to_module([Line()])
 
-    fdecl = FunctionDeclaration(
-                Value("void", "gather_flux"),
-                [
-                    Const(Reference(Value("face_group<face_pair<straight_face> >" , "fg"))),
-                    Reference(Value("arg_struct", "args"))
-                    ])
-
     from pymbolic.mapper.stringifier import PREC_PRODUCT
 
     def gen_flux_code():
@@ -426,7 +721,7 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
             Initializer(Value("value_type", cse_name), cse_str)
             for cse_name, cse_str in f2cm.cse_name_list] + result
 
-    fbody = Block([
+    prelude = [
         Initializer(
             Const(Value("numpy_array<value_type>::iterator", "fof%d_it" % i)),
             "args.flux%d_on_faces.begin()" % i)
@@ -437,10 +732,9 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
                 "%s_it" % arg_name)),
             "args.%s.begin()" % arg_name)
         for arg_name in fvi.arg_names
-        ]+[
-        Line(),
-        CustomLoop("BOOST_FOREACH(const face_pair<straight_face> &fp, fg.face_pairs)", Block(
-            list(flatten([
+        ]
+
+    fp_body = list(flatten([
             Initializer(Value("node_number_t", "%s_ebi" % where),
                 "fp.%s.el_base_index" % where),
             Initializer(Value("index_lists_t::const_iterator", "%s_idx_list" % where),
@@ -468,13 +762,13 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
                     ]+gen_flux_code()
                     )
                 )
-            ]))
-        ])
+            ]
 
-    mod.add_function(FunctionBody(fdecl, fbody))
+    add_gather_functions(mod, prelude, fp_body)
 
     #print "----------------------------------------------------------------"
     #print mod.generate()
     #raw_input("[Enter]")
 
-    return mod.compile(get_flux_toolchain(discr, fluxes))
+    return discr.compile_kernel_module(mod,
+            get_flux_toolchain(discr, fluxes), extra_key=(str(dtype),))
@@ -27,14 +27,54 @@ THE SOFTWARE.
 
 
 
+import numpy
 from pytools import memoize_method
 
 
 
 
-class JitLifter:
+class LifterBase(object):
     def __init__(self, discr):
         self.discr = discr
+        self.cast_matrix_cache = {}
+
+    def get_cast_matrix(self, matrix, dtype):
+        """Return *matrix* converted to *dtype*, converting only once for
+        each matrix and dtype.
+        """
+        key = id(matrix), dtype
+        try:
+            orig_matrix, cast_matrix = self.cast_matrix_cache[key]
+        except KeyError:
+            pass
+        else:
+            if orig_matrix is matrix:
+                return cast_matrix
+
+        # keep a reference to the original matrix so that its id
+        # cannot be reused for a different one
+        cast_matrix = numpy.asarray(matrix, dtype=dtype, order="C")
+        self.cast_matrix_cache[key] = matrix, cast_matrix
+        return cast_matrix
+
+
+
+
+class JitLifter(LifterBase):
+    """
+    :param runner: a :class:`hedge.backends.jit.parallel.ChunkRunner` used
+      to split the elements of each face group into chunks that are lifted
+      concurrently, or *None* to lift each face group in one call.
+    """
+
+    def __init__(self, discr, runner=None):
+        LifterBase.__init__(self, discr)
+
+        if runner is None:
+            from hedge.backends.jit.parallel import SerialRunner
+            runner = SerialRunner()
+
+        self.runner = runner
 
     @memoize_method
     def make_lift(self, fgroup, with_scale, dtype):
@@ -89,8 +129,10 @@ class JitLifter:
                     Value("numpy_array<value_type>", "result")
                     ]+if_(with_scale,
                         Const(Reference(Value("numpy_array<double>",
-                            "elwise_post_scaling"))))
-                    )
+                            "elwise_post_scaling"))))+[
+                    POD(numpy.uint32, "el_start"),
+                    POD(numpy.uint32, "el_stop"),
+                    ])
 
         def make_it(name, is_const=True, tpname="value_type"):
             if is_const:
@@ -103,12 +145,13 @@ class JitLifter:
                 "%s.begin()" % name)
 
         fbody = Block([
+            Line("Py_BEGIN_ALLOW_THREADS"),
             make_it("field"),
             make_it("result", is_const=False),
             ]+if_(with_scale, make_it("elwise_post_scaling", tpname="double"))+[
             Line(),
-            For("unsigned fg_el_nr = 0",
-                "fg_el_nr < fg.element_count()",
+            For("unsigned fg_el_nr = el_start",
+                "fg_el_nr < el_stop",
                 "++fg_el_nr",
                 Block([
                     Initializer(
@@ -132,13 +175,14 @@ class JitLifter:
                             Line(),
                             ]+if_(with_scale,
                                 Assign("result_it[dest_el_base+i]",
-                                    "tmp * value_type(*elwise_post_scaling_it)"),
+                                    "tmp * value_type("
+                                    "elwise_post_scaling_it[fg_el_nr])"),
                                 Assign("result_it[dest_el_base+i]", "tmp"))
                             )
                         ),
-                    ]+if_(with_scale, S("elwise_post_scaling_it++"))
-                    )
-                )
+                    ])
+                ),
+            Line("Py_END_ALLOW_THREADS"),
             ])
 
         mod.add_function(FunctionBody(fdecl, fbody))
@@ -147,16 +191,81 @@ class JitLifter:
         #print FunctionBody(fdecl, fbody)
         #raw_input()
 
-        return mod.compile(self.discr.toolchain).lift
+        return discr.compile_kernel_module(mod,
+                extra_key=(str(dtype), with_scale)).lift
 
     def __call__(self, fgroup, matrix, scaling, field, out):
         from pytools import to_uncomplex_dtype
         uncomplex_dtype = to_uncomplex_dtype(field.dtype)
-        args = [fgroup, matrix.astype(uncomplex_dtype), field, out]
+        args = [fgroup, self.get_cast_matrix(matrix, uncomplex_dtype),
+                field, out]
 
         if scaling is not None:
             args.append(scaling)
 
-        self.make_lift(fgroup,
+        lift = self.make_lift(fgroup,
                 scaling is not None,
-                field.dtype)(*args)
+                field.dtype)
+
+        def lift_range(start, stop):
+            lift(*(args + [start, stop]))
+
+        self.runner(lift_range, fgroup.element_count())
+
+
+
+
+class GemmLifter(LifterBase):
+    """Performs the lift of a whole face group with a single matrix-matrix
+    product, by viewing the face flux buffer as an array of shape
+    *(element_count, face_count*face_length)*.
+    """
+
+    @memoize_method
+    def get_write_info(self, fgroup, dofs_per_el):
+        """Return a tuple *(start, indices)*. If the elements of *fgroup*
+        occupy a contiguous, ascending range of the volume vector, *start*
+        is its first index and *indices* is *None*. Otherwise, *start* is
+        *None* and *indices* is an integer array of shape
+        *(element_count, dofs_per_el)* of destination indices.
+        """
+        write_base = numpy.asarray(fgroup.local_el_write_base, dtype=numpy.intp)
+
+        if len(write_base) and (
+                numpy.diff(write_base) == dofs_per_el).all():
+            return int(write_base[0]), None
+        else:
+            return None, (write_base[:, numpy.newaxis]
+                    + numpy.arange(dofs_per_el, dtype=numpy.intp))
+
+    def __call__(self, fgroup, matrix, scaling, field, out):
+        el_count = fgroup.element_count()
+        if el_count == 0:
+            return
+
+        cast_matrix = self.get_cast_matrix(matrix, field.dtype)
+        dofs_per_el, face_dofs_per_el = cast_matrix.shape
+
+        fluxes = field.reshape(el_count, face_dofs_per_el)
+
+        if scaling is not None:
+            # Scaling the rows of the fluxes scales the rows of the
+            # product, so that no pass over the result is needed after it.
+            fluxes = numpy.multiply(fluxes, scaling[:, numpy.newaxis],
+                    out=numpy.empty_like(fluxes))
+
+        start, indices = self.get_write_info(fgroup, dofs_per_el)
+        in_place = start is not None and out.dtype == field.dtype
+
+        if in_place:
+            # write the product straight into the output vector
+            result = out[start:start+el_count*dofs_per_el] \
+                    .reshape(el_count, dofs_per_el)
+            numpy.dot(fluxes, cast_matrix.T, out=result)
+        else:
+            result = numpy.dot(fluxes, cast_matrix.T)
+
+        if indices is not None:
+            out[indices] = result
+        elif not in_place:
+            out[start:start+el_count*dofs_per_el] = result.ravel()
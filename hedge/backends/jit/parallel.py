@@ -0,0 +1,125 @@
+"""Element- and face-pair-parallel execution of compiled kernels."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+DEFAULT_CHUNK_SIZE = 256
+
+
+
+
+class SerialRunner(object):
+    """Processes a range of work items in a single call.
+
+    Has the same interface as :class:`ChunkRunner`.
+    """
+
+    def __call__(self, func, count):
+        if count:
+            func(0, count)
+
+    def close(self):
+        pass
+
+
+
+
+class ChunkRunner(object):
+    """Splits a range of work items (elements, face pairs) into chunks
+    and processes them on a pool of threads.
+
+    The kernels run by this class release the global interpreter lock and
+    write to disjoint parts of their output for disjoint chunks. Since the
+    chunk boundaries depend only on *chunk_size*, not on *thread_count*,
+    the result does not depend on the number of threads.
+
+    :ivar progress_hook: if not *None*, a function of no arguments that
+      is called on the calling thread between chunks, or, with more than
+      one thread, every *poll_interval* seconds while the chunks are
+      processed. Used to make progress on outstanding messages during
+      long computations.
+    """
+
+    def __init__(self, thread_count, chunk_size=DEFAULT_CHUNK_SIZE,
+            poll_interval=1e-4):
+        if thread_count < 1:
+            raise ValueError("thread_count must be positive")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+
+        self.thread_count = thread_count
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.progress_hook = None
+
+        if thread_count > 1:
+            from multiprocessing.pool import ThreadPool
+            self.pool = ThreadPool(thread_count)
+        else:
+            self.pool = None
+
+    def chunks(self, count):
+        """Return a list of tuples *(start, stop)* covering
+        *range(count)*.
+        """
+        return [(start, min(start+self.chunk_size, count))
+                for start in xrange(0, count, self.chunk_size)]
+
+    def __call__(self, func, count):
+        """Call *func(start, stop)* for each of the :meth:`chunks` of
+        *count* work items and return once all calls have finished.
+        """
+        chunks = self.chunks(count)
+
+        progress_hook = self.progress_hook
+
+        if self.thread_count == 1 or len(chunks) <= 1:
+            for i, (start, stop) in enumerate(chunks):
+                if i and progress_hook is not None:
+                    progress_hook()
+                func(start, stop)
+            return
+
+        if self.pool is None:
+            raise RuntimeError("chunk runner has been closed")
+
+        if progress_hook is None:
+            self.pool.map(lambda chunk: func(*chunk), chunks)
+        else:
+            result = self.pool.map_async(lambda chunk: func(*chunk), chunks)
+            while not result.ready():
+                progress_hook()
+                result.wait(self.poll_interval)
+
+            # re-raises exceptions from the chunks
+            result.get()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -34,21 +34,76 @@ from hedge.backends.vector_expr import CompiledVectorExpressionBase
 
 
 
+class _CachedElementwiseKernel(object):
+    """Calls an elementwise kernel module generated by
+    :func:`codepy.elementwise.get_elwise_module_descriptor` and built
+    through a :class:`hedge.backends.jit.cache.KernelCache`. Takes the
+    same arguments as :class:`codepy.elementwise.ElementwiseKernel`.
+    """
+
+    def __init__(self, kernel_cache, arguments, operation,
+            name="kernel", toolchain=None):
+        if toolchain is None:
+            from codepy.toolchain import guess_toolchain
+            toolchain = guess_toolchain()
+
+        from codepy.libraries import add_pyublas
+        toolchain = toolchain.copy()
+        add_pyublas(toolchain)
+
+        self.arguments = arguments
+        self.module = kernel_cache.compile(
+                codepy.elementwise.get_elwise_module_descriptor(
+                    arguments, operation, name),
+                toolchain)
+        self.func = getattr(self.module, name)
+
+        self.vec_arg_indices = [i for i, arg in enumerate(arguments)
+                if isinstance(arg, codepy.elementwise.VectorArg)]
+        if not self.vec_arg_indices:
+            raise ValueError("elementwise kernels need at least one "
+                    "vector argument")
+
+    def __call__(self, *args):
+        from pytools import single_valued
+        size = single_valued(args[i].size for i in self.vec_arg_indices)
+
+        arg_struct = self.module.ArgStruct()
+        for arg_descr, arg in zip(self.arguments, args):
+            setattr(arg_struct, arg_descr.arg_name(), arg)
+
+        self.func(size, arg_struct)
+
+
+
+
 class CompiledVectorExpression(CompiledVectorExpressionBase):
     elementwise_mod = codepy.elementwise
 
-    def __init__(self, vec_expr_info_list, result_dtype_getter, toolchain=None):
+    def __init__(self, vec_expr_info_list, result_dtype_getter, toolchain=None,
+            kernel_cache=None):
         CompiledVectorExpressionBase.__init__(self,
                 vec_expr_info_list, result_dtype_getter)
 
         self.toolchain = toolchain
+        self.kernel_cache = kernel_cache
 
     def make_kernel_internal(self, args, instructions):
+        if self.kernel_cache is not None:
+            return _CachedElementwiseKernel(self.kernel_cache,
+                    args, instructions, name="vector_expression",
+                    toolchain=self.toolchain)
+
         return self.elementwise_mod.ElementwiseKernel(
                 args, instructions, name="vector_expression",
                 toolchain=self.toolchain)
 
-    def __call__(self, evaluate_subexpr, stats_callback=None):
+    def __call__(self, evaluate_subexpr, allocator, stats_callback=None):
+        """
+        :param allocator: a function of *(shape, dtype)* returning an
+          array into which results are written, typically
+          :meth:`hedge.backends.exec_common.BufferPool.empty`.
+        """
         vectors = [evaluate_subexpr(vec_expr) 
                 for vec_expr in self.vector_deps]
         scalars = [evaluate_subexpr(scal_expr) 
@@ -61,7 +116,7 @@ class CompiledVectorExpression(CompiledVectorExpressionBase):
                 tuple(v.dtype for v in vectors),
                 tuple(s.dtype for s in scalars))
 
-        results = [numpy.empty(shape, kernel_rec.result_dtype)
+        results = [allocator(shape, kernel_rec.result_dtype)
                 for vei in self.result_vec_expr_info_list]
 
         size = results[0].size
@@ -98,4 +153,4 @@ if __name__ == "__main__":
         var("z"): numpy.arange(5, dtype=test_dtype),
         }
 
-    print cexpr(lambda expr: ctx[expr])
+    print cexpr(lambda expr: ctx[expr], numpy.empty)
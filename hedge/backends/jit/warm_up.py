@@ -0,0 +1,180 @@
+"""Ahead-of-time compilation of the JIT kernels needed by an operator.
+
+Run as::
+
+    python -m hedge.backends.jit.warm_up --kernel-cache-dir=DIR \\
+            --operator=maxwell --dimensions=3 --order=4 --dtype=float64
+
+to populate the on-disk kernel cache, so that later runs using the same
+cache directory (and operator, order and dtype) start without compiling.
+"""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+# {{{ report
+
+def format_warm_up_report(report, max_insn_length=60):
+    """Format the result of :meth:`hedge.discretization.Discretization.warm_up`
+    as a table, most expensive instructions first.
+    """
+    total = sum(seconds for insn, seconds in report)
+
+    lines = []
+    for insn, seconds in sorted(report, key=lambda entry: -entry[1]):
+        if insn is None:
+            desc = "(operator compilation)"
+        else:
+            desc = " ".join(str(insn).split())
+            if len(desc) > max_insn_length:
+                desc = desc[:max_insn_length-3] + "..."
+
+        if total:
+            percent = 100*seconds/total
+        else:
+            percent = 0
+
+        lines.append("%9.3f s %5.1f%%  %s" % (seconds, percent, desc))
+
+    lines.append("%9.3f s total" % total)
+    return "\n".join(lines)
+
+# }}}
+
+
+# {{{ operators
+
+def make_operator(name, dimensions):
+    import hedge.mesh
+
+    if name == "maxwell":
+        if dimensions == 3:
+            from hedge.models.em import MaxwellOperator as op_class
+        elif dimensions == 2:
+            from hedge.models.em import TEMaxwellOperator as op_class
+        else:
+            raise ValueError("maxwell operator needs 2 or 3 dimensions")
+
+        return op_class(epsilon=1, mu=1, flux_type=1)
+
+    elif name == "wave":
+        from hedge.models.wave import StrongWaveOperator
+        return StrongWaveOperator(-1, dimensions, flux_type="upwind")
+
+    elif name == "gas-dynamics":
+        from hedge.models.gas_dynamics import (
+                GasDynamicsOperator, GammaLawEOS)
+        return GasDynamicsOperator(dimensions,
+                equation_of_state=GammaLawEOS(1.4),
+                inflow_tag=hedge.mesh.TAG_ALL)
+
+    else:
+        raise ValueError("unknown operator '%s'" % name)
+
+
+OPERATOR_NAMES = ["maxwell", "wave", "gas-dynamics"]
+
+# }}}
+
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser(
+            usage="%prog [options]",
+            description="Build and cache the JIT kernels for an operator "
+            "without running a time step.")
+    parser.add_option("--operator", choices=OPERATOR_NAMES, default="maxwell",
+            help="one of %s [default: %%default]" % ", ".join(OPERATOR_NAMES))
+    parser.add_option("--dimensions", type="int", default=3,
+            help="[default: %default]")
+    parser.add_option("--order", type="int", default=4,
+            help="[default: %default]")
+    parser.add_option("--dtype", default="float64",
+            help="[default: %default]")
+    parser.add_option("--arg-dtype", metavar="NAME=DTYPE", action="append",
+            default=[],
+            help="dtype of the operator argument NAME, if different from "
+            "--dtype (for fields) or its real counterpart (for scalar "
+            "parameters such as t). May be given more than once.")
+    parser.add_option("--mesh", metavar="FILE",
+            help="Gmsh file to read the mesh from (default: a unit box)")
+    parser.add_option("--kernel-cache-dir", metavar="DIR",
+            help="directory of the on-disk kernel cache (default: "
+            "$HEDGE_KERNEL_CACHE_DIR)")
+    options, args = parser.parse_args()
+
+    if args:
+        parser.error("no positional arguments expected")
+
+    import numpy as np
+    dtype = np.dtype(options.dtype)
+
+    arg_dtypes = {}
+    for arg_dtype in options.arg_dtype:
+        name, sep, arg_dtype = arg_dtype.partition("=")
+        if not sep:
+            parser.error("--arg-dtype expects NAME=DTYPE")
+        arg_dtypes[name] = np.dtype(arg_dtype)
+
+    if options.mesh is not None:
+        from hedge.mesh.reader.gmsh import read_gmsh
+        mesh = read_gmsh(options.mesh, force_dimension=options.dimensions)
+    elif options.dimensions == 3:
+        from hedge.mesh.generator import make_box_mesh
+        mesh = make_box_mesh(max_volume=0.1)
+    elif options.dimensions == 2:
+        from hedge.mesh.generator import make_regular_rect_mesh
+        mesh = make_regular_rect_mesh()
+    elif options.dimensions == 1:
+        from hedge.mesh.generator import make_uniform_1d_mesh
+        mesh = make_uniform_1d_mesh(0, 1, 10)
+    else:
+        parser.error("invalid number of dimensions")
+
+    from hedge.backends.jit import Discretization
+    discr = Discretization(mesh, order=options.order,
+            default_scalar_type=dtype.type,
+            kernel_cache_dir=options.kernel_cache_dir)
+
+    if discr.kernel_cache is None:
+        from warnings import warn
+        warn("no kernel cache directory configured, "
+                "compiled kernels will not persist")
+
+    op = make_operator(options.operator, options.dimensions)
+    print format_warm_up_report(discr.warm_up(op, dtype, arg_dtypes))
+
+    if discr.kernel_cache is not None:
+        print "kernel cache: %d hits, %d misses in %s" % (
+                discr.kernel_cache.hit_count,
+                discr.kernel_cache.miss_count,
+                discr.kernel_cache.cache_dir)
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: foldmethod=marker
@@ -27,6 +27,7 @@ THE SOFTWARE.
 
 
 import pytools
+from pytools import memoize_method
 import numpy
 import numpy.linalg as la
 import hedge.discretization
@@ -85,6 +86,15 @@ class MPIRunContext(RunContext):
         if partition is None:
             partition = len(self.ranks)
 
+        # Meshes stored as arrays are scattered collectively, everything
+        # else is sent as pickled objects. Tell the receiving ranks which.
+        from hedge.mesh.array import ElementArrays
+        use_scatter = isinstance(mesh.elements, ElementArrays)
+        self.communicator.bcast(use_scatter, root=self.head_rank)
+
+        if use_scatter:
+            return self._scatter_mesh(mesh, partition)
+
         # compute partition using Metis, if necessary
         if isinstance(partition, int):
             from pymetis import part_graph
@@ -111,15 +121,120 @@ class MPIRunContext(RunContext):
             if rank == self.head_rank:
                 result = rank_data
             else:
-                print "send rank", rank
                 self.communicator.send(rank_data, rank, 0)
-                print "end send", rank
 
         return result
 
     def receive_mesh(self):
+        use_scatter = self.communicator.bcast(None, root=self.head_rank)
+        if use_scatter:
+            return self._scatter_mesh(None, None)
+
         return self.communicator.recv(source=self.head_rank, tag=0)
-        print "receive end rank", self.rank
+
+    # {{{ collective mesh distribution
+
+    def _scatter_rows(self, sendbuf, counts, my_count, dtype, row_shape):
+        """Scatter the rows of *sendbuf*, of which rank *i* receives
+        *counts[i]*, in rank order. *sendbuf* and *counts* are only used on
+        the head rank.
+        """
+        comm = self.communicator
+        mpi_type = {
+                numpy.dtype(numpy.float64): mpi.DOUBLE,
+                numpy.dtype(numpy.int64): mpi.INT64_T,
+                }[numpy.dtype(dtype)]
+
+        row_size = int(numpy.prod(row_shape))
+        recvbuf = numpy.empty((my_count,) + tuple(row_shape), dtype=dtype)
+
+        if self.is_head_rank:
+            send_counts = numpy.asarray(counts, dtype=numpy.intp)*row_size
+            displacements = numpy.cumsum(send_counts) - send_counts
+            sendbuf = numpy.ascontiguousarray(sendbuf, dtype=dtype)
+            comm.Scatterv(
+                    [sendbuf, (send_counts, displacements), mpi_type],
+                    [recvbuf, mpi_type], root=self.head_rank)
+        else:
+            comm.Scatterv(None, [recvbuf, mpi_type], root=self.head_rank)
+
+        return recvbuf
+
+    def _scatter_mesh(self, mesh, partition):
+        """Partition *mesh* on the head rank and scatter the parts as
+        arrays, one part per rank. Each rank then builds its own part
+        mesh. Must be called on all ranks, with *mesh* and *partition*
+        only used on the head rank.
+        """
+        comm = self.communicator
+        rank_count = len(self.ranks)
+
+        if self.is_head_rank:
+            from hedge.partition import (
+                    partition_element_arrays, pack_mesh_partition)
+
+            if isinstance(partition, int):
+                el_parts = partition_element_arrays(mesh.elements, partition)
+            elif isinstance(partition, numpy.ndarray):
+                el_parts = partition
+            else:
+                el_parts = numpy.fromiter(
+                        (partition[i] for i in xrange(len(mesh.elements))),
+                        dtype=numpy.intp)
+
+            meta, arrays, counts = pack_mesh_partition(
+                    mesh, el_parts, rank_count)
+
+            array_info = []
+            for name in sorted(arrays):
+                ary = arrays[name]
+                if ary.dtype.kind == "f":
+                    dtype = numpy.float64
+                else:
+                    dtype = numpy.int64
+                array_info.append((name, dtype, ary.shape[1:]))
+            meta["array_info"] = array_info
+
+            rank_counts = [
+                    dict((name, int(counts[name][rank]))
+                        for name, dtype, row_shape in array_info)
+                    for rank in self.ranks]
+        else:
+            meta = arrays = counts = rank_counts = None
+
+        meta = comm.bcast(meta, root=self.head_rank)
+        my_counts = comm.scatter(rank_counts, root=self.head_rank)
+
+        my_arrays = {}
+        for name, dtype, row_shape in meta["array_info"]:
+            if self.is_head_rank:
+                sendbuf = arrays[name]
+                name_counts = counts[name]
+            else:
+                sendbuf = name_counts = None
+
+            my_arrays[name] = self._scatter_rows(sendbuf, name_counts,
+                    my_counts[name], dtype, row_shape)
+
+        # the head rank's copy of the global mesh is no longer needed here
+        del arrays
+
+        from hedge.partition import make_part_data
+        from hedge.mesh import TAG_RANK_BOUNDARY
+        part_data = make_part_data(self.rank, meta, my_arrays,
+                TAG_RANK_BOUNDARY)
+
+        return RankData(
+                mesh=part_data.mesh,
+                global2local_elements=part_data.global2local_elements,
+                global2local_vertex_indices=part_data
+                        .global2local_vertex_indices,
+                neighbor_ranks=part_data.neighbor_parts,
+                global_periodic_opposite_faces=part_data
+                        .global_periodic_opposite_faces,
+                tag_to_elements=part_data.tag_to_elements)
+
+    # }}}
 
     def make_discretization(self, mesh_data, *args, **kwargs):
         return ParallelDiscretization(self,
@@ -163,12 +278,15 @@ class MPICompletionFuture(Future):
         self.result = None
 
     def is_ready(self):
-        if self.request is not None:
-            status = mpi.Status()
-            if self.request.Test(status):
-                self.result = self.finish(status)
-                self.request = None
-                return True
+        if self.request is None:
+            # completed by an earlier call
+            return True
+
+        status = mpi.Status()
+        if self.request.Test(status):
+            self.result = self.finish(status)
+            self.request = None
+            return True
 
         return False
 
@@ -176,9 +294,10 @@ class MPICompletionFuture(Future):
         if self.request is not None:
             status = mpi.Status()
             self.request.Wait(status)
-            return self.finish(status)
-        else:
-            return self.result
+            self.result = self.finish(status)
+            self.request = None
+
+        return self.result
 
 
 class SendCompletionFuture(MPICompletionFuture):
@@ -239,11 +358,267 @@ class BoundaryConvertFuture(Future):
                 for idx, name in self.indices_and_names], []
 
 
+# {{{ persistent halo exchange
+
+class HaloNeighbor(pytools.Record):
+    """The buffers and persistent requests of a :class:`HaloExchange` for
+    one neighboring rank.
+
+    :ivar vol_indices: the volume node numbers of the rank boundary, in
+      the order in which their values are sent.
+    :ivar read_map: the gather that brings the received values into the
+      order of the local rank boundary.
+    """
+
+    def __init__(self, rank, vol_indices, read_map, send_buffer,
+            recv_buffer, send_request, recv_request):
+        pytools.Record.__init__(self, locals())
+
+
+MPI_FLOAT_TYPES = {
+        numpy.float64: mpi.DOUBLE,
+        numpy.float32: mpi.FLOAT,
+        }
+
+# Each halo exchange sends its messages with its own tag, starting here.
+# Tags below are used for setup and the non-persistent exchanges.
+HALO_TAG_BASE = 100
+
+
+class HaloExchange(object):
+    """Exchanges the rank-boundary values of a fixed number of volume
+    fields with all neighboring ranks.
+
+    All fields go into one contiguous buffer per neighbor and direction.
+    The buffers and the persistent MPI requests that send and receive
+    them are created once, and reused whenever :meth:`start` is called,
+    until :meth:`close` frees them.
+    Both sides of a rank boundary hold the same number of nodes, so the
+    receive buffers have the same shape as the send buffers.
+
+    :param tag: the MPI tag of the messages of this exchange. It must be
+      the same on all ranks, and different from that of any other
+      exchange that may be in flight at the same time.
+    :param dtype: the type in which values are sent, by default the
+      discretization's scalar type. Received values are converted back
+      to the scalar type.
+    """
+
+    def __init__(self, pdiscr, field_count, tag, dtype=None):
+        self.pdiscr = pdiscr
+        self.field_count = field_count
+        self.tag = tag
+
+        if dtype is None:
+            dtype = pdiscr.default_scalar_type
+        self.dtype = numpy.dtype(dtype)
+
+        from hedge.mesh import TAG_RANK_BOUNDARY
+
+        self.neighbors = []
+        for rank in pdiscr.neighbor_ranks:
+            vol_indices = pdiscr.get_boundary(
+                    TAG_RANK_BOUNDARY(rank)).vol_indices
+            send_buffer = numpy.empty((field_count, len(vol_indices)),
+                    self.dtype)
+            recv_buffer = numpy.empty_like(send_buffer)
+
+            send_request, recv_request = self._make_requests(
+                    rank, send_buffer, recv_buffer)
+
+            self.neighbors.append(HaloNeighbor(
+                rank=rank,
+                vol_indices=vol_indices,
+                read_map=pdiscr.from_neighbor_maps[rank],
+                send_buffer=send_buffer,
+                recv_buffer=recv_buffer,
+                send_request=send_request,
+                recv_request=recv_request))
+
+    def _make_requests(self, rank, send_buffer, recv_buffer):
+        comm = self.pdiscr.context.communicator
+        mpi_type = MPI_FLOAT_TYPES[self.dtype.type]
+        return (
+                comm.Send_init([send_buffer, mpi_type], rank, tag=self.tag),
+                comm.Recv_init([recv_buffer, mpi_type], source=rank,
+                    tag=self.tag))
+
+    def close(self):
+        """Complete any exchange still in flight, and free the persistent
+        requests. The exchange cannot be started afterwards.
+        """
+        for nb in self.neighbors:
+            for request in [nb.send_request, nb.recv_request]:
+                if request is not None:
+                    # returns at once if the request is not active
+                    request.Wait()
+                    request.Free()
+            nb.send_request = nb.recv_request = None
+        self.neighbors = []
+
+    def _pack(self, nb, fields):
+        for i, field in enumerate(fields):
+            if not isinstance(field, numpy.ndarray):
+                # a scalar, will be broadcast
+                nb.send_buffer[i] = field
+            elif field.dtype == nb.send_buffer.dtype:
+                field.take(nb.vol_indices, out=nb.send_buffer[i])
+            else:
+                nb.send_buffer[i] = field[nb.vol_indices]
+
+    def _start_receive(self, nb):
+        nb.recv_request.Start()
+        return nb.recv_request
+
+    def _prepare_send(self, nb):
+        """Return what :meth:`_start_send` sends to *nb*, once its send
+        buffer is packed. Raises an exception if the values cannot be sent.
+        """
+        return None
+
+    def _start_send(self, nb, send_data):
+        nb.send_request.Start()
+        return HaloSendFuture(nb.send_request), nb.send_buffer.nbytes
+
+    def unpack(self, nb, status):
+        """Return the values received from *nb* as an array of shape
+        *(field_count, boundary_node_count)*, in the node order of the
+        local rank boundary.
+        """
+        result = nb.recv_buffer.take(nb.read_map, axis=1)
+
+        scalar_type = self.pdiscr.default_scalar_type
+        if result.dtype != scalar_type:
+            result = result.astype(scalar_type)
+
+        return result
+
+    def start(self, fields, rank_to_index_and_name):
+        """Start sending *fields* to and receiving their counterparts from
+        all neighbors. Return a list of futures, which yield the received
+        fields under the names in *rank_to_index_and_name*.
+        """
+        if len(fields) != self.field_count:
+            raise ValueError("expected %d fields, got %d"
+                    % (self.field_count, len(fields)))
+
+        # pack everything before posting any request, so that values that
+        # cannot be sent raise before any message is under way
+        send_data = []
+        for nb in self.neighbors:
+            self._pack(nb, fields)
+            send_data.append(self._prepare_send(nb))
+
+        futures = []
+        for nb in self.neighbors:
+            futures.append(HaloReceiveFuture(self, nb,
+                self._start_receive(nb),
+                rank_to_index_and_name[nb.rank]))
+
+        for nb, nb_send_data in zip(self.neighbors, send_data):
+            send_future, byte_count = self._start_send(nb, nb_send_data)
+            futures.append(send_future)
+            self.pdiscr.record_halo_bytes(nb.rank, byte_count)
+
+        return futures
+
+
+class QuantizingHaloExchange(HaloExchange):
+    """A :class:`HaloExchange` that rounds values to multiples of
+    twice *error_bound* and sends the resulting integers compressed with
+    :mod:`zlib`. Every received value differs from the sent one by at most
+    *error_bound*. Since the message sizes vary, each exchange posts new,
+    non-persistent requests, which receive into a buffer sized for the
+    worst case.
+    """
+
+    def __init__(self, pdiscr, field_count, tag, error_bound,
+            compress_level=1):
+        if not error_bound > 0:
+            raise ValueError("error bound must be positive")
+
+        self.error_bound = error_bound
+        self.compress_level = compress_level
+
+        HaloExchange.__init__(self, pdiscr, field_count, tag)
+
+        self.recv_bytes = {}
+        for nb in self.neighbors:
+            # deflate adds at most five bytes per 16 kB block to
+            # incompressible data
+            raw_size = nb.send_buffer.size*numpy.dtype(numpy.int64).itemsize
+            self.recv_bytes[nb.rank] = numpy.empty(
+                    raw_size + raw_size//16000*5 + 64, dtype=numpy.uint8)
+
+    def _make_requests(self, rank, send_buffer, recv_buffer):
+        return None, None
+
+    def _start_receive(self, nb):
+        return self.pdiscr.context.communicator.Irecv(
+                [self.recv_bytes[nb.rank], mpi.BYTE], source=nb.rank,
+                tag=self.tag)
+
+    def _prepare_send(self, nb):
+        scaled = nb.send_buffer / (2*self.error_bound)
+
+        # also fails for NaN
+        if not numpy.abs(scaled).max() < 2**62:
+            raise ValueError("halo values out of range for error bound %g"
+                    % self.error_bound)
+
+        from zlib import compress
+        return numpy.frombuffer(compress(
+            numpy.rint(scaled).astype(numpy.int64).tostring(),
+            self.compress_level), dtype=numpy.uint8)
+
+    def _start_send(self, nb, send_bytes):
+        request = self.pdiscr.context.communicator.Isend(
+                [send_bytes, mpi.BYTE], nb.rank, tag=self.tag)
+        return HaloSendFuture(request, send_bytes), len(send_bytes)
+
+    def unpack(self, nb, status):
+        from zlib import decompress
+        byte_count = status.Get_count(mpi.BYTE)
+        quantized = numpy.fromstring(
+                decompress(self.recv_bytes[nb.rank][:byte_count].tostring()),
+                dtype=numpy.int64).reshape(nb.recv_buffer.shape)
+
+        nb.recv_buffer[:] = quantized*(2*self.error_bound)
+        return HaloExchange.unpack(self, nb, status)
+
+
+class HaloSendFuture(MPICompletionFuture):
+    def __init__(self, request, send_buffer=None):
+        MPICompletionFuture.__init__(self, request)
+
+        # keeps the buffer alive until the send completes
+        self.send_buffer = send_buffer
+
+    def finish(self, status):
+        return [], []
+
+
+class HaloReceiveFuture(MPICompletionFuture):
+    def __init__(self, exchange, nb, request, indices_and_names):
+        MPICompletionFuture.__init__(self, request)
+        self.exchange = exchange
+        self.nb = nb
+        self.indices_and_names = indices_and_names
+
+    def finish(self, status):
+        received = self.exchange.unpack(self.nb, status)
+        return [(name, received[idx])
+                for idx, name in self.indices_and_names], []
+
+# }}}
+
+
 def make_custom_exec_mapper_class(superclass):
     class ExecutionMapper(superclass):
         def __init__(self, context, executor):
             superclass.__init__(self, context, executor)
             self.discr = executor.discr
+            self.executor = executor
 
         def exec_flux_exchange_batch_assign(self, insn):
             pdiscr = self.discr.parallel_discr
@@ -256,6 +631,18 @@ def make_custom_exec_mapper_class(superclass):
             if self.discr.instrumented:
                 pdiscr.comm_flux_counter.add(
                         len(pdiscr.neighbor_ranks)*len(arg_fields))
+
+            if pdiscr.compute_kind == "numpy":
+                exchange = pdiscr.get_halo_exchange(
+                        self.executor, insn, len(arg_fields))
+                futures = exchange.start(
+                        arg_fields, insn.rank_to_index_and_name)
+                if pdiscr.polls_communication:
+                    # also drops the futures of earlier exchanges
+                    pdiscr.poll_communication()
+                    pdiscr.pending_comm_futures.extend(futures)
+                return [], futures
+
             return ([],
                     [BoundarizeSendFuture(pdiscr, rank, arg_fields)
                         for rank in pdiscr.neighbor_ranks]
@@ -351,6 +738,33 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
         return cls.my_debug_flags() | subcls.all_debug_flags()
 
     def __init__(self, rcon, subdiscr_class, rank_data, *args, **kwargs):
+        """
+        :param halo_dtype: if not *None*, send the values of rank-boundary
+          fluxes in this type (:class:`numpy.float32` or
+          :class:`numpy.float64`) instead of the scalar type.
+        :param halo_error_bound: if not *None*, send the values of
+          rank-boundary fluxes as integer multiples of twice this bound,
+          compressed with :mod:`zlib`. Each received value then differs
+          from the sent one by at most the bound.
+
+        The number of bytes sent to each neighbor so far is kept in
+        :attr:`halo_bytes_sent`, and the number sent per step is logged as
+        ``n_comm_bytes`` once :meth:`add_instrumentation` is called.
+        Both options only affect backends computing in :mod:`numpy` arrays.
+        """
+        self.halo_dtype = kwargs.pop("halo_dtype", None)
+        self.halo_error_bound = kwargs.pop("halo_error_bound", None)
+        if self.halo_dtype is not None and self.halo_error_bound is not None:
+            raise ValueError("halo_dtype and halo_error_bound are "
+                    "mutually exclusive")
+        if (self.halo_dtype is not None
+                and numpy.dtype(self.halo_dtype).type not in MPI_FLOAT_TYPES):
+            raise ValueError("unsupported halo_dtype '%s'" % self.halo_dtype)
+        if self.halo_error_bound is not None and not self.halo_error_bound > 0:
+            raise ValueError("halo_error_bound must be positive")
+
+        self.halo_bytes_sent = {}
+
         debug = set(kwargs.pop("debug", set()))
         self.debug = self.my_debug_flags() & debug
         kwargs["debug"] = debug - self.debug
@@ -364,6 +778,22 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
         self.received_bdrys = {}
         self.context = rcon
 
+        # maps id(executor) to a dict of that executor's halo exchanges,
+        # which are closed once the executor is garbage-collected
+        self.halo_exchanges = {}
+        self.halo_executor_refs = {}
+
+        # Poll outstanding halo messages between the chunks of long
+        # kernels, so that they make progress while the work that does
+        # not depend on them runs. MPI calls must stay on the main thread,
+        # so this is skipped if instructions run on a thread pool.
+        self.pending_comm_futures = []
+        runner = getattr(self.subdiscr, "chunk_runner", None)
+        self.polls_communication = (runner is not None
+                and getattr(self.subdiscr, "insn_worker_pool", None) is None)
+        if self.polls_communication:
+            runner.progress_hook = self.poll_communication
+
         self.global2local_vertex_indices = rank_data.global2local_vertex_indices
         self.neighbor_ranks = rank_data.neighbor_ranks
         self.global_periodic_opposite_faces = \
@@ -380,10 +810,77 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
 
         self._setup_neighbor_connections()
 
-        self.mpi_scalar_type = {
-                numpy.float64: mpi.DOUBLE,
-                numpy.float32: mpi.FLOAT,
-                }[self.default_scalar_type]
+        self.mpi_scalar_type = MPI_FLOAT_TYPES[self.default_scalar_type]
+
+    def get_halo_exchange(self, executor, insn, field_count):
+        """Return the :class:`HaloExchange` used by *executor* for the flux
+        exchange instruction *insn*, creating it on first use.
+
+        The exchange's tag is derived from the position of *insn* among
+        the flux exchange instructions of *executor*, which is the same on
+        all ranks since they all compile the same operator.
+        """
+        executor_key = id(executor)
+        try:
+            executor_exchanges = self.halo_exchanges[executor_key]
+        except KeyError:
+            executor_exchanges = self.halo_exchanges[executor_key] = {}
+
+            from weakref import ref
+            self.halo_executor_refs[executor_key] = ref(executor,
+                    lambda r: self.close_halo_exchanges(executor_key))
+
+        key = tuple(insn.names)
+        try:
+            return executor_exchanges[key]
+        except KeyError:
+            from hedge.compiler import FluxExchangeBatchAssign
+            exchange_insns = [other_insn
+                    for other_insn in executor.code.instructions
+                    if isinstance(other_insn, FluxExchangeBatchAssign)]
+            tag = HALO_TAG_BASE + exchange_insns.index(insn)
+
+            if self.halo_error_bound is not None:
+                result = QuantizingHaloExchange(
+                        self, field_count, tag, self.halo_error_bound)
+            else:
+                result = HaloExchange(self, field_count, tag,
+                        self.halo_dtype)
+
+            executor_exchanges[key] = result
+            return result
+
+    def close_halo_exchanges(self, executor_key=None):
+        """Free the persistent requests of the halo exchanges of the
+        executor with ``id`` *executor_key*, or of all executors if it is
+        *None*.
+        """
+        if executor_key is None:
+            executor_keys = list(self.halo_exchanges)
+        else:
+            executor_keys = [executor_key]
+
+        for key in executor_keys:
+            for exchange in self.halo_exchanges.pop(key, {}).itervalues():
+                exchange.close()
+            self.halo_executor_refs.pop(key, None)
+
+    def close(self):
+        self.pending_comm_futures = []
+        self.close_halo_exchanges()
+        self.subdiscr.close()
+
+    def record_halo_bytes(self, rank, byte_count):
+        self.halo_bytes_sent[rank] = \
+                self.halo_bytes_sent.get(rank, 0) + byte_count
+        if self.instrumented:
+            self.comm_byte_counter.add(byte_count)
+
+    def poll_communication(self):
+        """Check all outstanding halo messages for completion."""
+        self.pending_comm_futures = [future
+                for future in self.pending_comm_futures
+                if not future.is_ready()]
 
     def add_instrumentation(self, mgr):
         self.subdiscr.add_instrumentation(mgr)
@@ -391,8 +888,11 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
         from pytools.log import EventCounter
         self.comm_flux_counter = EventCounter("n_comm_flux",
                 "Number of inner flux communication runs")
+        self.comm_byte_counter = EventCounter("n_comm_bytes",
+                "Number of bytes of rank-boundary data sent")
 
         mgr.add_quantity(self.comm_flux_counter)
+        mgr.add_quantity(self.comm_byte_counter)
 
     # property forwards -------------------------------------------------------
     def __len__(self):
@@ -406,202 +906,228 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
 
     # {{{ neighbor connectivity
 
-    def _setup_neighbor_connections(self):
-        comm = self.context.communicator
-
-        # Why is this barrier needed? Some of our ranks may arrive at this
-        # point early and start sending packets to ranks that are still stuck
-        # in previous wildcard-recv loops. These receivers will then be very
-        # confused by packets they didn't expect, and, once they reach their
-        # recv bit in *this* subroutine, will wait for packets that will never
-        # arrive. This same argument does not apply to other recv()s in this
-        # file because they are targeted and thus benefit from MPI's
-        # non-overtaking rule.
-        #
-        # Parallel programming is fun.
-        comm.Barrier()
-
-        if self.neighbor_ranks:
-            # send interface information to neighboring ranks -----------------
-            from pytools import reverse_dictionary
-            local2global_vertex_indices = \
-                    reverse_dictionary(self.global2local_vertex_indices)
-
-            send_requests = []
-
-            for rank in self.neighbor_ranks:
-                bdry_tag = hedge.mesh.TAG_RANK_BOUNDARY(rank)
-                rank_bdry = self.subdiscr.mesh.tag_to_boundary[bdry_tag]
-                rank_discr_boundary = self.subdiscr.get_boundary(bdry_tag)
-
-                # a list of global vertex numbers for each face
-                my_vertices_global = [
-                        tuple(local2global_vertex_indices[vi]
-                            for vi in el.faces[face_nr])
-                        for el, face_nr in rank_bdry]
-
-                # a list of node coordinates, indicating the order
-                # in which nodal values will be sent, this is for
-                # testing only and could (potentially) be omitted
-
-                my_node_coords = []
-                for el, face_nr in rank_bdry:
-                    eslice, ldis = self.subdiscr.find_el_data(el.id)
-                    findices = ldis.face_indices()[face_nr]
-
-                    my_node_coords.append(
-                            [self.nodes[eslice.start+i] for i in findices])
-
-                # compile a list of FluxFace.h values for unification
-                # across the rank boundary
-
-                my_h_values = [rank_discr_boundary.find_facepair_side(el_face).h
-                        for el_face in rank_bdry]
-
-                packet = (my_vertices_global, my_node_coords, my_h_values)
-
-                send_requests.append(comm.isend(packet, dest=rank, tag=0))
-
-            received_packets = {}
-            while len(received_packets) < len(self.neighbor_ranks):
-                status = mpi.Status()
-                received_packet = comm.recv(
-                        tag=0, source=mpi.ANY_SOURCE, status=status)
-                received_packets[status.source] = received_packet
-
-            mpi.Request.Waitall(send_requests)
-
-            # process received packets ----------------------------------------
-            from pytools import flatten
-
-            # nb_ stands for neighbor_
-
-            self.from_neighbor_maps = {}
-
-            for rank, (nb_all_facevertices_global, nb_node_coords, nb_h_values) in \
-                    received_packets.iteritems():
-                bdry_tag = hedge.mesh.TAG_RANK_BOUNDARY(rank)
-                rank_bdry = self.subdiscr.mesh.tag_to_boundary[bdry_tag]
-                rank_discr_boundary = self.subdiscr.get_boundary(bdry_tag)
-
-                flat_nb_node_coords = list(flatten(nb_node_coords))
-
-                # step 1: find start node indices for each
-                # of the neighbor's elements
-                nb_face_starts = [0]
-                for node_coords in nb_node_coords[:-1]:
-                    nb_face_starts.append(
-                            nb_face_starts[-1]+len(node_coords))
-
-                # step 2: match faces by matching vertices
-                nb_face_order = dict(
-                        (frozenset(vertices), i)
-                        for i, vertices in enumerate(nb_all_facevertices_global))
-
-                # step 3: make a list of indices into the data we
-                # receive from our neighbor that'll tell us how
-                # to reshuffle them to match our node order
-                from_indices = []
-
-                shuffled_indices_cache = {}
-
-                def get_shuffled_indices(face_node_count, shuffle_op):
-                    try:
-                        return shuffled_indices_cache[shuffle_op]
-                    except KeyError:
-                        unshuffled_indices = range(face_node_count)
-                        result = shuffled_indices_cache[shuffle_op] = \
-                                shuffle_op(unshuffled_indices)
-                        return result
-
-                for el, face_nr in rank_bdry:
-                    eslice, ldis = self.subdiscr.find_el_data(el.id)
-
-                    my_vertices = el.faces[face_nr]
-                    my_global_vertices = tuple(local2global_vertex_indices[vi]
-                            for vi in my_vertices)
-
-                    face_node_count = ldis.face_node_count()
-                    try:
-                        nb_face_idx = nb_face_order[frozenset(my_global_vertices)]
-                        # continue below in else part
-                    except KeyError:
-                        # this happens if my_global_vertices is not a permutation
-                        # of the neighbor's face vertices. Periodicity is the only
-                        # reason why that would be so.
-                        my_vertices_there, axis = \
-                                self.global_periodic_opposite_faces[
-                                        my_global_vertices]
-                        nb_face_idx = nb_face_order[frozenset(my_vertices_there)]
-
-                        his_vertices_here, axis2 = \
-                                self.global_periodic_opposite_faces[
-                                        nb_all_facevertices_global[nb_face_idx]]
-
-                        assert axis == axis2
-
-                        nb_face_start = nb_face_starts[nb_face_idx]
-
-                        shuffle_op = \
-                                ldis.get_face_index_shuffle_to_match(
-                                        my_global_vertices,
-                                        his_vertices_here)
-
-                        shuffled_other_node_indices = [nb_face_start+i
-                                for i in get_shuffled_indices(
-                                    face_node_count, shuffle_op)]
-
-                        from_indices.extend(shuffled_other_node_indices)
-
-                        # check if the nodes really match up
-                        if "parallel_setup" in self.debug:
-                            my_node_indices = [
-                                    eslice.start+i
-                                    for i in ldis.face_indices()[face_nr]]
-
-                            for my_i, other_i in zip(
-                                    my_node_indices, shuffled_other_node_indices):
-                                dist = self.nodes[my_i]-flat_nb_node_coords[other_i]
-                                dist[axis] = 0
-                                assert la.norm(dist) < 1e-14
-                    else:
-                        # continue handling of nonperiodic case
-                        nb_global_vertices = nb_all_facevertices_global[nb_face_idx]
-
-                        nb_face_start = nb_face_starts[nb_face_idx]
-
-                        shuffle_op = \
-                                ldis.get_face_index_shuffle_to_match(
-                                        my_global_vertices,
-                                        nb_global_vertices)
-
-                        shuffled_other_node_indices = [nb_face_start+i
-                                for i in get_shuffled_indices(
-                                    face_node_count, shuffle_op)]
+    def _get_rank_boundary_ldis(self):
+        ldises = set(eg.local_discretization
+                for eg in self.subdiscr.element_groups)
+        if len(ldises) != 1:
+            raise NotImplementedError("rank boundaries need a single "
+                    "local discretization")
+
+        ldis, = ldises
+        return ldis
+
+    @memoize_method
+    def _get_face_shuffle_table(self):
+        """Return an integer array whose row *orientation_code* gives the
+        order in which a face's nodes must be read from the neighbor's
+        face to match the local node order. See
+        :meth:`_get_orientation_codes`.
+        """
+        ldis = self._get_rank_boundary_ldis()
+        face_vertex_count = ldis.dimensions
+        face_node_count = ldis.face_node_count()
+
+        table = numpy.zeros(
+                (face_vertex_count**face_vertex_count, face_node_count),
+                dtype=numpy.intp)
+        for vert_perm, shuffle_op in \
+                ldis.get_face_index_shuffle_lookup_map().iteritems():
+            code = sum(i*face_vertex_count**j
+                    for j, i in enumerate(vert_perm))
+            table[code] = shuffle_op(range(face_node_count))
+
+        return table
+
+    @staticmethod
+    def _get_orientation_codes(my_face_vertices, nb_face_vertices):
+        """Return, for each pair of rows of the (nfaces, face_vertices)
+        arrays *my_face_vertices* and *nb_face_vertices*, the row of
+        :meth:`_get_face_shuffle_table` matching their relative
+        orientation.
+        """
+        face_vertex_count = my_face_vertices.shape[1]
+
+        # same[k, i, j]: my vertex i of face k is the neighbor's vertex j
+        same = (my_face_vertices[:, :, numpy.newaxis]
+                == nb_face_vertices[:, numpy.newaxis, :])
+        if not same.any(axis=1).all():
+            raise RuntimeError("matched rank boundary faces do not "
+                    "share their vertices")
+
+        vert_perm = numpy.argmax(same, axis=1)
+        return numpy.dot(vert_perm,
+                face_vertex_count**numpy.arange(face_vertex_count))
+
+    def _get_rank_boundary_arrays(self, rank, local2global_vertex_indices):
+        """Return a tuple *(rank_bdry, face_vertices, node_indices)*, where
+        *face_vertices* holds the global vertex numbers of the faces in
+        *rank_bdry*, and *node_indices* the volume node numbers of their
+        nodes, in the order in which they are sent.
+        """
+        mesh = self.subdiscr.mesh
+        rank_bdry = mesh.tag_to_boundary[hedge.mesh.TAG_RANK_BOUNDARY(rank)]
+        ldis = self._get_rank_boundary_ldis()
+
+        el_ids = numpy.fromiter((el.id for el, face_nr in rank_bdry),
+                dtype=numpy.intp, count=len(rank_bdry))
+        face_nrs = numpy.fromiter((face_nr for el, face_nr in rank_bdry),
+                dtype=numpy.intp, count=len(rank_bdry))
+
+        from hedge.mesh.array import ElementArrays
+        if isinstance(mesh.elements, ElementArrays):
+            ea = mesh.elements
+            face_vertices = ea.vertex_indices[
+                    el_ids[:, numpy.newaxis], ea.face_vertex_numbers[face_nrs]]
+        else:
+            face_vertices = numpy.array(
+                    [el.faces[face_nr] for el, face_nr in rank_bdry],
+                    dtype=numpy.intp).reshape(len(rank_bdry), ldis.dimensions)
 
-                        from_indices.extend(shuffled_other_node_indices)
+        el_starts = numpy.fromiter(
+                (self.subdiscr.find_el_data(el_id)[0].start
+                    for el_id in el_ids),
+                dtype=numpy.intp, count=len(el_ids))
+        face_indices = numpy.array(ldis.face_indices(), dtype=numpy.intp)
+        node_indices = el_starts[:, numpy.newaxis] + face_indices[face_nrs]
 
-                        # check if the nodes really match up
-                        if "parallel_setup" in self.debug:
-                            my_node_indices = [eslice.start+i
-                                    for i in ldis.face_indices()[face_nr]]
+        return (rank_bdry,
+                local2global_vertex_indices[face_vertices],
+                node_indices.ravel())
 
-                            for my_i, other_i in zip(
-                                    my_node_indices, shuffled_other_node_indices):
-                                dist = self.nodes[my_i]-flat_nb_node_coords[other_i]
-                                assert la.norm(dist) < 1e-14
+    def _setup_neighbor_connections(self):
+        """Match the faces on each rank boundary with those of the
+        neighboring rank, to find the order in which to read the values
+        the neighbor sends, and to unify the :attr:`FluxFace.h` values
+        across the boundary.
 
-                    # finally, unify FluxFace.h values across boundary
-                    nb_h = nb_h_values[nb_face_idx]
-                    flux_face = rank_discr_boundary.find_facepair_side((el, face_nr))
-                    flux_face.h = max(nb_h, flux_face.h)
+        Both sides of a rank boundary hold the same number of faces, so
+        all message sizes are known in advance, and the face data is
+        exchanged as flat arrays with targeted, nonblocking sends and
+        receives.
+        """
+        self.from_neighbor_maps = {}
 
-                if "parallel_setup" in self.debug:
-                    assert len(from_indices) == len(flat_nb_node_coords)
+        if not self.neighbor_ranks:
+            return
 
-                # construct from_neighbor_map
-                self.from_neighbor_maps[rank] = \
-                        self.subdiscr.prepare_from_neighbor_map(from_indices)
+        comm = self.context.communicator
+        check_nodes = "parallel_setup" in self.debug
+        ldis = self._get_rank_boundary_ldis()
+        face_node_count = ldis.face_node_count()
+
+        local2global_vertex_indices = numpy.empty(
+                len(self.subdiscr.mesh.points), dtype=numpy.int64)
+        local2global_vertex_indices[
+                numpy.fromiter(self.global2local_vertex_indices.itervalues(),
+                    dtype=numpy.intp)] = numpy.fromiter(
+                        self.global2local_vertex_indices.iterkeys(),
+                        dtype=numpy.int64)
+
+        # {{{ exchange face data
+
+        my_data = {}
+        nb_data = {}
+        requests = []
+
+        # keeps send buffers alive until the requests complete
+        send_buffers = []
+
+        def exchange(rank, my_ary, mpi_type, tag):
+            send_buffers.append(my_ary)
+            nb_ary = numpy.empty_like(my_ary)
+            requests.append(comm.Irecv([nb_ary, mpi_type], source=rank, tag=tag))
+            requests.append(comm.Isend([my_ary, mpi_type], dest=rank, tag=tag))
+            return nb_ary
+
+        for rank in self.neighbor_ranks:
+            rank_bdry, face_vertices, node_indices = \
+                    self._get_rank_boundary_arrays(
+                            rank, local2global_vertex_indices)
+
+            rank_discr_boundary = self.subdiscr.get_boundary(
+                    hedge.mesh.TAG_RANK_BOUNDARY(rank))
+            flux_faces = [rank_discr_boundary.find_facepair_side(el_face)
+                    for el_face in rank_bdry]
+            h_values = numpy.fromiter((ff.h for ff in flux_faces),
+                    dtype=numpy.float64, count=len(flux_faces))
+
+            my_data[rank] = (face_vertices, node_indices, flux_faces)
+            nb_data[rank] = (
+                    exchange(rank, face_vertices, mpi.INT64_T, tag=10),
+                    exchange(rank, h_values, mpi.DOUBLE, tag=11))
+
+            if check_nodes:
+                # the nodes in the order in which values will be sent,
+                # for testing only
+                nb_data[rank] += (exchange(rank,
+                    numpy.ascontiguousarray(self.nodes[node_indices]),
+                    mpi.DOUBLE, tag=12),)
+
+        mpi.Request.Waitall(requests)
+
+        # }}}
+
+        from hedge.mesh.array import find_rows
+        shuffle_table = self._get_face_shuffle_table()
+
+        for rank in self.neighbor_ranks:
+            face_vertices, node_indices, flux_faces = my_data[rank]
+            nb_face_vertices, nb_h_values = nb_data[rank][:2]
+
+            # {{{ match faces by their sorted global vertex numbers
+
+            nb_face_keys = numpy.sort(nb_face_vertices, axis=1)
+            nb_face_idx = find_rows(nb_face_keys,
+                    numpy.sort(face_vertices, axis=1))
+
+            # Unmatched faces lie on a periodic boundary. Compare them
+            # with the neighbor's faces using their vertices on the
+            # opposite side of the mesh.
+            periodic_axes = numpy.empty(len(face_vertices), dtype=numpy.intp)
+            periodic_axes.fill(-1)
+            unmatched = numpy.nonzero(nb_face_idx == -1)[0]
+            if len(unmatched):
+                face_vertices = face_vertices.copy()
+                for i in unmatched:
+                    vertices_there, axis = \
+                            self.global_periodic_opposite_faces[
+                                    tuple(face_vertices[i].tolist())]
+                    face_vertices[i] = vertices_there
+                    periodic_axes[i] = axis
+
+                nb_face_idx[unmatched] = find_rows(nb_face_keys,
+                        numpy.sort(face_vertices[unmatched], axis=1))
+                if (nb_face_idx == -1).any():
+                    raise RuntimeError("faces on boundary with rank %d "
+                            "have no counterpart on that rank" % rank)
+
+            # }}}
+
+            orientation_codes = self._get_orientation_codes(
+                    face_vertices, nb_face_vertices[nb_face_idx])
+            from_indices = (
+                    nb_face_idx[:, numpy.newaxis]*face_node_count
+                    + shuffle_table[orientation_codes]).ravel()
+
+            if check_nodes:
+                nb_node_coords = nb_data[rank][2]
+                assert len(from_indices) == len(nb_node_coords)
+
+                dist = (self.nodes[node_indices]
+                        - nb_node_coords[from_indices]).reshape(
+                                len(face_vertices), face_node_count, -1)
+                for i in numpy.nonzero(periodic_axes >= 0)[0]:
+                    dist[i, :, periodic_axes[i]] = 0
+                assert (numpy.sqrt(numpy.sum(dist**2, axis=-1)) < 1e-14).all()
+
+            # unify FluxFace.h values across boundary
+            h_values = numpy.maximum(
+                    [ff.h for ff in flux_faces], nb_h_values[nb_face_idx])
+            for flux_face, h in zip(flux_faces, h_values):
+                flux_face.h = h
+
+            self.from_neighbor_maps[rank] = \
+                    self.subdiscr.prepare_from_neighbor_map(from_indices)
 
     # }}}
 
@@ -0,0 +1,311 @@
+"""Per-instruction profiling of compiled operators."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+
+import numpy as np
+
+
+
+
+def _count_bytes(value, seen):
+    from hedge.tools import is_obj_array
+    if is_obj_array(value):
+        return sum(_count_bytes(subval, seen) for subval in value)
+    elif isinstance(value, np.ndarray):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        return value.nbytes
+    else:
+        return 0
+
+
+
+
+class InstructionStatistics(object):
+    """Cost of one instruction, accumulated over all of its executions.
+
+    .. attribute:: count
+    .. attribute:: total_time
+    .. attribute:: min_time
+    .. attribute:: max_time
+    .. attribute:: bytes
+
+        Number of bytes read and written by all executions, counting each
+        input and output array once per execution.
+
+    .. attribute:: flops
+
+        Estimated number of floating point operations of all executions,
+        or *None* if unknown.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0
+        self.min_time = None
+        self.max_time = None
+        self.bytes = 0
+        self.flops = 0
+
+    def add(self, seconds, nbytes, flops):
+        self.count += 1
+        self.total_time += seconds
+        if self.min_time is None or seconds < self.min_time:
+            self.min_time = seconds
+        if self.max_time is None or seconds > self.max_time:
+            self.max_time = seconds
+        self.bytes += nbytes
+        if flops is None or self.flops is None:
+            self.flops = None
+        else:
+            self.flops += flops
+
+    @property
+    def gflops_per_second(self):
+        if self.flops is None or not self.total_time:
+            return None
+        return self.flops / self.total_time / 1e9
+
+    @property
+    def gbytes_per_second(self):
+        if not self.total_time:
+            return None
+        return self.bytes / self.total_time / 1e9
+
+
+
+
+class InstructionProfiler(object):
+    """Records wall time, bytes touched and flops of every instruction
+    executed by a :class:`hedge.compiler.Code`.
+
+    Obtain one from :meth:`hedge.backends.jit.Executor.start_profiling`.
+    Costs are aggregated over all executions until :meth:`reset`.
+
+    :param max_trace_events: the number of individual instruction
+      executions kept for :meth:`write_chrome_trace`. Older ones are
+      dropped first.
+    """
+
+    def __init__(self, discr, code, max_trace_events=100000):
+        self.discr = discr
+        self.code = code
+        self.max_trace_events = max_trace_events
+
+        from threading import Lock
+        self.lock = Lock()
+        self.flop_cache = {}
+
+        self.reset()
+
+    def reset(self):
+        self.statistics = {}
+        self.trace_events = []
+
+        from time import time
+        self.start_time = time()
+
+    def get_flops(self, insn):
+        try:
+            return self.flop_cache[insn]
+        except KeyError:
+            result = self.flop_cache[insn] = insn.estimate_flops(self.discr)
+            return result
+
+    def wrap_executor_method(self, exec_mapper, method):
+        """Return a version of the instruction execution method *method*
+        of *exec_mapper* that records the cost of each call.
+        """
+        def wrapped_method(insn):
+            from time import time
+            from thread import get_ident
+
+            seen = set()
+            nbytes = 0
+            for dep in insn.get_dependencies():
+                nbytes += _count_bytes(
+                        exec_mapper.context.get(getattr(dep, "name", None)),
+                        seen)
+
+            start = time()
+            assignments, new_futures = method(insn)
+            seconds = time() - start
+
+            for name, value in assignments:
+                nbytes += _count_bytes(value, seen)
+
+            self.record(insn, start, seconds, nbytes, get_ident())
+            return assignments, new_futures
+
+        return wrapped_method
+
+    def record(self, insn, start, seconds, nbytes, thread_id=0):
+        flops = self.get_flops(insn)
+
+        self.lock.acquire()
+        try:
+            try:
+                stats = self.statistics[insn]
+            except KeyError:
+                stats = self.statistics[insn] = InstructionStatistics()
+
+            stats.add(seconds, nbytes, flops)
+
+            self.trace_events.append(
+                    (insn, start, seconds, nbytes, flops, thread_id))
+            if len(self.trace_events) > self.max_trace_events:
+                del self.trace_events[:len(self.trace_events)//2]
+        finally:
+            self.lock.release()
+
+    # {{{ output
+
+    def describe(self, insn, max_length=60):
+        desc = " ".join(str(insn).split())
+        if len(desc) > max_length:
+            desc = desc[:max_length-3] + "..."
+        return desc
+
+    def make_table(self, max_insn_length=60):
+        """Return a table of instruction costs, most expensive first, as a
+        string.
+        """
+        from pytools import Table
+        tbl = Table()
+        tbl.add_row(("insn", "time [s]", "%", "count", "avg [ms]",
+            "GFLOP/s", "GB/s", "instruction"))
+
+        total_time = sum(stats.total_time
+                for stats in self.statistics.itervalues())
+
+        def format_rate(rate):
+            if rate is None:
+                return "-"
+            else:
+                return "%.2f" % rate
+
+        insn_numbers = dict(
+                (insn, i) for i, insn in enumerate(self.code.instructions))
+
+        for insn, stats in sorted(self.statistics.iteritems(),
+                key=lambda item: -item[1].total_time):
+            if total_time:
+                percent = 100*stats.total_time/total_time
+            else:
+                percent = 0
+
+            tbl.add_row((
+                insn_numbers.get(insn, "?"),
+                "%.4f" % stats.total_time,
+                "%.1f" % percent,
+                stats.count,
+                "%.3f" % (1000*stats.total_time/stats.count),
+                format_rate(stats.gflops_per_second),
+                format_rate(stats.gbytes_per_second),
+                self.describe(insn, max_insn_length),
+                ))
+
+        return str(tbl)
+
+    def get_chrome_trace(self):
+        """Return the recorded instruction executions in the JSON-compatible
+        trace event format understood by Chrome's ``about:tracing`` viewer.
+        """
+        insn_numbers = dict(
+                (insn, i) for i, insn in enumerate(self.code.instructions))
+
+        events = []
+        for insn, start, seconds, nbytes, flops, thread_id \
+                in self.trace_events:
+            events.append({
+                "name": "insn %s: %s" % (
+                    insn_numbers.get(insn, "?"), self.describe(insn)),
+                "cat": type(insn).__name__,
+                "ph": "X",
+                "ts": 1e6*(start-self.start_time),
+                "dur": 1e6*seconds,
+                "pid": 0,
+                "tid": thread_id,
+                "args": {"bytes": nbytes, "flops": flops},
+                })
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, filename):
+        import json
+        outf = open(filename, "w")
+        try:
+            json.dump(self.get_chrome_trace(), outf)
+        finally:
+            outf.close()
+
+    def dot_dataflow_graph(self, **kwargs):
+        """Return :func:`hedge.compiler.dot_dataflow_graph` of the profiled
+        code, with each instruction annotated by its cost.
+        """
+        annotations = {}
+        for insn, stats in self.statistics.iteritems():
+            lines = ["%.3f ms x %d" % (
+                1000*stats.total_time/stats.count, stats.count)]
+            if stats.gflops_per_second is not None:
+                lines.append("%.2f GFLOP/s" % stats.gflops_per_second)
+            if stats.gbytes_per_second is not None:
+                lines.append("%.2f GB/s" % stats.gbytes_per_second)
+            annotations[insn] = "\n".join(lines)
+
+        from hedge.compiler import dot_dataflow_graph
+        return dot_dataflow_graph(self.code,
+                insn_annotations=annotations, **kwargs)
+
+    # }}}
+
+
+
+
+class ProfilingExecutionMapper(object):
+    """Forwards to an execution mapper, timing the instruction execution
+    methods it hands to :class:`hedge.compiler.Code`.
+    """
+
+    def __init__(self, exec_mapper, profiler):
+        self.exec_mapper = exec_mapper
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        result = getattr(self.exec_mapper, name)
+        if name.startswith("exec_"):
+            result = self.profiler.wrap_executor_method(
+                    self.exec_mapper, result)
+        return result
+
+    def __call__(self, *args, **kwargs):
+        return self.exec_mapper(*args, **kwargs)
+
+# vim: foldmethod=marker
@@ -32,8 +32,17 @@ from hedge.optemplate import IdentityMapper
 # {{{ instructions
 
 class Instruction(Record):
+    """
+    .. attribute:: runs_on_main_thread
+
+        If true, :meth:`Code.execute_dynamic` never hands this instruction
+        to a worker pool. Used for instructions that communicate through
+        MPI, which need not be thread-safe.
+    """
+
     __slots__ = ["dep_mapper_factory"]
     priority = 0
+    runs_on_main_thread = False
 
     def get_assignees(self):
         raise NotImplementedError("no get_assignees in %s" % self.__class__)
@@ -47,6 +56,20 @@ class Instruction(Record):
     def get_executor_method(self, executor):
         raise NotImplementedError
 
+    def estimate_flops(self, discr):
+        """Return an estimate of the number of floating point operations
+        needed to execute this instruction on *discr*, or *None* if
+        unknown.
+        """
+        return None
+
+    def get_value_aliases(self):
+        """Return a list of tuples *(name, other_name)*, one for each
+        assignee *name* whose value may be (part of) the value of the
+        variable *other_name*, instead of being newly computed.
+        """
+        return []
+
 
 class Assign(Instruction):
     """
@@ -126,6 +149,24 @@ class Assign(Instruction):
     def get_executor_method(self, executor):
         return executor.exec_assign
 
+    def estimate_flops(self, discr):
+        if self.is_scalar_valued:
+            return self.flop_count()
+        else:
+            return self.flop_count() * len(discr)
+
+    def get_value_aliases(self):
+        from pymbolic.primitives import Variable, Subscript
+
+        result = []
+        for name, expr in zip(self.names, self.exprs):
+            while isinstance(expr, Subscript):
+                expr = expr.aggregate
+            if isinstance(expr, Variable):
+                result.append((name, expr.name))
+
+        return result
+
 
 class FluxBatchAssign(Instruction):
     __slots__ = ["names", "expressions", "repr_op"]
@@ -173,6 +214,23 @@ class FluxBatchAssign(Instruction):
     def get_executor_method(self, executor):
         return executor.exec_flux_batch_assign
 
+    def estimate_flops(self, discr):
+        from hedge.tools.flops import gather_flops, lift_flops
+
+        quadrature_tag = getattr(self, "quadrature_tag", None)
+        flux_count = len(self.expressions)
+
+        result = flux_count * gather_flops(discr, quadrature_tag)
+        if quadrature_tag is None:
+            if getattr(self, "is_boundary", False):
+                face_groups = discr.get_boundary(
+                        self.repr_op.boundary_tag).face_groups
+            else:
+                face_groups = discr.face_groups
+            result += flux_count * sum(lift_flops(fg) for fg in face_groups)
+
+        return result
+
 
 class DiffBatchAssign(Instruction):
     """
@@ -212,6 +270,10 @@ class DiffBatchAssign(Instruction):
     def get_executor_method(self, executor):
         return executor.exec_diff_batch_assign
 
+    def estimate_flops(self, discr):
+        from hedge.tools.flops import diff_rst_flops
+        return len(self.operators) * diff_rst_flops(discr)
+
 
 class QuadratureDiffBatchAssign(DiffBatchAssign):
     def get_executor_method(self, executor):
@@ -224,6 +286,7 @@ class FluxExchangeBatchAssign(Instruction):
             "rank_to_index_and_name", "arg_fields"]
 
     priority = 1
+    runs_on_main_thread = True
 
     def __init__(self, names, indices_and_ranks, arg_fields, dep_mapper_factory):
         rank_to_index_and_name = {}
@@ -269,7 +332,11 @@ class FluxExchangeBatchAssign(Instruction):
 # {{{ graphviz/dot dataflow graph drawing
 
 def dot_dataflow_graph(code, max_node_label_length=30,
-        label_wrap_width=50):
+        label_wrap_width=50, insn_annotations=None):
+    """
+    :param insn_annotations: a dictionary mapping instructions to strings
+      appended to their node labels, such as profiling results.
+    """
     origins = {}
     node_names = {}
 
@@ -290,6 +357,9 @@ def dot_dataflow_graph(code, max_node_label_length=30,
             node_label = word_wrap(node_label, label_wrap_width,
                     wrap_using="\n      ")
 
+        if insn_annotations is not None and insn in insn_annotations:
+            node_label += "\n" + insn_annotations[insn]
+
         node_label = node_label.replace("\n", "\\l") + "\\l"
 
         result.append("%s [ label=\"p%d: %s\" shape=box ];" % (
@@ -335,6 +405,8 @@ class Code(object):
         self.last_schedule = None
         self.static_schedule_attempts = 5
 
+        self._build_dependency_graph()
+
     def dump_dataflow_graph(self):
         from hedge.tools import open_unique_debug_file
 
@@ -349,35 +421,24 @@ class Code(object):
 
         return "\n".join(lines)
 
-    # {{{ dynamic scheduler (generates static schedules by self-observation)
-    class NoInstructionAvailable(Exception):
-        pass
-
-    @memoize_method
-    def get_next_step(self, available_names, done_insns):
-        from pytools import all, argmax2
-        available_insns = [
-                (insn, insn.priority) for insn in self.instructions
-                if insn not in done_insns
-                and all(dep.name in available_names
-                    for dep in insn.get_dependencies())]
-
-        if not available_insns:
-            raise self.NoInstructionAvailable
-
-        from pytools import flatten
-        discardable_vars = set(available_names) - set(flatten(
-            [dep.name for dep in insn.get_dependencies()]
-            for insn in self.instructions
-            if insn not in done_insns))
+    # {{{ dependency graph
 
+    def _build_dependency_graph(self):
+        """Find, once and for all, which variables each instruction reads,
+        which instructions read each variable, and which variables are
+        needed for the result. This lets the dynamic scheduler keep track
+        of instruction readiness and variable lifetimes incrementally.
+        """
         # {{{ make sure results do not get discarded
+
         from hedge.tools import with_object_array_or_scalar
 
         from hedge.optemplate.mappers import DependencyMapper
         dm = DependencyMapper(composite_leaves=False)
 
-        def remove_result_variable(result_expr):
+        self.result_names = set()
+
+        def add_result_variable(result_expr):
             # The extra dependency mapper run is necessary
             # because, for instance, subscripts can make it
             # into the result expression, which then does
@@ -386,16 +447,174 @@ class Code(object):
             for var in dm(result_expr):
                 from pymbolic.primitives import Variable
                 assert isinstance(var, Variable)
-                discardable_vars.discard(var.name)
+                self.result_names.add(var.name)
+
+        with_object_array_or_scalar(add_result_variable, self.result)
 
-        with_object_array_or_scalar(remove_result_variable, self.result)
         # }}}
 
-        return argmax2(available_insns), discardable_vars
+        # insn_dep_names[i] is the set of names read by instruction i
+        self.insn_dep_names = []
+
+        # var_to_readers[name] is a list of the numbers of the
+        # instructions reading *name*
+        self.var_to_readers = {}
+
+        for insn_nr, insn in enumerate(self.instructions):
+            dep_names = frozenset(
+                    dep.name for dep in insn.get_dependencies())
+            self.insn_dep_names.append(dep_names)
+
+            for name in dep_names:
+                self.var_to_readers.setdefault(name, []).append(insn_nr)
 
-    def execute_dynamic(self, exec_mapper, pre_assign_check=None):
+        # names not assigned here are arguments, whose values belong to
+        # the caller
+        self.assigned_names = set()
+        for insn in self.instructions:
+            self.assigned_names |= insn.get_assignees()
+
+        # alias_groups[name] is the set of variables that may share their
+        # value with *name*, for those variables that may share theirs
+        self.alias_groups = {}
+
+        for insn in self.instructions:
+            for name, other_name in insn.get_value_aliases():
+                group = (self.alias_groups.get(name, set([name]))
+                        | self.alias_groups.get(other_name, set([other_name])))
+
+                for group_name in group:
+                    self.alias_groups[group_name] = group
+
+    def is_value_private(self, name, context):
+        """Return whether the value of the variable *name* was computed by
+        an instruction, and no argument and no variable in *context* other
+        than *name* may share it. Such a value may be reused once
+        :meth:`execute` discards *name*.
+        """
+        if name not in self.assigned_names:
+            return False
+
+        for other_name in self.alias_groups.get(name, ()):
+            if other_name not in self.assigned_names:
+                return False
+            if other_name != name and other_name in context:
+                return False
+
+        return True
+
+    # }}}
+
+    # {{{ dynamic scheduler (generates static schedules by self-observation)
+
+    class _SchedulerState(object):
+        """Readiness and lifetime bookkeeping for one run of
+        :meth:`Code.execute_dynamic`. All updates take time proportional to
+        the number of instructions reading the variables involved.
+        """
+
+        def __init__(self, code, available_names):
+            self.code = code
+
+            # number of names each instruction still waits for
+            self.missing_count = [
+                    len([name for name in dep_names
+                        if name not in available_names])
+                    for dep_names in code.insn_dep_names]
+
+            # number of not-yet-executed readers of each variable
+            self.remaining_reads = dict(
+                    (name, len(readers))
+                    for name, readers in code.var_to_readers.iteritems())
+
+            # heap of (-priority, insn_nr), so that among the instructions
+            # that are ready, the one with highest priority (and, among
+            # those, the earliest one) is picked first
+            self.ready = [
+                    (-code.instructions[insn_nr].priority, insn_nr)
+                    for insn_nr, count in enumerate(self.missing_count)
+                    if count == 0]
+            from heapq import heapify
+            heapify(self.ready)
+
+            # variables that may be dropped before the next step
+            self.discardable_vars = []
+
+            # variables whose last reader is currently executing, see
+            # :meth:`take_released`
+            self.released_vars = []
+
+            for name in available_names:
+                self._check_discardable(name)
+
+        def _check_discardable(self, name):
+            if (not self.remaining_reads.get(name, 0)
+                    and name not in self.code.result_names):
+                self.discardable_vars.append(name)
+
+        def pop_discardable(self):
+            result = self.discardable_vars
+            self.discardable_vars = []
+            return result
+
+        def take_released(self):
+            """Return the variables no longer needed once the instruction
+            last returned by :meth:`get_next_insn` has finished executing.
+            """
+            result = self.released_vars
+            self.released_vars = []
+            return result
+
+        def finish_insn(self, released_vars=None):
+            """Mark *released_vars* (by default, the result of
+            :meth:`take_released`) as discardable.
+            """
+            if released_vars is None:
+                released_vars = self.take_released()
+
+            for name in released_vars:
+                self._check_discardable(name)
+
+        def mark_available(self, name):
+            from heapq import heappush
+            for insn_nr in self.code.var_to_readers.get(name, []):
+                self.missing_count[insn_nr] -= 1
+                if self.missing_count[insn_nr] == 0:
+                    heappush(self.ready,
+                            (-self.code.instructions[insn_nr].priority, insn_nr))
+
+            self._check_discardable(name)
+
+        def get_next_insn(self):
+            if not self.ready:
+                raise Code.NoInstructionAvailable
+
+            from heapq import heappop
+            priority, insn_nr = heappop(self.ready)
+
+            for name in self.code.insn_dep_names[insn_nr]:
+                self.remaining_reads[name] -= 1
+                if not self.remaining_reads[name]:
+                    self.released_vars.append(name)
+
+            return self.code.instructions[insn_nr]
+
+    class NoInstructionAvailable(Exception):
+        pass
+
+    def execute_dynamic(self, exec_mapper, pre_assign_check=None,
+            worker_pool=None):
         """Execute the instruction stream, make all scheduling decisions
         dynamically. Record the schedule in *self.last_schedule*.
+
+        :param worker_pool: if not *None*, a
+          :class:`multiprocessing.pool.ThreadPool` to which instructions are
+          handed as soon as their dependencies are available, so that
+          independent instructions may execute concurrently. Their results
+          are collected as futures (see :mod:`hedge.tools.futures`). In
+          this case, no schedule is recorded. Instructions with
+          :attr:`Instruction.runs_on_main_thread` set are still executed
+          on the calling thread.
         """
         schedule = []
 
@@ -405,7 +624,18 @@ class Code(object):
         futures = []
         done_insns = set()
 
-        force_future = False
+        # maps futures of instructions executing in *worker_pool* to
+        # the variables that become discardable once they finish
+        future_to_released = {}
+
+        state = self._SchedulerState(self, frozenset(context.keys()))
+
+        # set by instructions finishing in *worker_pool*
+        if worker_pool is not None:
+            from threading import Event
+            ready_event = Event()
+        else:
+            ready_event = None
 
         while True:
             insn = None
@@ -416,13 +646,16 @@ class Code(object):
             i = 0
             while i < len(futures):
                 future = futures[i]
-                if force_future or future.is_ready():
+                if future.is_ready():
                     futures.pop(i)
 
                     insn = self.EvaluateFuture(future.id)
 
                     assignments, new_futures = future()
-                    force_future = False
+
+                    released_vars = future_to_released.pop(future, None)
+                    if released_vars is not None:
+                        state.finish_insn(released_vars)
                     break
                 else:
                     i += 1
@@ -432,24 +665,37 @@ class Code(object):
             # if no future got processed, pick the next insn
             if insn is None:
                 try:
-                    insn, discardable_vars = self.get_next_step(
-                            frozenset(context.keys()),
-                            frozenset(done_insns))
+                    insn = state.get_next_insn()
 
                 except self.NoInstructionAvailable:
                     if futures:
-                        # no insn ready: we need a future to complete to continue
-                        force_future = True
+                        # no insn ready: we need a future to complete to
+                        # continue--wait for whichever one finishes first
+                        from hedge.tools.futures import wait_for_any
+                        wait_for_any(futures, ready_event)
                     else:
                         # no futures, no available instructions: we're done
                         break
                 else:
+                    discardable_vars = state.pop_discardable()
                     for name in discardable_vars:
-                        del context[name]
+                        exec_mapper.discard_variable(name)
 
                     done_insns.add(insn)
-                    assignments, new_futures = \
-                            insn.get_executor_method(exec_mapper)(insn)
+                    if worker_pool is None or insn.runs_on_main_thread:
+                        assignments, new_futures = \
+                                insn.get_executor_method(exec_mapper)(insn)
+                        state.finish_insn()
+                    else:
+                        from hedge.tools.futures import ThreadPoolFuture
+                        future = ThreadPoolFuture(worker_pool,
+                                insn.get_executor_method(exec_mapper), (insn,),
+                                ready_event)
+                        future_to_released[future] = state.take_released()
+
+                        assignments = []
+                        new_futures = [future]
+                        del future
 
             if insn is not None:
                 for target, value in assignments:
@@ -457,6 +703,7 @@ class Code(object):
                         pre_assign_check(target, value)
 
                     context[target] = value
+                    state.mark_available(target)
 
                 futures.extend(new_futures)
 
@@ -474,7 +721,7 @@ class Code(object):
             raise RuntimeError("not all instructions are reachable"
                     "--did you forget to pass a value for a placeholder?")
 
-        if self.static_schedule_attempts:
+        if self.static_schedule_attempts and worker_pool is None:
             self.last_schedule = schedule
 
         from hedge.tools import with_object_array_or_scalar
@@ -488,13 +735,18 @@ class Code(object):
         def __init__(self, future_id):
             self.future_id = future_id
 
-    def execute(self, exec_mapper, pre_assign_check=None):
+    def execute(self, exec_mapper, pre_assign_check=None, worker_pool=None):
         """If we have a saved, static schedule for this instruction stream,
         execute it. Otherwise, punt to the dynamic scheduler below.
+
+        If *worker_pool* is given, always use the dynamic scheduler and
+        execute independent instructions concurrently, see
+        :meth:`execute_dynamic`.
         """
 
-        if self.last_schedule is None:
-            return self.execute_dynamic(exec_mapper, pre_assign_check)
+        if self.last_schedule is None or worker_pool is not None:
+            return self.execute_dynamic(exec_mapper, pre_assign_check,
+                    worker_pool)
 
         context = exec_mapper.context
         id_to_future = {}
@@ -504,7 +756,7 @@ class Code(object):
 
         for discardable_vars, insn, new_future_count in self.last_schedule:
             for name in discardable_vars:
-                del context[name]
+                exec_mapper.discard_variable(name)
 
             if isinstance(insn, self.EvaluateFuture):
                 future = id_to_future.pop(insn.future_id)
@@ -216,13 +216,18 @@ class Discretization(TimestepCalculator):
     # {{{ construction / finalization
     def __init__(self, mesh, local_discretization=None,
             order=None, quad_min_degrees={},
-            debug=set(), default_scalar_type=np.float64, run_context=None):
+            debug=set(), default_scalar_type=np.float64, run_context=None,
+            snapshot=None):
         """
         :param quad_min_degrees: A mapping from quadrature tags to the degrees to
           which the desired quadrature is supposed to be exact.
         :param debug: A set of strings indicating which debug checks should
           be activated. See validity check below for the currently defined
           set of debug flags.
+        :param snapshot: a
+          :class:`hedge.discretization.snapshot.DiscretizationSnapshot`
+          from which to take nodes and face groups instead of computing
+          them. Use :meth:`load` rather than passing this directly.
         """
 
         self.run_context = run_context
@@ -256,13 +261,43 @@ class Discretization(TimestepCalculator):
         self.default_scalar_type = default_scalar_type
 
         self.exec_functions = {}
+        self._boundaries_by_face_subset = {}
 
-        self._build_element_groups_and_nodes(local_discretization)
+        self._build_element_groups_and_nodes(local_discretization, snapshot)
         self._calculate_local_matrices()
-        self._build_interior_face_groups()
+        self._build_interior_face_groups(snapshot)
 
     def close(self):
-        pass
+        self.release_element_arrays()
+
+    def save(self, path):
+        """Write the mesh, nodes and face groups of this discretization to
+        the directory *path*, such that :meth:`load` can recreate it
+        without repeating the setup.
+
+        Only meshes of straight simplices of a single type are supported.
+        See :mod:`hedge.discretization.snapshot` for the format.
+        """
+        from hedge.discretization.snapshot import save_discretization
+        save_discretization(self, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Recreate a discretization saved with :meth:`save`. Large arrays
+        are memory-mapped from the files in *path*. Additional keyword
+        arguments are passed on to the constructor, e.g. *run_context* or
+        backend-specific options.
+        """
+        from hedge.discretization.snapshot import load_snapshot
+        snapshot = load_snapshot(path)
+        hdr = snapshot.header
+
+        for name in ["quad_min_degrees", "debug", "default_scalar_type"]:
+            kwargs.setdefault(name, hdr[name])
+
+        return cls(snapshot.make_mesh(),
+                local_discretization=snapshot.make_local_discretization(),
+                snapshot=snapshot, **kwargs)
 
     # }}}
 
@@ -371,16 +406,23 @@ class Discretization(TimestepCalculator):
     # }}}
 
     # {{{ initialization ------------------------------------------------------
-    def _build_element_groups_and_nodes(self, local_discretization):
+    def _build_element_groups_and_nodes(self, local_discretization,
+            snapshot=None):
         from hedge.mesh.element import CurvedElement
         from hedge.mesh.element import SimplicialElement
+        from hedge.mesh.array import ElementArrays
 
-        straight_elements = [el
-                for el in self.mesh.elements
-                if isinstance(el, SimplicialElement)]
-        curved_elements = [el
-                for el in self.mesh.elements
-                if isinstance(el, CurvedElement)]
+        if isinstance(self.mesh.elements, ElementArrays):
+            # array-based meshes consist of straight simplices only
+            straight_elements = self.mesh.elements
+            curved_elements = []
+        else:
+            straight_elements = [el
+                    for el in self.mesh.elements
+                    if isinstance(el, SimplicialElement)]
+            curved_elements = [el
+                    for el in self.mesh.elements
+                    if isinstance(el, CurvedElement)]
 
         self.element_groups = []
 
@@ -392,8 +434,11 @@ class Discretization(TimestepCalculator):
             self.element_groups.append(eg)
 
             eg.members = straight_elements
-            eg.member_nrs = np.fromiter((el.id for el in eg.members),
-                    dtype=np.uint32)
+            if isinstance(eg.members, ElementArrays):
+                eg.member_nrs = np.arange(len(eg.members), dtype=np.uint32)
+            else:
+                eg.member_nrs = np.fromiter((el.id for el in eg.members),
+                        dtype=np.uint32)
             eg.local_discretization = ldis = local_discretization
             eg.ranges = UniformElementRanges(
                     0,
@@ -412,25 +457,35 @@ class Discretization(TimestepCalculator):
             # while it seems convenient, nodes should not have an
             # "element number" dimension: this would break once
             # p-adaptivity is implemented
-            self.nodes = np.empty(
-                    (len(self.mesh.elements) * nodes_per_el, self.dimensions),
-                    dtype=float, order="C")
-
-            unit_nodes = np.empty((nodes_per_el, self.dimensions),
-                    dtype=float, order="C")
+            if snapshot is not None:
+                self.nodes = snapshot.get_array("nodes")
+            else:
+                self.nodes = np.empty(
+                        (len(self.mesh.elements) * nodes_per_el,
+                            self.dimensions),
+                        dtype=float, order="C")
 
-            for i_node, node in enumerate(ldis.unit_nodes()):
-                unit_nodes[i_node] = node
+                unit_nodes = np.empty((nodes_per_el, self.dimensions),
+                        dtype=float, order="C")
 
-            from hedge._internal import map_element_nodes
+                for i_node, node in enumerate(ldis.unit_nodes()):
+                    unit_nodes[i_node] = node
 
-            for el in eg.members:
-                map_element_nodes(
-                        self.nodes,
-                        el.id * nodes_per_el * self.dimensions,
-                        el.map,
-                        unit_nodes,
-                        self.dimensions)
+                if isinstance(eg.members, ElementArrays):
+                    map_matrices = eg.members.map_matrices
+                    map_offsets = eg.members.map_offsets
+                else:
+                    map_matrices = np.array(
+                            [el.map.matrix for el in eg.members])
+                    map_offsets = np.array(
+                            [el.map.vector for el in eg.members])
+
+                # map all elements' nodes in one batched affine transform
+                el_nodes = self.nodes.reshape(
+                        len(self.mesh.elements), nodes_per_el, self.dimensions)
+                el_nodes[eg.member_nrs] = (
+                        np.einsum("eij,nj->eni", map_matrices, unit_nodes)
+                        + map_offsets[:, np.newaxis, :])
 
             self.group_map = [(eg, i) for i in range(len(self.mesh.elements))]
 
@@ -452,6 +507,14 @@ class Discretization(TimestepCalculator):
             eg.minv_st = \
                     [np.dot(np.dot(immat, d.T), mmat) for d in dmats]
 
+    @staticmethod
+    def _element_group_jacobians(eg):
+        from hedge.mesh.array import ElementArrays
+        if isinstance(eg.members, ElementArrays):
+            return np.abs(eg.members.jacobians)
+        else:
+            return np.array([abs(el.map.jacobian()) for el in eg.members])
+
     @memoize_method
     def volume_jacobians(self, quadrature_tag=None, kind="numpy"):
         """Return a full-volume vector of jacobians on nodal/
@@ -465,9 +528,8 @@ class Discretization(TimestepCalculator):
             vol_jac = self.volume_empty(kind=kind)
 
             for eg in self.element_groups:
-                (eg.el_array_from_volume(vol_jac).T)[:, :] = np.array([
-                    abs(el.map.jacobian())
-                    for el in eg.members])
+                (eg.el_array_from_volume(vol_jac).T)[:, :] = \
+                        self._element_group_jacobians(eg)
 
             return vol_jac
         else:
@@ -481,7 +543,7 @@ class Discretization(TimestepCalculator):
             for eg in self.element_groups:
                 eg_q_info = eg.quadrature_info[quadrature_tag]
                 (eg_q_info.el_array_from_volume(vol_jac).T)[:, :] \
-                        = np.array([abs(el.map.jacobian()) for el in eg.members])
+                        = self._element_group_jacobians(eg)
 
             return vol_jac
 
@@ -593,7 +655,269 @@ class Discretization(TimestepCalculator):
         # This unification happens below.
         f.h = abs(el.map.jacobian() / f.face_jacobian)
 
-    def _build_interior_face_groups(self):
+    def _get_element_arrays(self):
+        """Return the mesh's elements as a
+        :class:`hedge.mesh.array.ElementArrays` instance with connectivity,
+        building one if necessary. Return *None* if the mesh cannot be
+        represented that way.
+
+        For a mesh of element objects, the result is a copy of the
+        element data (vertex indices, maps, normals and connectivity, a few
+        hundred bytes per element). It is kept until
+        :meth:`release_element_arrays` is called, so that point location
+        and :meth:`save` can reuse it.
+        """
+        try:
+            return self._element_arrays
+        except AttributeError:
+            pass
+
+        self._element_arrays = self._make_element_arrays()
+        return self._element_arrays
+
+    def release_element_arrays(self):
+        """Drop the element arrays kept by :meth:`_get_element_arrays`.
+        They are rebuilt if they are needed again, e.g. for point location
+        or :meth:`save`. Boundaries are built from data extracted when the
+        first boundary was requested and do not need them. Objects already
+        built from them, such as the grid of
+        :meth:`get_element_bucket_grid`, keep their own reference.
+        """
+        self.__dict__.pop("_element_arrays", None)
+
+    def _make_element_arrays(self):
+        from hedge.mesh.array import ElementArrays, VIEW_CLASS
+
+        elements = self.mesh.elements
+        if isinstance(elements, ElementArrays):
+            if elements.neighbor_elements is None:
+                elements.set_connectivity(self.mesh.interfaces,
+                        self.mesh.periodic_opposite_faces)
+            return elements
+
+        el_classes = set(type(el) for el in elements)
+        if len(el_classes) != 1:
+            return None
+        el_class, = el_classes
+        if el_class not in VIEW_CLASS:
+            return None
+        for i, el in enumerate(elements):
+            if el.id != i:
+                return None
+
+        result = ElementArrays(el_class,
+                [el.vertex_indices for el in elements], self.mesh.points)
+        result.set_connectivity(self.mesh.interfaces,
+                self.mesh.periodic_opposite_faces)
+        return result
+
+    def _get_interior_face_pair_data(self, element_arrays):
+        """Return a dictionary of arrays describing all interior face
+        pairs, as consumed by :meth:`_make_interior_face_group`, or *None*
+        if there are no interior faces.
+        """
+        from hedge.mesh.array import NO_NEIGHBOR
+        from hedge.tools import IndexListRegistry
+        from pytools import get_write_to_map_from_permutation
+
+        ea = element_arrays
+        eg, = self.element_groups
+        ldis = eg.local_discretization
+        face_count = ldis.face_count()
+        perm_count = len(ea.face_permutations)
+
+        # find each interface once, from the side with the lower
+        # (element, face) number
+        el_l, fi_l = np.nonzero(ea.neighbor_elements != NO_NEIGHBOR)
+        el_n = ea.neighbor_elements[el_l, fi_l]
+        fi_n = ea.neighbor_faces[el_l, fi_l]
+
+        is_int_side = el_l*face_count + fi_l < el_n*face_count + fi_n
+        el_l = el_l[is_int_side]
+        fi_l = fi_l[is_int_side]
+        el_n = el_n[is_int_side]
+        fi_n = fi_n[is_int_side]
+
+        if not len(el_l):
+            return None
+
+        fil_registry = IndexListRegistry("ilist_generation" in self.debug)
+
+        # {{{ register index lists
+
+        # There is one index list per interior face number, and one per
+        # combination of exterior face number and relative orientation.
+        # Register each once, then look up the list numbers for all face
+        # pairs at once.
+
+        int_fil_numbers = np.zeros(face_count, dtype=np.uint32)
+        for fi in np.unique(fi_l):
+            fi = int(fi)
+            int_fil_numbers[fi] = fil_registry.register(
+                    identifier=fi,
+                    generator=lambda: ldis.face_indices()[fi])
+
+        ext_fil_numbers = np.zeros(face_count*perm_count, dtype=np.uint32)
+        ext_write_maps = np.zeros(face_count*perm_count, dtype=np.uint32)
+
+        ext_keys = fi_n*perm_count + ea.neighbor_orientations[el_l, fi_l]
+        int_face_vertices = tuple(range(ea.face_vertex_numbers.shape[1]))
+
+        for key in np.unique(ext_keys):
+            fi, perm_nr = divmod(int(key), perm_count)
+
+            # vertex j of the exterior face is vertex
+            # ext_face_vertices[j] of the interior face
+            ext_face_vertices = tuple(int(i) for i in
+                    np.argsort(ea.face_permutations[perm_nr]))
+            shuffle_op = ldis.get_face_index_shuffle_to_match(
+                    int_face_vertices, ext_face_vertices)
+            findices_n = ldis.face_indices()[fi]
+
+            ext_fil_numbers[key] = fil_registry.register(
+                    identifier=(fi, shuffle_op),
+                    generator=lambda: shuffle_op(findices_n))
+            ext_write_maps[key] = fil_registry.register(
+                    identifier=(fi, shuffle_op, "wtm"),
+                    generator=lambda:
+                    get_write_to_map_from_permutation(
+                        shuffle_op(findices_n), findices_n))
+
+        # }}}
+
+        # {{{ geometry
+
+        fj_l = ea.face_jacobians[el_l, fi_l]
+        fj_n = ea.face_jacobians[el_n, fi_n]
+        assert (np.abs(fj_l - fj_n) / np.abs(fj_l) < 1e-13).all()
+
+        # see _set_flux_face_data for the h approximation, which
+        # must be the same on both sides of an interface
+        h = np.maximum(
+                np.abs(ea.jacobians[el_l] / fj_l),
+                np.abs(ea.jacobians[el_n] / fj_n))
+
+        # }}}
+
+        # number elements locally
+        used_els = np.unique(np.hstack([el_l, el_n]))
+        used_el_bases = eg.ranges.start + used_els*eg.ranges.el_size
+
+        el_base_l = eg.ranges.start + el_l*eg.ranges.el_size
+        el_base_n = eg.ranges.start + el_n*eg.ranges.el_size
+
+        fp_count = len(el_l)
+
+        side_indices = np.empty((fp_count, 2, 5), dtype=np.uint32)
+        side_indices[:, 0, 0] = el_base_l
+        side_indices[:, 0, 1] = int_fil_numbers[fi_l]
+        side_indices[:, 0, 2] = np.searchsorted(used_els, el_l)
+        side_indices[:, 0, 3] = el_l
+        side_indices[:, 0, 4] = fi_l
+        side_indices[:, 1, 0] = el_base_n
+        side_indices[:, 1, 1] = ext_fil_numbers[ext_keys]
+        side_indices[:, 1, 2] = np.searchsorted(used_els, el_n)
+        side_indices[:, 1, 3] = el_n
+        side_indices[:, 1, 4] = fi_n
+
+        side_geometry = np.empty((fp_count, 2, 3), dtype=np.float64)
+        side_geometry[:, 0, 0] = h
+        side_geometry[:, 0, 1] = fj_l
+        side_geometry[:, 0, 2] = ea.jacobians[el_l]
+        side_geometry[:, 1, 0] = h
+        side_geometry[:, 1, 1] = fj_n
+        side_geometry[:, 1, 2] = ea.jacobians[el_n]
+
+        side_normals = np.empty((fp_count, 2, self.dimensions),
+                dtype=np.float64)
+        side_normals[:, 0] = ea.face_normals[el_l, fi_l]
+        side_normals[:, 1] = ea.face_normals[el_n, fi_n]
+
+        return dict(
+                side_indices=side_indices,
+                side_geometry=side_geometry,
+                side_normals=side_normals,
+                ext_native_write_maps=ext_write_maps[ext_keys],
+                index_lists=np.array(fil_registry.index_lists,
+                    dtype=np.uint32, order="C"),
+                local_el_write_base=used_el_bases,
+                local_el_inverse_jacobians=1/np.abs(ea.jacobians[used_els]))
+
+    def _make_interior_face_group(self, face_pair_data):
+        """Build the interior face group from the result of
+        :meth:`_get_interior_face_pair_data`.
+        """
+        from hedge.discretization.data import StraightFaceGroup
+
+        ldis = self.element_groups[0].local_discretization
+        fg = StraightFaceGroup(double_sided=True,
+                debug="ilist_generation" in self.debug)
+        fg.append_face_pairs(ldis.order,
+                face_pair_data["side_indices"],
+                face_pair_data["side_geometry"],
+                face_pair_data["side_normals"],
+                face_pair_data["ext_native_write_maps"])
+        fg.commit_local_elements(ldis, ldis,
+                face_pair_data["local_el_write_base"],
+                face_pair_data["local_el_inverse_jacobians"],
+                index_lists=face_pair_data["index_lists"])
+        return fg
+
+    def _build_interior_face_groups_from_arrays(self, element_arrays):
+        ea = element_arrays
+        face_pair_data = self._get_interior_face_pair_data(ea)
+        if face_pair_data is None:
+            self.face_groups = []
+            return
+
+        fg = self._make_interior_face_group(face_pair_data)
+
+        # check that nodes match up
+        if "node_permutation" in self.debug \
+                and fg.ldis_loc.has_facial_nodes:
+            side_indices = face_pair_data["side_indices"]
+            el_base_l = side_indices[:, 0, 0].astype(np.intp)
+            el_base_n = side_indices[:, 1, 0].astype(np.intp)
+            el_l, fi_l = side_indices[:, 0, 3], side_indices[:, 0, 4]
+            el_n, fi_n = side_indices[:, 1, 3], side_indices[:, 1, 4]
+
+            nodes_l = self.nodes[el_base_l[:, np.newaxis]
+                    + fg.index_lists[side_indices[:, 0, 1]]]
+            nodes_n = self.nodes[el_base_n[:, np.newaxis]
+                    + fg.index_lists[side_indices[:, 1, 1]]]
+            dist = nodes_l - nodes_n
+
+            # ignore the periodic axis for faces matched across
+            # a periodic boundary
+            faces_n = ea.faces[el_n, fi_n]
+            is_periodic = np.any(
+                    np.sort(ea.faces[el_l, fi_l], axis=1)
+                    != np.sort(faces_n, axis=1), axis=1)
+            for i in np.nonzero(is_periodic)[0]:
+                _, periodic_axis = self.mesh.periodic_opposite_faces[
+                        tuple(faces_n[i])]
+                dist[i, :, periodic_axis] = 0
+
+            assert (np.sqrt(np.sum(dist**2, axis=-1)) < 1e-14).all()
+
+        self.face_groups = [fg]
+
+    def _build_interior_face_groups(self, snapshot=None):
+        if snapshot is not None:
+            face_pair_data = snapshot.get_interior_face_pair_data()
+            if face_pair_data is None:
+                self.face_groups = []
+            else:
+                self.face_groups = [
+                        self._make_interior_face_group(face_pair_data)]
+            return
+
+        if len(self.element_groups) == 1:
+            element_arrays = self._get_element_arrays()
+            if element_arrays is not None:
+                self._build_interior_face_groups_from_arrays(element_arrays)
+                return
+
         from hedge.discretization.local import FaceVertexMismatch
         from hedge.discretization.data import StraightFaceGroup
         fg_type = StraightFaceGroup
@@ -694,6 +1018,30 @@ class Discretization(TimestepCalculator):
     def is_boundary_tag_nonempty(self, tag):
         return bool(self.mesh.tag_to_boundary.get(tag, []))
 
+    @memoize_method
+    def _get_all_boundary_faces(self):
+        """Return a tuple *(el_ids, face_nrs)* of arrays enumerating, in
+        sorted order, every face that carries any boundary tag.
+        """
+        keys = [self._get_boundary_face_keys(tag)
+                for tag in self.mesh.tag_to_boundary]
+        if keys:
+            all_keys = np.unique(np.hstack(keys))
+        else:
+            all_keys = np.zeros(0, dtype=np.intp)
+
+        return divmod(all_keys, self._max_face_count())
+
+    def _max_face_count(self):
+        return max(eg.local_discretization.face_count()
+                for eg in self.element_groups)
+
+    def _get_boundary_face_keys(self, tag):
+        from hedge.mesh.array import get_face_numbers
+        el_ids, face_nrs = get_face_numbers(
+                self.mesh.tag_to_boundary.get(tag, []))
+        return el_ids*self._max_face_count() + face_nrs
+
     @memoize_method
     def get_boundary(self, tag):
         """Get a Boundary instance for a given `tag'.
@@ -702,7 +1050,36 @@ class Discretization(TimestepCalculator):
         is returned. Asking for a nonexistant boundary is not an error.
         (Otherwise get_boundary would unnecessarily become non-local when run
         in parallel.)
+
+        Each tag is stored as a subset of :meth:`_get_all_boundary_faces`.
+        Tags that consist of the same faces in the same order (such as,
+        often, :class:`hedge.mesh.TAG_ALL` and
+        :class:`hedge.mesh.TAG_REALLY_ALL`) share one Boundary instance.
+        On meshes of straight simplices of a single type, the nodes, volume
+        indices and face data of every tag are indexed out of one store
+        for all boundary faces, see :meth:`_get_all_boundary_face_data`.
         """
+        all_el_ids, all_face_nrs = self._get_all_boundary_faces()
+        face_subset = np.searchsorted(
+                all_el_ids*self._max_face_count() + all_face_nrs,
+                self._get_boundary_face_keys(tag))
+
+        subset_key = face_subset.tostring()
+        try:
+            return self._boundaries_by_face_subset[subset_key]
+        except KeyError:
+            pass
+
+        faces = self.mesh.tag_to_boundary.get(tag, [])
+        if self._get_all_boundary_face_data() is not None:
+            bdry = self._make_boundary_from_arrays(faces, face_subset)
+        else:
+            bdry = self._make_boundary(faces)
+
+        self._boundaries_by_face_subset[subset_key] = bdry
+        return bdry
+
+    def _make_boundary(self, faces):
         from hedge.discretization.data import StraightFaceGroup
         nodes = []
         vol_indices = []
@@ -712,7 +1089,7 @@ class Discretization(TimestepCalculator):
         ldis = None  # if this boundary is empty, we might as well have no ldis
         el_face_to_face_group_and_face_pair = {}
 
-        for ef in self.mesh.tag_to_boundary.get(tag, []):
+        for ef in faces:
             el, face_nr = ef
 
             el_slice, ldis = self.find_el_data(el.id)
@@ -773,6 +1150,143 @@ class Discretization(TimestepCalculator):
 
         return bdry
 
+    @memoize_method
+    def _get_all_boundary_face_data(self):
+        """Return a :class:`dict` of arrays describing each face of
+        :meth:`_get_all_boundary_faces`, with one row per face:
+
+        * *el_ids*, *face_nrs*: as returned by
+          :meth:`_get_all_boundary_faces`.
+        * *vol_indices*: the volume indices of the face's nodes.
+        * *nodes*: the coordinates of the face's nodes.
+        * *int_side_indices*, *int_side_geometry*, *int_side_normals*: the
+          interior side data for :meth:`StraightFaceGroup.append_face_pairs`.
+
+        Return *None* unless the mesh consists of a single group of
+        straight simplices.
+        """
+        if len(self.element_groups) != 1:
+            return None
+        ea = self._get_element_arrays()
+        if ea is None:
+            return None
+
+        eg, = self.element_groups
+        ldis = eg.local_discretization
+        el_ids, face_nrs = self._get_all_boundary_faces()
+
+        face_indices = np.array(ldis.face_indices(), dtype=np.intp)
+        el_bases = eg.ranges.start + el_ids*eg.ranges.el_size
+        vol_indices = el_bases[:, np.newaxis] + face_indices[face_nrs]
+
+        # the index list and local element numbers depend on the tag
+        side_indices = np.zeros((len(el_ids), 5), dtype=np.uint32)
+        side_indices[:, 0] = el_bases
+        side_indices[:, 3] = el_ids
+        side_indices[:, 4] = face_nrs
+
+        fj = ea.face_jacobians[el_ids, face_nrs]
+        side_geometry = np.empty((len(el_ids), 3), dtype=np.float64)
+        side_geometry[:, 0] = np.abs(ea.jacobians[el_ids] / fj)
+        side_geometry[:, 1] = fj
+        side_geometry[:, 2] = ea.jacobians[el_ids]
+
+        return dict(
+                el_ids=el_ids,
+                face_nrs=face_nrs,
+                vol_indices=vol_indices,
+                nodes=self.nodes[vol_indices],
+                int_side_indices=side_indices,
+                int_side_geometry=side_geometry,
+                int_side_normals=ea.face_normals[el_ids, face_nrs])
+
+    def _make_boundary_from_arrays(self, faces, face_subset):
+        """Like :meth:`_make_boundary`, but build all face pairs at once
+        by indexing the rows *face_subset* of
+        :meth:`_get_all_boundary_face_data`, which correspond to *faces*.
+        If *face_subset* is a contiguous range of rows, the boundary's
+        nodes and volume indices are views into that store.
+        """
+        from hedge.discretization.data import StraightFaceGroup, Boundary
+        from hedge._internal import UniformElementRanges, INVALID_ELEMENT
+
+        eg, = self.element_groups
+        ldis = eg.local_discretization
+        fp_count = len(face_subset)
+
+        if not fp_count:
+            return Boundary(discr=self,
+                    nodes=np.zeros((0, self.dimensions), dtype=np.float64),
+                    vol_indices=[], face_groups=[], fg_ranges=[])
+
+        all_data = self._get_all_boundary_face_data()
+
+        if (face_subset == np.arange(
+                face_subset[0], face_subset[0]+fp_count)).all():
+            rows = slice(face_subset[0], face_subset[0]+fp_count)
+        else:
+            rows = face_subset
+
+        def get_rows(name):
+            return all_data[name][rows]
+
+        el_ids = get_rows("el_ids")
+        face_nrs = get_rows("face_nrs")
+        face_node_count = all_data["vol_indices"].shape[1]
+
+        fg = StraightFaceGroup(double_sided=False,
+                debug="ilist_generation" in self.debug)
+
+        int_fil_numbers = np.zeros(ldis.face_count(), dtype=np.uint32)
+        for fi in np.unique(face_nrs):
+            fi = int(fi)
+            int_fil_numbers[fi] = fg.register_face_index_list(
+                    identifier=fi,
+                    generator=lambda: ldis.face_indices()[fi])
+        ext_fil_number = fg.register_face_index_list(
+                identifier=(),
+                generator=lambda: tuple(xrange(face_node_count)))
+
+        used_els, first_faces = np.unique(el_ids, return_index=True)
+
+        # The exterior side has no element. The all-ones pattern is the
+        # C++-level INVALID_* marker for its element, face, index list and
+        # local element numbers.
+        invalid = np.uint32(INVALID_ELEMENT)
+
+        side_indices = np.empty((fp_count, 2, 5), dtype=np.uint32)
+        side_indices[:, 0] = get_rows("int_side_indices")
+        side_indices[:, 0, 1] = int_fil_numbers[face_nrs]
+        side_indices[:, 0, 2] = np.searchsorted(used_els, el_ids)
+        side_indices[:, 1, 0] = face_node_count*np.arange(fp_count)
+        side_indices[:, 1, 1] = ext_fil_number
+        side_indices[:, 1, 2:] = invalid
+
+        side_geometry = np.zeros((fp_count, 2, 3), dtype=np.float64)
+        side_geometry[:, 0] = get_rows("int_side_geometry")
+
+        side_normals = np.zeros((fp_count, 2, self.dimensions),
+                dtype=np.float64)
+        side_normals[:, 0] = get_rows("int_side_normals")
+
+        fg.append_face_pairs(ldis.order, side_indices, side_geometry,
+                side_normals, np.repeat(invalid, fp_count))
+
+        fg.commit_local_elements(ldis, ldis,
+                eg.ranges.start + used_els*eg.ranges.el_size,
+                1/np.abs(side_geometry[first_faces, 0, 2]))
+
+        from itertools import izip, repeat
+        return Boundary(
+                discr=self,
+                nodes=get_rows("nodes").reshape(-1, self.dimensions),
+                vol_indices=get_rows("vol_indices").reshape(-1),
+                face_groups=[fg],
+                fg_ranges=[UniformElementRanges(
+                    0, face_node_count, fp_count)],
+                el_face_to_face_group_and_face_pair=dict(
+                    izip(faces, izip(repeat(fg), xrange(fp_count)))))
+
     # }}}
 
     # {{{ quadrature descriptors
@@ -1248,17 +1762,99 @@ class Discretization(TimestepCalculator):
                 "point %s not found. Consider changing threshold."
                 % point)
 
+    @memoize_method
+    def get_element_bucket_grid(self):
+        """Return a :class:`hedge.discretization.interpolation.ElementBucketGrid`
+        over the elements of this discretization.
+        """
+        from hedge.discretization.interpolation import ElementBucketGrid
+        return ElementBucketGrid(self._get_point_location_arrays())
+
+    def _get_point_location_arrays(self):
+        element_arrays = self._get_element_arrays()
+        if element_arrays is None or len(self.element_groups) != 1:
+            raise NotImplementedError("batched point location needs a "
+                    "mesh of straight simplices of a single type")
+        return element_arrays
+
+    def locate_points(self, points, thresh=0):
+        """Return an array holding the number of the element containing
+        each row of the (n, dim) array *points*, or
+        :data:`hedge.discretization.interpolation.NOT_FOUND`.
+        """
+        from hedge.discretization.interpolation import locate_points
+        el_numbers, unit_points = locate_points(
+                self._get_point_location_arrays(),
+                self.get_element_bucket_grid(), points, thresh)
+        return el_numbers
+
+    def get_interpolation_operator(self, points, thresh=0):
+        """Return a
+        :class:`hedge.discretization.interpolation.PointInterpolationOperator`
+        evaluating volume fields at each row of the (n, dim) array *points*.
+        Building it is vectorized over all points, and the result can be
+        applied to any number of fields.
+        """
+        from hedge.discretization.interpolation import (
+                locate_points, interpolation_coefficients,
+                PointInterpolationOperator, NOT_FOUND)
+
+        points = np.asarray(points)
+        el_numbers, unit_points = locate_points(
+                self._get_point_location_arrays(),
+                self.get_element_bucket_grid(), points, thresh)
+
+        missing = np.nonzero(el_numbers == NOT_FOUND)[0]
+        if len(missing):
+            raise RuntimeError(
+                    "%d points not found, first: %s. "
+                    "Consider changing threshold."
+                    % (len(missing), points[missing[0]]))
+
+        eg, = self.element_groups
+        el_size = eg.ranges.el_size
+        node_indices = (eg.ranges.start + el_size*el_numbers[:, np.newaxis]
+                + np.arange(el_size, dtype=np.intp))
+
+        return PointInterpolationOperator(el_numbers, node_indices,
+                interpolation_coefficients(
+                    eg.local_discretization, unit_points))
+
+    @memoize_method
+    def get_regrid_operator(self, new_discr, thresh=0):
+        """Return a
+        :class:`hedge.discretization.interpolation.PointInterpolationOperator`
+        taking volume fields on this discretization to the nodes of
+        *new_discr*.
+        """
+        return self.get_interpolation_operator(new_discr.nodes, thresh)
+
     def get_regrid_values(self, field_in, new_discr, dtype=None,
             use_btree=True, thresh=0):
         """:param field_in: nodal values on old grid.
         :param new_discr: new discretization.
-        :param use_btree: bool to decide if a spatial binary tree will be used.
+        :param use_btree: bool to decide if a spatial binary tree will be
+          used. Only relevant if this discretization does not support
+          :meth:`get_regrid_operator`, which is used otherwise.
         """
 
         if self.get_kind(field_in) != "numpy":
             raise NotImplementedError(
                     "get_regrid_values needs numpy input field")
 
+        try:
+            regrid_op = self.get_regrid_operator(new_discr, thresh)
+        except NotImplementedError:
+            pass
+        else:
+            def regrid(scalar_field):
+                result = new_discr.volume_empty(dtype=dtype, kind="numpy")
+                result[:] = regrid_op(scalar_field)
+                return result
+
+            from pytools.obj_array import with_object_array_or_scalar
+            return with_object_array_or_scalar(regrid, field_in)
+
         def regrid(scalar_field):
             result = new_discr.volume_empty(dtype=dtype, kind="numpy")
             for ii in range(len(new_discr.nodes)):
@@ -1301,6 +1897,37 @@ class Discretization(TimestepCalculator):
             ex.instrument()
         return ex
 
+    def warm_up(self, operator, dtype=None, arg_dtypes=None):
+        """Compile *operator* and build all kernels it needs for fields of
+        *dtype*, without executing it. This is intended to populate the
+        kernel cache ahead of time, see :mod:`hedge.backends.jit.warm_up`.
+
+        :arg operator: an operator template, or a model operator (such as
+          :class:`hedge.models.em.MaxwellOperator`) providing an
+          :meth:`op_template` method.
+        :arg arg_dtypes: a mapping from argument names of *operator* to the
+          dtypes they will be passed with, for arguments whose dtype
+          differs from *dtype*. See
+          :meth:`hedge.backends.jit.Executor.infer_dtypes`.
+        :returns: a list of tuples *(insn, seconds)*, one per instruction of
+          the compiled code. The time spent compiling the operator template
+          itself is reported with *insn* set to *None*.
+        """
+        from time import time
+
+        if hasattr(operator, "op_template"):
+            operator = operator.op_template()
+
+        start = time()
+        ex = self.compile(operator)
+        report = [(None, time()-start)]
+
+        warm_up = getattr(ex, "warm_up", None)
+        if warm_up is not None:
+            report.extend(warm_up(dtype, arg_dtypes))
+
+        return report
+
     def add_function(self, name, func):
         self.exec_functions[name] = func
 
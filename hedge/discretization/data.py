@@ -196,15 +196,12 @@ class StraightFaceGroup(hedge._internal.StraightFaceGroup):
     def register_face_index_list(self, identifier, generator):
         return self.fil_registry.register(identifier, generator)
 
-    def commit(self, discr, ldis_loc, ldis_opp, get_write_el_base=None):
-        """
-        :param get_write_el_base: a function of *(read_el_base, element_id)*
-          returning the DOF index to which data should be written post-lift.
-          This is needed since on a quadrature grid, element base indices in a
-          face pair refer to interior boundary vectors and are hence only
-          usable for reading.
-        """
-        if self.fil_registry.index_lists:
+    def _commit_index_lists(self, ldis_loc, index_lists=None):
+        if index_lists is not None:
+            self.index_lists = np.ascontiguousarray(
+                    index_lists, dtype=np.uint32)
+            del self.fil_registry
+        elif self.fil_registry.index_lists:
             self.index_lists = np.array(
                     self.fil_registry.index_lists,
                     dtype=np.uint32, order="C")
@@ -215,6 +212,16 @@ class StraightFaceGroup(hedge._internal.StraightFaceGroup):
         else:
             self.face_count = ldis_loc.face_count()
 
+    def commit(self, discr, ldis_loc, ldis_opp, get_write_el_base=None):
+        """
+        :param get_write_el_base: a function of *(read_el_base, element_id)*
+          returning the DOF index to which data should be written post-lift.
+          This is needed since on a quadrature grid, element base indices in a
+          face pair refer to interior boundary vectors and are hence only
+          usable for reading.
+        """
+        self._commit_index_lists(ldis_loc)
+
         # number elements locally
         used_bases_and_els = list(set(
                 (side.el_base_index, side.element_id)
@@ -247,6 +254,60 @@ class StraightFaceGroup(hedge._internal.StraightFaceGroup):
         self.ldis_loc = ldis_loc
         self.ldis_opp = ldis_opp
 
+    def append_face_pairs(self, order, side_indices, side_geometry,
+            side_normals, ext_native_write_maps):
+        """Append many face pairs at once, instead of one
+        :class:`FacePair` at a time.
+
+        :param side_indices: a :class:`numpy.uint32` array of shape
+          *(face_pairs, 2, 5)*. Along the second axis, the interior side
+          comes first. Along the last axis, it contains *el_base_index*,
+          *face_index_list_number*, *local_el_number*, *element_id* and
+          *face_id*.
+        :param side_geometry: a :class:`numpy.float64` array of shape
+          *(face_pairs, 2, 3)*, containing *h*, *face_jacobian* and
+          *element_jacobian*.
+        :param side_normals: a :class:`numpy.float64` array of shape
+          *(face_pairs, 2, dimensions)*.
+        :param ext_native_write_maps: a :class:`numpy.uint32` array of shape
+          *(face_pairs,)*.
+
+        *order* is assigned to every side with a valid *element_id*.
+
+        Since local element numbers are passed in, finish with
+        :meth:`commit_local_elements` instead of :meth:`commit`.
+        """
+        from hedge._internal import append_face_pairs
+        append_face_pairs(self, order,
+                np.ascontiguousarray(side_indices, dtype=np.uint32).ravel(),
+                np.ascontiguousarray(side_geometry, dtype=np.float64).ravel(),
+                np.ascontiguousarray(side_normals, dtype=np.float64).ravel(),
+                np.ascontiguousarray(ext_native_write_maps, dtype=np.uint32))
+
+    def commit_local_elements(self, ldis_loc, ldis_opp,
+            local_el_write_base, local_el_inverse_jacobians,
+            index_lists=None):
+        """Like :meth:`commit`, for face pairs whose local element numbers
+        have already been assigned, see :meth:`append_face_pairs`.
+
+        :param local_el_write_base: the global volume element base index
+          of each local element.
+        :param local_el_inverse_jacobians: the absolute value of the inverse
+          jacobian of each local element.
+        :param index_lists: if given, an array of shape
+          *(index_list_count, index_list_length)* to use instead of the
+          index lists registered with :meth:`register_face_index_list`.
+        """
+        self._commit_index_lists(ldis_loc, index_lists)
+
+        self.local_el_write_base = np.asarray(
+                local_el_write_base, dtype=np.uint32)
+        self.local_el_inverse_jacobians = np.asarray(
+                local_el_inverse_jacobians, dtype=np.float64)
+
+        self.ldis_loc = ldis_loc
+        self.ldis_opp = ldis_opp
+
 
 class CurvedFaceGroup(hedge._internal.CurvedFaceGroup):
     def __init__(self, double_sided, debug):
@@ -0,0 +1,269 @@
+"""Batched point location and interpolation on simplicial meshes."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import numpy as np
+import numpy.linalg as la
+
+
+NOT_FOUND = -1
+
+
+# {{{ spatial index
+
+def _repeat_ranges(starts, counts):
+    """Return the concatenation of ``range(start, start+count)`` for all
+    pairs in *starts* and *counts*.
+    """
+    total = counts.sum()
+    run_starts = np.cumsum(counts) - counts
+    return (np.arange(total, dtype=np.intp)
+            - np.repeat(run_starts - starts, counts))
+
+
+class ElementBucketGrid(object):
+    """A uniform grid of buckets over the bounding box of a mesh. Each
+    bucket lists the elements whose bounding boxes overlap it, so that the
+    candidate elements for a batch of points can be found without any
+    per-point Python work.
+
+    :param element_arrays: a :class:`hedge.mesh.array.ElementArrays`.
+    :param elements_per_bucket: the average number of elements per bucket
+      the grid resolution is chosen for.
+
+    :ivar bucket_starts: an array of length ``n_buckets+1``; the elements in
+      bucket *i* are ``bucket_elements[bucket_starts[i]:bucket_starts[i+1]]``.
+    """
+
+    def __init__(self, element_arrays, elements_per_bucket=0.5):
+        ea = element_arrays
+        el_vertices = ea.points[ea.vertex_indices]
+        bbox_min = el_vertices.min(axis=1)
+        bbox_max = el_vertices.max(axis=1)
+
+        self.dimensions = dim = ea.dimensions
+        self.origin = bbox_min.min(axis=0)
+        extent = bbox_max.max(axis=0) - self.origin
+        extent[extent == 0] = 1
+
+        bucket_count = max(1, len(ea) / elements_per_bucket)
+        h = (np.prod(extent) / bucket_count) ** (1/dim)
+        self.shape = np.maximum(np.ceil(extent/h), 1).astype(np.intp)
+        self.bucket_size = extent / self.shape
+
+        self.strides = np.ones(dim, dtype=np.intp)
+        for axis in range(dim-2, -1, -1):
+            self.strides[axis] = self.strides[axis+1]*self.shape[axis+1]
+        n_buckets = int(np.prod(self.shape))
+
+        # enumerate all (element, bucket) pairs from each element's
+        # range of bucket coordinates
+        lo = self._bucket_coordinates(bbox_min)
+        spans = self._bucket_coordinates(bbox_max) - lo + 1
+        counts = np.prod(spans, axis=1)
+
+        el_nrs = np.repeat(np.arange(len(ea), dtype=np.intp), counts)
+        remainder = _repeat_ranges(np.zeros_like(counts), counts)
+        bucket_ids = np.zeros(len(el_nrs), dtype=np.intp)
+        for axis in range(dim-1, -1, -1):
+            axis_span = spans[el_nrs, axis]
+            bucket_ids += (lo[el_nrs, axis] + remainder % axis_span) \
+                    * self.strides[axis]
+            remainder //= axis_span
+
+        order = np.argsort(bucket_ids, kind="mergesort")
+        self.bucket_elements = el_nrs[order]
+        self.bucket_starts = np.searchsorted(bucket_ids[order],
+                np.arange(n_buckets+1))
+
+    def _bucket_coordinates(self, points):
+        coords = np.floor((points - self.origin) / self.bucket_size)
+        return np.clip(coords, 0, self.shape-1).astype(np.intp)
+
+    def bucket_numbers(self, points):
+        """Return the bucket number for each row of the (n, dim) array
+        *points*. Points outside the grid are assigned to the nearest
+        bucket.
+        """
+        return np.dot(self._bucket_coordinates(points), self.strides)
+
+    def candidates(self, points):
+        """Return a tuple *(point_numbers, element_numbers)* of equal-length
+        arrays enumerating every element whose bounding box may contain
+        the corresponding point.
+        """
+        buckets = self.bucket_numbers(points)
+        starts = self.bucket_starts[buckets]
+        counts = self.bucket_starts[buckets+1] - starts
+
+        point_nrs = np.repeat(np.arange(len(points), dtype=np.intp), counts)
+        return point_nrs, self.bucket_elements[_repeat_ranges(starts, counts)]
+
+# }}}
+
+
+# {{{ point location
+
+def locate_points(element_arrays, grid, points, thresh=0, chunk_size=2**16):
+    """Find the element containing each row of the (n, dim) array *points*.
+
+    The containment test is that of
+    :meth:`hedge.mesh.element.SimplicialElement.contains_point`, applied
+    to all candidates from *grid* at once.
+
+    :returns: a tuple *(el_numbers, unit_points)*, where *el_numbers* has
+      :data:`NOT_FOUND` for points outside the mesh and *unit_points*
+      holds the coordinates of each point in its element's unit
+      coordinate system.
+    """
+    ea = element_arrays
+    points = np.asarray(points, dtype=np.float64)
+    dim = ea.dimensions
+    if points.ndim != 2 or points.shape[1] != dim:
+        raise ValueError("points must be an array of shape (n, %d)" % dim)
+
+    inv_matrices = ea.inverse_map_matrices
+    inv_offsets = ea.inverse_map_offsets
+
+    n = len(points)
+    el_numbers = np.empty(n, dtype=np.intp)
+    el_numbers.fill(NOT_FOUND)
+    unit_points = np.zeros((n, dim), dtype=np.float64)
+
+    for chunk_start in range(0, n, chunk_size):
+        chunk = points[chunk_start:chunk_start+chunk_size]
+        point_nrs, el_nrs = grid.candidates(chunk)
+
+        unit = np.einsum("kij,kj->ki",
+                inv_matrices[el_nrs], chunk[point_nrs]) + inv_offsets[el_nrs]
+        inside = ((unit >= -1-thresh).all(axis=1)
+                & (unit.sum(axis=1) <= -(dim-2)+thresh))
+
+        # candidates come sorted by point, then by element number--keep
+        # the first match for each point
+        hits = np.nonzero(inside)[0]
+        found_points, first = np.unique(point_nrs[hits], return_index=True)
+        hits = hits[first]
+        el_numbers[chunk_start + found_points] = el_nrs[hits]
+        unit_points[chunk_start + found_points] = unit[hits]
+
+    return el_numbers, unit_points
+
+# }}}
+
+
+# {{{ interpolation
+
+def _legendre_table(x, order):
+    """Return the Legendre polynomials of degree 0..*order* evaluated at
+    *x*, as an array of shape ``(len(x), order+1)``.
+    """
+    result = np.empty((len(x), order+1), dtype=np.float64)
+    result[:, 0] = 1
+    if order >= 1:
+        result[:, 1] = x
+    for k in range(1, order):
+        result[:, k+1] = ((2*k+1)*x*result[:, k] - k*result[:, k-1]) / (k+1)
+    return result
+
+
+def _total_degree_basis(mode_ids, unit_points, order):
+    """Evaluate the products of Legendre polynomials indexed by *mode_ids*
+    at *unit_points*. These span the same space as the nodal basis of
+    a simplex of degree *order*, which is all interpolation needs.
+    """
+    result = np.ones((len(unit_points), len(mode_ids)), dtype=np.float64)
+    for axis in range(unit_points.shape[1]):
+        table = _legendre_table(unit_points[:, axis], order)
+        result *= table[:, mode_ids[:, axis]]
+    return result
+
+
+def interpolation_coefficients(ldis, unit_points):
+    """Return an array of shape ``(n, ldis.node_count())`` whose rows are
+    the weights that interpolate a nodal field of *ldis* to each of
+    *unit_points*.
+    """
+    mode_ids = np.array(list(ldis.generate_mode_identifiers()),
+            dtype=np.intp).reshape(-1, ldis.dimensions)
+    vdm = _total_degree_basis(mode_ids,
+            np.array(ldis.unit_nodes(), dtype=np.float64), ldis.order)
+    return np.dot(
+            _total_degree_basis(mode_ids, unit_points, ldis.order),
+            la.inv(vdm))
+
+
+class PointInterpolationOperator(object):
+    """Evaluates volume fields at a fixed set of points. Stores, for each
+    point, the indices of the nodes of its containing element and the
+    matching interpolation weights, so that applying it is a gather and a
+    row-wise dot product.
+
+    :ivar el_numbers: the containing element of each point.
+    :ivar node_indices: an integer array of shape
+      ``(n_points, nodes_per_element)``.
+    :ivar coefficients: an array of the same shape as *node_indices*.
+    """
+
+    def __init__(self, el_numbers, node_indices, coefficients):
+        self.el_numbers = el_numbers
+        self.node_indices = node_indices
+        self.coefficients = coefficients
+
+    def __len__(self):
+        return len(self.node_indices)
+
+    def _apply_scalar(self, field):
+        return np.einsum("ij,ij->i",
+                self.coefficients, field[self.node_indices])
+
+    def __call__(self, field):
+        from hedge.tools import log_shape
+        ls = log_shape(field)
+        if ls == ():
+            return self._apply_scalar(field)
+
+        from pytools import indices_in_shape
+        result = np.empty(ls, dtype=object)
+        for i in indices_in_shape(ls):
+            result[i] = self._apply_scalar(field[i])
+        return result
+
+    def to_scipy(self, field_size):
+        """Return the operator as a :class:`scipy.sparse.csr_matrix` of
+        shape ``(len(self), field_size)``.
+        """
+        from scipy.sparse import csr_matrix
+        n, nodes_per_el = self.node_indices.shape
+        return csr_matrix(
+                (self.coefficients.ravel(), self.node_indices.ravel(),
+                    np.arange(0, n*nodes_per_el+1, nodes_per_el)),
+                shape=(n, field_size))
+
+# }}}
+
+
+# vim: foldmethod=marker
@@ -0,0 +1,247 @@
+"""On-disk snapshots of a discretization, for restarting without setup."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import os
+import numpy as np
+
+
+FORMAT_VERSION = 1
+HEADER_NAME = "header.pickle"
+
+FACE_PAIR_ARRAYS = ["side_indices", "side_geometry", "side_normals",
+        "ext_native_write_maps", "index_lists", "local_el_write_base",
+        "local_el_inverse_jacobians"]
+
+
+# {{{ snapshot
+
+class DiscretizationSnapshot(object):
+    """The saved state of a :class:`hedge.discretization.Discretization`.
+
+    On disk, a snapshot is a directory holding a small pickled header and
+    one ``.npy`` file per array. ``.npy`` files store raw, aligned
+    buffers, so arrays are memory-mapped rather than read on load.
+
+    :ivar header: a :class:`dict` of the small, pickled data.
+    :ivar path: the snapshot directory.
+    :ivar mmap_mode: passed to :func:`numpy.load`. The default, ``"c"``
+      (copy-on-write), gives writable arrays backed by the file, which can
+      be handed to C++ without a copy.
+    """
+
+    def __init__(self, path, header, mmap_mode="c"):
+        self.path = path
+        self.header = header
+        self.mmap_mode = mmap_mode
+
+    def get_array(self, name):
+        return np.load(os.path.join(self.path, name+".npy"),
+                mmap_mode=self.mmap_mode)
+
+    def make_local_discretization(self):
+        return self.header["ldis_class"](self.header["order"])
+
+    def make_mesh(self):
+        """Return the saved :class:`hedge.mesh.ConformalMesh`, with elements
+        stored as :class:`hedge.mesh.array.ElementArrays` and connectivity
+        taken from the snapshot.
+        """
+        from hedge.mesh import ConformalMesh
+        from hedge.mesh.array import \
+                ElementArrays, ElementSubset, FaceSubset
+
+        hdr = self.header
+        points = self.get_array("points")
+        elements = ElementArrays(hdr["el_class"],
+                self.get_array("vertex_indices"), points,
+                maps=(self.get_array("map_matrices"),
+                    self.get_array("map_offsets"),
+                    self.get_array("jacobians")))
+        elements.neighbor_elements = self.get_array("neighbor_elements")
+        elements.neighbor_faces = self.get_array("neighbor_faces")
+        elements.neighbor_orientations = \
+                self.get_array("neighbor_orientations")
+
+        tag_to_boundary = {}
+        for i, tag in enumerate(hdr["boundary_tags"]):
+            tag_to_boundary[tag] = FaceSubset(elements,
+                    self.get_array("boundary_%d_el_ids" % i),
+                    self.get_array("boundary_%d_face_nrs" % i))
+
+        tag_to_elements = {}
+        for i, tag in enumerate(hdr["element_tags"]):
+            tag_to_elements[tag] = ElementSubset(elements,
+                    self.get_array("element_tag_%d" % i))
+
+        return ConformalMesh(points, elements, elements.interfaces(),
+                tag_to_boundary, tag_to_elements,
+                hdr["periodicity"],
+                hdr["periodic_opposite_faces"],
+                hdr["periodic_opposite_vertices"],
+                hdr["has_internal_boundaries"])
+
+    def get_interior_face_pair_data(self):
+        """Return the arguments of
+        :meth:`hedge.discretization.Discretization._make_interior_face_group`,
+        or *None* if the discretization has no interior faces.
+        """
+        if not self.header["has_interior_faces"]:
+            return None
+
+        return dict((name, self.get_array("face_pairs_"+name))
+                for name in FACE_PAIR_ARRAYS)
+
+# }}}
+
+
+# {{{ save/load
+
+def save_discretization(discr, path):
+    """Write a snapshot of *discr* to the directory *path*, which is
+    created if necessary. See
+    :meth:`hedge.discretization.Discretization.save`.
+    """
+    from hedge.version import VERSION_TEXT
+    from hedge.mesh.array import get_element_numbers, get_face_numbers
+
+    element_arrays = discr._get_element_arrays()
+    if element_arrays is None or len(discr.element_groups) != 1:
+        raise NotImplementedError("snapshots need a mesh of straight "
+                "simplices of a single type")
+
+    mesh = discr.mesh
+    ea = element_arrays
+    ldis = discr.element_groups[0].local_discretization
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    def save_array(name, ary):
+        np.save(os.path.join(path, name+".npy"), np.ascontiguousarray(ary))
+
+    # remove a stale header first, so that an interrupted save does not
+    # leave behind a snapshot that looks complete
+    header_name = os.path.join(path, HEADER_NAME)
+    if os.path.exists(header_name):
+        os.unlink(header_name)
+
+    # {{{ mesh
+
+    save_array("points", np.asarray(mesh.points, dtype=np.float64))
+    for name in ["vertex_indices", "map_matrices", "map_offsets",
+            "jacobians", "neighbor_elements", "neighbor_faces",
+            "neighbor_orientations"]:
+        save_array(name, getattr(ea, name))
+
+    boundary_tags = list(mesh.tag_to_boundary)
+    for i, tag in enumerate(boundary_tags):
+        el_ids, face_nrs = get_face_numbers(mesh.tag_to_boundary[tag])
+        save_array("boundary_%d_el_ids" % i, el_ids)
+        save_array("boundary_%d_face_nrs" % i, face_nrs)
+
+    element_tags = list(mesh.tag_to_elements)
+    for i, tag in enumerate(element_tags):
+        save_array("element_tag_%d" % i,
+                get_element_numbers(mesh.tag_to_elements[tag]))
+
+    # }}}
+
+    # {{{ discretization
+
+    save_array("nodes", discr.nodes)
+
+    face_pair_data = discr._get_interior_face_pair_data(ea)
+    if face_pair_data is not None:
+        for name in FACE_PAIR_ARRAYS:
+            save_array("face_pairs_"+name, face_pair_data[name])
+
+    # }}}
+
+    header = dict(
+            format_version=FORMAT_VERSION,
+            hedge_version=VERSION_TEXT,
+            el_class=ea.el_class,
+            ldis_class=type(ldis),
+            order=ldis.order,
+            quad_min_degrees=discr.quad_min_degrees,
+            default_scalar_type=discr.default_scalar_type,
+            debug=discr.debug,
+            boundary_tags=boundary_tags,
+            element_tags=element_tags,
+            periodicity=mesh.periodicity,
+            periodic_opposite_faces=mesh.periodic_opposite_faces,
+            periodic_opposite_vertices=mesh.periodic_opposite_vertices,
+            has_internal_boundaries=mesh.has_internal_boundaries,
+            has_interior_faces=face_pair_data is not None,
+            )
+
+    from cPickle import dump, HIGHEST_PROTOCOL
+    tmp_name = header_name + ".tmp"
+    outf = open(tmp_name, "wb")
+    try:
+        dump(header, outf, HIGHEST_PROTOCOL)
+    finally:
+        outf.close()
+
+    # rename is atomic on POSIX file systems
+    os.rename(tmp_name, header_name)
+
+
+def load_snapshot(path, mmap_mode="c"):
+    """Read the header of the snapshot in the directory *path* and return a
+    :class:`DiscretizationSnapshot`.
+    """
+    from cPickle import load
+    from hedge.version import VERSION_TEXT
+
+    header_name = os.path.join(path, HEADER_NAME)
+    if not os.path.exists(header_name):
+        raise ValueError("'%s' does not contain a complete "
+                "discretization snapshot" % path)
+
+    inf = open(header_name, "rb")
+    try:
+        header = load(inf)
+    finally:
+        inf.close()
+
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError("discretization snapshot '%s' has format "
+                "version %s, expected %d"
+                % (path, header.get("format_version"), FORMAT_VERSION))
+
+    if header["hedge_version"] != VERSION_TEXT:
+        from warnings import warn
+        warn("discretization snapshot '%s' was written by hedge %s"
+                % (path, header["hedge_version"]))
+
+    return DiscretizationSnapshot(path, header, mmap_mode)
+
+# }}}
+
+
+# vim: foldmethod=marker
@@ -151,6 +151,95 @@ namespace hedge
 
 
 
+
+  /** Fill one side of a face pair from row \c i of the arrays passed to
+   * append_face_pairs(). Sides without an element (such as the exterior
+   * side of a boundary face) keep the default order of zero.
+   */
+  template <class SideType>
+  inline
+  void set_face_pair_side_from_arrays(
+      SideType &side, unsigned order,
+      const numpy_vector<npy_uint> &side_indices,
+      const numpy_vector<double> &side_geometry,
+      const numpy_vector<double> &side_normals,
+      unsigned dims, unsigned i)
+  {
+    const unsigned idx_base = 5*i;
+    side.el_base_index = side_indices[idx_base+0];
+    side.face_index_list_number = side_indices[idx_base+1];
+    side.local_el_number = side_indices[idx_base+2];
+    side.element_id = side_indices[idx_base+3];
+    side.face_id = side_indices[idx_base+4];
+
+    const unsigned geo_base = 3*i;
+    side.h = side_geometry[geo_base+0];
+    side.face_jacobian = side_geometry[geo_base+1];
+    side.element_jacobian = side_geometry[geo_base+2];
+
+    if (side.element_id != INVALID_ELEMENT)
+      side.order = order;
+
+    side.normal.resize(dims);
+    for (unsigned j = 0; j < dims; ++j)
+      side.normal[j] = side_normals[dims*i+j];
+  }
+
+
+
+
+  /** Append \c ext_native_write_maps.size() face pairs to \c fg in one go.
+   *
+   * The arrays are C-ordered, with one row per face pair side, interior
+   * side first:
+   *
+   * - \c side_indices: (face pairs, 2, 5), containing el_base_index,
+   *   face_index_list_number, local_el_number, element_id and face_id.
+   * - \c side_geometry: (face pairs, 2, 3), containing h, face_jacobian and
+   *   element_jacobian.
+   * - \c side_normals: (face pairs, 2, dimensions).
+   */
+  template <class FaceGroup>
+  void append_face_pairs(
+      FaceGroup &fg, unsigned order,
+      const numpy_vector<npy_uint> &side_indices,
+      const numpy_vector<double> &side_geometry,
+      const numpy_vector<double> &side_normals,
+      const numpy_vector<npy_uint> &ext_native_write_maps)
+  {
+    typedef typename FaceGroup::face_pair_type face_pair_type;
+
+    const unsigned fp_count = ext_native_write_maps.size();
+    if (fp_count == 0)
+      return;
+
+    const unsigned dims = side_normals.size() / (2*fp_count);
+
+    if (side_indices.size() != 2*5*fp_count)
+      throw std::runtime_error("side_indices is of wrong size");
+    if (side_geometry.size() != 2*3*fp_count)
+      throw std::runtime_error("side_geometry is of wrong size");
+    if (side_normals.size() != 2*dims*fp_count || dims > max_dims)
+      throw std::runtime_error("side_normals is of wrong size");
+
+    fg.face_pairs.reserve(fg.face_pairs.size() + fp_count);
+
+    for (unsigned i = 0; i < fp_count; ++i)
+    {
+      face_pair_type fp;
+      set_face_pair_side_from_arrays(fp.int_side, order,
+          side_indices, side_geometry, side_normals, dims, 2*i);
+      set_face_pair_side_from_arrays(fp.ext_side, order,
+          side_indices, side_geometry, side_normals, dims, 2*i+1);
+      fp.ext_native_write_map = ext_native_write_maps[i];
+
+      fg.face_pairs.push_back(fp);
+    }
+  }
+
+
+
+
   template <class MatrixScalar, class FieldScalar>
   inline
   void lift_flux_without_blas(
@@ -29,7 +29,6 @@ THE SOFTWARE.
 
 import pytools
 import numpy
-import numpy.linalg as la
 
 # make sure AffineMap monkeypatch happens
 import hedge.tools
@@ -94,7 +93,9 @@ class Mesh(pytools.Record):
     is stored here.)
 
     :ivar points: list of Pylinear vectors of node coordinates
-    :ivar elements: list of Element instances
+    :ivar elements: list of Element instances, or a
+      :class:`hedge.mesh.array.ElementArrays` instance, which
+      behaves like such a list.
     :ivar interfaces: a list of pairs:
 
           ((element instance 1, face index 1), (element instance 2, face index 2))
@@ -102,16 +103,27 @@ class Mesh(pytools.Record):
       enumerating elements bordering one another.  The relation "element 1 touches
       element 2" is always reflexive, but this list will only contain one entry
       per element pair.
+
+      If :attr:`elements` is a :class:`hedge.mesh.array.ElementArrays`
+      instance, this is a :class:`hedge.mesh.array.InterfaceSequence`.
     :ivar tag_to_boundary: a mapping of the form:
           boundary_tag -> [(element instance, face index)])
 
       The boundary tag :class:`TAG_NONE` always refers to an empty boundary.
       The boundary tag :class:`TAG_ALL` always refers to the entire boundary.
+
+      If :attr:`elements` is a :class:`hedge.mesh.array.ElementArrays`
+      instance, the values may be :class:`hedge.mesh.array.FaceSubset`
+      instances.
     :ivar tag_to_elements: a mapping of the form
       element_tag -> [element instances]
 
       The element tag :class:`TAG_NONE` always refers to an empty domain.
       The element tag :class:`TAG_ALL` always refers to the entire domain.
+
+      If :attr:`elements` is a :class:`hedge.mesh.array.ElementArrays`
+      instance, the values may be :class:`hedge.mesh.array.ElementSubset`
+      instances.
     :ivar periodicity: A list of tuples (minus_tag, plus_tag) or None
       indicating the tags of the boundaries to be matched together
       as periodic. There is one tuple per axis, so that for example
@@ -152,6 +164,10 @@ class Mesh(pytools.Record):
         """Return a dictionary mapping each element id to a
         list of adjacent element ids.
         """
+        from hedge.mesh.array import ElementArrays
+        if isinstance(self.elements, ElementArrays):
+            return self.elements.adjacency_graph()
+
         adjacency = {}
         for (e1, f1), (e2, f2) in self.interfaces:
             adjacency.setdefault(e1.id, set()).add(e2.id)
@@ -163,20 +179,20 @@ class Mesh(pytools.Record):
 
 
 def find_matching_vertices_along_axis(axis, points_a, points_b, numbers_a, numbers_b):
-    a_to_b = {}
-    not_found = []
-
-    for i, pi in enumerate(points_a):
-        found = False
-        for j, pj in enumerate(points_b):
-            dist = pi-pj
-            dist[axis] = 0
-            if la.norm(dist) < 1e-12:
-                a_to_b[numbers_a[i]] = numbers_b[j]
-                found = True
-                break
-        if not found:
-            not_found.append(numbers_a[i])
+    from hedge.mesh.array import match_vertices_along_axis
+
+    points = numpy.array(list(points_a) + list(points_b), dtype=numpy.float64)
+    match_a, match_b = match_vertices_along_axis(axis, points,
+            numpy.arange(len(points_a)),
+            numpy.arange(len(points_a), len(points)))
+
+    a_to_b = dict(
+            (numbers_a[i], numbers_b[j-len(points_a)])
+            for i, j in zip(match_a, match_b))
+
+    is_found = numpy.zeros(len(points_a), dtype=numpy.bool_)
+    is_found[match_a] = True
+    not_found = [numbers_a[i] for i in numpy.nonzero(~is_found)[0]]
 
     return a_to_b, not_found
 
@@ -197,7 +213,11 @@ def make_conformal_mesh_ext(points, elements,
 
     :param points: an array of vertex coordinates, given as vectors.
     :param elements: an iterable of :class:`hedge.mesh.element.Element`
-      instances.
+      instances, or a :class:`hedge.mesh.array.ElementArrays` instance.
+      In the latter case, the neighbor arrays of *elements* are
+      filled in as well, and the connectivity and tags of the resulting
+      mesh are array-backed sequences (see :class:`Mesh`) rather than
+      lists.
     :param boundary_tagger: A function of *(fvi, el, fn, all_v)* 
       that returns a list of boundary tags for a face identified
       by the parameters.
@@ -206,12 +226,18 @@ def make_conformal_mesh_ext(points, elements,
       in question, *el* is an :class:`Element` instance,
       *fn* is the face number within *el*, and *all_v* is 
       a list of all vertices.
+
+      Alternatively, an instance of
+      :class:`hedge.mesh.array.ArrayBoundaryTagger`, which is
+      called once to tag all boundary faces.
     :param volume_tagger: A function of *(el, all_v)* 
       returning a list of volume tags for the element identified
       by the parameters.
 
       *el* is an :class:`Element` instance and *all_v* is a list of
-      all vertex coordinates.
+      all vertex coordinates. If *None*, elements are not visited
+      individually, and only the tags :class:`TAG_ALL` and
+      :class:`TAG_NONE` exist.
     :param periodicity: either None or is a list of tuples
       just like the one documented for the `periodicity`
       member of class :class:`Mesh`.
@@ -235,162 +261,282 @@ def make_conformal_mesh_ext(points, elements,
         def boundary_tagger(fvi, el, fn, all_v):
             return []
 
-    if volume_tagger is None:
-        def volume_tagger(el, all_v):
-            return []
-
     if _is_rankbdry_face is None:
         def _is_rankbdry_face(el_face):
             return False
 
-    dim = max(el.dimensions for el in elements)
+    from hedge.mesh.array import (ElementArrays, ArrayBoundaryTagger,
+            ElementSubset, FaceSubset, find_face_pairs, find_rows,
+            match_vertices_along_axis)
+    if isinstance(elements, ElementArrays):
+        dim = elements.dimensions
+        faces = elements.faces
+    else:
+        dim = max(el.dimensions for el in elements)
+        faces = numpy.array([el.faces for el in elements], dtype=numpy.intp)
+
     if periodicity is None:
         periodicity = dim*[None]
     assert len(periodicity) == dim
 
-    # tag elements
-    tag_to_elements = {TAG_NONE: [], TAG_ALL: []}
-    for el in elements:
-        for el_tag in volume_tagger(el, points):
-            tag_to_elements.setdefault(el_tag, []).append(el)
-        tag_to_elements[TAG_ALL].append(el)
-
-    # create face_map, which is a mapping of
-    # (vertices on a face) ->
-    #  [(element, face_idx) for elements bordering that face]
-    face_map = {}
-    for el in elements:
-        for fid, face_vertices in enumerate(el.faces):
-            face_map.setdefault(frozenset(face_vertices), []).append((el, fid))
-
-    # build non-periodic connectivity structures
-    interfaces = []
-    tag_to_boundary = {
-            TAG_NONE: [],
-            TAG_ALL: [],
-            TAG_REALLY_ALL: [],
-            }
+    # Faces are numbered as el_nr*face_count + face_nr. All connectivity is
+    # kept in terms of these numbers until the mesh is assembled at the
+    # end.
+    el_count, face_count, face_vertex_count = faces.shape
+    faces = faces.reshape(-1, face_vertex_count)
 
-    for face_vertices, els_faces in face_map.iteritems():
-        boundary_el_faces_tags = []
-        if len(els_faces) == 2:
-            if allow_internal_boundaries:
-                el_face_a, el_face_b = els_faces
-                el_a, face_a = el_face_a
-                el_b, face_b = el_face_b
-
-                tags_a = boundary_tagger(face_vertices, el_a, face_a, points)
-                tags_b = boundary_tagger(face_vertices, el_b, face_b, points)
-
-                if not tags_a and not tags_b:
-                    interfaces.append(els_faces)
-                elif tags_a and tags_b:
-                    boundary_el_faces_tags.append((el_face_a, tags_a))
-                    boundary_el_faces_tags.append((el_face_b, tags_b))
-                else:
-                    raise RuntimeError("boundary tagger is inconsistent "
-                            "about boundary-ness of interior interface")
-            else:
-                interfaces.append(els_faces)
-        elif len(els_faces) == 1:
-            el_face = el, face = els_faces[0]
-            tags = boundary_tagger(face_vertices, el, face, points)
-            boundary_el_faces_tags.append((el_face, tags))
+    def get_el_face(face_nr):
+        return elements[int(face_nr // face_count)], int(face_nr % face_count)
+
+    # {{{ tag elements
+
+    tag_to_el_numbers = {}
+    if volume_tagger is not None:
+        for el_nr, el in enumerate(elements):
+            for el_tag in volume_tagger(el, points):
+                tag_to_el_numbers.setdefault(el_tag, []).append(el_nr)
+
+    # }}}
+
+    # {{{ find interior and boundary faces
+
+    # Find pairs of faces that share their vertices. All other faces are
+    # boundary faces.
+    int_faces_a, int_faces_b = find_face_pairs(faces)
+
+    is_bdry_face = numpy.ones(len(faces), dtype=numpy.bool_)
+    is_bdry_face[int_faces_a] = False
+    is_bdry_face[int_faces_b] = False
+    bdry_faces = numpy.nonzero(is_bdry_face)[0]
+
+    # }}}
+
+    # {{{ tag boundary faces
+
+    def get_tag_masks(face_nrs):
+        """Return a mapping of tags to boolean masks over *face_nrs*."""
+
+        if isinstance(boundary_tagger, ArrayBoundaryTagger):
+            tag_masks = dict(
+                    (btag, numpy.asarray(mask, dtype=numpy.bool_))
+                    for btag, mask in boundary_tagger.tag_faces(
+                        faces[face_nrs], face_nrs // face_count,
+                        face_nrs % face_count, points).iteritems())
         else:
-            raise RuntimeError("face can at most border two elements")
+            tag_masks = {}
+            for i, face_nr in enumerate(face_nrs):
+                el, face = get_el_face(face_nr)
+                tags = boundary_tagger(
+                        frozenset(faces[face_nr]), el, face, points)
+                assert not isinstance(tags, str), \
+                    RuntimeError("Received string as tag list")
+
+                for btag in tags:
+                    try:
+                        mask = tag_masks[btag]
+                    except KeyError:
+                        mask = tag_masks[btag] = numpy.zeros(
+                                len(face_nrs), dtype=numpy.bool_)
+                    mask[i] = True
+
+        for btag in MESH_CREATION_TAGS:
+            tag_masks.pop(btag, None)
+
+        return tag_masks
+
+    if allow_internal_boundaries:
+        # also ask the boundary tagger about interior faces,
+        # which become boundary faces if it tags them
+        int_face_count = len(int_faces_a)
+        candidates = numpy.hstack([int_faces_a, int_faces_b, bdry_faces])
+        tag_masks = get_tag_masks(candidates)
+
+        is_tagged = numpy.zeros(len(candidates), dtype=numpy.bool_)
+        for mask in tag_masks.itervalues():
+            is_tagged |= mask
+
+        int_tagged_a = is_tagged[:int_face_count]
+        int_tagged_b = is_tagged[int_face_count:2*int_face_count]
+        if (int_tagged_a != int_tagged_b).any():
+            raise RuntimeError("boundary tagger is inconsistent "
+                    "about boundary-ness of interior interface")
+
+        keep = numpy.hstack([
+            int_tagged_a, int_tagged_b,
+            numpy.ones(len(bdry_faces), dtype=numpy.bool_)])
+        bdry_faces = candidates[keep]
+        tag_masks = dict(
+                (btag, mask[keep]) for btag, mask in tag_masks.iteritems())
+
+        int_faces_a = int_faces_a[~int_tagged_a]
+        int_faces_b = int_faces_b[~int_tagged_b]
+    else:
+        tag_masks = get_tag_masks(bdry_faces)
 
-        for el_face, tags in boundary_el_faces_tags:
-            el, face = el_face
-            tags = set(tags) - MESH_CREATION_TAGS
-            assert not isinstance(tags, str), \
-                RuntimeError("Received string as tag list")
-            assert TAG_ALL not in tags
-            assert TAG_REALLY_ALL not in tags
+    no_faces = numpy.zeros(0, dtype=numpy.intp)
+    tag_to_bdry_faces = {
+            TAG_NONE: no_faces,
+            TAG_REALLY_ALL: bdry_faces,
+            }
 
-            for btag in tags:
-                tag_to_boundary.setdefault(btag, []) \
-                        .append(el_face)
+    for btag, mask in tag_masks.iteritems():
+        tag_faces = bdry_faces[mask]
+        if btag in tag_to_bdry_faces:
+            tag_faces = numpy.hstack([tag_to_bdry_faces[btag], tag_faces])
+        tag_to_bdry_faces[btag] = tag_faces
 
-            if TAG_NO_BOUNDARY not in tags:
-                # TAG_NO_BOUNDARY is used to mark rank interfaces
-                # as not being part of the boundary
-                tag_to_boundary[TAG_ALL].append(el_face)
+    if TAG_NO_BOUNDARY in tag_masks:
+        # TAG_NO_BOUNDARY is used to mark rank interfaces
+        # as not being part of the boundary
+        tag_to_bdry_faces[TAG_ALL] = bdry_faces[~tag_masks[TAG_NO_BOUNDARY]]
+    else:
+        tag_to_bdry_faces[TAG_ALL] = bdry_faces
 
-            tag_to_boundary[TAG_REALLY_ALL].append(el_face)
+    # }}}
 
-    # add periodicity-induced connectivity
-    from pytools import flatten, reverse_dictionary
+    # {{{ add periodicity-induced connectivity
 
     periodic_opposite_faces = {}
     periodic_opposite_vertices = {}
 
-    for tag_bdries in tag_to_boundary.itervalues():
-        assert len(set(tag_bdries)) == len(tag_bdries)
+    periodic_faces_a = []
+    periodic_faces_b = []
+    periodic_mapped_fvi_a = []
+
+    if any(axis_periodicity is not None for axis_periodicity in periodicity):
+        # boundary faces as sorted vertex tuples, to look up faces
+        # by their vertices
+        really_all_faces = tag_to_bdry_faces[TAG_REALLY_ALL]
+        sorted_bdry_fvi = numpy.sort(faces[really_all_faces], axis=1)
 
     for axis, axis_periodicity in enumerate(periodicity):
-        if axis_periodicity is not None:
-            # find faces on +-axis boundaries
-            minus_tag, plus_tag = axis_periodicity
-            minus_faces = tag_to_boundary.get(minus_tag, [])
-            plus_faces = tag_to_boundary.get(plus_tag, [])
-
-            # find vertex indices and points on these faces
-            minus_vertex_indices = list(set(flatten(el.faces[face]
-                for el, face in minus_faces)))
-            plus_vertex_indices = list(set(flatten(el.faces[face]
-                for el, face in plus_faces)))
-
-            minus_z_points = [points[pi] for pi in minus_vertex_indices]
-            plus_z_points = [points[pi] for pi in plus_vertex_indices]
-
-            # find a mapping from -axis to +axis vertices
-            minus_to_plus, not_found = find_matching_vertices_along_axis(
-                    axis, minus_z_points, plus_z_points,
-                    minus_vertex_indices, plus_vertex_indices)
-            plus_to_minus = reverse_dictionary(minus_to_plus)
-
-            for a, b in minus_to_plus.iteritems():
-                periodic_opposite_vertices.setdefault(a, []).append((b, axis))
-                periodic_opposite_vertices.setdefault(b, []).append((a, axis))
-
-            # establish face connectivity
-            for minus_face in minus_faces:
-                minus_el, minus_fi = minus_face
-                minus_fvi = minus_el.faces[minus_fi]
-
-                try:
-                    mapped_plus_fvi = tuple(minus_to_plus[i] for i in minus_fvi)
-                    plus_faces = face_map[frozenset(mapped_plus_fvi)]
-                    assert len(plus_faces) == 1
-                except KeyError:
-                    # is our periodic counterpart is in a different mesh clump?
-                    if _is_rankbdry_face(minus_face):
-                        # if so, cool. parallel handler will take care of it.
-                        continue
-                    else:
-                        # if not, bad.
-                        raise
-
-                plus_face = plus_faces[0]
-                interfaces.append([minus_face, plus_face])
-
-                plus_el, plus_fi = plus_face
-                plus_fvi = plus_el.faces[plus_fi]
-
-                mapped_minus_fvi = tuple(plus_to_minus[i] for i in plus_fvi)
-
-                # periodic_opposite_faces maps face vertex tuples from
-                # one end of the periodic domain to the other, while
-                # correspondence between each entry
-
-                periodic_opposite_faces[minus_fvi] = mapped_plus_fvi, axis
-                periodic_opposite_faces[plus_fvi] = mapped_minus_fvi, axis
-
-                tag_to_boundary[TAG_ALL].remove(plus_face)
-                tag_to_boundary[TAG_ALL].remove(minus_face)
-
-                tag_to_boundary[TAG_REALLY_ALL].remove(plus_face)
-                tag_to_boundary[TAG_REALLY_ALL].remove(minus_face)
+        if axis_periodicity is None:
+            continue
+
+        # find faces on +-axis boundaries
+        minus_tag, plus_tag = axis_periodicity
+        minus_faces = tag_to_bdry_faces.get(minus_tag, no_faces)
+        plus_faces = tag_to_bdry_faces.get(plus_tag, no_faces)
+
+        # find a mapping from -axis to +axis vertices
+        minus_vertices, plus_vertices = match_vertices_along_axis(axis,
+                points,
+                numpy.unique(faces[minus_faces]),
+                numpy.unique(faces[plus_faces]))
+
+        minus_to_plus = numpy.empty(len(points), dtype=numpy.intp)
+        minus_to_plus.fill(-1)
+        minus_to_plus[minus_vertices] = plus_vertices
+        plus_to_minus = numpy.empty(len(points), dtype=numpy.intp)
+        plus_to_minus.fill(-1)
+        plus_to_minus[plus_vertices] = minus_vertices
+
+        for a, b in zip(minus_vertices.tolist(), plus_vertices.tolist()):
+            periodic_opposite_vertices.setdefault(a, []).append((b, axis))
+            periodic_opposite_vertices.setdefault(b, []).append((a, axis))
+
+        # establish face connectivity
+        minus_fvi = faces[minus_faces]
+        mapped_plus_fvi = minus_to_plus[minus_fvi]
+
+        plus_face_idx = find_rows(sorted_bdry_fvi,
+                numpy.sort(mapped_plus_fvi, axis=1))
+        plus_face_idx[(mapped_plus_fvi < 0).any(axis=1)] = -1
+
+        found = plus_face_idx >= 0
+        for face_nr in minus_faces[~found]:
+            # is our periodic counterpart in a different mesh clump?
+            # if so, cool. parallel handler will take care of it.
+            if not _is_rankbdry_face(get_el_face(face_nr)):
+                raise RuntimeError("face %d of element %d has no "
+                        "periodic counterpart along axis %d"
+                        % (face_nr % face_count, face_nr // face_count,
+                            axis))
+
+        minus_faces = minus_faces[found]
+        minus_fvi = minus_fvi[found]
+        mapped_plus_fvi = mapped_plus_fvi[found]
+        plus_faces = really_all_faces[plus_face_idx[found]]
+        plus_fvi = faces[plus_faces]
+        mapped_minus_fvi = plus_to_minus[plus_fvi]
+
+        periodic_faces_a.append(minus_faces)
+        periodic_faces_b.append(plus_faces)
+        periodic_mapped_fvi_a.append(mapped_plus_fvi)
+
+        # periodic_opposite_faces maps face vertex tuples from
+        # one end of the periodic domain to the other, while
+        # correspondence between each entry
+        for minus_fvi_i, mapped_plus_fvi_i, plus_fvi_i, mapped_minus_fvi_i \
+                in zip(minus_fvi.tolist(), mapped_plus_fvi.tolist(),
+                        plus_fvi.tolist(), mapped_minus_fvi.tolist()):
+            periodic_opposite_faces[tuple(minus_fvi_i)] = \
+                    tuple(mapped_plus_fvi_i), axis
+            periodic_opposite_faces[tuple(plus_fvi_i)] = \
+                    tuple(mapped_minus_fvi_i), axis
+
+        # periodic faces are no longer boundary faces
+        periodic_faces = numpy.hstack([minus_faces, plus_faces])
+        for btag in [TAG_ALL, TAG_REALLY_ALL]:
+            tag_faces = tag_to_bdry_faces[btag]
+            tag_to_bdry_faces[btag] = tag_faces[
+                    ~numpy.in1d(tag_faces, periodic_faces)]
+
+    if periodic_faces_a:
+        periodic_faces_a = numpy.hstack(periodic_faces_a)
+        periodic_faces_b = numpy.hstack(periodic_faces_b)
+        periodic_mapped_fvi_a = numpy.vstack(periodic_mapped_fvi_a)
+    else:
+        periodic_faces_a = periodic_faces_b = no_faces
+
+    # }}}
+
+    # {{{ assemble mesh
+
+    if isinstance(elements, ElementArrays):
+        elements.clear_connectivity()
+        elements.connect_faces(
+                int_faces_a // face_count, int_faces_a % face_count,
+                int_faces_b // face_count, int_faces_b % face_count)
+        if len(periodic_faces_a):
+            elements.connect_faces(
+                    periodic_faces_a // face_count,
+                    periodic_faces_a % face_count,
+                    periodic_faces_b // face_count,
+                    periodic_faces_b % face_count,
+                    periodic_mapped_fvi_a)
+
+        interfaces = elements.interfaces()
+
+        tag_to_boundary = dict(
+                (btag, FaceSubset(elements,
+                    tag_faces // face_count, tag_faces % face_count))
+                for btag, tag_faces in tag_to_bdry_faces.iteritems())
+
+        tag_to_elements = dict(
+                (el_tag, ElementSubset(elements, el_numbers))
+                for el_tag, el_numbers in tag_to_el_numbers.iteritems())
+        tag_to_elements[TAG_NONE] = ElementSubset(elements, no_faces)
+        tag_to_elements[TAG_ALL] = ElementSubset(elements,
+                numpy.arange(el_count, dtype=numpy.intp))
+    else:
+        interfaces = [
+                [get_el_face(face_a), get_el_face(face_b)]
+                for face_a, face_b in zip(
+                    numpy.hstack([int_faces_a, periodic_faces_a]),
+                    numpy.hstack([int_faces_b, periodic_faces_b]))]
+
+        tag_to_boundary = dict(
+                (btag, [get_el_face(face_nr) for face_nr in tag_faces])
+                for btag, tag_faces in tag_to_bdry_faces.iteritems())
+
+        tag_to_elements = dict(
+                (el_tag, [elements[el_nr] for el_nr in el_numbers])
+                for el_tag, el_numbers in tag_to_el_numbers.iteritems())
+        tag_to_elements[TAG_NONE] = []
+        tag_to_elements[TAG_ALL] = list(elements)
+
+    # }}}
 
     return ConformalMesh(
             points=points,
@@ -508,9 +654,14 @@ class ConformalMesh(Mesh):
         element.
         """
 
-        elements = [self.elements[old_numbers[i]].copy(
-            id=i, all_vertices=self.points)
-                for i in range(len(self.elements))]
+        from hedge.mesh.array import ElementArrays
+        if isinstance(self.elements, ElementArrays):
+            elements = self.elements.subset(
+                    numpy.asarray(old_numbers, dtype=numpy.intp))
+        else:
+            elements = [self.elements[old_numbers[i]].copy(
+                id=i, all_vertices=self.points)
+                    for i in range(len(self.elements))]
 
         old2new_el = dict(
                 (self.elements[old_numbers[i]], new_el)
@@ -539,6 +690,9 @@ class ConformalMesh(Mesh):
                 (tag, [old2new_el[old_el] for old_el in tag_els])
                 for tag, tag_els in self.tag_to_elements.iteritems())
 
+        if isinstance(elements, ElementArrays):
+            elements.set_connectivity(interfaces, self.periodic_opposite_faces)
+
         return ConformalMesh(
                 self.points, elements, interfaces,
                 tag_to_boundary, tag_to_elements, self.periodicity,
@@ -0,0 +1,878 @@
+"""Struct-of-arrays storage for the elements of a simplicial mesh."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import numpy
+from hedge.mesh.element import Interval, Triangle, Tetrahedron
+
+
+NO_NEIGHBOR = -1
+
+
+# {{{ geometry helpers
+
+def _orientations(jacobians):
+    """Return +1 for positively and -1 for negatively oriented elements,
+    consistent with :meth:`hedge.mesh.element.Interval.face_normals_and_jacobians`.
+    """
+    return numpy.where(jacobians < 0, -1., 1.)
+
+
+def _determinants(matrices):
+    dim = matrices.shape[-1]
+    m = matrices
+
+    if dim == 1:
+        return m[:, 0, 0].copy()
+    elif dim == 2:
+        return m[:, 0, 0]*m[:, 1, 1] - m[:, 0, 1]*m[:, 1, 0]
+    elif dim == 3:
+        return (m[:, 0, 0]*(m[:, 1, 1]*m[:, 2, 2] - m[:, 1, 2]*m[:, 2, 1])
+                - m[:, 0, 1]*(m[:, 1, 0]*m[:, 2, 2] - m[:, 1, 2]*m[:, 2, 0])
+                + m[:, 0, 2]*(m[:, 1, 0]*m[:, 2, 1] - m[:, 1, 1]*m[:, 2, 0]))
+    else:
+        raise ValueError("%d-dimensional elements are unsupported" % dim)
+
+
+def _inverses(matrices, determinants):
+    dim = matrices.shape[-1]
+    m = matrices
+    result = numpy.empty_like(matrices)
+
+    if dim == 1:
+        result[:, 0, 0] = 1
+    elif dim == 2:
+        result[:, 0, 0] = m[:, 1, 1]
+        result[:, 0, 1] = -m[:, 0, 1]
+        result[:, 1, 0] = -m[:, 1, 0]
+        result[:, 1, 1] = m[:, 0, 0]
+    elif dim == 3:
+        # transposed cofactor matrix
+        for i in range(3):
+            i1 = (i+1) % 3
+            i2 = (i+2) % 3
+            for j in range(3):
+                j1 = (j+1) % 3
+                j2 = (j+2) % 3
+                result[:, j, i] = (m[:, i1, j1]*m[:, i2, j2]
+                        - m[:, i1, j2]*m[:, i2, j1])
+    else:
+        raise ValueError("%d-dimensional elements are unsupported" % dim)
+
+    result /= determinants[:, numpy.newaxis, numpy.newaxis]
+    return result
+
+# }}}
+
+
+# {{{ element views
+
+class ElementView(object):
+    """A lightweight stand-in for an :class:`hedge.mesh.element.Element`
+    that reads its data from an :class:`ElementArrays` instance instead of
+    storing it.
+
+    Views compare equal (and hash alike) if they refer to the same element
+    of the same :class:`ElementArrays`, so they may be used as dictionary
+    keys just like element instances.
+    """
+
+    __slots__ = []
+
+    def __init__(self, element_arrays, id):
+        self.element_arrays = element_arrays
+        self.id = id
+
+    @property
+    def vertex_indices(self):
+        return self.element_arrays.vertex_indices[self.id]
+
+    @property
+    def map(self):
+        from hedge.tools.affine import AffineMap
+        ea = self.element_arrays
+        return AffineMap(ea.map_matrices[self.id], ea.map_offsets[self.id])
+
+    @property
+    def inverse_map(self):
+        from hedge.tools.affine import AffineMap
+        ea = self.element_arrays
+        return AffineMap(
+                ea.inverse_map_matrices[self.id],
+                ea.inverse_map_offsets[self.id])
+
+    @property
+    def face_normals(self):
+        return self.element_arrays.face_normals[self.id]
+
+    @property
+    def face_jacobians(self):
+        return self.element_arrays.face_jacobians[self.id]
+
+    def copy(self, id, all_vertices):
+        """Return a stand-alone element object equivalent to *self*,
+        with id *id*.
+        """
+        return self.element_arrays.el_class(
+                id, self.vertex_indices, all_vertices)
+
+    def __eq__(self, other):
+        return (isinstance(other, ElementView)
+                and self.element_arrays is other.element_arrays
+                and self.id == other.id)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.element_arrays), self.id))
+
+    def __reduce__(self):
+        return (_make_element_view, (self.element_arrays, self.id))
+
+    def __repr__(self):
+        return "%s(%d)" % (type(self).__name__, self.id)
+
+
+class IntervalView(ElementView, Interval):
+    __slots__ = ["element_arrays"]
+
+
+class TriangleView(ElementView, Triangle):
+    __slots__ = ["element_arrays"]
+
+
+class TetrahedronView(ElementView, Tetrahedron):
+    __slots__ = ["element_arrays"]
+
+
+VIEW_CLASS = {
+        Interval: IntervalView,
+        Triangle: TriangleView,
+        Tetrahedron: TetrahedronView,
+        }
+
+
+def _make_element_view(element_arrays, id):
+    return element_arrays[id]
+
+# }}}
+
+
+# {{{ element arrays
+
+class ElementArrays(object):
+    """The elements of a mesh of uniform simplex type, stored as contiguous
+    arrays rather than as one Python object per element.
+
+    Instances behave like a read-only sequence of elements (which is what
+    :attr:`hedge.mesh.Mesh.elements` is expected to be), yielding
+    :class:`ElementView` instances that are created on demand. Code that
+    knows about this class may instead use the arrays directly.
+
+    :ivar el_class: the element class, one of
+      :class:`hedge.mesh.element.Interval`,
+      :class:`hedge.mesh.element.Triangle` or
+      :class:`hedge.mesh.element.Tetrahedron`.
+    :ivar vertex_indices: an integer array of shape *(nelements, dim+1)*.
+    :ivar map_matrices: an array of shape *(nelements, dim, dim)*
+      containing the matrices of the maps from the unit element.
+    :ivar map_offsets: an array of shape *(nelements, dim)*.
+    :ivar jacobians: the (signed) determinants of *map_matrices*.
+    :ivar face_vertex_numbers: an integer array of shape
+      *(faces, face_vertices)* giving the element-local vertex numbers
+      of each face.
+    :ivar neighbor_elements: an integer array of shape *(nelements, faces)*
+      containing the number of the element across each face, or
+      :data:`NO_NEIGHBOR` for boundary faces. *None* until the
+      connectivity is known, see :meth:`set_connectivity`.
+    :ivar neighbor_faces: an integer array of shape *(nelements, faces)*
+      containing the face number within the neighboring element.
+    :ivar neighbor_orientations: an integer array of shape
+      *(nelements, faces)*. Entry *k* refers to
+      *face_permutations[k]*, a tuple *p* such that vertex *i* of the
+      face coincides with vertex *p[i]* of the neighbor's face.
+
+    Face normals, face jacobians and inverse maps are computed on first
+    use.
+
+    :param maps: if given, a tuple *(map_matrices, map_offsets, jacobians)*
+      to use instead of computing them from *points*.
+    """
+
+    def __init__(self, el_class, vertex_indices, points, maps=None):
+        if el_class not in VIEW_CLASS:
+            raise ValueError("unsupported element class: %s"
+                    % el_class.__name__)
+
+        self.el_class = el_class
+        self.points = points
+        self.dimensions = el_class.dimensions
+
+        vertex_indices = numpy.asarray(vertex_indices, dtype=numpy.intp,
+                order="C")
+        if len(vertex_indices) == 0:
+            vertex_indices = vertex_indices.reshape(0, self.dimensions+1)
+        if (len(vertex_indices.shape) != 2
+                or vertex_indices.shape[1] != self.dimensions+1):
+            raise ValueError("vertex_indices must have shape "
+                    "(element count, %d)" % (self.dimensions+1))
+        self.vertex_indices = vertex_indices
+
+        self.face_vertex_numbers = numpy.array(
+                el_class.face_vertices(range(self.dimensions+1)),
+                dtype=numpy.intp)
+
+        from itertools import permutations
+        self.face_permutations = list(permutations(
+            range(self.face_vertex_numbers.shape[1])))
+
+        if maps is None:
+            self._compute_maps()
+        else:
+            self.map_matrices, self.map_offsets, self.jacobians = maps
+
+        self.neighbor_elements = None
+        self.neighbor_faces = None
+        self.neighbor_orientations = None
+
+    def _compute_maps(self):
+        # see get_simplex_map_unit_to_global in hedge/_internal
+        vertices = self.points[self.vertex_indices]
+        v0 = vertices[:, 0]
+
+        self.map_matrices = numpy.ascontiguousarray(
+                0.5*(vertices[:, 1:] - v0[:, numpy.newaxis]
+                    ).transpose(0, 2, 1))
+        self.map_offsets = (0.5*numpy.sum(vertices[:, 1:], axis=1)
+                - 0.5*(self.dimensions-2)*v0)
+        self.jacobians = _determinants(self.map_matrices)
+
+    def __getstate__(self):
+        return dict(
+                el_class=self.el_class,
+                vertex_indices=self.vertex_indices,
+                points=self.points,
+                neighbor_elements=self.neighbor_elements,
+                neighbor_faces=self.neighbor_faces,
+                neighbor_orientations=self.neighbor_orientations,
+                )
+
+    def __setstate__(self, state):
+        self.__init__(state["el_class"], state["vertex_indices"],
+                state["points"])
+        self.neighbor_elements = state["neighbor_elements"]
+        self.neighbor_faces = state["neighbor_faces"]
+        self.neighbor_orientations = state["neighbor_orientations"]
+
+    # {{{ sequence interface
+
+    def __len__(self):
+        return len(self.vertex_indices)
+
+    def __getitem__(self, index):
+        count = len(self.vertex_indices)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("element index out of range")
+
+        return VIEW_CLASS[self.el_class](self, int(index))
+
+    def __iter__(self):
+        view_class = VIEW_CLASS[self.el_class]
+        for i in xrange(len(self.vertex_indices)):
+            yield view_class(self, i)
+
+    # }}}
+
+    # {{{ lazily computed geometry
+
+    @property
+    def faces(self):
+        """An integer array of shape *(nelements, faces, face_vertices)*
+        containing the global vertex indices of each face.
+        """
+        return self.vertex_indices[:, self.face_vertex_numbers]
+
+    @property
+    def inverse_map_matrices(self):
+        try:
+            return self._inverse_map_matrices
+        except AttributeError:
+            self._inverse_map_matrices = _inverses(
+                    self.map_matrices, self.jacobians)
+            return self._inverse_map_matrices
+
+    @property
+    def inverse_map_offsets(self):
+        try:
+            return self._inverse_map_offsets
+        except AttributeError:
+            self._inverse_map_offsets = -numpy.sum(
+                    self.inverse_map_matrices
+                    * self.map_offsets[:, numpy.newaxis, :], axis=-1)
+            return self._inverse_map_offsets
+
+    def _compute_face_geometry(self):
+        orient = _orientations(self.jacobians)
+        el_count = len(self)
+
+        if self.el_class is Interval:
+            normals = numpy.empty((el_count, 2, 1))
+            normals[:, 0, 0] = -orient
+            normals[:, 1, 0] = orient
+            face_jacobians = numpy.ones((el_count, 2))
+
+        elif self.el_class is Triangle:
+            m = self.map_matrices
+            face1 = m[:, :, 1] - m[:, :, 0]
+
+            normals = numpy.empty((el_count, 3, 2))
+            normals[:, 0, 0] = m[:, 1, 0]
+            normals[:, 0, 1] = -m[:, 0, 0]
+            normals[:, 1, 0] = face1[:, 1]
+            normals[:, 1, 1] = -face1[:, 0]
+            normals[:, 2, 0] = -m[:, 1, 1]
+            normals[:, 2, 1] = m[:, 0, 1]
+            normals *= orient[:, numpy.newaxis, numpy.newaxis]
+
+            face_jacobians = numpy.sqrt(numpy.sum(normals**2, axis=-1))
+
+        elif self.el_class is Tetrahedron:
+            # see tetrahedron_fj_and_normal in hedge/_internal
+            face_orientations = numpy.array([-1, 1, -1, 1], dtype=numpy.float64)
+
+            fv = self.points[self.faces]
+            normals = numpy.cross(
+                    fv[:, :, 1] - fv[:, :, 0],
+                    fv[:, :, 2] - fv[:, :, 0])
+            normals *= (orient[:, numpy.newaxis]
+                    * face_orientations)[:, :, numpy.newaxis]
+
+            # the unit triangle has area two
+            face_jacobians = numpy.sqrt(numpy.sum(normals**2, axis=-1))/4
+            normals /= 4
+
+        else:
+            raise ValueError("unsupported element class: %s"
+                    % self.el_class.__name__)
+
+        self._face_normals = normals / face_jacobians[:, :, numpy.newaxis]
+        self._face_jacobians = face_jacobians
+
+    @property
+    def face_normals(self):
+        """An array of shape *(nelements, faces, dim)* containing the
+        unit outward normals.
+        """
+        try:
+            return self._face_normals
+        except AttributeError:
+            self._compute_face_geometry()
+            return self._face_normals
+
+    @property
+    def face_jacobians(self):
+        """An array of shape *(nelements, faces)*."""
+        try:
+            return self._face_jacobians
+        except AttributeError:
+            self._compute_face_geometry()
+            return self._face_jacobians
+
+    # }}}
+
+    # {{{ connectivity
+
+    def clear_connectivity(self):
+        """Mark all faces as boundary faces."""
+        shape = (len(self), len(self.face_vertex_numbers))
+
+        self.neighbor_elements = numpy.empty(shape, dtype=numpy.intp)
+        self.neighbor_elements.fill(NO_NEIGHBOR)
+        self.neighbor_faces = numpy.zeros(shape, dtype=numpy.intp)
+        self.neighbor_orientations = numpy.zeros(shape, dtype=numpy.intp)
+
+    def connect_faces(self, el_a, face_a, el_b, face_b, mapped_fvi_a=None):
+        """Record that face *face_a[i]* of element *el_a[i]* touches face
+        *face_b[i]* of element *el_b[i]*, for all *i*.
+
+        :param mapped_fvi_a: if not *None*, an integer array of shape
+          *(len(el_a), face_vertices)* giving the vertices of faces *a*
+          as they appear on side *b*, for faces matched across a
+          periodic boundary.
+        """
+        if self.neighbor_elements is None:
+            self.clear_connectivity()
+
+        el_a = numpy.asarray(el_a, dtype=numpy.intp)
+        face_a = numpy.asarray(face_a, dtype=numpy.intp)
+        el_b = numpy.asarray(el_b, dtype=numpy.intp)
+        face_b = numpy.asarray(face_b, dtype=numpy.intp)
+
+        self.neighbor_elements[el_a, face_a] = el_b
+        self.neighbor_faces[el_a, face_a] = face_b
+        self.neighbor_elements[el_b, face_b] = el_a
+        self.neighbor_faces[el_b, face_b] = face_a
+
+        if mapped_fvi_a is None:
+            fvi_a = self.vertex_indices[
+                    el_a[:, numpy.newaxis], self.face_vertex_numbers[face_a]]
+        else:
+            fvi_a = numpy.asarray(mapped_fvi_a, dtype=numpy.intp)
+        fvi_b = self.vertex_indices[
+                el_b[:, numpy.newaxis], self.face_vertex_numbers[face_b]]
+
+        orientations = numpy.empty(len(el_a), dtype=numpy.intp)
+        orientations.fill(-1)
+        for i, perm in enumerate(self.face_permutations):
+            orientations[numpy.all(fvi_b[:, perm] == fvi_a, axis=1)] = i
+
+        if (orientations < 0).any():
+            raise ValueError("connected faces do not share their vertices")
+
+        perm_numbers = dict(
+                (perm, i) for i, perm in enumerate(self.face_permutations))
+        inverse_perm_numbers = numpy.array([
+            perm_numbers[tuple(numpy.argsort(perm))]
+            for perm in self.face_permutations], dtype=numpy.intp)
+
+        self.neighbor_orientations[el_a, face_a] = orientations
+        self.neighbor_orientations[el_b, face_b] = \
+                inverse_perm_numbers[orientations]
+
+    def set_connectivity(self, interfaces, periodic_opposite_faces=None):
+        """Fill :attr:`neighbor_elements`, :attr:`neighbor_faces` and
+        :attr:`neighbor_orientations` from *interfaces*, in the format of
+        :attr:`hedge.mesh.Mesh.interfaces`.
+
+        :param periodic_opposite_faces: as in :class:`hedge.mesh.Mesh`, used
+          to relate the vertices of faces matched across a periodic
+          boundary.
+        """
+        if periodic_opposite_faces is None:
+            periodic_opposite_faces = {}
+
+        self.clear_connectivity()
+
+        if not interfaces:
+            return
+
+        faces = self.faces
+
+        el_a = []
+        face_a = []
+        el_b = []
+        face_b = []
+        mapped_fvi_a = []
+
+        for (el_a_i, face_a_i), (el_b_i, face_b_i) in interfaces:
+            el_a.append(el_a_i.id)
+            face_a.append(face_a_i)
+            el_b.append(el_b_i.id)
+            face_b.append(face_b_i)
+
+            fvi = tuple(faces[el_a_i.id, face_a_i])
+            try:
+                fvi, axis = periodic_opposite_faces[fvi]
+            except KeyError:
+                pass
+            mapped_fvi_a.append(fvi)
+
+        self.connect_faces(el_a, face_a, el_b, face_b, mapped_fvi_a)
+
+    def adjacency_graph(self):
+        """Return a dictionary mapping each element id to a set of
+        adjacent element ids, like :meth:`hedge.mesh.Mesh.element_adjacency_graph`.
+        """
+        if self.neighbor_elements is None:
+            raise RuntimeError("connectivity of element arrays is not known")
+
+        adjacency = {}
+        el_numbers, face_numbers = numpy.nonzero(
+                self.neighbor_elements != NO_NEIGHBOR)
+        for el, nb in zip(el_numbers,
+                self.neighbor_elements[el_numbers, face_numbers]):
+            adjacency.setdefault(int(el), set()).add(int(nb))
+        return adjacency
+
+    def adjacency_arrays(self):
+        """Return the element adjacency graph in compressed sparse row form,
+        as a tuple *(xadj, adjncy)* of integer arrays. The neighbors of
+        element *i* are *adjncy[xadj[i]:xadj[i+1]]*. This is the form
+        graph partitioners such as PyMetis take.
+        """
+        if self.neighbor_elements is None:
+            raise RuntimeError("connectivity of element arrays is not known")
+
+        el_count = len(self)
+        el_numbers, face_numbers = numpy.nonzero(
+                self.neighbor_elements != NO_NEIGHBOR)
+        nb_numbers = self.neighbor_elements[el_numbers, face_numbers]
+
+        # drop self-loops and repeated neighbors, both of which periodic
+        # connections can produce
+        edges = numpy.unique((el_numbers*el_count + nb_numbers)[
+            el_numbers != nb_numbers])
+        el_numbers = edges // el_count
+
+        xadj = numpy.zeros(el_count+1, dtype=numpy.intp)
+        xadj[1:] = numpy.cumsum(numpy.bincount(el_numbers, minlength=el_count))
+        return xadj, edges % el_count
+
+    def interfaces(self):
+        """Return the interior faces as an :class:`InterfaceSequence`."""
+        return InterfaceSequence(self)
+
+    # }}}
+
+    def subset(self, element_numbers, points=None):
+        """Return an :class:`ElementArrays` containing the elements
+        *element_numbers*, in that order, without connectivity.
+
+        :param points: if given, a new array of vertex coordinates.
+          The vertex indices are then not changed, so the caller must
+          renumber them, if necessary.
+        """
+        if points is None:
+            points = self.points
+
+        return ElementArrays(self.el_class,
+                self.vertex_indices[element_numbers], points)
+
+# }}}
+
+
+# {{{ face matching
+
+class InterfaceSequence(object):
+    """A read-only sequence of the interior faces of an
+    :class:`ElementArrays` instance, in the form of
+    :attr:`hedge.mesh.Mesh.interfaces`. Entries are created on demand from
+    the neighbor arrays, each interface once, starting from its side with
+    the lower *(element, face)* number.
+    """
+
+    def __init__(self, element_arrays):
+        ea = element_arrays
+        if ea.neighbor_elements is None:
+            raise RuntimeError("connectivity of element arrays is not known")
+
+        face_count = ea.neighbor_elements.shape[1]
+        el_a, face_a = numpy.nonzero(ea.neighbor_elements != NO_NEIGHBOR)
+        el_b = ea.neighbor_elements[el_a, face_a]
+        face_b = ea.neighbor_faces[el_a, face_a]
+
+        is_first = el_a*face_count + face_a < el_b*face_count + face_b
+        self.element_arrays = ea
+        self.el_a = el_a[is_first]
+        self.face_a = face_a[is_first]
+        self.el_b = el_b[is_first]
+        self.face_b = face_b[is_first]
+
+    def __len__(self):
+        return len(self.el_a)
+
+    def __getitem__(self, index):
+        ea = self.element_arrays
+        return (
+                (ea[self.el_a[index]], int(self.face_a[index])),
+                (ea[self.el_b[index]], int(self.face_b[index])))
+
+    def __iter__(self):
+        for i in xrange(len(self.el_a)):
+            yield self[i]
+
+
+class ElementSubset(object):
+    """A read-only sequence of some of the elements of an
+    :class:`ElementArrays` instance, in the form of the values of
+    :attr:`hedge.mesh.Mesh.tag_to_elements`. Entries are created on demand.
+
+    :ivar element_arrays:
+    :ivar el_numbers: an integer array of the numbers of the elements in
+      the subset.
+    """
+
+    def __init__(self, element_arrays, el_numbers):
+        self.element_arrays = element_arrays
+        self.el_numbers = numpy.asarray(el_numbers, dtype=numpy.intp)
+
+    def __len__(self):
+        return len(self.el_numbers)
+
+    def __getitem__(self, index):
+        return self.element_arrays[self.el_numbers[index]]
+
+    def __iter__(self):
+        ea = self.element_arrays
+        for el_nr in self.el_numbers:
+            yield ea[el_nr]
+
+
+class FaceSubset(object):
+    """A read-only sequence of faces of the elements of an
+    :class:`ElementArrays` instance, in the form of the values of
+    :attr:`hedge.mesh.Mesh.tag_to_boundary`, i.e. of tuples
+    *(element, face number)*. Entries are created on demand.
+
+    :ivar element_arrays:
+    :ivar el_numbers: an integer array of the element number of each face.
+    :ivar face_numbers: an integer array of the number of each face within
+      its element.
+    """
+
+    def __init__(self, element_arrays, el_numbers, face_numbers):
+        self.element_arrays = element_arrays
+        self.el_numbers = numpy.asarray(el_numbers, dtype=numpy.intp)
+        self.face_numbers = numpy.asarray(face_numbers, dtype=numpy.intp)
+
+    def __len__(self):
+        return len(self.el_numbers)
+
+    def __getitem__(self, index):
+        return (self.element_arrays[self.el_numbers[index]],
+                int(self.face_numbers[index]))
+
+    def __iter__(self):
+        for i in xrange(len(self.el_numbers)):
+            yield self[i]
+
+
+def get_element_numbers(elements):
+    """Return an integer array of the :attr:`id` of each element in the
+    sequence *elements*. :class:`ElementArrays` and :class:`ElementSubset`
+    instances are handled without creating element objects.
+    """
+    if isinstance(elements, ElementArrays):
+        return numpy.arange(len(elements), dtype=numpy.intp)
+    elif isinstance(elements, ElementSubset):
+        return elements.el_numbers
+    else:
+        return numpy.fromiter((el.id for el in elements),
+                dtype=numpy.intp, count=len(elements))
+
+
+def get_face_numbers(faces):
+    """Return a tuple *(el_ids, face_nrs)* of integer arrays for the
+    sequence *faces* of *(element, face number)* tuples, such as a value
+    of :attr:`hedge.mesh.Mesh.tag_to_boundary`. :class:`FaceSubset`
+    instances are handled without creating element objects.
+    """
+    if isinstance(faces, FaceSubset):
+        return faces.el_numbers, faces.face_numbers
+    else:
+        return (
+                numpy.fromiter((el.id for el, face_nr in faces),
+                    dtype=numpy.intp, count=len(faces)),
+                numpy.fromiter((face_nr for el, face_nr in faces),
+                    dtype=numpy.intp, count=len(faces)))
+
+
+def find_face_pairs(face_vertex_indices):
+    """Find the faces that share the same set of vertices.
+
+    :param face_vertex_indices: an integer array of shape
+      *(nfaces, face_vertices)*.
+    :returns: a tuple *(a, b)* of integer arrays such that faces *a[i]* and
+      *b[i]* consist of the same vertices, possibly in different order.
+
+    Faces are matched by sorting the vertex indices of each face, and then
+    sorting the faces lexicographically, so that matching faces become
+    adjacent.
+    """
+    sorted_fvi = numpy.sort(face_vertex_indices, axis=1)
+
+    # lexsort uses the last key as the primary one
+    order = numpy.lexsort(sorted_fvi.T[::-1])
+    sorted_fvi = sorted_fvi[order]
+
+    same_as_next = numpy.all(sorted_fvi[1:] == sorted_fvi[:-1], axis=1)
+    if (same_as_next[1:] & same_as_next[:-1]).any():
+        raise RuntimeError("face can at most border two elements")
+
+    return order[:-1][same_as_next], order[1:][same_as_next]
+
+
+def find_rows(table, rows):
+    """Return, for each row of the integer array *rows*, the index of an
+    equal row in *table*, or -1 if there is none.
+    """
+    both = numpy.vstack([table, rows])
+    is_query = numpy.arange(len(both)) >= len(table)
+
+    # sort rows lexicographically, rows of *table* first among equal ones
+    # (lexsort uses the last key as the primary one)
+    order = numpy.lexsort([is_query] + list(both.T[::-1]))
+    sorted_rows = both[order]
+
+    run_start = numpy.arange(len(both))
+    run_start[1:][(sorted_rows[1:] == sorted_rows[:-1]).all(axis=1)] = 0
+    run_start = numpy.maximum.accumulate(run_start)
+
+    first = order[run_start]
+    result = numpy.empty(len(both), dtype=numpy.intp)
+    result[order] = numpy.where(first < len(table), first, -1)
+    return result[len(table):]
+
+
+def find_all_rows(table, rows):
+    """Return a tuple *(row_nrs, table_nrs)* of integer arrays listing
+    every pair of a row of the integer array *rows* and an equal row of
+    *table*.
+    """
+    both = numpy.vstack([table, rows])
+    is_table = numpy.arange(len(both)) < len(table)
+
+    # sort rows lexicographically, rows of *table* first among equal ones
+    # (lexsort uses the last key as the primary one)
+    order = numpy.lexsort([~is_table] + list(both.T[::-1]))
+    sorted_rows = both[order]
+    sorted_is_table = is_table[order]
+
+    run_start = numpy.arange(len(both))
+    run_start[1:][(sorted_rows[1:] == sorted_rows[:-1]).all(axis=1)] = 0
+    run_start = numpy.maximum.accumulate(run_start)
+
+    # the number of table rows in front of each sorted row, within its run
+    tables_before = numpy.cumsum(sorted_is_table) - sorted_is_table
+    table_counts = tables_before - tables_before[run_start]
+
+    query_pos, = numpy.nonzero(~sorted_is_table)
+    counts = table_counts[query_pos]
+    count_starts = numpy.cumsum(counts) - counts
+    table_pos = (numpy.repeat(run_start[query_pos], counts)
+            + numpy.arange(counts.sum())
+            - numpy.repeat(count_starts, counts))
+
+    return (numpy.repeat(order[query_pos] - len(table), counts),
+            order[table_pos])
+
+
+def match_vertices_along_axis(axis, points, numbers_a, numbers_b,
+        tolerance=1e-12):
+    """Find, for the vertices *numbers_a*, the vertices among *numbers_b*
+    that coincide with them except for their coordinate along *axis*.
+
+    :returns: a tuple *(a, b)* of integer arrays such that vertex *a[i]*
+      matches vertex *b[i]*. Vertices of *numbers_a* without a match are
+      omitted. Like :func:`hedge.mesh.find_matching_vertices_along_axis`,
+      the first match is used if there are several.
+
+    The remaining coordinates are rounded to a grid of cells of size
+    twice *tolerance*, so that matching vertices fall into the same or
+    neighboring cells. The cells of *numbers_b* are then looked up by
+    sorting, see :func:`find_all_rows`, which takes *O(n log n)* time.
+    """
+    numbers_a = numpy.asarray(numbers_a, dtype=numpy.intp)
+    numbers_b = numpy.asarray(numbers_b, dtype=numpy.intp)
+
+    if not len(numbers_a) or not len(numbers_b):
+        empty = numpy.zeros(0, dtype=numpy.intp)
+        return empty, empty
+
+    other_axes = [i for i in xrange(points.shape[1]) if i != axis]
+    points_a = points[numbers_a][:, other_axes]
+    points_b = points[numbers_b][:, other_axes]
+
+    cell_size = 2*tolerance
+    cells_a = numpy.floor(points_a / cell_size).astype(numpy.int64)
+    cells_b = numpy.floor(points_b / cell_size).astype(numpy.int64)
+
+    from itertools import product
+    match = numpy.empty(len(numbers_a), dtype=numpy.intp)
+    match.fill(len(numbers_b))
+    for offset in product([-1, 0, 1], repeat=len(other_axes)):
+        a_nrs, b_nrs = find_all_rows(cells_b,
+                cells_a + numpy.array(offset, dtype=numpy.int64))
+
+        is_close = numpy.sum((points_a[a_nrs] - points_b[b_nrs])**2,
+                axis=-1) < tolerance**2
+        numpy.minimum.at(match, a_nrs[is_close], b_nrs[is_close])
+
+    found = match < len(numbers_b)
+    return numbers_a[found], numbers_b[match[found]]
+
+
+class ArrayBoundaryTagger(object):
+    """Base class for boundary taggers that tag many faces in one call.
+
+    When passed as *boundary_tagger* to
+    :func:`hedge.mesh.make_conformal_mesh_ext`, :meth:`tag_faces` is
+    called once for all boundary faces, instead of calling the tagger once
+    per face. Instances may still be called like a per-face boundary tagger.
+    """
+
+    def tag_faces(self, face_vertex_indices, el_numbers, face_numbers, all_v):
+        """Return a mapping from boundary tags to boolean arrays of shape
+        *(nfaces,)* indicating which faces receive each tag.
+
+        :param face_vertex_indices: an integer array of shape
+          *(nfaces, face_vertices)*.
+        :param el_numbers: an integer array of shape *(nfaces,)* giving the
+          index of the element of each face within the mesh's element
+          sequence.
+        :param face_numbers: an integer array of shape *(nfaces,)* giving
+          the face number of each face within its element.
+        :param all_v: the array of all vertex coordinates.
+        """
+        raise NotImplementedError
+
+    def __call__(self, fvi, el, fn, all_v):
+        tag_masks = self.tag_faces(
+                numpy.array([el.faces[fn]], dtype=numpy.intp),
+                numpy.array([el.id], dtype=numpy.intp),
+                numpy.array([fn], dtype=numpy.intp),
+                all_v)
+        return [tag for tag, mask in tag_masks.iteritems() if mask[0]]
+
+# }}}
+
+
+def make_element_arrays(points, vertex_indices):
+    """Return an :class:`ElementArrays` instance for the simplices given by
+    *vertex_indices*, choosing the element type based on the dimension of
+    *points*. The result may be passed as *elements* to
+    :func:`hedge.mesh.make_conformal_mesh_ext`.
+
+    :param points: a float64 array of shape *(npoints, dim)*.
+    :param vertex_indices: an integer array of shape *(nelements, dim+1)*.
+    """
+    dim = points.shape[1]
+    if dim == 1:
+        el_class = Interval
+    elif dim == 2:
+        el_class = Triangle
+    elif dim == 3:
+        el_class = Tetrahedron
+    else:
+        raise ValueError("%d-dimensional meshes are unsupported" % dim)
+
+    return ElementArrays(el_class, vertex_indices, points)
+
+
+# vim: foldmethod=marker
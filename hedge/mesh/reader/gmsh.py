@@ -32,6 +32,7 @@ from hedge.discretization.local import \
         TriangleDiscretization, \
         TetrahedronDiscretization
 from meshpy.gmsh_reader import GmshMeshReceiverBase, GmshPoint
+from hedge.mesh.array import ArrayBoundaryTagger, find_rows
 
 
 
@@ -379,22 +380,562 @@ class HedgeGmshMeshReceiver(GmshMeshReceiverBase):
 
 
 
+# {{{ streaming reader
+
+class GmshFileFormatError(ValueError):
+    pass
+
+
+# maps gmsh element type numbers to (dimensions, node count)
+GMSH_ELEMENT_TYPES = {
+        1: (1, 2), 2: (2, 3), 3: (2, 4), 4: (3, 4), 5: (3, 8),
+        6: (3, 6), 7: (3, 5), 8: (1, 3), 9: (2, 6), 10: (2, 9),
+        11: (3, 10), 12: (3, 27), 13: (3, 18), 14: (3, 14), 15: (0, 1),
+        16: (2, 8), 17: (3, 20), 18: (3, 15), 19: (3, 13), 20: (2, 9),
+        21: (2, 10), 22: (2, 12), 23: (2, 15), 24: (2, 15), 25: (2, 21),
+        26: (1, 4), 27: (1, 5), 28: (1, 6), 29: (3, 20), 30: (3, 35),
+        31: (3, 56),
+        }
+
+
+class GmshPhysicalNames(Record):
+    """
+    :ivar names: a :class:`dict` mapping *(dimension, number)* to the name
+      of a physical entity.
+    """
+
+
+class GmshNodes(Record):
+    """
+    :ivar numbers: an integer array of gmsh node numbers.
+    :ivar coordinates: a float64 array of shape *(nnodes, 3)*.
+    """
+
+
+class GmshElementBlock(Record):
+    """A run of elements of the same type, read in one piece.
+
+    :ivar el_type: the gmsh element type number.
+    :ivar numbers: an integer array of gmsh element numbers.
+    :ivar tags: an integer array of shape *(nelements, ntags)*. Column 0
+      holds the physical entity, column 1 the elementary entity.
+    :ivar nodes: an integer array of shape *(nelements, node count)*
+      holding gmsh node numbers in gmsh's node order.
+    """
+
+
+def _read_line(inf):
+    line = inf.readline()
+    if not line:
+        raise GmshFileFormatError("unexpected end of file")
+    return line.strip()
+
+
+def _expect_line(inf, expected):
+    line = _read_line(inf)
+    if line != expected:
+        raise GmshFileFormatError("expected '%s', got '%s'"
+                % (expected, line[:80]))
+
+
+def _read_binary(inf, dtype, count):
+    dtype = np.dtype(dtype)
+    data = inf.read(dtype.itemsize*count)
+    if len(data) != dtype.itemsize*count:
+        raise GmshFileFormatError("unexpected end of file")
+    return np.frombuffer(data, dtype=dtype)
+
+
+def _read_ascii_lines(inf, count, dtype):
+    text = "".join([inf.readline() for i in xrange(count)])
+    return np.fromstring(text, dtype=dtype, sep=" ")
+
+
+def _split_element_rows(flat):
+    """Split the integers of a run of ASCII element lines into blocks of
+    lines of equal type and tag count, which gmsh writes in long runs.
+    Yields arrays of shape *(nelements, line length)*.
+    """
+    pos = 0
+    while pos < len(flat):
+        if pos+3 > len(flat):
+            raise GmshFileFormatError("truncated element line")
+
+        el_type = flat[pos+1]
+        tag_count = flat[pos+2]
+        try:
+            dim, node_count = GMSH_ELEMENT_TYPES[el_type]
+        except KeyError:
+            raise GmshFileFormatError(
+                    "unsupported gmsh element type %d" % el_type)
+
+        width = 3 + tag_count + node_count
+        rows = flat[pos:pos + (len(flat)-pos)//width*width].reshape(-1, width)
+        if not len(rows):
+            raise GmshFileFormatError("truncated element line")
+
+        # Lines past the end of the run are misaligned, but the first
+        # of them is a correctly aligned line of a different type or tag
+        # count. Check in growing steps, to keep runs of few elements cheap.
+        run_length = 0
+        step = 64
+        while run_length < len(rows):
+            window = rows[run_length:run_length+step]
+            same = (window[:, 1] == el_type) & (window[:, 2] == tag_count)
+            if not same.all():
+                run_length += int(np.argmin(same))
+                break
+            run_length += len(window)
+            step *= 2
+
+        yield rows[:run_length]
+        pos += run_length*width
+
+
+def _make_element_block(el_type, tag_count, numbers, tags_and_nodes):
+    return GmshElementBlock(
+            el_type=int(el_type),
+            numbers=numbers,
+            tags=tags_and_nodes[:, :tag_count],
+            nodes=tags_and_nodes[:, tag_count:])
+
+
+def _iter_gmsh_blocks(inf, chunk_size):
+    _expect_line(inf, "$MeshFormat")
+    version, file_type, data_size = _read_line(inf).split()
+    if not version.startswith("2."):
+        raise GmshFileFormatError("unsupported gmsh format version %s"
+                % version)
+    if int(data_size) != 8:
+        raise GmshFileFormatError("unsupported gmsh data size %s"
+                % data_size)
+
+    is_binary = int(file_type) == 1
+    if is_binary:
+        one = _read_binary(inf, "<i4", 1)[0]
+        if one == 1:
+            byte_order = "<"
+        elif one == 1 << 24:
+            byte_order = ">"
+        else:
+            raise GmshFileFormatError("invalid binary endianness marker")
+        inf.readline()
+
+        int_type = np.dtype(byte_order+"i4")
+        node_type = np.dtype([
+            ("number", int_type), ("coordinates", byte_order+"f8", 3)])
+
+    _expect_line(inf, "$EndMeshFormat")
+
+    while True:
+        section = inf.readline()
+        if not section:
+            break
+        section = section.strip()
+        if not section:
+            continue
+
+        if section == "$PhysicalNames":
+            names = {}
+            for i in xrange(int(_read_line(inf))):
+                dim, number, name = _read_line(inf).split(None, 2)
+                names[int(dim), int(number)] = name.strip('"')
+            yield GmshPhysicalNames(names=names)
+
+        elif section == "$Nodes":
+            node_count = int(_read_line(inf))
+            numbers = np.empty(node_count, dtype=np.intp)
+            coordinates = np.empty((node_count, 3), dtype=np.float64)
+
+            for start in xrange(0, node_count, chunk_size):
+                count = min(chunk_size, node_count-start)
+                if is_binary:
+                    data = _read_binary(inf, node_type, count)
+                    numbers[start:start+count] = data["number"]
+                    coordinates[start:start+count] = data["coordinates"]
+                else:
+                    data = _read_ascii_lines(inf, count, np.float64)
+                    try:
+                        data = data.reshape(count, 4)
+                    except ValueError:
+                        raise GmshFileFormatError("invalid node lines")
+                    numbers[start:start+count] = data[:, 0]
+                    coordinates[start:start+count] = data[:, 1:]
+
+            if is_binary:
+                inf.readline()
+
+            yield GmshNodes(numbers=numbers, coordinates=coordinates)
+
+        elif section == "$Elements":
+            el_count = int(_read_line(inf))
+
+            if is_binary:
+                read_count = 0
+                while read_count < el_count:
+                    el_type, following, tag_count = [int(x)
+                            for x in _read_binary(inf, int_type, 3)]
+                    try:
+                        dim, node_count = GMSH_ELEMENT_TYPES[el_type]
+                    except KeyError:
+                        raise GmshFileFormatError(
+                                "unsupported gmsh element type %d" % el_type)
+
+                    width = 1 + tag_count + node_count
+                    for start in xrange(0, following, chunk_size):
+                        count = min(chunk_size, following-start)
+                        rows = _read_binary(inf, int_type, count*width) \
+                                .astype(np.intp).reshape(count, width)
+                        yield _make_element_block(el_type, tag_count,
+                                rows[:, 0], rows[:, 1:])
+
+                    read_count += following
+
+                inf.readline()
+            else:
+                for start in xrange(0, el_count, chunk_size):
+                    flat = _read_ascii_lines(inf,
+                            min(chunk_size, el_count-start), np.intp)
+                    for rows in _split_element_rows(flat):
+                        yield _make_element_block(rows[0, 1], rows[0, 2],
+                                rows[:, 0], rows[:, 3:])
+
+        else:
+            if not section.startswith("$"):
+                raise GmshFileFormatError("expected section, got '%s'"
+                        % section[:80])
+            # skip unknown section
+            end_marker = "$End" + section[1:]
+            while _read_line(inf) != end_marker:
+                pass
+            continue
+
+        _expect_line(inf, "$End" + section[1:])
+
+
+def iter_gmsh_blocks(filename, chunk_size=2**16):
+    """Read the Gmsh 2.x file *filename*, in ASCII or binary format, and
+    yield its contents as a sequence of :class:`GmshPhysicalNames`,
+    :class:`GmshNodes` and :class:`GmshElementBlock` instances, in file
+    order. Element blocks hold at most *chunk_size* elements, so that the
+    elements of a large file can be processed without holding all of
+    them at once.
+    """
+    inf = open(filename, "rb")
+    try:
+        for block in _iter_gmsh_blocks(inf, chunk_size):
+            yield block
+    finally:
+        inf.close()
+
+# }}}
+
+
+# {{{ array-based mesh construction
+
+class GmshBoundaryTagger(ArrayBoundaryTagger):
+    """Tags boundary faces with the names of the physical entities of the
+    gmsh elements, one dimension lower than the mesh, that cover them.
+
+    :param face_vertices: an integer array of shape *(nfaces, face_vertices)*
+      holding the vertex indices of the tagged gmsh elements.
+    :param face_physical: the physical entity number of each face.
+    :param physical_tags: a :class:`dict` mapping physical entity numbers
+      to lists of tags.
+    """
+
+    def __init__(self, face_vertices, face_physical, physical_tags):
+        self.face_vertices = np.sort(face_vertices, axis=1)
+        self.face_physical = face_physical
+        self.physical_tags = physical_tags
+
+    def tag_faces(self, face_vertex_indices, el_numbers, face_numbers, all_v):
+        matches = find_rows(self.face_vertices,
+                np.sort(face_vertex_indices, axis=1))
+        found = matches != -1
+        physical = np.where(found, self.face_physical[matches], 0)
+
+        result = {}
+        for phys, tags in self.physical_tags.iteritems():
+            mask = found & (physical == phys)
+            if mask.any():
+                for tag in tags:
+                    if tag in result:
+                        result[tag] = result[tag] | mask
+                    else:
+                        result[tag] = mask
+
+        return result
+
+
+def _find_curved_elements(el_type, node_coordinates):
+    """Return a boolean array indicating which of the elements whose nodes
+    are given by *node_coordinates* (in gmsh node order) have high-order
+    geometry. This is :meth:`LocalToGlobalMap.is_affine`, applied to all
+    elements at once.
+    """
+    el_count = len(node_coordinates)
+    if el_type.order == 1:
+        return np.zeros(el_count, dtype=np.bool_)
+
+    node_src_indices = np.array(
+            el_type.get_lexicographic_gmsh_node_indices(), dtype=np.intp)
+    modal_coeff = np.einsum("ij,ejk->eik",
+            la.inv(el_type.equidistant_vandermonde()),
+            node_coordinates[:, node_src_indices])
+    high_order = np.array([sum(mid) >= 2
+        for mid in el_type.generate_mode_identifiers()], dtype=np.bool_)
+
+    return (np.abs(modal_coeff[:, high_order]) >= 1e-13) \
+            .reshape(el_count, -1).any(axis=1)
+
+
+class _ElementChunk(Record):
+    pass
+
+
+class GmshArrayMeshBuilder(object):
+    """Builds a :class:`hedge.mesh.ConformalMesh` from the blocks yielded by
+    :func:`iter_gmsh_blocks`.
+
+    Only the vertex numbers and physical entity of each element are kept,
+    plus all nodes of the few elements found to be curved, so that element
+    blocks may be discarded once added. If the mesh has no curved elements,
+    it is built on a :class:`hedge.mesh.array.ElementArrays`.
+    """
+
+    def __init__(self, force_dimension=None, tag_mapper=lambda tag: tag):
+        self.force_dimension = force_dimension
+        self.tag_mapper = tag_mapper
+
+        # maps (tag_number, dimension) -> tag_name
+        self.tag_name_map = {}
+
+        self.coordinates = None
+        self.node_number_to_row = None
+
+        # maps dimension -> list of _ElementChunk
+        self.dim_to_chunks = {}
+        # maps dimension -> set of gmsh types hedge cannot use
+        self.dim_to_unsupported_types = {}
+
+    # {{{ intake
+
+    def _get_node_rows(self, node_numbers):
+        if self.coordinates is None:
+            raise GmshFileFormatError("elements found before nodes")
+
+        if len(node_numbers) and (node_numbers.min() < 0
+                or node_numbers.max() >= len(self.node_number_to_row)):
+            raise GmshFileFormatError("element refers to undefined node")
+
+        rows = self.node_number_to_row[node_numbers]
+        if (rows < 0).any():
+            raise GmshFileFormatError("element refers to undefined node")
+        return rows
+
+    def add_block(self, block):
+        if isinstance(block, GmshPhysicalNames):
+            for (dim, number), name in block.names.iteritems():
+                self.tag_name_map[number, dim] = self.tag_mapper(name)
+
+        elif isinstance(block, GmshNodes):
+            self.coordinates = block.coordinates[:, :self.force_dimension]
+
+            self.node_number_to_row = np.empty(
+                    block.numbers.max()+1 if len(block.numbers) else 0,
+                    dtype=np.intp)
+            self.node_number_to_row.fill(-1)
+            self.node_number_to_row[block.numbers] = np.arange(
+                    len(block.numbers))
+
+        elif isinstance(block, GmshElementBlock):
+            self.add_elements(block)
+
+        else:
+            raise TypeError("unexpected block type: %s"
+                    % type(block).__name__)
+
+    def add_elements(self, block):
+        dim = GMSH_ELEMENT_TYPES[block.el_type][0]
+        el_type = HedgeGmshMeshReceiver.gmsh_element_type_to_info_map.get(
+                block.el_type)
+        if el_type is None:
+            self.dim_to_unsupported_types.setdefault(dim, set()).add(
+                    block.el_type)
+            return
+
+        if block.tags.shape[1]:
+            physical = block.tags[:, 0].copy()
+        else:
+            physical = np.zeros(len(block.numbers), dtype=np.intp)
+
+        node_rows = self._get_node_rows(block.nodes)
+
+        if isinstance(el_type, (IntervalDiscretization,
+                TriangleDiscretization, TetrahedronDiscretization)):
+            curved = np.nonzero(_find_curved_elements(
+                el_type, self.coordinates[node_rows]))[0]
+        else:
+            curved = np.zeros(0, dtype=np.intp)
+
+        self.dim_to_chunks.setdefault(dim, []).append(_ElementChunk(
+            el_type=el_type,
+            vertex_nodes=block.nodes[:, :dim+1].copy(),
+            physical=physical,
+            curved=curved,
+            curved_node_rows=node_rows[curved]))
+
+    # }}}
+
+    # {{{ mesh construction
+
+    def _make_boundary_tagger(self, vol_dim, vertex_nodes):
+        physical_tags = {}
+        for (number, dim), name in self.tag_name_map.iteritems():
+            if dim == vol_dim-1:
+                physical_tags[number] = [name]
+
+        chunks = self.dim_to_chunks.get(vol_dim-1, [])
+        if not chunks or not physical_tags:
+            return None
+
+        face_nodes = np.vstack([chunk.vertex_nodes for chunk in chunks])
+        face_physical = np.hstack([chunk.physical for chunk in chunks])
+
+        # map gmsh node numbers to hedge vertex numbers, dropping
+        # faces that are not made of volume element vertices
+        face_vertices = np.searchsorted(vertex_nodes, face_nodes)
+        face_vertices[face_vertices == len(vertex_nodes)] = 0
+        if len(vertex_nodes):
+            valid = (vertex_nodes[face_vertices] == face_nodes).all(axis=1)
+        else:
+            valid = np.zeros(len(face_nodes), dtype=np.bool_)
+        valid &= np.in1d(face_physical, list(physical_tags))
+
+        return GmshBoundaryTagger(face_vertices[valid], face_physical[valid],
+                physical_tags)
+
+    def build_mesh(self, periodicity=None, allow_internal_boundaries=False,
+            boundary_tagger=None):
+        dims = [dim for dim, chunks in self.dim_to_chunks.iteritems()
+                if any(len(chunk.physical) for chunk in chunks)]
+        dims.extend(self.dim_to_unsupported_types)
+        if not dims:
+            raise GmshFileFormatError("mesh has no elements")
+        vol_dim = max(dims)
+
+        if vol_dim in self.dim_to_unsupported_types:
+            raise NotImplementedError("unsupported gmsh element types: %s"
+                    % ", ".join(str(el_type) for el_type in
+                        sorted(self.dim_to_unsupported_types[vol_dim])))
+
+        chunks = self.dim_to_chunks[vol_dim]
+        el_class = single_valued(chunk.el_type.geometry for chunk in chunks)
+
+        all_vertex_nodes = np.vstack([chunk.vertex_nodes for chunk in chunks])
+        physical = np.hstack([chunk.physical for chunk in chunks])
+
+        vertex_nodes, vertex_indices = np.unique(all_vertex_nodes,
+                return_inverse=True)
+        vertex_indices = vertex_indices.reshape(all_vertex_nodes.shape)
+        del all_vertex_nodes
+
+        vertices = np.array(
+                self.coordinates[self._get_node_rows(vertex_nodes)],
+                dtype=np.float64)
+
+        pt_dim = vertices.shape[-1]
+        if pt_dim != vol_dim:
+            from warnings import warn
+            warn("Found %d-dimensional mesh embedded in %d-dimensional space. "
+                    "Hedge only supports meshes of zero codimension (for now). "
+                    "Maybe you want to set force_dimension=%d?"
+                    % (vol_dim, pt_dim, vol_dim))
+
+        # {{{ elements
+
+        curved = {}
+        el_base = 0
+        for chunk in chunks:
+            for el_nr, node_rows in zip(chunk.curved, chunk.curved_node_rows):
+                curved[el_base+el_nr] = LocalToGlobalMap(
+                        self.coordinates[node_rows], chunk.el_type)
+            el_base += len(chunk.physical)
+
+        if not curved and pt_dim == vol_dim:
+            from hedge.mesh.array import ElementArrays
+            elements = ElementArrays(el_class, vertex_indices, vertices)
+        else:
+            if curved:
+                from hedge.mesh.element import TO_CURVED_CLASS
+                try:
+                    curved_class = TO_CURVED_CLASS[el_class]
+                except KeyError:
+                    raise NotImplementedError(
+                            "unsupported curved gmsh element type %s"
+                            % el_class)
+
+            elements = []
+            for el_nr, el_vertex_indices in enumerate(vertex_indices.tolist()):
+                try:
+                    el_map = curved[el_nr]
+                except KeyError:
+                    elements.append(
+                            el_class(el_nr, el_vertex_indices, vertices))
+                else:
+                    elements.append(
+                            curved_class(el_nr, el_vertex_indices, el_map))
+
+        # }}}
+
+        volume_tags = {}
+        for (number, dim), name in self.tag_name_map.iteritems():
+            if dim == vol_dim:
+                volume_tags[number] = [name]
+
+        def volume_tagger(el, all_v):
+            return volume_tags.get(physical[el.id], [])
+
+        if boundary_tagger is None:
+            boundary_tagger = self._make_boundary_tagger(vol_dim, vertex_nodes)
+
+        from hedge.mesh import make_conformal_mesh_ext
+        return make_conformal_mesh_ext(
+                vertices,
+                elements,
+                boundary_tagger=boundary_tagger,
+                volume_tagger=volume_tagger,
+                periodicity=periodicity,
+                allow_internal_boundaries=allow_internal_boundaries)
+
+    # }}}
+
+# }}}
+
+
+
+
 # {{{ front-end functions
 
 def read_gmsh(filename, force_dimension=None, periodicity=None,
         allow_internal_boundaries=False,
-        tag_mapper=lambda tag: tag, boundary_tagger=None):
-    """
+        tag_mapper=lambda tag: tag, boundary_tagger=None,
+        chunk_size=2**16):
+    """Read a mesh from a Gmsh 2.x file in ASCII or binary format.
+
     :param force_dimension: if not None, truncate point coordinates to this many dimensions.
+    :param chunk_size: the number of elements read at a time. See
+      :func:`iter_gmsh_blocks`.
     """
 
-    mr = HedgeGmshMeshReceiver(force_dimension, tag_mapper)
-    from meshpy.gmsh_reader import read_gmsh
-    read_gmsh(mr, filename, force_dimension=force_dimension)
+    builder = GmshArrayMeshBuilder(force_dimension, tag_mapper)
+    for block in iter_gmsh_blocks(filename, chunk_size):
+        builder.add_block(block)
 
-    return mr.build_mesh(periodicity=periodicity,
+    return builder.build_mesh(periodicity=periodicity,
             allow_internal_boundaries=allow_internal_boundaries,
-            tag_mapper=tag_mapper, boundary_tagger=boundary_tagger)
+            boundary_tagger=boundary_tagger)
 
 
 
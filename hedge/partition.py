@@ -36,6 +36,7 @@ import pytools
 from pytools import memoize_method
 import hedge.mesh
 import hedge.optemplate
+from hedge.mesh.array import ArrayBoundaryTagger
 
 
 
@@ -74,89 +75,147 @@ def partition_mesh(mesh, partition, part_bdry_tag_factory):
 
     For historical reasons, the values in partition are called
     'parts'.
+
+    If *mesh* stores its elements as a
+    :class:`hedge.mesh.array.ElementArrays` instance, so do the
+    resulting part meshes.
     """
 
+    from hedge.mesh.array import ElementArrays, NO_NEIGHBOR
+    elements_are_arrays = isinstance(mesh.elements, ElementArrays)
+
     # Find parts to which we need to distribute.
-    all_parts = list(set(
-        partition[el.id] for el in mesh.elements))
+    if elements_are_arrays:
+        if isinstance(partition, numpy.ndarray):
+            el_parts = partition
+        else:
+            el_parts = numpy.fromiter(
+                    (partition[i] for i in xrange(len(mesh.elements))),
+                    dtype=numpy.intp)
+
+        all_parts = numpy.unique(el_parts).tolist()
+    else:
+        all_parts = list(set(
+            partition[el.id] for el in mesh.elements))
 
-    # Prepare a mapping of elements to tags to speed up
+    # Prepare a mapping of element numbers to tags to speed up
     # copy_el_tagger, below.
     el2tags = {}
     for tag, elements in mesh.tag_to_elements.iteritems():
         if tag == hedge.mesh.TAG_ALL:
             continue
         for el in elements:
-            el2tags.setdefault(el, []).append(tag)
+            el2tags.setdefault(el.id, []).append(tag)
 
-    # prepare a mapping of (el, face_nr) to boundary_tags
+    # prepare a mapping of (el_nr, face_nr) to boundary_tags
     # to speed up partition_bdry_tagger, below
     elface2tags = {}
     for tag, elfaces in mesh.tag_to_boundary.iteritems():
         if tag == hedge.mesh.TAG_ALL:
             continue
         for el, fn in elfaces:
-            elface2tags.setdefault((el, fn), []).append(tag)
+            elface2tags.setdefault((el.id, fn), []).append(tag)
 
-    # prepare a mapping from (el, face_nr) to the part
+    # prepare a mapping from (el_nr, face_nr) to the part
     # at the other end of the interface, if different from
     # current. concurrently, prepare a mapping
     #  part -> set([parts that border me])
     elface2part = {}
     neighboring_parts = {}
 
-    for elface1, elface2 in mesh.interfaces:
-        e1, f1 = elface1
-        e2, f2 = elface2
-        r1 = partition[e1.id]
-        r2 = partition[e2.id]
-
-        if r1 != r2:
-            neighboring_parts.setdefault(r1, set()).add(r2)
-            neighboring_parts.setdefault(r2, set()).add(r1)
-
-            elface2part[elface1] = r2
-            elface2part[elface2] = r1
+    if elements_are_arrays:
+        nb_elements = mesh.elements.neighbor_elements
+        el_nrs, face_nrs = numpy.nonzero(nb_elements != NO_NEIGHBOR)
+        nb_el_nrs = nb_elements[el_nrs, face_nrs]
+        is_cut = el_parts[el_nrs] != el_parts[nb_el_nrs]
+
+        for e, f, nb_e in zip(
+                el_nrs[is_cut].tolist(),
+                face_nrs[is_cut].tolist(),
+                nb_el_nrs[is_cut].tolist()):
+            r = int(el_parts[e])
+            nb_r = int(el_parts[nb_e])
+            neighboring_parts.setdefault(r, set()).add(nb_r)
+            elface2part[e, f] = nb_r
+    else:
+        for elface1, elface2 in mesh.interfaces:
+            e1, f1 = elface1
+            e2, f2 = elface2
+            r1 = partition[e1.id]
+            r2 = partition[e2.id]
+
+            if r1 != r2:
+                neighboring_parts.setdefault(r1, set()).add(r2)
+                neighboring_parts.setdefault(r2, set()).add(r1)
+
+                elface2part[e1.id, f1] = r2
+                elface2part[e2.id, f2] = r1
 
     # prepare a new mesh for each part and send it
     from hedge.mesh import TAG_NO_BOUNDARY
 
     for part in all_parts:
-        part_global_elements = [el
-                for el in mesh.elements
-                if partition[el.id] == part]
-
-        # pick out this part's vertices
-        from pytools import flatten
-        part_global_vertex_indices = set(flatten(
-                el.vertex_indices for el in part_global_elements))
-
-        part_local_vertices = [mesh.points[vi]
-                for vi in part_global_vertex_indices]
-
-        # find global-to-local maps
-        part_global2local_vertex_indices = dict(
-                (gvi, lvi) for lvi, gvi in
-                enumerate(part_global_vertex_indices))
-
-        part_global2local_elements = dict(
-                (el.id, i) for i, el in
-                enumerate(part_global_elements))
-
-        # find elements in local numbering
-        part_local_elements = [
-                [part_global2local_vertex_indices[vi]
-                    for vi in el.vertex_indices]
-                for el in part_global_elements]
+        if elements_are_arrays:
+            part_global_el_nrs = numpy.nonzero(el_parts == part)[0]
+
+            # pick out this part's vertices, renumber them
+            part_global_vertex_indices, part_local_vertex_indices = \
+                    numpy.unique(
+                            mesh.elements.vertex_indices[part_global_el_nrs],
+                            return_inverse=True)
+
+            part_local_vertices = mesh.points[part_global_vertex_indices]
+
+            part_global2local_vertex_indices = dict(zip(
+                part_global_vertex_indices.tolist(),
+                xrange(len(part_global_vertex_indices))))
+
+            part_local_elements = ElementArrays(
+                    mesh.elements.el_class,
+                    part_local_vertex_indices.reshape(
+                        len(part_global_el_nrs), -1),
+                    part_local_vertices)
+
+            part_global2local_elements = dict(zip(
+                part_global_el_nrs.tolist(),
+                xrange(len(part_global_el_nrs))))
+        else:
+            part_global_elements = [el
+                    for el in mesh.elements
+                    if partition[el.id] == part]
+            part_global_el_nrs = [el.id for el in part_global_elements]
+
+            # pick out this part's vertices
+            from pytools import flatten
+            part_global_vertex_indices = set(flatten(
+                    el.vertex_indices for el in part_global_elements))
+
+            part_local_vertices = [mesh.points[vi]
+                    for vi in part_global_vertex_indices]
+
+            # find global-to-local maps
+            part_global2local_vertex_indices = dict(
+                    (gvi, lvi) for lvi, gvi in
+                    enumerate(part_global_vertex_indices))
+
+            part_global2local_elements = dict(
+                    (el.id, i) for i, el in
+                    enumerate(part_global_elements))
+
+            # find elements in local numbering
+            part_local_elements = [
+                    [part_global2local_vertex_indices[vi]
+                        for vi in el.vertex_indices]
+                    for el in part_global_elements]
 
         # make new local Mesh object, including
         # boundary and element tagging
         def partition_bdry_tagger(fvi, local_el, fn, all_vertices):
-            el = part_global_elements[local_el.id]
+            el_nr = part_global_el_nrs[local_el.id]
 
-            result = elface2tags.get((el, fn), [])
+            result = elface2tags.get((el_nr, fn), [])
             try:
-                opp_part = elface2part[el, fn]
+                opp_part = elface2part[el_nr, fn]
                 result.append(part_bdry_tag_factory(opp_part))
 
                 # keeps this part of the boundary from falling
@@ -169,19 +228,29 @@ def partition_mesh(mesh, partition, part_bdry_tag_factory):
             return result
 
         def copy_el_tagger(local_el, all_vertices):
-            return el2tags.get(part_global_elements[local_el.id], [])
+            return el2tags.get(part_global_el_nrs[local_el.id], [])
 
         def is_partbdry_face((local_el, face_nr)):
-            return (part_global_elements[local_el.id], face_nr) in elface2part
-
-        from hedge.mesh import make_conformal_mesh
-        part_mesh = make_conformal_mesh(
-                part_local_vertices,
-                part_local_elements,
-                partition_bdry_tagger,
-                copy_el_tagger,
-                mesh.periodicity,
-                is_partbdry_face)
+            return (part_global_el_nrs[local_el.id], face_nr) in elface2part
+
+        if elements_are_arrays:
+            from hedge.mesh import make_conformal_mesh_ext
+            part_mesh = make_conformal_mesh_ext(
+                    part_local_vertices,
+                    part_local_elements,
+                    boundary_tagger=partition_bdry_tagger,
+                    volume_tagger=copy_el_tagger,
+                    periodicity=mesh.periodicity,
+                    _is_rankbdry_face=is_partbdry_face)
+        else:
+            from hedge.mesh import make_conformal_mesh
+            part_mesh = make_conformal_mesh(
+                    part_local_vertices,
+                    part_local_elements,
+                    partition_bdry_tagger,
+                    copy_el_tagger,
+                    mesh.periodicity,
+                    is_partbdry_face)
 
         # assemble per-part data
 
@@ -203,6 +272,311 @@ def partition_mesh(mesh, partition, part_bdry_tag_factory):
 
 
 
+# {{{ array-based partitioning
+
+def partition_element_arrays(elements, part_count):
+    """Partition the :class:`hedge.mesh.array.ElementArrays` *elements* into
+    *part_count* parts using PyMetis, passing the adjacency graph as
+    arrays. Return an integer array giving the part of each element.
+    """
+    if part_count == 1:
+        return numpy.zeros(len(elements), dtype=numpy.intp)
+
+    from pymetis import part_graph
+    xadj, adjncy = elements.adjacency_arrays()
+    dummy, el_parts = part_graph(part_count, xadj=xadj, adjncy=adjncy)
+    return numpy.asarray(el_parts, dtype=numpy.intp)
+
+
+def _sort_by_part(part_count, parts, arrays):
+    """Return *arrays* reordered so that entries belonging to part 0 come
+    first, then part 1 and so on, along with the number of entries in
+    each part.
+    """
+    order = numpy.argsort(parts, kind="mergesort")
+    return ([ary[order] for ary in arrays],
+            numpy.bincount(parts, minlength=part_count))
+
+
+def pack_mesh_partition(mesh, el_parts, part_count):
+    """Describe each part of *mesh*, whose elements must be stored as a
+    :class:`hedge.mesh.array.ElementArrays`, by a set of arrays numbered
+    in the part's local numbering.
+
+    :param el_parts: an integer array giving the part of each element.
+    :returns: a tuple *(meta, arrays, counts)*. *meta* is a small
+      :class:`dict` of data shared by all parts. *arrays* maps names to
+      arrays holding the data of all parts, concatenated in part order.
+      *counts* maps the same names to arrays of the number of rows
+      belonging to each part. See :func:`make_part_data` for the inverse.
+    """
+    from hedge.mesh import MESH_CREATION_TAGS, TAG_NONE, TAG_ALL
+    from hedge.mesh.array import NO_NEIGHBOR, \
+            get_element_numbers, get_face_numbers, find_rows
+
+    elements = mesh.elements
+    el_parts = numpy.asarray(el_parts, dtype=numpy.intp)
+    if len(el_parts) != len(elements):
+        raise ValueError("partition must have one entry per element")
+    if len(el_parts) and (el_parts.min() < 0 or el_parts.max() >= part_count):
+        raise ValueError("partition refers to parts outside 0..%d"
+                % (part_count-1))
+
+    vertex_count = len(mesh.points)
+    face_count = len(elements.face_vertex_numbers)
+
+    arrays = {}
+    counts = {}
+
+    # {{{ elements and vertices
+
+    (el_numbers,), el_counts = _sort_by_part(part_count, el_parts,
+            [numpy.arange(len(elements), dtype=numpy.intp)])
+    el_starts = numpy.cumsum(el_counts) - el_counts
+    sorted_el_parts = el_parts[el_numbers]
+
+    global2local_el = numpy.empty(len(elements), dtype=numpy.intp)
+    global2local_el[el_numbers] = (numpy.arange(len(elements))
+            - el_starts[sorted_el_parts])
+
+    arrays["element_numbers"] = el_numbers
+    counts["element_numbers"] = el_counts
+
+    # Number each part's vertices by sorting (part, vertex) pairs.
+    vertex_keys, local_vertex_indices = numpy.unique(
+            (sorted_el_parts[:, numpy.newaxis]*vertex_count
+                + elements.vertex_indices[el_numbers]).ravel(),
+            return_inverse=True)
+    vertex_parts = vertex_keys // vertex_count
+    vertex_numbers = vertex_keys % vertex_count
+    vertex_counts = numpy.bincount(vertex_parts, minlength=part_count)
+    vertex_starts = numpy.cumsum(vertex_counts) - vertex_counts
+
+    arrays["vertex_numbers"] = vertex_numbers
+    arrays["points"] = mesh.points[vertex_numbers]
+    counts["vertex_numbers"] = counts["points"] = vertex_counts
+
+    arrays["vertex_indices"] = (
+            local_vertex_indices.reshape(elements.vertex_indices.shape)
+            - vertex_starts[sorted_el_parts][:, numpy.newaxis])
+    counts["vertex_indices"] = el_counts
+
+    # }}}
+
+    # {{{ tags
+
+    boundary_tags = [tag for tag in mesh.tag_to_boundary
+            if tag not in MESH_CREATION_TAGS and tag is not TAG_NONE]
+    bdry_el_ids = []
+    bdry_face_nrs = []
+    bdry_tag_nrs = []
+    for i, tag in enumerate(boundary_tags):
+        el_ids, face_nrs = get_face_numbers(mesh.tag_to_boundary[tag])
+        bdry_el_ids.append(el_ids)
+        bdry_face_nrs.append(face_nrs)
+        bdry_tag_nrs.append(numpy.empty(len(el_ids), dtype=numpy.intp))
+        bdry_tag_nrs[-1].fill(i)
+
+    if boundary_tags:
+        bdry_el_ids = numpy.hstack(bdry_el_ids)
+        (bdry_elements, bdry_faces, bdry_tags), bdry_counts = _sort_by_part(
+                part_count, el_parts[bdry_el_ids],
+                [global2local_el[bdry_el_ids],
+                    numpy.hstack(bdry_face_nrs), numpy.hstack(bdry_tag_nrs)])
+    else:
+        bdry_elements = bdry_faces = bdry_tags = numpy.zeros(0, numpy.intp)
+        bdry_counts = numpy.zeros(part_count, dtype=numpy.intp)
+
+    arrays["boundary_elements"] = bdry_elements
+    arrays["boundary_faces"] = bdry_faces
+    arrays["boundary_tags"] = bdry_tags
+    counts["boundary_elements"] = counts["boundary_faces"] = \
+            counts["boundary_tags"] = bdry_counts
+
+    element_tags = [tag for tag in mesh.tag_to_elements
+            if tag is not TAG_ALL and tag is not TAG_NONE]
+    tagged_el_ids = [get_element_numbers(mesh.tag_to_elements[tag])
+        for tag in element_tags]
+
+    if element_tags:
+        tag_nrs = numpy.repeat(numpy.arange(len(element_tags)),
+                [len(el_ids) for el_ids in tagged_el_ids])
+        tagged_el_ids = numpy.hstack(tagged_el_ids)
+        (tagged_elements, tag_nrs), tagged_counts = _sort_by_part(
+                part_count, el_parts[tagged_el_ids],
+                [global2local_el[tagged_el_ids], tag_nrs])
+    else:
+        tagged_elements = tag_nrs = numpy.zeros(0, numpy.intp)
+        tagged_counts = numpy.zeros(part_count, dtype=numpy.intp)
+
+    arrays["tagged_elements"] = tagged_elements
+    arrays["element_tags"] = tag_nrs
+    counts["tagged_elements"] = counts["element_tags"] = tagged_counts
+
+    # }}}
+
+    # {{{ faces between parts
+
+    nb_elements = elements.neighbor_elements
+    el_ids, face_nrs = numpy.nonzero(nb_elements != NO_NEIGHBOR)
+    nb_el_ids = nb_elements[el_ids, face_nrs]
+    is_cut = el_parts[el_ids] != el_parts[nb_el_ids]
+    el_ids = el_ids[is_cut]
+
+    (cut_elements, cut_faces, cut_nb_parts), cut_counts = _sort_by_part(
+            part_count, el_parts[el_ids],
+            [global2local_el[el_ids], face_nrs[is_cut],
+                el_parts[nb_el_ids[is_cut]]])
+
+    arrays["part_boundary_elements"] = cut_elements
+    arrays["part_boundary_faces"] = cut_faces
+    arrays["part_boundary_neighbors"] = cut_nb_parts
+    counts["part_boundary_elements"] = counts["part_boundary_faces"] = \
+            counts["part_boundary_neighbors"] = cut_counts
+
+    # }}}
+
+    # {{{ periodic faces
+
+    # Each part only receives the entries of periodic_opposite_faces
+    # for its own faces.
+    face_vertex_count = elements.face_vertex_numbers.shape[1]
+    periodic_items = mesh.periodic_opposite_faces.items()
+
+    def make_face_array(faces):
+        return numpy.array(faces, dtype=numpy.intp).reshape(
+                -1, face_vertex_count)
+
+    periodic_fvi = make_face_array(
+            [fvi for fvi, (opp_fvi, axis) in periodic_items])
+    periodic_opp_fvi = make_face_array(
+            [opp_fvi for fvi, (opp_fvi, axis) in periodic_items])
+    periodic_axes = numpy.array(
+            [axis for fvi, (opp_fvi, axis) in periodic_items],
+            dtype=numpy.intp)
+
+    periodic_face_nrs = find_rows(
+            elements.faces.reshape(-1, face_vertex_count), periodic_fvi)
+    if (periodic_face_nrs < 0).any():
+        raise RuntimeError("periodic_opposite_faces refers to faces "
+                "not in the mesh")
+
+    (periodic_fvi, periodic_opp_fvi, periodic_axes), periodic_counts = \
+            _sort_by_part(part_count,
+                    el_parts[periodic_face_nrs // face_count],
+                    [periodic_fvi, periodic_opp_fvi, periodic_axes])
+
+    arrays["periodic_faces"] = periodic_fvi
+    arrays["periodic_opposite_faces"] = periodic_opp_fvi
+    arrays["periodic_axes"] = periodic_axes
+    counts["periodic_faces"] = counts["periodic_opposite_faces"] = \
+            counts["periodic_axes"] = periodic_counts
+
+    # }}}
+
+    meta = dict(
+            el_class=elements.el_class,
+            face_count=face_count,
+            boundary_tags=boundary_tags,
+            element_tags=element_tags,
+            periodicity=mesh.periodicity,
+            )
+
+    return meta, arrays, counts
+
+
+class _PartBoundaryTagger(ArrayBoundaryTagger):
+    def __init__(self, face_count, tag_to_face_keys):
+        self.face_count = face_count
+        self.tag_to_face_keys = tag_to_face_keys
+
+    def tag_faces(self, face_vertex_indices, el_numbers, face_numbers, all_v):
+        keys = el_numbers*self.face_count + face_numbers
+        return dict((tag, numpy.in1d(keys, tag_keys))
+                for tag, tag_keys in self.tag_to_face_keys.iteritems())
+
+
+def make_part_data(part, meta, arrays, part_bdry_tag_factory):
+    """Build the :class:`PartitionData` for *part* from its share of the
+    output of :func:`pack_mesh_partition`. *arrays* maps names to this
+    part's rows only.
+    """
+    from hedge.mesh import TAG_NO_BOUNDARY, make_conformal_mesh_ext
+    from hedge.mesh.array import ElementArrays
+
+    face_count = meta["face_count"]
+    points = numpy.asarray(arrays["points"], dtype=numpy.float64)
+    elements = ElementArrays(meta["el_class"],
+            arrays["vertex_indices"], points)
+
+    # {{{ boundary tagger
+
+    def face_keys(prefix):
+        return (arrays[prefix+"elements"]*face_count
+                + arrays[prefix+"faces"])
+
+    bdry_keys = face_keys("boundary_")
+    tag_to_face_keys = dict(
+            (tag, bdry_keys[arrays["boundary_tags"] == i])
+            for i, tag in enumerate(meta["boundary_tags"]))
+
+    cut_keys = face_keys("part_boundary_")
+    nb_parts = arrays["part_boundary_neighbors"]
+    neighbor_parts = numpy.unique(nb_parts).tolist()
+    for nb_part in neighbor_parts:
+        tag_to_face_keys[part_bdry_tag_factory(nb_part)] = \
+                cut_keys[nb_parts == nb_part]
+
+    # keeps faces between parts from falling under TAG_ALL
+    tag_to_face_keys[TAG_NO_BOUNDARY] = cut_keys
+
+    # }}}
+
+    tagged_elements = arrays["tagged_elements"]
+    el_tag_masks = []
+    for i, tag in enumerate(meta["element_tags"]):
+        mask = numpy.zeros(len(elements), dtype=numpy.bool_)
+        mask[tagged_elements[arrays["element_tags"] == i]] = True
+        el_tag_masks.append((tag, mask))
+
+    def volume_tagger(el, all_v):
+        return [tag for tag, mask in el_tag_masks if mask[el.id]]
+
+    cut_key_set = set(cut_keys.tolist())
+
+    def is_partbdry_face((local_el, face_nr)):
+        return local_el.id*face_count + face_nr in cut_key_set
+
+    part_mesh = make_conformal_mesh_ext(
+            points, elements,
+            boundary_tagger=_PartBoundaryTagger(face_count, tag_to_face_keys),
+            volume_tagger=volume_tagger,
+            periodicity=meta["periodicity"],
+            _is_rankbdry_face=is_partbdry_face)
+
+    return PartitionData(
+            part,
+            part_mesh,
+            dict(zip(arrays["element_numbers"].tolist(),
+                xrange(len(elements)))),
+            dict(zip(arrays["vertex_numbers"].tolist(), xrange(len(points)))),
+            neighbor_parts,
+            dict((tuple(fvi), (tuple(opp_fvi), axis))
+                for fvi, opp_fvi, axis in zip(
+                    arrays["periodic_faces"].tolist(),
+                    arrays["periodic_opposite_faces"].tolist(),
+                    arrays["periodic_axes"].tolist())),
+            part_boundary_tags=dict(
+                (nb_part, part_bdry_tag_factory(nb_part))
+                for nb_part in neighbor_parts),
+            tag_to_elements=part_mesh.tag_to_elements)
+
+# }}}
+
+
+
+
+
 def find_neighbor_vol_indices(
         my_discr, my_part_data,
         nb_discr, nb_part_data,
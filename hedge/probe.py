@@ -0,0 +1,235 @@
+"""Time series of volume fields sampled at fixed probe points."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+import numpy as np
+import hedge.tools
+
+
+# {{{ ownership
+
+def _find_owned_probes(discr, points, thresh):
+    """Return the numbers of the probes in *points* that lie in the part of
+    the mesh held by this rank. A probe on a part boundary is owned by the
+    lowest-numbered rank containing it.
+    """
+    from hedge.discretization.interpolation import NOT_FOUND
+
+    found = discr.locate_points(points, thresh) != NOT_FOUND
+
+    rcon = discr.run_context
+    comm = getattr(rcon, "communicator", None)
+    if comm is None:
+        my_rank = 0
+        owner = np.where(found, my_rank, -1)
+    else:
+        import pytools.mpiwrap as mpi
+
+        my_rank = rcon.rank
+        no_rank = len(rcon.ranks)
+        my_claims = np.where(found, rcon.rank, no_rank).astype(np.int32)
+        claims = np.empty_like(my_claims)
+        comm.Allreduce(my_claims, claims, op=mpi.MIN)
+        owner = np.where(claims == no_rank, -1, claims)
+
+    missing = np.nonzero(owner == -1)[0]
+    if len(missing):
+        raise RuntimeError(
+                "%d probes not found, first: %s. "
+                "Consider changing threshold."
+                % (len(missing), points[missing[0]]))
+
+    return np.nonzero(owner == my_rank)[0]
+
+# }}}
+
+
+# {{{ probe set
+
+def _make_record_dtype(value_dtype, field_count, probe_count):
+    return np.dtype([
+        ("t", np.float64),
+        ("values", value_dtype, (field_count, probe_count)),
+        ])
+
+
+class ProbeSet(hedge.tools.Closable):
+    """Samples a fixed list of volume fields at a fixed set of points.
+
+    The element numbers and interpolation weights of all probes are found
+    once, as a
+    :class:`hedge.discretization.interpolation.PointInterpolationOperator`.
+    Each call to :meth:`record` then evaluates all fields at all probes
+    with one gather per field and one batched dot product, and stores the
+    result in a preallocated ring buffer of *buffer_steps* records.
+
+    If *pathname* is given, the buffer is appended to ``pathname+".dat"``
+    whenever it fills up, and a description of the probes is written to
+    ``pathname+".npz"``. On a
+    :class:`hedge.backends.mpi.ParallelDiscretization`, every rank
+    samples the probes in its part of the mesh and writes its own pair of
+    files, named with a ``-%05d`` rank suffix. Use
+    :func:`read_probe_history` to read them back.
+
+    If *pathname* is *None*, the oldest records are overwritten once the
+    buffer is full, and only the last *buffer_steps* are available from
+    :meth:`history`.
+
+    :param points: a global (n, dim) array of probe locations, the same on
+      all ranks.
+    :param field_names: one name per field passed to :meth:`record`.
+
+    :ivar probe_numbers: the indices into *points* of the probes sampled on
+      this rank.
+    """
+
+    def __init__(self, discr, points, field_names, pathname=None,
+            buffer_steps=1000, dtype=None, thresh=0):
+        hedge.tools.Closable.__init__(self)
+
+        points = np.asarray(points, dtype=np.float64)
+        if dtype is None:
+            dtype = discr.default_scalar_type
+
+        self.field_names = list(field_names)
+        self.probe_numbers = _find_owned_probes(discr, points, thresh)
+        self.points = points[self.probe_numbers]
+        self.interp_op = discr.get_interpolation_operator(
+                self.points, thresh)
+
+        self.record_dtype = _make_record_dtype(
+                dtype, len(self.field_names), len(self.points))
+        self.buffer = np.zeros(buffer_steps, dtype=self.record_dtype)
+        self.record_count = 0
+        self.flushed_count = 0
+
+        n_probes, nodes_per_el = self.interp_op.node_indices.shape
+        self._gathered = np.empty(
+                (len(self.field_names), n_probes, nodes_per_el),
+                dtype=dtype)
+
+        rcon = discr.run_context
+        if pathname is not None and rcon is not None \
+                and len(rcon.ranks) > 1:
+            pathname = "%s-%05d" % (pathname, rcon.rank)
+        self.pathname = pathname
+
+        if pathname is not None:
+            np.savez(pathname+".npz",
+                    probe_numbers=self.probe_numbers,
+                    points=self.points,
+                    field_names=np.array(self.field_names),
+                    dtype=np.array(np.dtype(dtype).str))
+            self.data_file = open(pathname+".dat", "wb")
+        else:
+            self.data_file = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def evaluate(self, fields):
+        """Return an array of shape ``(len(fields), len(self))`` holding
+        each of *fields* at each probe.
+        """
+        if len(fields) != len(self.field_names):
+            raise ValueError("expected %d fields, got %d"
+                    % (len(self.field_names), len(fields)))
+
+        node_indices = self.interp_op.node_indices
+        for i, field in enumerate(fields):
+            if field.dtype == self._gathered.dtype:
+                field.take(node_indices, out=self._gathered[i])
+            else:
+                self._gathered[i] = field[node_indices]
+
+        return np.einsum("fpj,pj->fp",
+                self._gathered, self.interp_op.coefficients)
+
+    def record(self, t, fields):
+        """Evaluate *fields* at all probes and store the result as the
+        record for time *t*.
+        """
+        if self.is_closed:
+            raise RuntimeError("probe set is closed")
+
+        i = self.record_count % len(self.buffer)
+        self.buffer["t"][i] = t
+        self.buffer["values"][i] = self.evaluate(fields)
+        self.record_count += 1
+
+        if (self.data_file is not None
+                and self.record_count - self.flushed_count == len(self.buffer)):
+            self.flush()
+
+    def _buffered_records(self):
+        start = max(self.flushed_count, self.record_count - len(self.buffer))
+        indices = np.arange(start, self.record_count) % len(self.buffer)
+        return self.buffer[indices]
+
+    def flush(self):
+        """Append all records not yet written to the data file."""
+        if self.data_file is None:
+            return
+
+        self._buffered_records().tofile(self.data_file)
+        self.data_file.flush()
+        self.flushed_count = self.record_count
+
+    def history(self):
+        """Return a tuple *(times, values)* of the records still held in the
+        buffer, oldest first. *values* has shape
+        ``(n_records, len(field_names), len(self))``.
+        """
+        start = max(0, self.record_count - len(self.buffer))
+        records = self.buffer[
+                np.arange(start, self.record_count) % len(self.buffer)]
+        return records["t"], records["values"]
+
+    def do_close(self):
+        if self.data_file is not None:
+            self.flush()
+            self.data_file.close()
+
+
+def read_probe_history(pathname):
+    """Read the files written by a :class:`ProbeSet` with *pathname*
+    (including the rank suffix, if any).
+
+    :returns: a tuple *(probe_numbers, points, field_names, times, values)*.
+    """
+    header = np.load(pathname+".npz")
+    field_names = list(header["field_names"])
+    record_dtype = _make_record_dtype(str(header["dtype"]),
+            len(field_names), len(header["probe_numbers"]))
+    records = np.fromfile(pathname+".dat", dtype=record_dtype)
+
+    return (header["probe_numbers"], header["points"],
+            field_names, records["t"], records["values"])
+
+# }}}
+
+
+# vim: foldmethod=marker
@@ -31,7 +31,16 @@ class Future(object):
     """An abstract interface definition for futures.
 
     See http://en.wikipedia.org/wiki/Future_(programming)
+
+    .. attribute:: sets_ready_event
+
+        If true, this future sets the :class:`threading.Event` it was
+        created with once it becomes ready, so that :func:`wait_for_any`
+        can block on that event instead of polling.
     """
+
+    sets_ready_event = False
+
     def is_ready(self):
         raise NotImplementedError(self.__class__)
 
@@ -75,3 +84,83 @@ class NestedFuture(Future):
             return self.outer_future_factory(self.inner_future())()
         else:
             return self.outer_future()
+
+
+
+
+def wait_for_any(futures, ready_event=None, poll_interval=1e-5):
+    """Return once at least one of *futures* :meth:`Future.is_ready`.
+
+    :param ready_event: a :class:`threading.Event` set by those of
+      *futures* that have :attr:`Future.sets_ready_event`. If all of
+      *futures* set it, this blocks on it. Other futures, such as MPI
+      requests, have no common primitive to block on and are polled every
+      *poll_interval* seconds.
+    """
+    if ready_event is None:
+        from time import sleep
+
+        while True:
+            for future in futures:
+                if future.is_ready():
+                    return
+
+            sleep(poll_interval)
+
+    if all(future.sets_ready_event for future in futures):
+        timeout = None
+    else:
+        timeout = poll_interval
+
+    while True:
+        # Clear the event before checking, so that a future becoming ready
+        # after the check is sure to wake us up.
+        ready_event.clear()
+
+        for future in futures:
+            if future.is_ready():
+                return
+
+        ready_event.wait(timeout)
+
+
+
+
+class ThreadPoolFuture(Future):
+    """A future for calling *func* with the arguments *args* in a
+    :class:`multiprocessing.pool.ThreadPool`.
+
+    :param ready_event: if not *None*, a :class:`threading.Event` to set
+      once the call has finished, see :func:`wait_for_any`.
+    """
+    def __init__(self, pool, func, args, ready_event=None):
+        from threading import Event
+        self.done_event = Event()
+        self.ready_event = ready_event
+        self.sets_ready_event = ready_event is not None
+
+        pool.apply_async(self._run, (func, args))
+
+    def _run(self, func, args):
+        try:
+            self.result = True, func(*args)
+        except:
+            import sys
+            self.result = False, sys.exc_info()
+
+        # the result must be in place before anyone is told about it
+        self.done_event.set()
+        if self.ready_event is not None:
+            self.ready_event.set()
+
+    def is_ready(self):
+        return self.done_event.is_set()
+
+    def __call__(self):
+        self.done_event.wait()
+
+        success, value = self.result
+        if success:
+            return value
+        else:
+            raise value[0], value[1], value[2]
@@ -0,0 +1,3 @@
+VERSION = (0, 91)
+VERSION_STATUS = ""
+VERSION_TEXT = ".".join(str(x) for x in VERSION) + VERSION_STATUS
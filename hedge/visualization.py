@@ -520,6 +520,543 @@ class SiloVisualizer(Visualizer):
 # }}}
 
 
+# {{{ xdmf
+
+def _xdmf_data_item(filename, dtype, shape, offset):
+    import sys
+
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        number_type = "Float"
+    elif dtype.kind == "i":
+        number_type = "Int"
+    elif dtype.kind == "u":
+        number_type = "UInt"
+    else:
+        raise ValueError("unsupported data type for XDMF output: %s" % dtype)
+
+    if dtype.byteorder == ">" or (
+            dtype.byteorder == "=" and sys.byteorder == "big"):
+        endian = "Big"
+    else:
+        endian = "Little"
+
+    return ('<DataItem Format="Binary" NumberType="%s" Precision="%d" '
+            'Endian="%s" Seek="%d" Dimensions="%s">%s</DataItem>'
+            % (number_type, dtype.itemsize, endian, offset,
+                " ".join(str(n) for n in shape), filename))
+
+
+class XdmfTimeStep(hedge.tools.Closable):
+    """One time step of an :class:`XdmfVisualizer`, as returned by
+    :meth:`XdmfVisualizer.make_file`. Its fields are handed to the
+    visualizer on :meth:`close`.
+    """
+
+    def __init__(self, visualizer, name):
+        hedge.tools.Closable.__init__(self)
+        self.visualizer = visualizer
+        self.name = name
+        self.time = None
+        self.step = None
+        self.attributes = []
+
+    def do_close(self):
+        self.visualizer._commit_time_step(self)
+
+
+class XdmfVisualizer(Visualizer, hedge.tools.Closable):
+    """Writes all time steps of a run to one XDMF data set, which ParaView
+    and VisIt can read.
+
+    The mesh is written once, to ``basename-mesh.bin``. Each time step
+    only appends its fields, as raw binary, to ``basename-data.bin``.
+    ``basename.xmf`` is a small XML index of both. Whenever data is
+    written, the entries for the new time steps are appended to it in
+    place, so that updating it does not get slower as the run goes on.
+    Under MPI, every rank writes its own pair of binary files, with a
+    ``-%05d`` rank suffix, and the head rank writes an index covering all
+    of them.
+
+    :param dtype: if given, the type fields are converted to before
+      writing, e.g. :class:`numpy.float32` to halve the output size.
+    :param buffer_steps: the number of time steps kept in memory before
+      their data is written out together.
+    """
+
+    def __init__(self, discr, pcontext, basename, dtype=None, buffer_steps=1):
+        logger.info("init xdmf visualizer: start")
+
+        hedge.tools.Closable.__init__(self)
+
+        if buffer_steps < 1:
+            raise ValueError("buffer_steps must be at least 1")
+
+        self.pcontext = pcontext
+        self.basename = basename
+        self.dtype = dtype
+        self.buffer_steps = buffer_steps
+
+        if pcontext is None or len(pcontext.ranks) == 1:
+            rank_suffix = ""
+            self.ranks = [0]
+        else:
+            rank_suffix = "-%05d" % pcontext.rank
+            self.ranks = list(pcontext.ranks)
+        self.is_head_rank = pcontext is None or pcontext.is_head_rank
+
+        from os.path import basename as path_basename
+        self.mesh_filenames = [
+                path_basename(basename + "-mesh%s.bin" % suffix)
+                for suffix in self._rank_suffixes()]
+        self.data_filenames = [
+                path_basename(basename + "-data%s.bin" % suffix)
+                for suffix in self._rank_suffixes()]
+
+        # {{{ mesh
+
+        from hedge.mesh.element import Interval, Triangle, Tetrahedron
+        from pytools import single_valued
+
+        geometry = single_valued(eg.local_discretization.geometry
+                for eg in discr.element_groups)
+        if geometry is Interval:
+            self.topology = 'TopologyType="Polyline" NodesPerElement="2"'
+        elif geometry is Triangle:
+            self.topology = 'TopologyType="Triangle"'
+        elif geometry is Tetrahedron:
+            self.topology = 'TopologyType="Tetrahedron"'
+        else:
+            raise RuntimeError("unsupported element type: %s" % geometry)
+
+        cells = []
+        for eg in discr.element_groups:
+            smi = np.array(eg.local_discretization.get_submesh_indices(),
+                    dtype=np.int32)
+            el_starts = eg.ranges.start + eg.ranges.el_size*np.arange(
+                    len(eg.ranges), dtype=np.int32)
+            cells.append((el_starts[:, np.newaxis, np.newaxis]
+                + smi[np.newaxis]).reshape(-1, smi.shape[1]))
+        cells = np.vstack(cells)
+
+        points = np.zeros((len(discr), 3), dtype=np.float64)
+        points[:, :discr.dimensions] = discr.nodes
+
+        mesh_file = open(basename + "-mesh%s.bin" % rank_suffix, "wb")
+        points.tofile(mesh_file)
+        cells.tofile(mesh_file)
+        mesh_file.close()
+
+        # }}}
+
+        # The head rank writes the index for all ranks, so it needs the
+        # size of every rank's mesh. Since all ranks add the same fields,
+        # that is enough to know where each rank's data ends up.
+        my_sizes = (len(points), len(cells), cells.shape[1])
+        if len(self.ranks) > 1:
+            all_sizes = pcontext.communicator.gather(
+                    my_sizes, root=pcontext.head_rank)
+        else:
+            all_sizes = [my_sizes]
+        self.rank_sizes = all_sizes
+
+        self.node_count = len(points)
+        self.data_file = open(basename + "-data%s.bin" % rank_suffix, "wb")
+
+        # closed XdmfTimeStep instances, whose data is not yet written
+        self.pending_steps = []
+        # written XdmfTimeStep instances, not yet in the index
+        self.written_steps = []
+
+        # the index file is kept open, and new entries are written over
+        # its closing tags, which start at index_footer_start
+        self.index_file = None
+        self.index_footer_start = None
+        self.index_step_count = 0
+        self.index_data_offsets = [0] * len(self.ranks)
+
+        logger.info("init xdmf visualizer: done")
+
+    def _rank_suffixes(self):
+        if len(self.ranks) == 1:
+            return [""]
+        else:
+            return ["-%05d" % rank for rank in self.ranks]
+
+    def make_file(self, pathname):
+        """Return a :class:`XdmfTimeStep` to pass to :meth:`add_data`. The
+        base name of *pathname* names the time step in the index.
+        """
+        from os.path import basename
+        return XdmfTimeStep(self, basename(pathname))
+
+    def add_data(self, visf, variables=[], scalars=[], vectors=[],
+            time=None, step=None, scale_factor=1):
+        if scalars or vectors:
+            import warnings
+            warnings.warn("`scalars' and `vectors' arguments are deprecated",
+                    DeprecationWarning)
+            variables = scalars + vectors
+
+        if visf.is_closed:
+            raise RuntimeError("time step is already closed")
+
+        if time is not None:
+            visf.time = time
+        if step is not None:
+            visf.step = step
+
+        from hedge.tools import log_shape
+
+        for name, field in variables:
+            ls = log_shape(field)
+            if ls == ():
+                components = [("Scalar", name, [field])]
+            elif len(ls) == 1 and ls[0] in [2, 3]:
+                components = [("Vector", name, list(field))]
+            elif len(ls) == 1:
+                components = [("Scalar", "%s_comp%d" % (name, i), [f_i])
+                        for i, f_i in enumerate(field)]
+            else:
+                raise NotImplementedError(
+                        "XDMF output of fields of shape %s" % (ls,))
+
+            for attr_type, attr_name, comp_fields in components:
+                dtype = self.dtype
+                if dtype is None:
+                    dtype = comp_fields[0].dtype
+
+                if attr_type == "Vector":
+                    data = np.zeros((self.node_count, 3), dtype=dtype)
+                    for i, f_i in enumerate(comp_fields):
+                        data[:, i] = scale_factor*f_i
+                else:
+                    data = np.empty(self.node_count, dtype=dtype)
+                    data[:] = scale_factor*comp_fields[0]
+
+                visf.attributes.append((attr_name, attr_type, data))
+
+    def _commit_time_step(self, visf):
+        if self.is_closed:
+            raise RuntimeError("visualizer is already closed")
+
+        self.pending_steps.append(visf)
+        if len(self.pending_steps) >= self.buffer_steps:
+            self.flush()
+
+    def flush(self):
+        """Write the data of all buffered time steps, and update the index."""
+        for visf in self.pending_steps:
+            for attr_name, attr_type, data in visf.attributes:
+                data.tofile(self.data_file)
+
+            # drop the data, but keep what the index needs
+            visf.attributes = [
+                    (attr_name, attr_type, data.dtype, data.shape[1:])
+                    for attr_name, attr_type, data in visf.attributes]
+            self.written_steps.append(visf)
+
+        self.pending_steps = []
+        self.data_file.flush()
+
+        if self.is_head_rank:
+            self.write_index()
+
+    def write_index(self):
+        """Add the time steps written since the last call to the index."""
+        import os
+
+        if self.index_file is None:
+            self.index_file = open(self.basename + ".xmf", "w")
+            self.index_file.write("\n".join([
+                    '<?xml version="1.0" ?>',
+                    '<Xdmf Version="2.0">',
+                    '<Domain>',
+                    '<Grid Name="%s" GridType="Collection" '
+                    'CollectionType="Temporal">'
+                    % os.path.basename(self.basename),
+                    '']))
+            self.index_footer_start = self.index_file.tell()
+
+        lines = []
+        for visf in self.written_steps:
+            lines.extend(self._get_index_step_lines(visf))
+        self.written_steps = []
+
+        # Only the new entries and the closing tags are written. A reader
+        # looking at the index while it is updated may see it without its
+        # closing tags, but never with entries for data not yet written.
+        outf = self.index_file
+        outf.seek(self.index_footer_start)
+        for line in lines:
+            outf.write(line + "\n")
+        self.index_footer_start = outf.tell()
+        outf.write("\n".join(['</Grid>', '</Domain>', '</Xdmf>', '']))
+        outf.truncate()
+        outf.flush()
+
+    def _get_index_step_lines(self, visf):
+        if visf.time is not None:
+            time = visf.time
+        elif visf.step is not None:
+            time = visf.step
+        else:
+            time = self.index_step_count
+        self.index_step_count += 1
+
+        lines = []
+        data_offsets = self.index_data_offsets
+
+        if len(self.ranks) > 1:
+            lines.append('<Grid Name="%s" GridType="Collection" '
+                    'CollectionType="Spatial">' % visf.name)
+            lines.append('<Time Value="%r" />' % time)
+
+        for i, (node_count, cell_count, cell_vertices) in enumerate(
+                self.rank_sizes):
+            if len(self.ranks) > 1:
+                lines.append('<Grid Name="%s-%05d" GridType="Uniform">'
+                        % (visf.name, self.ranks[i]))
+            else:
+                lines.append('<Grid Name="%s" GridType="Uniform">'
+                        % visf.name)
+                lines.append('<Time Value="%r" />' % time)
+
+            lines.append('<Topology %s NumberOfElements="%d">'
+                    % (self.topology, cell_count))
+            lines.append(_xdmf_data_item(self.mesh_filenames[i], np.int32,
+                (cell_count, cell_vertices), node_count*3*8))
+            lines.append('</Topology>')
+            lines.append('<Geometry GeometryType="XYZ">')
+            lines.append(_xdmf_data_item(self.mesh_filenames[i],
+                np.float64, (node_count, 3), 0))
+            lines.append('</Geometry>')
+            for attr_name, attr_type, dtype, comp_shape in visf.attributes:
+                shape = (node_count,) + comp_shape
+                lines.append('<Attribute Name="%s" AttributeType="%s" '
+                        'Center="Node">' % (attr_name, attr_type))
+                lines.append(_xdmf_data_item(self.data_filenames[i],
+                    dtype, shape, data_offsets[i]))
+                lines.append('</Attribute>')
+                data_offsets[i] += int(np.prod(shape))*dtype.itemsize
+
+            lines.append('</Grid>')
+
+        if len(self.ranks) > 1:
+            lines.append('</Grid>')
+
+        return lines
+
+    def do_close(self):
+        self.flush()
+        self.data_file.close()
+        if self.index_file is not None:
+            self.index_file.close()
+
+# }}}
+
+
+# {{{ asynchronous output
+
+def _run_background_jobs(queue, errors):
+    """Body of the thread of a :class:`BackgroundWriter`. It holds no
+    reference to the writer, so that a writer nobody uses any more can be
+    garbage-collected.
+    """
+    while True:
+        job = queue.get()
+        try:
+            if job is None:
+                return
+
+            if not errors:
+                func, args, kwargs = job
+                func(*args, **kwargs)
+        except:
+            import sys
+            errors.append(sys.exc_info())
+            logger.exception("background output job failed")
+        finally:
+            queue.task_done()
+
+
+# maps weak references to the writers not yet closed to their threads
+_background_writer_threads = None
+
+
+def _close_background_writers():
+    """Make sure queued output gets written before the interpreter exits,
+    which would otherwise kill the (daemon) writer threads.
+    """
+    for writer_ref, thread in _background_writer_threads.items():
+        writer = writer_ref()
+        if writer is not None:
+            writer.close()
+        else:
+            thread.join()
+
+
+class BackgroundWriter(hedge.tools.Closable):
+    """Runs output jobs, one at a time and in order, on a background thread.
+
+    At most *max_queued* jobs wait to be run. Once that many are
+    waiting, :meth:`submit` blocks until the oldest one has started, so
+    that output that cannot keep up slows the computation down instead of
+    piling up snapshots in memory.
+
+    An exception raised by a job is re-raised by the next call to
+    :meth:`submit`, :meth:`flush` or :meth:`close`. Jobs submitted after a
+    failed one are skipped.
+
+    Writers that are still open when the interpreter exits are closed,
+    so that queued output gets written. A writer that is garbage-collected
+    without being closed still runs the jobs queued so far.
+    """
+
+    def __init__(self, max_queued=2):
+        hedge.tools.Closable.__init__(self)
+
+        from Queue import Queue
+        from threading import Thread
+
+        self.queue = Queue(max_queued)
+        self.errors = []
+
+        self.thread = Thread(target=_run_background_jobs,
+                args=(self.queue, self.errors),
+                name="hedge-output-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+        global _background_writer_threads
+        if _background_writer_threads is None:
+            _background_writer_threads = {}
+
+            import atexit
+            atexit.register(_close_background_writers)
+
+        for writer_ref, thread in _background_writer_threads.items():
+            if not thread.is_alive():
+                del _background_writer_threads[writer_ref]
+
+        # Once this writer is gone, let the thread finish the queued jobs
+        # and end. The callback must not refer to the writer itself.
+        queue = self.queue
+        from weakref import ref
+        self._writer_ref = ref(self, lambda writer_ref: queue.put(None))
+        _background_writer_threads[self._writer_ref] = self.thread
+
+    def _raise_job_exception(self):
+        if self.errors:
+            exc_info = self.errors.pop()
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a call of *func* with the given arguments."""
+        if self.is_closed:
+            raise RuntimeError("background writer is closed")
+
+        self._raise_job_exception()
+        self.queue.put((func, args, kwargs))
+
+    def flush(self):
+        """Wait until all queued jobs have been run."""
+        self.queue.join()
+        self._raise_job_exception()
+
+    def do_close(self):
+        del _background_writer_threads[self._writer_ref]
+
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_job_exception()
+
+
+class AsyncVisualizationFile(hedge.tools.Closable):
+    """Stands in for the file of the wrapped visualizer on the computing
+    thread, see :class:`AsyncVisualizer`.
+    """
+
+    def __init__(self, visualizer, pathname):
+        hedge.tools.Closable.__init__(self)
+        self.visualizer = visualizer
+        self.pathname = pathname
+        self.add_data_calls = []
+
+    def do_close(self):
+        self.visualizer.writer.submit(self.visualizer._write_file,
+                self.pathname, self.add_data_calls)
+        self.add_data_calls = None
+
+
+class AsyncVisualizer(Visualizer, hedge.tools.Closable):
+    """Wraps a visualizer, such as a :class:`VtkVisualizer` or a
+    :class:`SiloVisualizer`, so that its files are written by a
+    :class:`BackgroundWriter`.
+
+    The only work left on the computing thread is taking a copy of each
+    field passed to :meth:`add_data`. When the file is closed, it is
+    queued for writing; creating, encoding, compressing and writing the
+    actual file then happen in the background, overlapping with the
+    computation. The wrapped visualizer is only ever used from the
+    background thread while jobs are pending.
+
+    :param max_queued: the number of closed files that may wait to be
+      written. See :class:`BackgroundWriter`.
+    """
+
+    def __init__(self, visualizer, max_queued=2):
+        hedge.tools.Closable.__init__(self)
+        self.visualizer = visualizer
+        self.writer = BackgroundWriter(max_queued)
+
+    def make_file(self, pathname):
+        if self.is_closed:
+            raise RuntimeError("visualizer is closed")
+        return AsyncVisualizationFile(self, pathname)
+
+    def add_data(self, visf, variables=[], scalars=[], vectors=[],
+            scale_factor=1, **kwargs):
+        if visf.is_closed:
+            raise RuntimeError("file is already closed")
+
+        from pytools.obj_array import with_object_array_or_scalar
+
+        def snapshot(field):
+            # multiplying allocates, so this is also the copy that
+            # decouples the written data from later updates of *field*
+            return scale_factor*field
+
+        kwargs["variables"] = [
+                (name, with_object_array_or_scalar(snapshot, field))
+                for name, field in list(variables) + scalars + vectors]
+        visf.add_data_calls.append(kwargs)
+
+    def _write_file(self, pathname, add_data_calls):
+        visf = self.visualizer.make_file(pathname)
+        try:
+            for kwargs in add_data_calls:
+                self.visualizer.add_data(visf, **kwargs)
+        finally:
+            visf.close()
+
+    def flush(self):
+        """Wait until all closed files have been written."""
+        self.writer.flush()
+
+    def update_pvd(self):
+        self.flush()
+        self.visualizer.update_pvd()
+
+    def do_close(self):
+        try:
+            self.writer.close()
+        finally:
+            self.visualizer.close()
+
+# }}}
+
+
 # {{{ tools
 
 def get_rank_partition(pcon, discr):
@@ -78,9 +78,18 @@ def main():
         # 2.x
         from distutils.command.build_py import build_py
 
+    ver_dic = {}
+    version_file = open("hedge/version.py")
+    try:
+        version_file_contents = version_file.read()
+    finally:
+        version_file.close()
+
+    exec(compile(version_file_contents, "hedge/version.py", 'exec'), ver_dic)
+
     setup(name="hedge",
             # metadata
-            version="0.91",
+            version=ver_dic["VERSION_TEXT"],
             description="Hybrid Easy Discontinuous Galerkin Environment",
             long_description=open("README.rst", "rt").read(),
             author=u"Andreas Kloeckner",
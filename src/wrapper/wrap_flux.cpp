@@ -152,6 +152,11 @@ void hedge_expose_fluxes()
   expose_face_pair<straight_face, curved_face>("StraightCurved");
   expose_face_pair<curved_face, curved_face>("Curved");
 
+  def("append_face_pairs",
+      append_face_pairs<face_group<face_pair<straight_face> > >,
+      args("fg", "order", "side_indices", "side_geometry", "side_normals",
+        "ext_native_write_maps"));
+
   expose_lift_flux<float, float>();
   expose_lift_flux<double, double>();
   expose_lift_flux_without_blas<float, std::complex<float> >();
@@ -876,6 +876,368 @@ def test_all_periodic_no_boundary():
 
 
 
+def get_boundary_faces(mesh, tag, vertex_numbers=None):
+    """Return the faces of *mesh* tagged *tag*, each as a
+    :class:`frozenset` of vertex numbers. If given, *vertex_numbers* maps
+    the mesh's vertex indices to the numbers used, for instance to
+    compare the faces of a mesh part by their global vertex numbers.
+    """
+    if vertex_numbers is None:
+        return set(frozenset(el.faces[fn])
+                for el, fn in mesh.tag_to_boundary.get(tag, []))
+    else:
+        return set(frozenset(vertex_numbers[vi] for vi in el.faces[fn])
+                for el, fn in mesh.tag_to_boundary.get(tag, []))
+
+
+def test_array_boundary_tagger():
+    """Check that array and per-face boundary taggers give the same mesh."""
+    from hedge.mesh import make_conformal_mesh_ext, TAG_ALL
+    from hedge.mesh.generator import make_box_mesh
+    from hedge.mesh.array import make_element_arrays, ArrayBoundaryTagger
+
+    box_mesh = make_box_mesh(max_volume=0.1)
+    points = box_mesh.points
+    vertex_indices = [el.vertex_indices for el in box_mesh.elements]
+
+    class BottomTagger(ArrayBoundaryTagger):
+        def tag_faces(self, face_vertex_indices, el_numbers, face_numbers,
+                all_v):
+            centers = numpy.average(all_v[face_vertex_indices], axis=1)
+            return {"bottom": centers[:, 2] < 1e-12}
+
+    array_mesh = make_conformal_mesh_ext(points,
+            make_element_arrays(points, vertex_indices),
+            boundary_tagger=BottomTagger())
+    obj_mesh = make_conformal_mesh_ext(points,
+            box_mesh.elements, boundary_tagger=BottomTagger())
+
+    for tag in ["bottom", TAG_ALL]:
+        assert get_boundary_faces(array_mesh, tag) \
+                == get_boundary_faces(obj_mesh, tag)
+    assert get_boundary_faces(array_mesh, "bottom") \
+            == get_boundary_faces(box_mesh, "minus_z")
+    assert get_boundary_faces(array_mesh, TAG_ALL) \
+            == get_boundary_faces(box_mesh, TAG_ALL)
+
+    assert len(array_mesh.interfaces) == len(box_mesh.interfaces)
+    el, fn = array_mesh.tag_to_boundary["bottom"][0]
+    assert BottomTagger()(frozenset(el.faces[fn]), el, fn, points) \
+            == ["bottom"]
+
+
+def test_element_array_mesh_connectivity():
+    """Check that an element array mesh keeps its connectivity in arrays
+    and matches the object mesh, including periodic faces."""
+    from hedge.mesh import make_conformal_mesh_ext, TAG_ALL
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.mesh.array import make_element_arrays, \
+            InterfaceSequence, FaceSubset, ElementSubset
+
+    obj_mesh = make_regular_rect_mesh(n=(6, 5), periodicity=(True, False))
+    points = obj_mesh.points
+    vertex_indices = [el.vertex_indices for el in obj_mesh.elements]
+
+    def boundary_tagger(fvi, el, fn, all_v):
+        center = numpy.average(all_v[list(fvi)], axis=0)
+        result = []
+        if center[0] < 1e-12:
+            result.append("minus_x")
+        if center[0] > 1-1e-12:
+            result.append("plus_x")
+        return result
+
+    array_mesh = make_conformal_mesh_ext(points,
+            make_element_arrays(points, vertex_indices),
+            boundary_tagger=boundary_tagger,
+            periodicity=[("minus_x", "plus_x"), None])
+
+    assert isinstance(array_mesh.interfaces, InterfaceSequence)
+    assert isinstance(array_mesh.tag_to_boundary[TAG_ALL], FaceSubset)
+    assert isinstance(array_mesh.tag_to_elements[TAG_ALL], ElementSubset)
+    assert len(array_mesh.tag_to_elements[TAG_ALL]) == len(obj_mesh.elements)
+
+    def get_interfaces(mesh):
+        return set(frozenset([(el_a.id, fn_a), (el_b.id, fn_b)])
+                for (el_a, fn_a), (el_b, fn_b) in mesh.interfaces)
+
+    assert get_interfaces(array_mesh) == get_interfaces(obj_mesh)
+    for tag in [TAG_ALL, "minus_x", "plus_x"]:
+        assert get_boundary_faces(array_mesh, tag) \
+                == get_boundary_faces(obj_mesh, tag)
+    assert array_mesh.periodic_opposite_faces \
+            == obj_mesh.periodic_opposite_faces
+
+
+def test_match_vertices_along_axis():
+    """Check periodic vertex matching against a brute-force search."""
+    from hedge.mesh.array import match_vertices_along_axis
+
+    rng = numpy.random.RandomState(17)
+    for dim in [1, 2, 3]:
+        # coarse grid points, some repeated, some perturbed within the
+        # tolerance
+        minus_points = numpy.round(rng.rand(50, dim)*3)/3
+        minus_points += 1e-13*rng.randn(50, dim)*(rng.rand(50, dim) < 0.3)
+        plus_points = minus_points[rng.permutation(50)]
+        plus_points[:, 0] += 1
+        points = numpy.vstack([minus_points, plus_points])
+
+        numbers_a = numpy.arange(50)
+        numbers_b = numpy.arange(50, 100)
+        match_a, match_b = match_vertices_along_axis(
+                0, points, numbers_a, numbers_b)
+
+        expected = {}
+        for a in numbers_a:
+            for b in numbers_b:
+                dist = points[a] - points[b]
+                dist[0] = 0
+                if la.norm(dist) < 1e-12:
+                    expected[a] = b
+                    break
+
+        assert dict(zip(match_a, match_b)) == expected
+
+    """Check that ASCII and binary Gmsh files give the same array-based
+    mesh, with boundary and volume tags."""
+    import os
+    import struct
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    from hedge.mesh import TAG_ALL
+    from hedge.mesh.array import ElementArrays
+    from hedge.mesh.generator import make_box_mesh
+    from hedge.mesh.reader.gmsh import read_gmsh
+
+    box_mesh = make_box_mesh(max_volume=0.1)
+    points = box_mesh.points
+
+    # gmsh node numbers need not be contiguous
+    node_numbers = 3*numpy.arange(len(points)) + 10
+    elements = [(4, [7, 1], [node_numbers[vi] for vi in el.vertex_indices])
+            for el in box_mesh.elements]
+    elements.extend(
+            (2, [5, 2], [node_numbers[vi] for vi in el.faces[fn]])
+            for el, fn in box_mesh.tag_to_boundary["minus_z"])
+
+    def write_gmsh(filename, binary):
+        outf = open(filename, "wb")
+        outf.write("$MeshFormat\n2.2 %d 8\n" % binary)
+        if binary:
+            outf.write(struct.pack("<i", 1) + "\n")
+        outf.write("$EndMeshFormat\n$PhysicalNames\n2\n"
+                "2 5 \"bottom\"\n3 7 \"vol\"\n$EndPhysicalNames\n")
+
+        outf.write("$Nodes\n%d\n" % len(points))
+        for nr, pt in zip(node_numbers, points):
+            if binary:
+                outf.write(struct.pack("<i3d", nr, *pt))
+            else:
+                outf.write("%d %r %r %r\n" % ((nr,) + tuple(pt)))
+        if binary:
+            outf.write("\n")
+
+        outf.write("$EndNodes\n$Elements\n%d\n" % len(elements))
+        for i, (el_type, tags, nodes) in enumerate(elements):
+            if binary:
+                outf.write(struct.pack("<%di" % (4+len(tags)+len(nodes)),
+                    el_type, 1, len(tags), i+1, *(tags+nodes)))
+            else:
+                outf.write("%d %d %d %s\n" % (i+1, el_type, len(tags),
+                    " ".join(str(x) for x in tags+nodes)))
+        if binary:
+            outf.write("\n")
+        outf.write("$EndElements\n")
+        outf.close()
+
+    def get_faces(mesh, tag):
+        # the vertex numbering differs, so compare faces by their points
+        return get_boundary_faces(mesh, tag,
+                [tuple(pt) for pt in mesh.points])
+
+    tmpdir = mkdtemp()
+    try:
+        for binary in [0, 1]:
+            filename = os.path.join(tmpdir, "box-%d.msh" % binary)
+            write_gmsh(filename, binary)
+            mesh = read_gmsh(filename, chunk_size=17)
+
+            assert isinstance(mesh.elements, ElementArrays)
+            assert len(mesh.elements) == len(box_mesh.elements)
+            assert len(mesh.tag_to_elements["vol"]) == len(box_mesh.elements)
+            assert len(mesh.interfaces) == len(box_mesh.interfaces)
+            assert get_faces(mesh, "bottom") == get_faces(box_mesh, "minus_z")
+            assert get_faces(mesh, TAG_ALL) == get_faces(box_mesh, TAG_ALL)
+    finally:
+        rmtree(tmpdir)
+
+
+def test_pack_mesh_partition():
+    """Check that parts rebuilt from packed arrays match those of
+    :func:`hedge.partition.partition_mesh`."""
+    from hedge.mesh import (make_conformal_mesh_ext, TAG_ALL,
+            TAG_RANK_BOUNDARY)
+    from hedge.mesh.generator import make_box_mesh
+    from hedge.mesh.array import make_element_arrays, ArrayBoundaryTagger
+    from hedge.partition import (partition_mesh, pack_mesh_partition,
+            make_part_data)
+
+    box_mesh = make_box_mesh(max_volume=0.1)
+    points = box_mesh.points
+
+    class BottomTagger(ArrayBoundaryTagger):
+        def tag_faces(self, face_vertex_indices, el_numbers, face_numbers,
+                all_v):
+            centers = numpy.average(all_v[face_vertex_indices], axis=1)
+            return {"bottom": centers[:, 2] < 1e-12}
+
+    mesh = make_conformal_mesh_ext(points,
+            make_element_arrays(points,
+                [el.vertex_indices for el in box_mesh.elements]),
+            boundary_tagger=BottomTagger())
+
+    part_count = 3
+    ea = mesh.elements
+    centroids = numpy.average(points[ea.vertex_indices], axis=1)
+    el_parts = numpy.minimum(
+            (centroids[:, 0]*part_count).astype(numpy.intp), part_count-1)
+
+    meta, arrays, counts = pack_mesh_partition(mesh, el_parts, part_count)
+
+    starts = dict((name, numpy.cumsum(cnt) - cnt)
+            for name, cnt in counts.iteritems())
+
+    obj_parts = partition_mesh(mesh, dict(enumerate(el_parts)),
+            part_bdry_tag_factory=TAG_RANK_BOUNDARY)
+
+    def get_faces(part_data, tag):
+        return get_boundary_faces(part_data.mesh, tag, dict(
+            (l, g) for g, l
+            in part_data.global2local_vertex_indices.iteritems()))
+
+    for obj_data in obj_parts:
+        part = obj_data.part_nr
+        part_arrays = dict(
+                (name, ary[starts[name][part]
+                    :starts[name][part]+counts[name][part]])
+                for name, ary in arrays.iteritems())
+        array_data = make_part_data(part, meta, part_arrays,
+                TAG_RANK_BOUNDARY)
+
+        assert sorted(array_data.neighbor_parts) \
+                == sorted(obj_data.neighbor_parts)
+        assert set(array_data.global2local_elements) \
+                == set(obj_data.global2local_elements)
+        assert set(array_data.global2local_vertex_indices) \
+                == set(obj_data.global2local_vertex_indices)
+        assert len(array_data.mesh.interfaces) \
+                == len(obj_data.mesh.interfaces)
+
+        for tag in ["bottom", TAG_ALL] + [TAG_RANK_BOUNDARY(nb)
+                for nb in obj_data.neighbor_parts]:
+            assert get_faces(array_data, tag) == get_faces(obj_data, tag)
+
+
+def test_pack_mesh_partition_periodic():
+    """Check that each packed part carries the periodic face
+    correspondences of its own faces only."""
+    from hedge.mesh import make_conformal_mesh_ext, TAG_RANK_BOUNDARY
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.mesh.array import make_element_arrays
+    from hedge.partition import pack_mesh_partition, make_part_data
+
+    obj_mesh = make_regular_rect_mesh(n=(9, 5), periodicity=(True, False))
+    points = obj_mesh.points
+
+    def boundary_tagger(fvi, el, fn, all_v):
+        center = numpy.average(all_v[list(fvi)], axis=0)
+        result = []
+        if center[0] < 1e-12:
+            result.append("minus_x")
+        if center[0] > 1-1e-12:
+            result.append("plus_x")
+        return result
+
+    mesh = make_conformal_mesh_ext(points,
+            make_element_arrays(points,
+                [el.vertex_indices for el in obj_mesh.elements]),
+            boundary_tagger=boundary_tagger,
+            periodicity=[("minus_x", "plus_x"), None])
+
+    part_count = 3
+    centroids = numpy.average(points[mesh.elements.vertex_indices], axis=1)
+    el_parts = numpy.minimum(
+            (centroids[:, 0]*part_count).astype(numpy.intp), part_count-1)
+
+    meta, arrays, counts = pack_mesh_partition(mesh, el_parts, part_count)
+    assert "periodic_opposite_faces" not in meta
+
+    starts = dict((name, numpy.cumsum(cnt) - cnt)
+            for name, cnt in counts.iteritems())
+
+    expected = [{} for part in range(part_count)]
+    for el_nr, el_faces in enumerate(mesh.elements.faces.tolist()):
+        for fvi in el_faces:
+            fvi = tuple(fvi)
+            if fvi in mesh.periodic_opposite_faces:
+                expected[el_parts[el_nr]][fvi] = \
+                        mesh.periodic_opposite_faces[fvi]
+
+    assert mesh.periodic_opposite_faces
+    assert sum(len(part_faces) for part_faces in expected) \
+            == len(mesh.periodic_opposite_faces)
+
+    for part in range(part_count):
+        part_arrays = dict(
+                (name, ary[starts[name][part]
+                    :starts[name][part]+counts[name][part]])
+                for name, ary in arrays.iteritems())
+        part_data = make_part_data(part, meta, part_arrays,
+                TAG_RANK_BOUNDARY)
+
+        assert part_data.global_periodic_opposite_faces == expected[part]
+
+
+def test_wait_for_any():
+    """Check that waiting on thread pool futures wakes up when the first
+    one is done, and that their results and exceptions are passed on."""
+    from hedge.tools.futures import ThreadPoolFuture, wait_for_any
+    from multiprocessing.pool import ThreadPool
+    from threading import Event
+    from time import sleep
+
+    def fail():
+        raise KeyError("failed")
+
+    pool = ThreadPool(2)
+    try:
+        ready_event = Event()
+        release_event = Event()
+
+        slow = ThreadPoolFuture(pool, release_event.wait, (), ready_event)
+        fast = ThreadPoolFuture(pool, sleep, (0.01,), ready_event)
+        wait_for_any([slow, fast], ready_event)
+        assert fast.is_ready() and not slow.is_ready()
+        assert fast() is None
+
+        release_event.set()
+        wait_for_any([slow], ready_event)
+        slow()
+
+        failing = ThreadPoolFuture(pool, fail, (), ready_event)
+        wait_for_any([failing], ready_event)
+        try:
+            failing()
+        except KeyError:
+            pass
+        else:
+            assert False, "exception from pool thread was lost"
+    finally:
+        pool.close()
+        pool.join()
+
+
 def test_simp_cubature():
     """Check that Grundmann-Moeller cubature works as advertised"""
     from pytools import generate_nonnegative_integer_tuples_summing_to_at_most
@@ -1175,6 +1175,1201 @@ def test_mesh_regrid():
     # FIXME: Add EOC test, too.
 
 
+
+def test_kernel_cache():
+    """Check that a second discretization picks up all its kernels from
+    the on-disk kernel cache written by the first one."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.advection import StrongAdvectionOperator
+    from hedge.data import TimeDependentGivenFunction
+    from math import sin
+
+    v = numpy.array([0.27, 0])
+
+    def u_analytic(x, el, t):
+        return sin(numpy.dot(v, x) - t)
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(4, 4),
+            boundary_tagger=lambda fvi, el, fn, all_v: ["inflow"])
+
+    from tempfile import mkdtemp
+    cache_dir = mkdtemp()
+
+    try:
+        results = []
+        discrs = []
+        for i in range(2):
+            discr = discr_class(mesh, order=3,
+                    debug=discr_class.noninteractive_debug_flags(),
+                    kernel_cache_dir=cache_dir)
+            op = StrongAdvectionOperator(v,
+                    inflow_u=TimeDependentGivenFunction(u_analytic),
+                    flux_type="upwind")
+
+            u = discr.interpolate_volume_function(
+                    lambda x, el: u_analytic(x, el, 0))
+            results.append(op.bind(discr)(0, u))
+            discrs.append(discr)
+
+        assert discrs[0].kernel_cache.miss_count > 0
+        assert discrs[1].kernel_cache.miss_count == 0
+        assert discrs[1].kernel_cache.hit_count > 0
+        assert la.norm(results[0] - results[1]) == 0
+    finally:
+        from shutil import rmtree
+        rmtree(cache_dir)
+
+
+def test_kernel_warm_up():
+    """Check that warming up an operator leaves nothing to compile when
+    the operator is subsequently executed."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.wave import StrongWaveOperator
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(4, 4))
+
+    from tempfile import mkdtemp
+    cache_dir = mkdtemp()
+
+    try:
+        op = StrongWaveOperator(-1, 2, flux_type="upwind")
+
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags(),
+                kernel_cache_dir=cache_dir)
+        report = discr.warm_up(op)
+        assert len(report) > 1
+        assert discr.kernel_cache.miss_count > 0
+
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags(),
+                kernel_cache_dir=cache_dir)
+        from hedge.tools import join_fields
+        fields = join_fields(discr.volume_zeros(),
+                [discr.volume_zeros() for i in range(discr.dimensions)])
+        op.bind(discr)(0, fields)
+        assert discr.kernel_cache.miss_count == 0
+    finally:
+        from shutil import rmtree
+        rmtree(cache_dir)
+
+
+
+def test_kernel_warm_up_arg_dtypes():
+    """Check that warming up with per-argument dtypes builds the kernels
+    that executing with arguments of those dtypes needs."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.optemplate import Field, ScalarParameter
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(4, 4))
+    optemplate = ScalarParameter("s")*Field("u")**2 + Field("v")
+
+    from tempfile import mkdtemp
+    cache_dir = mkdtemp()
+
+    try:
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags(),
+                kernel_cache_dir=cache_dir)
+        discr.warm_up(optemplate, numpy.float32,
+                dict(s=numpy.float64, v=numpy.float64))
+
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags(),
+                kernel_cache_dir=cache_dir)
+        result = discr.compile(optemplate)(
+                u=discr.volume_zeros(dtype=numpy.float32),
+                v=discr.volume_zeros(dtype=numpy.float64),
+                s=numpy.float64(2))
+        assert result.dtype == numpy.float64
+        assert discr.kernel_cache.miss_count == 0
+    finally:
+        from shutil import rmtree
+        rmtree(cache_dir)
+
+def test_lift_engines():
+    """Check that all lift engines agree."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.models.advection import StrongAdvectionOperator
+    from hedge.data import TimeDependentGivenFunction
+    from math import sin
+
+    v = numpy.array([0.27, 0.1])
+
+    def u_analytic(x, el, t):
+        return sin(3*numpy.dot(v, x) - t)
+
+    mesh = make_disk_mesh(max_area=0.1,
+            boundary_tagger=lambda fvi, el, fn, all_v: ["inflow"])
+
+    for order in [1, 4]:
+        results = []
+        for lift_engine in discr_class.lift_engines:
+            discr = discr_class(mesh, order=order,
+                    debug=discr_class.noninteractive_debug_flags(),
+                    lift_engine=lift_engine)
+            op = StrongAdvectionOperator(v,
+                    inflow_u=TimeDependentGivenFunction(u_analytic),
+                    flux_type="upwind")
+
+            u = discr.interpolate_volume_function(
+                    lambda x, el: u_analytic(x, el, 0))
+            results.append(op.bind(discr)(0, u))
+
+        for result in results[1:]:
+            assert la.norm(result - results[0]) < 1e-10*la.norm(results[0])
+
+
+def test_diff_engines():
+    """Check that all differentiation engines agree, including on
+    derivatives of several fields batched together."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.em import TEMaxwellOperator
+    from hedge.tools import join_fields
+    from math import sin, cos
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+
+    op = TEMaxwellOperator(epsilon=1, mu=1, flux_type=1)
+
+    for order in [1, 4]:
+        results = []
+        for diff_engine in discr_class.diff_engines:
+            discr = discr_class(mesh, order=order,
+                    debug=discr_class.noninteractive_debug_flags(),
+                    diff_engine=diff_engine)
+
+            fields = join_fields(
+                    discr.interpolate_volume_function(
+                        lambda x, el: sin(3*x[0])*cos(2*x[1])),
+                    discr.interpolate_volume_function(
+                        lambda x, el: x[0]*x[1]),
+                    discr.interpolate_volume_function(
+                        lambda x, el: cos(x[0]+x[1])))
+            results.append(op.bind(discr)(0, fields))
+
+        for result in results[1:]:
+            for comp, ref_comp in zip(result, results[0]):
+                assert la.norm(comp - ref_comp) < 1e-10*la.norm(ref_comp)
+
+
+def test_buffer_pool_reuse():
+    """Check that repeated operator evaluation recycles intermediate
+    buffers without changing the result."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.tools import join_fields
+    from math import sin
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    op = StrongWaveOperator(-1, discr.dimensions, flux_type="upwind")
+    compiled_op = discr.compile(op.op_template())
+
+    fields = join_fields(
+            discr.interpolate_volume_function(lambda x, el: sin(3*x[0])),
+            [discr.interpolate_volume_function(lambda x, el: x[0]*x[1])
+                for i in range(discr.dimensions)])
+
+    results = [compiled_op(w=fields, t=0) for i in range(3)]
+
+    pool = compiled_op.buffer_pool
+    assert pool.reuse_count > 0
+
+    for result in results[1:]:
+        for comp, ref_comp in zip(result, results[0]):
+            assert la.norm(comp - ref_comp) == 0
+
+
+def test_buffer_pool_steady_state():
+    """Check that, as long as the caller hands the results back to the
+    buffer pool, no step after the first allocates new arrays."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.tools import join_fields
+    from math import sin
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    op = StrongWaveOperator(-1, discr.dimensions, flux_type="upwind")
+    compiled_op = discr.compile(op.op_template())
+    pool = compiled_op.buffer_pool
+
+    fields = join_fields(
+            discr.interpolate_volume_function(lambda x, el: sin(3*x[0])),
+            [discr.interpolate_volume_function(lambda x, el: x[0]*x[1])
+                for i in range(discr.dimensions)])
+
+    for step in range(4):
+        result = compiled_op(w=fields, t=0)
+
+        if step == 0:
+            ref_result = [comp.copy() for comp in result]
+        else:
+            for comp, ref_comp in zip(result, ref_result):
+                assert la.norm(comp - ref_comp) == 0
+
+        for comp in result:
+            assert comp.base is None
+            pool.release(comp)
+        del result, comp
+
+        if step == 0:
+            allocation_count = pool.allocation_count
+
+    assert pool.allocation_count == allocation_count
+
+
+def test_buffer_pool_recycling_rules():
+    """Check that only arrays computed by the code and handed out by the
+    pool are recycled, and only once no other variable may share them."""
+
+    from pymbolic import var
+    from hedge.compiler import Assign, Code
+    from hedge.optemplate import DependencyMapper
+    from hedge.backends.exec_common import BufferPool
+
+    def dep_mapper_factory(include_subscripts=False):
+        return DependencyMapper(
+                include_operator_bindings=False,
+                include_subscripts=include_subscripts,
+                include_calls="descend_args")
+
+    code = Code([
+        Assign(names=["b"], exprs=[var("a")],
+            dep_mapper_factory=dep_mapper_factory),
+        Assign(names=["c"], exprs=[2*var("b")],
+            dep_mapper_factory=dep_mapper_factory),
+        ], var("c"))
+
+    assert code.alias_groups["a"] == set(["a", "b"])
+    assert "c" not in code.alias_groups
+
+    # "a" is an argument, "b" may share its value
+    assert not code.is_value_private("a", {"a": 1, "c": 1})
+    assert not code.is_value_private("b", {"b": 1, "c": 1})
+    assert code.is_value_private("c", {"c": 1})
+
+    code = Code([
+        Assign(names=["a"], exprs=[2*var("x")],
+            dep_mapper_factory=dep_mapper_factory),
+        Assign(names=["b"], exprs=[var("a")],
+            dep_mapper_factory=dep_mapper_factory),
+        ], var("b"))
+
+    assert not code.is_value_private("a", {"a": 1, "b": 1})
+    assert code.is_value_private("a", {"a": 1})
+
+    pool = BufferPool()
+    shape = (10,)
+    context = {
+            "issued": pool.empty(shape, numpy.float64),
+            "argument": numpy.zeros(shape),
+            }
+
+    # arrays not handed out by the pool are never recycled
+    pool.release_variable(context, "argument", True)
+    # nor are possibly shared ones
+    issued = context["issued"]
+    pool.release_variable(context, "issued", False)
+    assert pool.empty(shape, numpy.float64) is not issued
+    assert pool.reuse_count == 0
+
+    context["issued"] = issued = pool.empty(shape, numpy.float64)
+    pool.release_variable(context, "issued", True)
+    assert not context
+    assert pool.empty(shape, numpy.float64) is issued
+    assert pool.reuse_count == 1
+
+
+def test_threaded_execution():
+    """Check that element-parallel execution gives bit-for-bit the same
+    result for any number of threads, and the same as running the same
+    JIT kernels serially, both kernel by kernel and for a whole
+    operator."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.models.advection import StrongAdvectionOperator
+    from hedge.data import TimeDependentGivenFunction
+    from hedge.backends.jit.elwise import JitElementwiseOperator
+    from math import sin
+
+    v = numpy.array([0.27, 0.1])
+
+    def u_analytic(x, el, t):
+        return sin(3*numpy.dot(v, x) - t)
+
+    mesh = make_disk_mesh(max_area=0.1,
+            boundary_tagger=lambda fvi, el, fn, all_v: ["inflow"])
+
+    def make_discr(thread_count):
+        # pin all engines, so that serial and threaded runs execute the
+        # same kernels
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags(),
+                diff_engine="jit", lift_engine="jit", flux_engine="split",
+                thread_count=thread_count)
+        if discr.chunk_runner is not None:
+            # make sure there is more than one chunk per group
+            discr.chunk_runner.chunk_size = 5
+        return discr
+
+    op = StrongAdvectionOperator(v,
+            inflow_u=TimeDependentGivenFunction(u_analytic),
+            flux_type="upwind")
+
+    results = []
+    for thread_count in [None, 1, 4]:
+        discr = make_discr(thread_count)
+
+        compiled = discr.compile(op.op_template())
+        if thread_count is None:
+            # the serial counterpart of the threaded elementwise kernel
+            compiled.elwise_operator = JitElementwiseOperator(discr)
+
+        u = discr.interpolate_volume_function(
+                lambda x, el: u_analytic(x, el, 0))
+        bc_in = op.inflow_u.boundary_interpolant(0, discr, op.inflow_tag)
+        results.append(compiled(u=u, bc_in=bc_in))
+        discr.close()
+
+    serial, one_thread, four_threads = results
+    assert (one_thread == four_threads).all()
+    assert (one_thread == serial).all()
+
+    # The threaded kernels against the same kernels run serially
+    from hedge.backends.jit.diff import JitDifferentiator
+    from hedge.backends.jit.lift import JitLifter
+    from hedge.optemplate.operators import (
+            ReferenceDifferentiationOperator, InverseMassOperator)
+
+    discr = make_discr(4)
+    u = discr.interpolate_volume_function(
+            lambda x, el: u_analytic(x, el, 0))
+
+    diff_ops = [ReferenceDifferentiationOperator(i)
+            for i in range(discr.dimensions)]
+    serial_diff = JitDifferentiator(discr)(diff_ops, u)
+    threaded_diff = JitDifferentiator(discr, discr.chunk_runner)(diff_ops, u)
+    for serial_d, threaded_d in zip(serial_diff, threaded_diff):
+        assert (serial_d == threaded_d).all()
+
+    minv = InverseMassOperator()
+    elwise_results = []
+    for runner in [None, discr.chunk_runner]:
+        out = discr.volume_zeros()
+        elwise_op = JitElementwiseOperator(discr, runner)
+        for eg in discr.element_groups:
+            elwise_op(eg.ranges, eg.ranges,
+                    numpy.asarray(minv.matrix(eg), dtype=u.dtype),
+                    minv.coefficients(eg), u, out)
+        elwise_results.append(out)
+    assert (elwise_results[0] == elwise_results[1]).all()
+
+    for fg in discr.face_groups:
+        fluxes = numpy.sin(numpy.arange(
+            fg.face_count*fg.face_length()*fg.element_count(),
+            dtype=numpy.float64))
+        for matrix, scaling in [
+                (fg.ldis_loc.lifting_matrix(), fg.local_el_inverse_jacobians),
+                (fg.ldis_loc.multi_face_mass_matrix(), None)]:
+            lift_results = []
+            for runner in [None, discr.chunk_runner]:
+                out = discr.volume_zeros()
+                JitLifter(discr, runner)(fg, matrix, scaling, fluxes, out)
+                lift_results.append(out)
+            assert (lift_results[0] == lift_results[1]).all()
+
+    discr.close()
+
+
+def test_chunk_runner_progress_hook():
+    """Check that the chunk runner calls its progress hook while it works
+    and still processes every chunk exactly once."""
+    from hedge.backends.jit.parallel import ChunkRunner
+
+    for thread_count in [1, 3]:
+        runner = ChunkRunner(thread_count, chunk_size=4)
+        hook_calls = []
+        runner.progress_hook = lambda: hook_calls.append(None)
+
+        done = numpy.zeros(30, dtype=numpy.intp)
+
+        def work(start, stop):
+            from time import sleep
+            sleep(0.01)
+            done[start:stop] += 1
+
+        runner(work, len(done))
+        runner.close()
+
+        assert (done == 1).all()
+        assert hook_calls
+
+
+def test_fused_flux_lift():
+    """Check that fused flux gather and lift agrees with the split path."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.em import TEMaxwellOperator
+    from hedge.tools import join_fields
+    from math import sin, cos
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+
+    op = TEMaxwellOperator(epsilon=1, mu=1, flux_type=1)
+
+    for order in [1, 4]:
+        results = []
+        for flux_engine in discr_class.flux_engines + [None]:
+            discr = discr_class(mesh, order=order,
+                    debug=discr_class.noninteractive_debug_flags(),
+                    flux_engine=flux_engine)
+
+            fields = join_fields(
+                    discr.interpolate_volume_function(
+                        lambda x, el: sin(3*x[0])*cos(2*x[1])),
+                    discr.interpolate_volume_function(
+                        lambda x, el: x[0]*x[1]),
+                    discr.interpolate_volume_function(
+                        lambda x, el: cos(x[0]+x[1])))
+
+            results.append(op.bind(discr)(0, fields))
+
+        for result in results[1:]:
+            for comp, ref_comp in zip(result, results[0]):
+                assert la.norm(comp - ref_comp) < 1e-12*la.norm(ref_comp)
+
+
+def test_concurrent_instructions():
+    """Check that executing independent instructions concurrently does not
+    change the result."""
+
+    from hedge.mesh.generator import make_box_mesh
+    from hedge.models.em import MaxwellOperator
+    from hedge.tools import join_fields
+    from math import sin
+
+    mesh = make_box_mesh(max_volume=0.05)
+
+    op = MaxwellOperator(epsilon=1, mu=1, flux_type=1)
+
+    results = []
+    for insn_thread_count in [None, 4]:
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags(),
+                insn_thread_count=insn_thread_count)
+
+        fields = join_fields(*[
+            discr.interpolate_volume_function(
+                lambda x, el: sin(i+x[0]*x[1]-x[2]))
+            for i in range(6)])
+
+        bound_op = op.bind(discr)
+        # the first evaluation is always sequential
+        results.extend([bound_op(0, fields), bound_op(0, fields)])
+        discr.close()
+
+    for result in results[1:]:
+        for comp, ref_comp in zip(result, results[0]):
+            assert la.norm(comp - ref_comp) == 0
+
+
+def test_main_thread_instructions():
+    """Check that instructions that must run on the main thread are not
+    handed to the instruction worker pool."""
+
+    from threading import current_thread
+    from multiprocessing.pool import ThreadPool
+    from pymbolic import var
+    from pytools.obj_array import make_obj_array
+    from hedge.compiler import Instruction, Code
+
+    class ThreadRecordingAssign(Instruction):
+        def get_assignees(self):
+            return set([self.name])
+
+        def get_dependencies(self):
+            return set()
+
+        def get_executor_method(self, exec_mapper):
+            return exec_mapper.exec_thread_recording_assign
+
+    class MainThreadAssign(ThreadRecordingAssign):
+        runs_on_main_thread = True
+
+    class ExecutionMapper:
+        def __init__(self):
+            self.context = {}
+
+        def exec_thread_recording_assign(self, insn):
+            return [(insn.name, current_thread())], []
+
+        def discard_variable(self, name):
+            del self.context[name]
+
+        def __call__(self, expr):
+            return self.context[expr.name]
+
+    code = Code(
+            [ThreadRecordingAssign(name="pooled"),
+                MainThreadAssign(name="main")],
+            make_obj_array([var("pooled"), var("main")]))
+
+    pool = ThreadPool(2)
+    try:
+        pooled_thread, main_thread = code.execute_dynamic(
+                ExecutionMapper(), worker_pool=pool)
+    finally:
+        pool.close()
+        pool.join()
+
+    assert main_thread is current_thread()
+    assert pooled_thread is not current_thread()
+
+
+def _execute_with_reference_scheduler(code, exec_mapper):
+    """Execute *code* the way :meth:`hedge.compiler.Code.execute_dynamic`
+    used to, by rescanning all instructions at each step.
+
+    :returns: a tuple *(schedule, result)*, where *schedule* is a list of
+      *(discardable_vars, insn)* tuples.
+    """
+    from pytools import argmax2
+    from hedge.tools import with_object_array_or_scalar
+
+    context = exec_mapper.context
+    done_insns = set()
+    schedule = []
+
+    while True:
+        available_insns = [
+                (insn, insn.priority) for insn in code.instructions
+                if insn not in done_insns
+                and all(dep.name in context
+                    for dep in insn.get_dependencies())]
+
+        if not available_insns:
+            break
+
+        insn = argmax2(available_insns)
+
+        still_needed = set(code.result_names)
+        for other_insn in code.instructions:
+            if other_insn not in done_insns:
+                still_needed.update(
+                        dep.name for dep in other_insn.get_dependencies())
+        discardable_vars = set(context) - still_needed
+
+        for name in discardable_vars:
+            exec_mapper.discard_variable(name)
+
+        done_insns.add(insn)
+        assignments, new_futures = insn.get_executor_method(exec_mapper)(insn)
+        assert not new_futures
+
+        for target, value in assignments:
+            context[target] = value
+
+        schedule.append((discardable_vars, insn))
+
+    assert len(done_insns) == len(code.instructions)
+
+    return schedule, with_object_array_or_scalar(exec_mapper, code.result)
+
+
+def _make_scheduler_test_operator():
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.tools import join_fields
+    from math import sin
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    op = StrongWaveOperator(-1, discr.dimensions, flux_type="upwind")
+    compiled_op = discr.compile(op.op_template())
+
+    fields = join_fields(
+            discr.interpolate_volume_function(lambda x, el: sin(3*x[0])),
+            [discr.interpolate_volume_function(
+                lambda x, el: sin(i+x[0]*x[1]))
+                for i in range(discr.dimensions)])
+
+    def make_exec_mapper():
+        return discr.exec_mapper_class({"w": fields, "t": 0}, compiled_op)
+
+    return discr, compiled_op.code, make_exec_mapper
+
+
+def test_dynamic_schedule():
+    """Check the instruction order and the points at which variables are
+    discarded by the dynamic scheduler against a full rescan of the
+    instruction stream at each step."""
+
+    discr, code, make_exec_mapper = _make_scheduler_test_operator()
+    assert len(code.instructions) > 1
+
+    ref_schedule, ref_result = _execute_with_reference_scheduler(
+            code, make_exec_mapper())
+
+    code.last_schedule = None
+    result = code.execute_dynamic(make_exec_mapper())
+
+    schedule = [(set(discardable_vars), insn)
+            for discardable_vars, insn, new_future_count
+            in code.last_schedule]
+    assert schedule == ref_schedule
+
+    # no variable is discarded before its last reader has executed
+    for step_nr, (discardable_vars, insn) in enumerate(schedule):
+        assert not discardable_vars & code.result_names
+        for later_discardable_vars, later_insn in schedule[step_nr:]:
+            assert not discardable_vars & set(
+                    dep.name for dep in later_insn.get_dependencies())
+
+    for comp, ref_comp in zip(result, ref_result):
+        assert (comp == ref_comp).all()
+
+    # the recorded static schedule reproduces the result
+    result = code.execute(make_exec_mapper())
+    for comp, ref_comp in zip(result, ref_result):
+        assert (comp == ref_comp).all()
+
+    discr.close()
+
+
+def test_dynamic_schedule_with_worker_pool():
+    """Check that the future-aware path of the dynamic scheduler gives
+    the same result as a full rescan of the instruction stream."""
+
+    from multiprocessing.pool import ThreadPool
+
+    discr, code, make_exec_mapper = _make_scheduler_test_operator()
+
+    ref_schedule, ref_result = _execute_with_reference_scheduler(
+            code, make_exec_mapper())
+
+    pool = ThreadPool(4)
+    try:
+        for i in range(3):
+            result = code.execute_dynamic(make_exec_mapper(),
+                    worker_pool=pool)
+
+            for comp, ref_comp in zip(result, ref_result):
+                assert (comp == ref_comp).all()
+    finally:
+        pool.close()
+        pool.join()
+
+    discr.close()
+
+
+def test_instruction_profiler():
+    """Check that the profiler accounts for every executed instruction."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.tools import join_fields
+    from math import sin
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    op = StrongWaveOperator(-1, discr.dimensions, flux_type="upwind")
+    compiled_op = discr.compile(op.op_template())
+
+    fields = join_fields(
+            discr.interpolate_volume_function(lambda x, el: sin(3*x[0])),
+            [discr.interpolate_volume_function(lambda x, el: x[0]*x[1])
+                for i in range(discr.dimensions)])
+
+    profiler = compiled_op.start_profiling()
+    step_count = 3
+    for i in range(step_count):
+        compiled_op(w=fields, t=0)
+    assert compiled_op.stop_profiling() is profiler
+
+    assert set(profiler.statistics) == set(compiled_op.code.instructions)
+    for stats in profiler.statistics.itervalues():
+        assert stats.count == step_count
+    assert sum(stats.bytes
+            for stats in profiler.statistics.itervalues()) > 0
+
+    assert len(profiler.get_chrome_trace()["traceEvents"]) \
+            == step_count*len(compiled_op.code.instructions)
+    assert "GB/s" in profiler.make_table()
+    assert "GB/s" in profiler.dot_dataflow_graph()
+
+
+
+def test_array_mesh():
+    """Check that a mesh stored as element arrays matches one made of
+    element objects, and that it can be discretized and partitioned."""
+
+    from hedge.mesh import make_conformal_mesh_ext, TAG_ALL
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.mesh.array import make_element_arrays, NO_NEIGHBOR
+    from hedge.partition import partition_mesh
+
+    obj_mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+    elements = make_element_arrays(obj_mesh.points,
+            [el.vertex_indices for el in obj_mesh.elements])
+    mesh = make_conformal_mesh_ext(obj_mesh.points, elements)
+
+    assert len(mesh.elements) == len(obj_mesh.elements)
+    assert len(mesh.interfaces) == len(obj_mesh.interfaces)
+    assert mesh.element_adjacency_graph() \
+            == obj_mesh.element_adjacency_graph()
+
+    for obj_el, el in zip(obj_mesh.elements, mesh.elements):
+        assert el.id == obj_el.id
+        assert la.norm(el.map.matrix - obj_el.map.matrix) < 1e-13
+        assert la.norm(el.map.vector - obj_el.map.vector) < 1e-13
+        assert la.norm(el.inverse_map.matrix
+                - obj_el.inverse_map.matrix) < 1e-12
+        for fi in range(len(obj_el.faces)):
+            assert la.norm(el.face_normals[fi]
+                    - obj_el.face_normals[fi]) < 1e-13
+            assert abs(el.face_jacobians[fi]
+                    - obj_el.face_jacobians[fi]) < 1e-13
+
+    # connectivity is symmetric
+    nb_els = elements.neighbor_elements
+    el_nrs, face_nrs = numpy.nonzero(nb_els != NO_NEIGHBOR)
+    nb_el_nrs = nb_els[el_nrs, face_nrs]
+    nb_face_nrs = elements.neighbor_faces[el_nrs, face_nrs]
+    assert (nb_els[nb_el_nrs, nb_face_nrs] == el_nrs).all()
+    assert (len(el_nrs) + len(mesh.tag_to_boundary[TAG_ALL])
+            == nb_els.size)
+
+    obj_discr = discr_class(obj_mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+    assert la.norm(discr.nodes - obj_discr.nodes) < 1e-13
+    assert la.norm(discr.volume_jacobians()
+            - obj_discr.volume_jacobians()) < 1e-13
+
+    parts = list(partition_mesh(mesh,
+        [el.id % 2 for el in mesh.elements],
+        lambda part: ("part", part)))
+    assert sum(len(pd.mesh.elements) for pd in parts) == len(mesh.elements)
+    for pd in parts:
+        assert pd.mesh.elements.neighbor_elements is not None
+
+
+
+def test_bulk_face_groups():
+    """Check the interior face pairs built from element arrays."""
+
+    from hedge.mesh.generator import make_regular_rect_mesh, make_box_mesh
+
+    for mesh in [
+            make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5),
+                periodicity=(True, False)),
+            make_box_mesh(max_volume=0.1),
+            ]:
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags())
+
+        fg, = discr.face_groups
+        assert len(fg.face_pairs) == len(mesh.interfaces)
+
+        el_faces = set()
+        for fp in fg.face_pairs:
+            int_side = fp.int_side
+            ext_side = fp.ext_side
+
+            el_faces.add(frozenset([
+                (int_side.element_id, int_side.face_id),
+                (ext_side.element_id, ext_side.face_id)]))
+
+            assert la.norm(int_side.normal + ext_side.normal) < 1e-13
+            assert int_side.h == ext_side.h
+            assert abs(int_side.face_jacobian - ext_side.face_jacobian) \
+                    < 1e-13 * abs(int_side.face_jacobian)
+
+            int_el = mesh.elements[int_side.element_id]
+            assert abs(int_side.element_jacobian
+                    - int_el.map.jacobian()) < 1e-13
+            assert int_side.local_el_number < fg.element_count()
+
+        assert el_faces == set(
+                frozenset([(el_a.id, face_a), (el_b.id, face_b)])
+                for (el_a, face_a), (el_b, face_b) in mesh.interfaces)
+
+
+
+def test_point_interpolation_operator():
+    """Check batched point location and interpolation against the
+    per-point evaluator."""
+
+    from math import sin, cos
+    from hedge.mesh.generator import make_box_mesh
+    from hedge.discretization.interpolation import NOT_FOUND
+
+    mesh = make_box_mesh(max_volume=0.01)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+    u = discr.interpolate_volume_function(
+            lambda x, el: sin(x[0]) * cos(2*x[1]) + x[2])
+
+    from numpy.random import RandomState
+    points = RandomState(17).uniform(0.05, 0.95, size=(50, 3))
+
+    interp_op = discr.get_interpolation_operator(points)
+    assert len(interp_op) == len(points)
+
+    values = interp_op(u)
+    for point, value in zip(points, values):
+        assert abs(discr.get_point_evaluator(point)(u) - value) < 1e-12
+
+    el_numbers = discr.locate_points(
+            numpy.vstack([points[:3], [[5, 5, 5]]]))
+    assert (el_numbers[:3] == interp_op.el_numbers[:3]).all()
+    assert el_numbers[3] == NOT_FOUND
+
+
+
+def test_probe_set():
+    """Check probe time series against the per-point evaluator, both in the
+    ring buffer and after a round trip through the data file."""
+
+    from math import sin
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.probe import ProbeSet, read_probe_history
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5))
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+    u = discr.interpolate_volume_function(lambda x, el: sin(x[0]) + x[1])
+
+    points = numpy.array([[0.1, 0.2], [0.5, 0.5], [0.9, 0.35]])
+    exact = numpy.array([discr.get_point_evaluator(pt)(u) for pt in points])
+
+    import tempfile
+    import shutil
+    tmpdir = tempfile.mkdtemp()
+    try:
+        from os.path import join
+        pathname = join(tmpdir, "probes")
+        probes = ProbeSet(discr, points, ["u", "2u"],
+                pathname=pathname, buffer_steps=4)
+
+        for step in range(10):
+            probes.record(step*0.1, [step*u, 2*step*u])
+
+        times, values = probes.history()
+        assert len(times) == 4
+        assert la.norm(values[-1, 1] - 18*exact) < 1e-12
+
+        probes.close()
+
+        probe_numbers, dummy, field_names, times, values = \
+                read_probe_history(pathname)
+        assert (probe_numbers == numpy.arange(len(points))).all()
+        assert field_names == ["u", "2u"]
+        assert la.norm(times - 0.1*numpy.arange(10)) < 1e-15
+        assert la.norm(values[:, 0] - numpy.outer(numpy.arange(10), exact)) \
+                < 1e-11
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+
+def test_array_boundaries():
+    """Check boundaries built from the all-boundary-faces array against
+    those built one face at a time, and that equal tags share data."""
+
+    from hedge.mesh import TAG_ALL, TAG_REALLY_ALL
+    from hedge.mesh.generator import make_box_mesh
+
+    def bottom(fvi, el, fn, all_v):
+        return ["bottom"] if all(all_v[i][2] < 1e-12 for i in fvi) else []
+
+    mesh = make_box_mesh(max_volume=0.1, boundary_tagger=bottom)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    assert discr.get_boundary(TAG_ALL) is discr.get_boundary(TAG_REALLY_ALL)
+    assert discr.get_boundary("nonexistent").is_empty()
+
+    # once the boundary face store exists, the element arrays are not needed
+    discr.release_element_arrays()
+    discr.get_boundary("bottom")
+    assert "_element_arrays" not in discr.__dict__
+
+    # every tag indexes into one store of all boundary face nodes
+    all_data = discr._get_all_boundary_face_data()
+    assert numpy.may_share_memory(
+            discr.get_boundary(TAG_ALL).nodes, all_data["nodes"])
+    assert set(discr.get_boundary("bottom").vol_indices) \
+            <= set(discr.get_boundary(TAG_ALL).vol_indices)
+
+    for tag in [TAG_ALL, "bottom"]:
+        bdry = discr.get_boundary(tag)
+        ref_bdry = discr._make_boundary(mesh.tag_to_boundary[tag])
+
+        assert (bdry.vol_indices == ref_bdry.vol_indices).all()
+        assert la.norm(bdry.nodes - ref_bdry.nodes) == 0
+
+        fg, = bdry.face_groups
+        ref_fg, = ref_bdry.face_groups
+        assert (fg.local_el_write_base == ref_fg.local_el_write_base).all()
+
+        for el_face in mesh.tag_to_boundary[tag]:
+            fp = bdry.find_facepair(el_face)
+            ref_fp = ref_bdry.find_facepair(el_face)
+
+            for side, ref_side in [
+                    (fp.int_side, ref_fp.int_side),
+                    (fp.ext_side, ref_fp.ext_side)]:
+                assert side.el_base_index == ref_side.el_base_index
+                assert side.element_id == ref_side.element_id
+                assert side.face_id == ref_side.face_id
+                assert side.local_el_number == ref_side.local_el_number
+                assert side.order == ref_side.order
+                assert (fg.index_lists[side.face_index_list_number]
+                        == ref_fg.index_lists[ref_side.face_index_list_number]
+                        ).all()
+
+            assert abs(fp.int_side.h - ref_fp.int_side.h) < 1e-13
+            assert abs(fp.int_side.face_jacobian
+                    - ref_fp.int_side.face_jacobian) < 1e-13
+            assert la.norm(fp.int_side.normal - ref_fp.int_side.normal) \
+                    < 1e-13
+
+
+
+def test_discretization_snapshot():
+    """Check that a saved and reloaded discretization matches the
+    original."""
+
+    from hedge.mesh import TAG_ALL
+    from hedge.mesh.generator import make_regular_rect_mesh
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(5, 5),
+            periodicity=(True, False))
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    import tempfile
+    import shutil
+    tmpdir = tempfile.mkdtemp()
+    try:
+        discr.save(tmpdir)
+        loaded = discr_class.load(tmpdir)
+
+        assert la.norm(loaded.nodes - discr.nodes) == 0
+        assert len(loaded.mesh.interfaces) == len(mesh.interfaces)
+        assert loaded.mesh.element_adjacency_graph() \
+                == mesh.element_adjacency_graph()
+        assert loaded.debug == discr.debug
+
+        fg, = discr.face_groups
+        loaded_fg, = loaded.face_groups
+        assert len(loaded_fg.face_pairs) == len(fg.face_pairs)
+        assert (loaded_fg.index_lists == fg.index_lists).all()
+        assert (loaded_fg.local_el_write_base
+                == fg.local_el_write_base).all()
+
+        from hedge.mesh.array import FaceSubset, ElementSubset
+        for tag in mesh.tag_to_boundary:
+            loaded_faces = loaded.mesh.tag_to_boundary[tag]
+            assert isinstance(loaded_faces, FaceSubset)
+            assert [(el.id, fn) for el, fn in loaded_faces] \
+                    == [(el.id, fn) for el, fn in mesh.tag_to_boundary[tag]]
+            assert (loaded.get_boundary(tag).vol_indices
+                    == discr.get_boundary(tag).vol_indices).all()
+        for tag in mesh.tag_to_elements:
+            assert isinstance(loaded.mesh.tag_to_elements[tag], ElementSubset)
+
+        # the maps are memory-mapped from the snapshot, not recomputed
+        loaded_ea = loaded.mesh.elements
+        for name in ["map_matrices", "map_offsets", "jacobians"]:
+            assert isinstance(getattr(loaded_ea, name), numpy.memmap)
+        assert (loaded_ea.map_matrices
+                == discr._get_element_arrays().map_matrices).all()
+
+        from math import sin
+        u = discr.interpolate_volume_function(lambda x, el: sin(x[0]))
+        from hedge.models.wave import StrongWaveOperator
+        from hedge.tools import join_fields
+        op = StrongWaveOperator(-1, 2, dirichlet_tag=TAG_ALL)
+        fields = join_fields(u, discr.volume_zeros(), discr.volume_zeros())
+        assert discr.norm(
+                op.bind(loaded)(0, fields) - op.bind(discr)(0, fields)) < 1e-12
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_xdmf_visualizer():
+    """Check that the XDMF index points at the written geometry and field
+    data, with the mesh written once for all time steps."""
+
+    from math import sin
+    from xml.dom.minidom import parse
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.visualization import XdmfVisualizer
+    from hedge.tools import join_fields
+
+    mesh = make_regular_rect_mesh(a=(0, 0), b=(1, 1), n=(3, 3))
+    discr = discr_class(mesh, order=2,
+            debug=discr_class.noninteractive_debug_flags())
+    u = discr.interpolate_volume_function(lambda x, el: sin(x[0]) + x[1])
+
+    import tempfile
+    import shutil
+    import os
+    tmpdir = tempfile.mkdtemp()
+    try:
+        basename = os.path.join(tmpdir, "fld")
+        vis = XdmfVisualizer(discr, None, basename, dtype=numpy.float32,
+                buffer_steps=2)
+        for step in range(3):
+            visf = vis.make_file("fld-%04d" % step)
+            vis.add_data(visf, [("u", step*u), ("v", join_fields(u, -u))],
+                    time=0.5*step, step=step)
+            visf.close()
+
+            # the index is valid whenever a batch of steps has been written
+            if step == 1:
+                assert len(parse(basename+".xmf")
+                        .getElementsByTagName("Time")) == 2
+        vis.close()
+
+        def read_data_item(item):
+            shape = tuple(int(n) for n in item.getAttribute("Dimensions").split())
+            dtype = {"Float": "f", "Int": "i"}[item.getAttribute("NumberType")] \
+                    + item.getAttribute("Precision")
+            inf = open(os.path.join(tmpdir, item.firstChild.data), "rb")
+            inf.seek(int(item.getAttribute("Seek")))
+            result = numpy.fromfile(inf, dtype=dtype,
+                    count=int(numpy.prod(shape))).reshape(shape)
+            inf.close()
+            return result
+
+        grids = [grid for grid in parse(basename+".xmf").getElementsByTagName("Grid")
+                if grid.getAttribute("GridType") == "Uniform"]
+        assert len(grids) == 3
+
+        for step, grid in enumerate(grids):
+            geometry, = grid.getElementsByTagName("Geometry")
+            points = read_data_item(geometry.getElementsByTagName("DataItem")[0])
+            assert la.norm(points[:, :2] - discr.nodes) == 0
+
+            u_attr, v_attr = grid.getElementsByTagName("Attribute")
+            assert u_attr.getAttribute("Name") == "u"
+            u_data = read_data_item(u_attr.getElementsByTagName("DataItem")[0])
+            assert u_data.dtype == numpy.float32
+            assert la.norm(u_data - step*u) < 1e-5*(1+la.norm(u))
+
+            v_data = read_data_item(v_attr.getElementsByTagName("DataItem")[0])
+            assert la.norm(v_data[:, 1] + u) < 1e-5*la.norm(u)
+            assert (v_data[:, 2] == 0).all()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_async_visualizer():
+    """Check that the background writer writes snapshots of the fields, in
+    order, and passes on exceptions from the writing thread."""
+
+    from hedge.visualization import AsyncVisualizer
+    import time
+
+    class RecordingVisualizer(object):
+        def __init__(self):
+            self.written = []
+            self.is_closed = False
+
+        def make_file(self, pathname):
+            if pathname == "fail":
+                raise IOError("cannot write")
+            return RecordingFile(self, pathname)
+
+        def add_data(self, visf, variables, time=None, step=None):
+            visf.variables.extend(variables)
+
+        def close(self):
+            self.is_closed = True
+
+    class RecordingFile(object):
+        def __init__(self, vis, pathname):
+            self.vis = vis
+            self.pathname = pathname
+            self.variables = []
+
+        def close(self):
+            # pretend that writing takes a while
+            time.sleep(0.01)
+            self.vis.written.append((self.pathname, self.variables))
+
+    rec_vis = RecordingVisualizer()
+    vis = AsyncVisualizer(rec_vis, max_queued=2)
+
+    u = numpy.zeros(10)
+    for step in range(5):
+        u[:] = step
+        visf = vis.make_file("fld-%04d" % step)
+        vis.add_data(visf, [("u", u)], time=step, step=step)
+        visf.close()
+
+    vis.flush()
+    assert [pathname for pathname, variables in rec_vis.written] \
+            == ["fld-%04d" % step for step in range(5)]
+    for step, (pathname, variables) in enumerate(rec_vis.written):
+        assert (variables[0][1] == step).all()
+
+    vis.make_file("fail").close()
+    try:
+        vis.flush()
+    except IOError:
+        pass
+    else:
+        assert False, "exception from writing thread was lost"
+
+    vis.close()
+    assert rec_vis.is_closed
+
+
+def test_background_writer_collection():
+    """Check that a background writer that is dropped without being
+    closed is garbage-collected and still runs its queued jobs."""
+
+    from hedge.visualization import BackgroundWriter
+    from weakref import ref
+    import gc
+
+    done = []
+    writer = BackgroundWriter()
+    writer.submit(done.append, 17)
+
+    thread = writer.thread
+    writer_ref = ref(writer)
+    del writer
+    gc.collect()
+
+    assert writer_ref() is None
+    thread.join(10)
+    assert not thread.is_alive()
+    assert done == [17]
+
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
@@ -175,6 +175,192 @@ def test_hedge_parallel(dtype, flux_type, random_partition, mesh_gen):
                 (dtype, flux_type, random_partition, mesh_gen))
 
 
+
+def run_halo_exchange_tags():
+    """Check that each flux exchange sends with its own tag, and that
+    closing the discretization frees the persistent requests."""
+
+    from hedge.backends import guess_run_context
+    rcon = guess_run_context(["mpi"])
+
+    if rcon.is_head_rank:
+        from hedge.mesh.generator import make_regular_rect_mesh
+        mesh_data = rcon.distribute_mesh(make_regular_rect_mesh(n=(6, 6)))
+    else:
+        mesh_data = rcon.receive_mesh()
+
+    discr = rcon.make_discretization(mesh_data, order=2)
+
+    from hedge.flux import FluxScalarPlaceholder
+    from hedge.optemplate import Field, get_flux_operator
+    from hedge.tools import join_fields
+    u = FluxScalarPlaceholder(0)
+    flux_op = get_flux_operator(u.int - u.ext)
+
+    # two fluxes of different fields need two exchanges
+    compiled = discr.compile(join_fields(
+        flux_op(Field("u")), flux_op(Field("w"))))
+
+    def f(x, el):
+        return x[0] - x[1]
+
+    u = discr.interpolate_volume_function(f)
+    for i in range(2):
+        u_flux, w_flux = compiled(u=u, w=2*u)
+        assert la.norm(w_flux - 2*u_flux) < 1e-12*(1+la.norm(u_flux))
+
+    from hedge.backends.mpi import HALO_TAG_BASE
+    exchanges = [exchange
+            for executor_exchanges in discr.halo_exchanges.values()
+            for exchange in executor_exchanges.values()]
+    assert sorted(exchange.tag for exchange in exchanges) \
+            == [HALO_TAG_BASE, HALO_TAG_BASE+1]
+
+    discr.close()
+    assert not discr.halo_exchanges
+    for exchange in exchanges:
+        assert not exchange.neighbors
+
+
+def test_halo_exchange_tags():
+    from pytools.mpi import run_with_mpi_ranks
+    run_with_mpi_ranks(__file__, 2, run_halo_exchange_tags, ())
+
+
+
+def run_halo_precision_test(halo_kwargs):
+    """Check that an operator evaluated with reduced-precision halos
+    matches the one with full-precision halos."""
+
+    from math import sin
+    from hedge.backends import guess_run_context
+    from hedge.data import TimeDependentGivenFunction
+    rcon = guess_run_context(["mpi"])
+
+    v = np.array([0.9, 0.3])
+
+    def u_analytic(x, el, t):
+        return sin(np.dot(v, x) - t)
+
+    def boundary_tagger(vertices, el, face_nr, points):
+        if np.dot(el.face_normals[face_nr], v) < 0:
+            return ["inflow"]
+        else:
+            return ["outflow"]
+
+    mesh = my_box_mesh(boundary_tagger)
+
+    discrs = []
+    for kwargs in [{}, halo_kwargs]:
+        if rcon.is_head_rank:
+            mesh_data = rcon.distribute_mesh(mesh)
+        else:
+            mesh_data = rcon.receive_mesh()
+
+        discrs.append(rcon.make_discretization(mesh_data, order=3,
+            **kwargs))
+
+    op = StrongAdvectionOperator(v,
+            inflow_u=TimeDependentGivenFunction(u_analytic),
+            flux_type="upwind")
+
+    full_discr, reduced_discr = discrs
+    full_rhs, reduced_rhs = [
+            op.bind(discr)(0, discr.interpolate_volume_function(
+                lambda x, el: u_analytic(x, el, 0)))
+            for discr in discrs]
+
+    assert la.norm(reduced_rhs - full_rhs) < 1e-5*la.norm(full_rhs)
+
+    if "halo_dtype" in halo_kwargs:
+        assert 2*sum(reduced_discr.halo_bytes_sent.values()) \
+                == sum(full_discr.halo_bytes_sent.values())
+
+
+@pytest.mark.parametrize("halo_kwargs", [
+    dict(halo_dtype=np.float32),
+    dict(halo_error_bound=1e-8),
+    ])
+def test_halo_precision(halo_kwargs):
+    from pytools.mpi import run_with_mpi_ranks
+    run_with_mpi_ranks(__file__, 2, run_halo_precision_test, (halo_kwargs,))
+
+
+
+def run_scatter_mesh_test():
+    """Check that each rank receives its rows of
+    :func:`hedge.partition.pack_mesh_partition` through the collective
+    scatter, including its share of the periodic face data."""
+
+    from hedge.backends import guess_run_context
+    from hedge.mesh import make_conformal_mesh_ext, TAG_RANK_BOUNDARY
+    from hedge.mesh.generator import make_regular_rect_mesh
+    from hedge.mesh.array import make_element_arrays, ElementArrays
+    from hedge.partition import pack_mesh_partition, make_part_data
+    rcon = guess_run_context(["mpi"])
+
+    # every rank builds the same mesh, to compare against
+    obj_mesh = make_regular_rect_mesh(n=(9, 5), periodicity=(True, False))
+
+    def boundary_tagger(fvi, el, fn, all_v):
+        center = np.average(all_v[list(fvi)], axis=0)
+        result = []
+        if center[0] < 1e-12:
+            result.append("minus_x")
+        if center[0] > 1-1e-12:
+            result.append("plus_x")
+        if center[1] < 1e-12:
+            result.append("bottom")
+        return result
+
+    points = obj_mesh.points
+    mesh = make_conformal_mesh_ext(points,
+            make_element_arrays(points,
+                [el.vertex_indices for el in obj_mesh.elements]),
+            boundary_tagger=boundary_tagger,
+            periodicity=[("minus_x", "plus_x"), None])
+
+    rank_count = len(rcon.ranks)
+    centroids = np.average(points[mesh.elements.vertex_indices], axis=1)
+    el_parts = np.minimum(
+            (centroids[:, 0]*rank_count).astype(np.intp), rank_count-1)
+
+    if rcon.is_head_rank:
+        rank_data = rcon.distribute_mesh(mesh, el_parts)
+    else:
+        rank_data = rcon.receive_mesh()
+
+    meta, arrays, counts = pack_mesh_partition(mesh, el_parts, rank_count)
+    my_arrays = {}
+    for name, ary in arrays.iteritems():
+        start = np.sum(counts[name][:rcon.rank])
+        my_arrays[name] = ary[start:start+counts[name][rcon.rank]]
+    ref_data = make_part_data(rcon.rank, meta, my_arrays, TAG_RANK_BOUNDARY)
+
+    assert isinstance(rank_data.mesh.elements, ElementArrays)
+    assert (rank_data.mesh.points == ref_data.mesh.points).all()
+    assert (rank_data.mesh.elements.vertex_indices
+            == ref_data.mesh.elements.vertex_indices).all()
+
+    assert rank_data.global2local_elements \
+            == ref_data.global2local_elements
+    assert rank_data.global2local_vertex_indices \
+            == ref_data.global2local_vertex_indices
+    assert rank_data.neighbor_ranks == ref_data.neighbor_parts
+    assert rank_data.global_periodic_opposite_faces \
+            == ref_data.global_periodic_opposite_faces
+
+    assert set(rank_data.mesh.tag_to_boundary) \
+            == set(ref_data.mesh.tag_to_boundary)
+    for tag, faces in ref_data.mesh.tag_to_boundary.iteritems():
+        assert len(rank_data.mesh.tag_to_boundary[tag]) == len(faces)
+
+
+def test_scatter_mesh():
+    from pytools.mpi import run_with_mpi_ranks
+    run_with_mpi_ranks(__file__, 3, run_scatter_mesh_test, ())
+
+
 if __name__ == "__main__":
     import sys
     from pytools.mpi import check_for_mpi_relaunch